@@ -1223,6 +1223,7 @@ def clean():
                    "xpra/server/cystats.c",
                    "xpra/rectangle.c",
                    "xpra/server/window/motion.c",
+                   "xpra/server/window/tiles.c",
                    "xpra/server/pam.c",
                    "fs/etc/xpra/xpra.conf",
                    #special case for the generated xpra conf files in build (see #891):
@@ -2173,6 +2174,7 @@ tace(client_ENABLED or server_ENABLED, "xpra.buffers.cyxor", optimize=3)
 tace(client_ENABLED or server_ENABLED or shadow_ENABLED, "xpra.rectangle", optimize=3)
 tace(server_ENABLED or shadow_ENABLED, "xpra.server.cystats", optimize=3)
 tace(server_ENABLED or shadow_ENABLED, "xpra.server.window.motion", optimize=3)
+tace(server_ENABLED or shadow_ENABLED, "xpra.server.window.tiles", optimize=3)
 if pam_ENABLED:
     if pkg_config_ok("--exists", "pam", "pam_misc"):
         pam_kwargs = {"pkgconfig_names" : "pam,pam_misc"}
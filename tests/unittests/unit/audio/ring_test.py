@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import os
+import unittest
+
+from xpra.os_util import POSIX
+from xpra.net import mmap_pipe
+from xpra.audio.ring import AudioRing
+
+
+class WarningRecorder:
+    def __init__(self):
+        self.warnings = []
+
+    def __call__(self, *args, **kwargs):
+        pass
+
+    def warn(self, *args, **kwargs):
+        self.warnings.append(args)
+
+
+class TestAudioRing(unittest.TestCase):
+
+    def test_ring(self):
+        writer = AudioRing.create(64*1024)
+        assert writer
+        try:
+            reader = AudioRing.open(writer.filename)
+            assert reader and reader.size==writer.size
+            #enough buffers to wrap around the ring a few times:
+            for i in range(200):
+                data = os.urandom(1000+i*37)
+                chunks = writer.write(data)
+                assert chunks, "failed to write buffer %i" % i
+                assert reader.read(chunks)==data
+            #the reader is not keeping up:
+            pending = []
+            saved = mmap_pipe.log
+            mmap_pipe.log = recorder = WarningRecorder()
+            try:
+                while True:
+                    data = os.urandom(8000)
+                    chunks = writer.write(data)
+                    if not chunks:
+                        break
+                    pending.append((chunks, data))
+            finally:
+                mmap_pipe.log = saved
+            assert writer.overflows==1
+            #overflows are counted, not logged as warnings:
+            assert not recorder.warnings
+            for chunks, data in pending:
+                assert reader.read(chunks)==data
+            assert writer.write(b"0"*1000)
+            #too big for the ring:
+            assert writer.write(b"0"*32*1024) is None
+            reader.close()
+        finally:
+            writer.close()
+        assert not os.path.exists(writer.filename)
+
+
+def main():
+    if POSIX:
+        unittest.main()
+
+if __name__ == '__main__':
+    main()
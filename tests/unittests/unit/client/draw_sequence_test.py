@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import unittest
+
+from xpra.client.gui.draw_sequence import DrawSequence
+
+
+class TestDrawSequence(unittest.TestCase):
+
+    def test_in_order(self):
+        ds = DrawSequence(100)
+        previous = 0
+        for i in range(1, 10):
+            assert ds.received(i, previous, 0, 0, 10, 10, 0)
+            previous = i
+        assert not ds.missing
+        assert not ds.get_lost(10)
+
+    def test_lost(self):
+        ds = DrawSequence(100)
+        assert ds.received(1, 0, 0, 0, 10, 10, 0)
+        #2 and 3 were sent reliably:
+        assert ds.received(3, -1, 50, 50, 10, 10, 0)
+        assert ds.received(5, 4, 0, 0, 10, 10, 0)
+        assert sorted(ds.missing)==[4]
+        #not yet:
+        assert not ds.get_lost(0.05)
+        #4 arrives late, does not overlap, and tells us that 2 is missing too:
+        assert ds.received(4, 2, 100, 100, 10, 10, 0.06)
+        assert sorted(ds.missing)==[2]
+        assert not ds.get_lost(0.1)
+        assert ds.get_lost(0.2)==[2]
+        assert not ds.missing
+        #too late now:
+        assert not ds.received(2, 1, 100, 100, 10, 10, 0.3)
+
+    def test_stale(self):
+        ds = DrawSequence(100)
+        assert ds.received(1, 0, 0, 0, 10, 10, 0)
+        assert ds.received(3, 2, 0, 0, 10, 10, 0)
+        #2 would overwrite the newer pixels from 3:
+        assert not ds.received(2, 1, 5, 5, 10, 10, 0)
+        #it is no longer missing:
+        assert not ds.get_lost(1)
+        #duplicate:
+        assert not ds.received(3, 2, 0, 0, 10, 10, 0)
+
+    def test_reliable(self):
+        ds = DrawSequence(100)
+        #packets which are not sent as datagrams are never dropped or reported:
+        for i in range(1, 10):
+            assert ds.received(i*2, -1, 0, 0, 10, 10, 0)
+        assert ds.received(1, -1, 0, 0, 10, 10, 0)
+        assert not ds.missing
+        #a late reliable packet overwrites the pixels of a newer datagram packet:
+        assert ds.received(30, 0, 0, 0, 10, 10, 0)
+        assert ds.received(25, -1, 5, 5, 10, 10, 0)
+        assert ds.get_lost(0)==[30]
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
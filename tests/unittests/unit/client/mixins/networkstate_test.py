@@ -29,6 +29,19 @@ class MixinsTest(ClientMixinTest):
 		packet = ["info-response", {"foo" : "bar"}]
 		self.handle_packet(packet)
 		assert x.server_last_info.get("foo")=="bar"
+		#subscriptions:
+		assert not x.subscribe_info("test")
+		x.server_packet_types = ("info-subscribe", )
+		assert x.subscribe_info("test") and x.subscribe_info("other")
+		assert len([p for p in self.packets if p[0]=="info-subscribe"])==1
+		self.handle_packet(["info-delta", {"foo" : "baz", "bar" : {"a" : 1}}, [], True])
+		self.handle_packet(["info-delta", {"bar" : {"b" : 2}}, [("foo", )], False])
+		assert x.server_last_info=={"bar" : {"a" : 1, "b" : 2}}
+		x.unsubscribe_info("test")
+		assert x.info_subscribed
+		x.unsubscribe_info("other")
+		assert not x.info_subscribed
+		assert self.get_packet(-1)==("info-subscribe", (), 0)
 
 def main():
 	unittest.main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import os
+import unittest
+
+from xpra.net.compression import Compressible
+from xpra.clipboard.clipboard_core import (
+    ClipboardProtocolHelperCore, ClipboardProxyCore, ContentsCache,
+    CLIPBOARD_CHUNK_SIZE,
+    )
+
+
+class FakeProxy(ClipboardProxyCore):
+
+    def __init__(self, selection):
+        super().__init__(selection)
+        self.contents = None
+
+    def get_contents(self, target, got_contents):
+        got_contents(*self.contents)
+
+
+class LoopbackHelper(ClipboardProtocolHelperCore):
+
+    def __init__(self, **kwargs):
+        self.sent = []
+        self.received = {}
+        kwargs["clipboards.local"] = kwargs["clipboards.remote"] = ("CLIPBOARD", )
+        super().__init__(self.queue_packet, **kwargs)
+        for proxy in self._clipboard_proxies.values():
+            proxy.set_enabled(True)
+            proxy.set_direction(True, True)
+
+    def queue_packet(self, *packet):
+        self.sent.append(packet)
+
+    def make_proxy(self, selection):
+        return FakeProxy(selection)
+
+    def _clipboard_got_contents(self, request_id, dtype="", dformat=0, data=None):
+        self.received[request_id] = (dtype, dformat, data)
+
+
+def pump(a, b):
+    """ deliver the packets in both directions until there are none left """
+    types = []
+    while a.sent or b.sent:
+        for src, dst in ((a, b), (b, a)):
+            while src.sent:
+                packet = [x.data if isinstance(x, Compressible) else x for x in src.sent.pop(0)]
+                types.append(packet[0])
+                dst.process_clipboard_packet(packet)
+    return types
+
+
+class TestContentsCache(unittest.TestCase):
+
+    def test_lru(self):
+        cache = ContentsCache(max_entries=2, max_size=100)
+        cache.add("a", b"a"*10)
+        cache.add("b", b"b"*10)
+        assert cache.get("a")
+        cache.add("c", b"c"*10)
+        #"b" was the least recently used:
+        assert cache.get("b") is None
+        assert cache.get("a") and cache.get("c")
+        #too big to cache at all:
+        cache.add("d", b"d"*101)
+        assert cache.get("d") is None
+        cache.add("e", b"e"*90)
+        assert cache.size<=100
+        assert cache.get("a") is None
+        assert cache.get_info()["entries"]==2
+
+
+class TestContentsStreaming(unittest.TestCase):
+
+    def make_pair(self, contents_digest=True):
+        sender = LoopbackHelper(**{"contents-digest" : contents_digest})
+        receiver = LoopbackHelper(**{"contents-digest" : contents_digest})
+        return sender, receiver
+
+    def request(self, sender, receiver, request_id, data, dtype="image/png"):
+        sender._clipboard_proxies["CLIPBOARD"].contents = (dtype, 8, data)
+        receiver.send("clipboard-request", request_id, "CLIPBOARD", dtype)
+        return pump(receiver, sender)
+
+    def test_small(self):
+        sender, receiver = self.make_pair()
+        types = self.request(sender, receiver, 1, b"hello", "UTF8_STRING")
+        assert types==["clipboard-request", "clipboard-contents"], types
+        assert receiver.received[1]==("UTF8_STRING", 8, b"hello")
+
+    def test_large_image(self):
+        sender, receiver = self.make_pair()
+        data = os.urandom(50*1024*1024)
+        types = self.request(sender, receiver, 1, data)
+        nchunks = (len(data)+CLIPBOARD_CHUNK_SIZE-1)//CLIPBOARD_CHUNK_SIZE
+        assert types.count("clipboard-contents-chunk")==nchunks
+        assert types[:3]==["clipboard-request", "clipboard-contents-digest", "clipboard-contents-ack"]
+        assert receiver.received[1]==("image/png", 8, data)
+        assert not sender._clipboard_outgoing and not receiver._clipboard_incoming
+        #the second request is served from the cache:
+        types = self.request(sender, receiver, 2, data)
+        assert types==["clipboard-request", "clipboard-contents-digest", "clipboard-contents-ack"], types
+        assert receiver.received[2]==("image/png", 8, data)
+        assert not sender._clipboard_outgoing
+        info = receiver.get_info()["cache"]["CLIPBOARD"]
+        assert info["hits"]==1 and info["entries"]==1
+
+    def test_no_digest_support(self):
+        sender, receiver = self.make_pair(False)
+        data = os.urandom(1024*1024)
+        types = self.request(sender, receiver, 1, data)
+        assert types==["clipboard-request", "clipboard-contents"], types
+        assert receiver.received[1][2]==data
+
+    def test_invalid_chunk(self):
+        sender, receiver = self.make_pair()
+        data = os.urandom(3*CLIPBOARD_CHUNK_SIZE)
+        sender._clipboard_proxies["CLIPBOARD"].contents = ("image/png", 8, data)
+        receiver.send("clipboard-request", 1, "CLIPBOARD", "image/png")
+        #deliver the request, the digest, the ack:
+        for src, dst in ((receiver, sender), (sender, receiver), (receiver, sender)):
+            dst.process_clipboard_packet(src.sent.pop(0))
+        assert len(sender.sent)==3
+        #drop the first chunk:
+        sender.sent.pop(0)
+        pump(sender, receiver)
+        assert receiver.received[1]==("", 0, None)
+        assert not receiver._clipboard_incoming
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
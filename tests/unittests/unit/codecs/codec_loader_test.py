@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import os
+import json
+import tempfile
+import unittest
+from types import ModuleType
+from threading import current_thread
+
+from xpra.codecs import loader
+
+
+class TestProbeCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.saved = loader.CODEC_CACHE, loader.CODEC_CACHE_FILE
+        loader.CODEC_CACHE = True
+        loader.CODEC_CACHE_FILE = os.path.join(self.tmpdir.name, "cache", "codecs.json")
+        self.reset()
+
+    def tearDown(self):
+        loader.CODEC_CACHE, loader.CODEC_CACHE_FILE = self.saved
+        self.reset()
+        self.tmpdir.cleanup()
+
+    def reset(self):
+        loader.probe_cache.clear()
+        loader.probe_cache_state.update({"loaded" : False, "modified" : False})
+
+    def make_module(self, version="1.0"):
+        filename = os.path.join(self.tmpdir.name, "encoder.so")
+        with open(filename, "wb") as f:
+            f.write(b"0"*100)
+        module = ModuleType("encoder")
+        module.__file__ = filename
+        module.get_version = lambda : version
+        return module
+
+    def test_cache(self):
+        module = self.make_module()
+        assert not loader.probe_cached("enc_test", module)
+        loader.record_probe("enc_test", module)
+        assert loader.probe_cached("enc_test", module)
+        loader.save_probe_cache()
+        with open(loader.CODEC_CACHE_FILE, "r", encoding="utf8") as f:
+            assert "enc_test" in json.load(f)
+        #reload from disk:
+        self.reset()
+        assert loader.probe_cached("enc_test", module)
+        #a new codec version invalidates the cached result:
+        assert not loader.probe_cached("enc_test", self.make_module("2.0"))
+        #so does modifying the module:
+        module = self.make_module()
+        with open(module.__file__, "ab") as f:
+            f.write(b"1")
+        assert not loader.probe_cached("enc_test", module)
+
+    def test_nocache(self):
+        module = self.make_module()
+        loader.record_probe("nvenc", module)
+        assert not loader.probe_cached("nvenc", module)
+        loader.save_probe_cache()
+        assert not os.path.exists(loader.CODEC_CACHE_FILE)
+
+    def test_invalid_file(self):
+        os.makedirs(os.path.dirname(loader.CODEC_CACHE_FILE))
+        with open(loader.CODEC_CACHE_FILE, "w", encoding="utf8") as f:
+            f.write("not json")
+        assert not loader.probe_cached("enc_test", self.make_module())
+
+
+class TestParallelLoad(unittest.TestCase):
+
+    def test_parallel(self):
+        threads = {}
+        saved = loader.load_codec, loader.save_probe_cache
+        def load_codec(name):
+            threads[name] = current_thread().name
+        try:
+            loader.load_codec = load_codec
+            loader.save_probe_cache = lambda : None
+            names = [f"codec{i}" for i in range(10)]
+            loader.load_codecs_parallel(*names, threads=4)
+            assert sorted(threads.keys())==sorted(names)
+            assert all(x.startswith("codec-loader-") for x in threads.values())
+            assert len(set(threads.values()))<=4
+            threads.clear()
+            loader.load_codecs_parallel(*names, threads=1)
+            assert sorted(threads.keys())==sorted(names)
+            assert current_thread().name in threads.values()
+            #the GPU codecs are loaded by the same thread:
+            threads.clear()
+            gpu = ["nvenc", "nvdec", "enc_nvjpeg"]
+            loader.load_codecs_parallel(*(names+gpu), threads=4)
+            assert sorted(threads.keys())==sorted(names+gpu)
+            assert len(set(threads[name] for name in gpu))==1
+        finally:
+            loader.load_codec, loader.save_probe_cache = saved
+
+
+class TestLazyLoad(unittest.TestCase):
+
+    def test_filt_encodings(self):
+        from xpra.codecs.video_helper import filt_encodings
+        modules = ["enc_x264", "enc_vpx", "nvenc"]
+        assert filt_encodings(modules, ())==modules
+        assert filt_encodings(modules, ("vp8", "png"))==["enc_vpx", "nvenc"]
+        assert filt_encodings(modules, ("png", ))==["nvenc"]
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
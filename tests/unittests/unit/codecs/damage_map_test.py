@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import unittest
+
+from xpra.codecs.codec_constants import get_damage_map
+
+
+class TestDamageMap(unittest.TestCase):
+
+    def test_empty(self):
+        assert get_damage_map((), 1920, 1080)==bytearray(120*68)
+
+    def test_blocks(self):
+        m = get_damage_map(((20, 0, 1, 1), (0, 40, 48, 10)), 64, 50)
+        assert len(m)==4*4
+        assert tuple(m)==(
+            0, 1, 0, 0,
+            0, 0, 0, 0,
+            1, 1, 1, 0,
+            1, 1, 1, 0,
+            )
+
+    def test_clipped(self):
+        m = get_damage_map(((-10, -10, 20, 20), (60, 60, 100, 100), (200, 0, 10, 10)), 64, 64)
+        assert m[0]==1 and m[15]==1 and sum(m)==2
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import os
+import json
+import tempfile
+import unittest
+from time import monotonic
+
+from xpra.latency_trace import LatencyTrace, get_server_stages, to_us
+
+
+class TestLatencyTrace(unittest.TestCase):
+
+    def test_server_stages(self):
+        assert get_server_stages((1, 2, 5, 9))==[("batch", 1, 2), ("capture", 2, 5), ("encode", 5, 9)]
+        assert get_server_stages((1, 2))==[("batch", 1, 2)]
+        now = monotonic()
+        assert to_us(now)<to_us(now+1)
+
+    def test_trace(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "trace.json")
+            trace = LatencyTrace(filename, "test")
+            trace.mark((1, 10), 5)
+            assert trace.pop_mark((1, 10))==5
+            assert trace.pop_mark((1, 10))==0
+            trace.flow(1, 10, 100, True)
+            trace.spans(1, 10, (("encode", 100, 150), ("invalid", 200, 100), ("send", 150, 180)))
+            trace.spans(2, 1, (("decode", 200, 250), ))
+            #the file can be loaded before it is closed:
+            trace.file.flush()
+            with open(filename, encoding="utf8") as f:
+                assert f.read().startswith("[\n")
+            trace.close()
+            trace.spans(1, 11, (("encode", 100, 150), ))
+            with open(filename, encoding="utf8") as f:
+                events = json.load(f)
+            names = [e.get("name") for e in events if e.get("ph")=="X"]
+            assert names==["encode", "send", "decode"], names
+            tracks = [e["args"]["name"] for e in events if e.get("name")=="thread_name"]
+            assert tracks==["window 1", "window 2"], tracks
+            flow = [e for e in events if e.get("ph")=="s"][0]
+            assert flow["id"]==(1<<32) | 10
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
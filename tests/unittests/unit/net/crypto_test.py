@@ -12,6 +12,7 @@ from xpra.util import envbool
 
 from xpra.net.crypto import (
     DEFAULT_SALT, DEFAULT_ITERATIONS, DEFAULT_KEYSIZE, DEFAULT_KEY_HASH, DEFAULT_IV,
+    AEAD_MODE, AEAD_TAG_SIZE,
     crypto_backend_init,
     )
 
@@ -28,7 +29,47 @@ class TestCrypto(unittest.TestCase):
     def test_crypto(self):
         from xpra.net.crypto import get_modes
         for mode in get_modes():
-            self.do_test_roundtrip(mode=mode)
+            if mode!=AEAD_MODE:
+                self.do_test_roundtrip(mode=mode)
+
+    def test_aead(self):
+        from xpra.net.crypto import get_ciphers, get_encryptor, get_decryptor
+        args = DEFAULT_IV, "this is our secret", DEFAULT_SALT, DEFAULT_KEY_HASH, 32, DEFAULT_ITERATIONS
+        header = b"P\x02\x00\x00\x00\x00\x00\x10"
+        message = b"0123456789ABCDEF"
+        for cipher in get_ciphers():
+            enc, block_size = get_encryptor(f"{cipher}-{AEAD_MODE}", *args)
+            assert block_size==0
+            dec = get_decryptor(f"{cipher}-{AEAD_MODE}", *args)[0]
+            encrypted = [enc.encrypt(message, header) for _ in range(3)]
+            assert all(len(v)==len(message)+AEAD_TAG_SIZE for v in encrypted)
+            #each packet uses a different nonce:
+            assert len(set(encrypted))==3
+            buf = bytearray(len(message)+AEAD_TAG_SIZE)
+            enc.encrypt_into(message, header, memoryview(buf))
+            encrypted.append(bytes(buf))
+            for v in encrypted:
+                assert dec.decrypt(memoryview(v), header)==message
+            #the header is authenticated:
+            v = enc.encrypt(message, header)
+            with self.assertRaises(Exception):
+                dec.decrypt(v, header[:-1]+b"\x11")
+        with self.assertRaises(ValueError):
+            get_encryptor("ChaCha20-CBC", *args)
+
+    def test_first_packet(self):
+        from xpra.net import crypto
+        saved = crypto.ENCRYPT_FIRST_PACKET
+        try:
+            crypto.ENCRYPT_FIRST_PACKET = True
+            assert crypto.can_encrypt_first_packet("AES-CBC")
+            #the default iv and salt would re-use the nonces:
+            assert not crypto.can_encrypt_first_packet(f"AES-{AEAD_MODE}")
+            assert not crypto.can_encrypt_first_packet("ChaCha20")
+            crypto.ENCRYPT_FIRST_PACKET = False
+            assert not crypto.can_encrypt_first_packet("AES-CBC")
+        finally:
+            crypto.ENCRYPT_FIRST_PACKET = saved
 
     def do_test_roundtrip(self, message=b"some message1234", encrypt_count=1, decrypt_count=1, mode="CBC"):
         from xpra.net.crypto import get_cipher_encryptor, get_cipher_decryptor, get_key
@@ -5,15 +5,78 @@
 # later version. See the file COPYING for details.
 
 import os
+import tempfile
 import unittest
 
 from xpra.util import typedict
+from xpra.net import file_transfer
 from xpra.net.file_transfer import (
-    basename, safe_open_download_file,
+    basename, safe_open_download_file, load_file_data,
     FileTransferAttributes, FileTransferHandler,
     )
 
 
+class LoopbackFileTransferHandler(FileTransferHandler):
+
+    def __init__(self):
+        self.packets = []
+        self.timers = []
+        self.timeout_add = self.add_timer
+        self.idle_add = self.add_timer
+        self.source_remove = self.remove_timer
+        super().__init__()
+        self.init_attributes("yes", "1G", "no", "no", "no")
+
+    def add_timer(self, *args):
+        self.timers.append(args)
+        return len(self.timers)
+
+    def remove_timer(self, _timer):
+        pass
+
+    def send(self, *parts):
+        self.packets.append(parts)
+
+    def compressed_wrapper(self, datatype, data, level=5):
+        return data
+
+    def get_file_transfer_peer_id(self):
+        return "loopback"
+
+    def connect(self, peer):
+        caps = typedict({"file" : peer.get_file_transfer_info()})
+        self.parse_file_transfer_caps(caps)
+        self.peer = peer
+
+    def process_packets(self, max_packets=-1):
+        count = 0
+        handlers = {
+            "send-file"         : self.peer._process_send_file,
+            "send-file-chunk"   : self.peer._process_send_file_chunk,
+            "ack-file-chunk"    : self.peer._process_ack_file_chunk,
+            }
+        while self.packets and count!=max_packets:
+            packet = self.packets.pop(0)
+            handlers[packet[0]](packet)
+            count += 1
+        return count
+
+def connect_pair():
+    sender = LoopbackFileTransferHandler()
+    receiver = LoopbackFileTransferHandler()
+    sender.connect(receiver)
+    receiver.connect(sender)
+    return sender, receiver
+
+def pump(*handlers, max_packets=-1):
+    count = 0
+    while count!=max_packets:
+        n = sum(h.process_packets(1) for h in handlers)
+        if not n:
+            break
+        count += n
+
+
 class TestVersionUtilModule(unittest.TestCase):
 
     def test_basename(self):
@@ -53,6 +116,144 @@ class TestVersionUtilModule(unittest.TestCase):
         assert fth.get_info()
         fth.cleanup()
 
+    def test_load_file_data(self):
+        with tempfile.NamedTemporaryFile() as f:
+            assert not load_file_data(f.name)
+            f.write(b"hello")
+            f.flush()
+            data = load_file_data(f.name)
+            assert len(data)==5
+            reader = data.open()
+            try:
+                assert reader[1:3]==b"el"
+                assert reader[:]==b"hello"
+                #the file is read on demand, so it must not change while it is being sent:
+                f.truncate(0)
+                f.flush()
+                with self.assertRaises(OSError):
+                    reader.read(0, 5)
+                #nor before the transfer starts:
+                with self.assertRaises(OSError):
+                    data.open()
+            finally:
+                reader.close()
+
+
+class TestChunkedTransfer(unittest.TestCase):
+
+    def setUp(self):
+        self.download_dir = tempfile.TemporaryDirectory()
+        os.environ["XPRA_DOWNLOAD_DIR"] = self.download_dir.name
+
+    def tearDown(self):
+        os.environ.pop("XPRA_DOWNLOAD_DIR", None)
+        self.download_dir.cleanup()
+        file_transfer.resumable_sends.clear()
+        file_transfer.resumable_receives.clear()
+        file_transfer.expire_timer = 0
+
+    def get_downloaded_data(self):
+        files = os.listdir(self.download_dir.name)
+        assert len(files)==1, f"expected one file but found {files}"
+        with open(os.path.join(self.download_dir.name, files[0]), "rb") as f:
+            return f.read()
+
+    def test_windowed_transfer(self):
+        sender, receiver = connect_pair()
+        data = os.urandom(1024*1024+123)
+        assert sender.send_file("test.bin", "", data, len(data))
+        #process the 'send-file' and the first ack:
+        pump(sender, receiver, max_packets=2)
+        #the sender does not wait for each ack:
+        chunks = [p for p in sender.packets if p[0]=="send-file-chunk"]
+        assert len(chunks)==file_transfer.FILE_CHUNKS_WINDOW
+        pump(sender, receiver)
+        assert not sender.send_chunks_in_progress
+        assert not receiver.receive_chunks_in_progress
+        assert self.get_downloaded_data()==data
+
+    def test_resume(self):
+        sender, receiver = connect_pair()
+        data = os.urandom(1024*1024)
+        assert sender.send_file("test.bin", "", data, len(data))
+        pump(sender, receiver, max_packets=8)
+        #connection lost:
+        sender.interrupt_file_transfers()
+        receiver.interrupt_file_transfers()
+        assert file_transfer.resumable_sends and file_transfer.resumable_receives
+        #reconnect:
+        sender, receiver = connect_pair()
+        sender.resume_file_transfers()
+        assert sender.packets[0][0]=="send-file"
+        pump(sender, receiver, max_packets=2)
+        #the receiver tells us where to resume from:
+        chunk_state = tuple(sender.send_chunks_in_progress.values())[0]
+        assert chunk_state.acked>0
+        pump(sender, receiver)
+        assert not sender.send_chunks_in_progress
+        assert self.get_downloaded_data()==data
+
+    def test_expire(self):
+        sender, receiver = connect_pair()
+        data = os.urandom(1024*1024)
+        assert sender.send_file("test.bin", "", data, len(data))
+        pump(sender, receiver, max_packets=8)
+        sender.interrupt_file_transfers()
+        receiver.interrupt_file_transfers()
+        #a single timer expires the interrupted transfers:
+        timers = [t for t in sender.timers+receiver.timers if t[1].__name__=="expire"]
+        assert len(timers)==1 and file_transfer.expire_timer
+        for state in (*file_transfer.resumable_sends.values(), *file_transfer.resumable_receives.values()):
+            state.interrupted -= file_transfer.RESUME_TIMEOUT+1
+        timers[0][1]()
+        assert not file_transfer.resumable_sends and not file_transfer.resumable_receives
+        assert not file_transfer.expire_timer
+        assert not os.listdir(self.download_dir.name)
+
+    def test_send_from_disk(self):
+        sender, receiver = connect_pair()
+        data = os.urandom(1024*1024+123)
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(data)
+            f.flush()
+            source = file_transfer.load_file_data(f.name)
+            assert sender.send_file("test.bin", "", source, len(source))
+            chunk_state = tuple(sender.send_chunks_in_progress.values())[0]
+            assert isinstance(chunk_state.data, file_transfer.FileReader)
+            pump(sender, receiver)
+            assert not sender.send_chunks_in_progress
+            assert self.get_downloaded_data()==data
+            #the file descriptor is closed once the transfer completes:
+            assert chunk_state.data.fd<0
+
+    def test_file_modified(self):
+        sender, receiver = connect_pair()
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(os.urandom(8*1024*1024))
+            f.flush()
+            source = file_transfer.load_file_data(f.name)
+            assert sender.send_file("test.bin", "", source, len(source))
+            chunk_state = tuple(sender.send_chunks_in_progress.values())[0]
+            pump(sender, receiver, max_packets=2)
+            f.truncate(1024)
+            f.flush()
+            pump(sender, receiver)
+            #the transfer is aborted instead of sending the wrong data:
+            assert not sender.send_chunks_in_progress
+            assert chunk_state.data.fd<0
+            assert chunk_state.acked<len(source)
+
+    def test_no_resume(self):
+        sender, receiver = connect_pair()
+        sender.remote_file_resume = receiver.remote_file_resume = False
+        data = os.urandom(1024*1024)
+        assert sender.send_file("test.bin", "", data, len(data))
+        pump(sender, receiver, max_packets=8)
+        sender.interrupt_file_transfers()
+        receiver.interrupt_file_transfers()
+        #the peer cannot resume these transfers, so we don't keep them:
+        assert not file_transfer.resumable_sends and not file_transfer.resumable_receives
+
 
 def main():
     unittest.main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import mmap
+import unittest
+
+from xpra.net.mmap_pipe import MmapRing, MmapRings, MmapRingReader, mmap_ack, RING_HEADER_SIZE
+
+MB = 1024*1024
+
+
+class TestMmapRings(unittest.TestCase):
+
+    def test_ring(self):
+        area = mmap.mmap(-1, 64*1024)
+        ring = MmapRing(area, 4096, 1024)
+        assert ring.is_empty()
+        data = b"0123456789"*20
+        l = len(data)
+        pos = ring.write(data)
+        assert pos==4096+RING_HEADER_SIZE
+        assert area[pos:pos+l]==data
+        assert ring.used()==l
+        #the data is never split, so we run out of space:
+        positions = [pos]
+        while True:
+            pos = ring.write(data)
+            if pos is None:
+                break
+            positions.append(pos)
+        assert len(positions)==5
+        assert ring.fallbacks==1
+        #the client reads the first two frames, the next one wraps around:
+        mmap_ack(area, 4096, positions[1]+l)
+        pos = ring.write(data)
+        assert pos==ring.data_start
+        assert area[pos:pos+l]==data
+        assert ring.used()>=4*l
+        #once the client has read everything, we restart from the beginning:
+        mmap_ack(area, 4096, pos+l)
+        assert ring.is_empty()
+        assert ring.write(data)==ring.data_start
+        #too big for this ring:
+        assert ring.write(b"0"*1024) is None
+        info = ring.get_info()
+        assert info["fallbacks"]==2
+        assert info["writes"]==7
+
+    def test_rings(self):
+        area = mmap.mmap(-1, 64*MB)
+        rings = MmapRings(area, 64*MB, min_ring_size=1*MB, ring_frames=4)
+        r1 = rings.get_ring(1, 100*1024)
+        assert r1.size==1*MB
+        assert rings.get_ring(1, 100*1024) is r1
+        r2 = rings.get_ring(2, 100*1024)
+        assert r2.offset>=r1.offset+r1.size
+        #the client has not read this frame yet:
+        pos = r1.write(b"0"*1024)
+        #bigger frames need a bigger ring:
+        r1b = rings.get_ring(1, 1000*1024)
+        assert r1b is not r1 and r1b.size==4*MB
+        assert rings.get_info()["released"]==1
+        #frames can't be bigger than half the area:
+        r3 = rings.get_ring(3, 100*MB)
+        assert r3.size==rings.max_ring_size
+        #no space left for another big ring:
+        assert rings.get_ring(4, 100*MB) is None
+        assert rings.allocation_failures==1
+        #once released and read, the space is re-used:
+        rings.release(3)
+        assert rings.get_ring(4, 100*MB).offset==r3.offset
+        #the ring released by window 1 still has data in it:
+        rings.release(4)
+        rings.release(2)
+        with rings.lock:
+            rings.reclaim()
+            assert len(rings.released)==1
+        mmap_ack(area, r1.offset, pos+1024)
+        with rings.lock:
+            rings.reclaim()
+            assert not rings.released
+        info = rings.get_info()
+        assert list(info["rings"].keys())==[1]
+        assert info["free"]==rings.max_ring_size*2-r1b.size
+
+    def test_unacked_ring(self):
+        area = mmap.mmap(-1, 16*MB)
+        rings = MmapRings(area, 16*MB, min_ring_size=1*MB, ring_frames=4)
+        r1 = rings.get_ring(1, 100*1024)
+        pos = r1.write(b"0"*1024)
+        rings.release(1)
+        #the client may still be painting from it:
+        with rings.lock:
+            assert not rings.reclaim()
+        #until the window's backing is closed and releases the region:
+        reader = MmapRingReader(area)
+        reader.skip(r1.offset, pos, 1024)
+        with rings.lock:
+            assert rings.reclaim()
+            assert not rings.released
+
+    def test_out_of_order_acks(self):
+        area = mmap.mmap(-1, 64*1024)
+        ring = MmapRing(area, 4096, 4096)
+        reader = MmapRingReader(area)
+        data = b"x"*512
+        regions = []
+        for _ in range(3):
+            pos = ring.write(data)
+            regions.append((pos, reader.read(ring.offset, pos, len(data))))
+        used = ring.used()
+        #the last two paints complete first, the first region is still in use:
+        reader.release(ring.offset, regions[2][1][0])
+        reader.release(ring.offset, regions[1][1][0])
+        assert ring.used()==used
+        view = regions[0][1][1]
+        assert bytes(view)==data
+        #releasing it frees all three regions:
+        reader.release(ring.offset, regions[0][1][0])
+        assert ring.is_empty()
+        assert reader.get_info()["regions"]==0
+        #releasing twice does not move the read index back:
+        reader.release(ring.offset, regions[1][1][0])
+        assert ring.is_empty()
+
+    def test_close_with_view(self):
+        area = mmap.mmap(-1, 64*1024)
+        ring = MmapRing(area, 4096, 4096)
+        reader = MmapRingReader(area)
+        pos = ring.write(b"y"*256)
+        rid, view = reader.read(ring.offset, pos, 256)
+        reader.close()
+        assert area.closed
+        try:
+            bytes(view)
+        except ValueError:
+            pass
+        else:
+            raise RuntimeError("the view should have been released")
+        #releasing it afterwards is harmless:
+        reader.release(ring.offset, rid)
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -32,6 +32,10 @@ class TestPacketEncoding(unittest.TestCase):
                 except Exception:
                     print("error calling decode(%s, %s) for encoder %s" % (v, flag, x))
                     raise
+        caps = packet_encoding.get_packet_encoding_caps(2)
+        for x in packet_encoding.get_enabled_encoders():
+            if x!="none":
+                assert caps[x].get("version"), f"missing {x} version in {caps[x]}"
         #one-shot function:
         assert packet_encoding.pack_one_packet(["hello", {}])
 
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import random
+import unittest
+
+from xpra.net.protocol.header import pack_header, unpack_header
+from xpra.net.protocol.packet_reader import PacketReader
+
+
+def payload_size(header:bytes) -> int:
+    if header[:1]!=b"P":
+        return -1
+    return unpack_header(header)[4]
+
+
+class StreamReader:
+    """ returns the stream in chunks of random sizes """
+    def __init__(self, data:bytes, max_chunk:int):
+        self.data = data
+        self.pos = 0
+        self.max_chunk = max_chunk
+
+    def read_into(self, buf) -> int:
+        n = min(len(buf), len(self.data)-self.pos, random.randint(1, self.max_chunk))
+        buf[:n] = self.data[self.pos:self.pos+n]
+        self.pos += n
+        return n
+
+
+def read_all(reader:PacketReader):
+    bufs = []
+    while True:
+        r = reader.read()
+        if r is None:
+            return bufs
+        bufs += r
+
+
+class TestPacketReader(unittest.TestCase):
+
+    def test_stream(self):
+        sizes = (1, 10, 1000, 65535, 65536, 100000, 1024*1024, 5, 200000)
+        payloads = [bytes([i])*size for i, size in enumerate(sizes)]
+        data = b"".join(pack_header(0, 0, 0, len(p))+p for p in payloads)
+        for max_chunk in (7, 4096, 65536, 1024*1024):
+            random.seed(max_chunk)
+            stream = StreamReader(data, max_chunk)
+            reader = PacketReader(stream.read_into, payload_size, 1024, 256*1024, 65536)
+            bufs = read_all(reader)
+            assert b"".join(bytes(b) for b in bufs)==data
+            #the large payloads are received as a single buffer:
+            large = [bytes(b) for b in bufs if isinstance(b, memoryview)]
+            assert all(p in payloads and len(p)>=65536 for p in large)
+            if max_chunk<65536:
+                assert large==[p for p in payloads if len(p)>=65536]
+            assert reader.read_size<=256*1024
+
+    def test_invalid_header(self):
+        data = pack_header(0, 0, 0, 10)+b"0"*10+b"garbage"*1000+pack_header(0, 0, 0, 100000)+b"1"*100000
+        stream = StreamReader(data, 100)
+        reader = PacketReader(stream.read_into, payload_size, 1024)
+        bufs = read_all(reader)
+        assert not reader.framing
+        assert b"".join(bytes(b) for b in bufs)==data
+        assert not any(isinstance(b, memoryview) for b in bufs)
+
+    def test_read_size(self):
+        sizes = []
+        def read_into(buf):
+            n = min(len(buf), sizes.pop(0))
+            buf[:n] = b"0"*n
+            return n
+        reader = PacketReader(read_into, lambda _header : -1, 16, 1024)
+        #grows when the reads fill the buffer:
+        sizes += [1024]*10
+        for _ in range(10):
+            reader.read()
+        assert reader.read_size==1024
+        #shrinks when they don't:
+        sizes += [1]*10
+        for _ in range(10):
+            reader.read()
+        assert reader.read_size==16
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
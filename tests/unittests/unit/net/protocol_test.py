@@ -6,15 +6,20 @@
 
 import os
 import time
+import socket
 import unittest
+from threading import Event, Thread
 from gi.repository import GLib  # @UnresolvedImport
 
 from xpra.util import csv, envint, envbool
+from xpra.os_util import memoryview_to_bytes
 from xpra.common import noop
 from xpra.net.protocol import socket_handler
 from xpra.net.protocol import check
 from xpra.net.protocol.constants import CONNECTION_LOST
-from xpra.net.bytestreams import Connection
+from xpra.net.protocol.header import FLAGS_OOB, FLAGS_RENCODEPLUS, pack_header
+from xpra.net.packet_encoding import MAX_OOB_BUFFERS
+from xpra.net.bytestreams import Connection, SocketConnection
 from xpra.net.compression import Compressed
 from xpra.log import Logger
 
@@ -167,6 +172,176 @@ class ProtocolTest(unittest.TestCase):
                 items = p.encode(packet)
                 assert items
 
+    def test_oob_buffers(self):
+        p = self.make_memory_protocol()
+        p.enable_encoder("rencodeplus")
+        p.send_oob_buffers = True
+        data = os.urandom(256*1024)
+        packet = ("clipboard-contents", 1, {"data" : data, "small" : b"x"})
+        chunks = p.encode(packet)
+        assert len(chunks)==2
+        proto_flags, index, _, oob = chunks[0]
+        assert proto_flags & FLAGS_OOB and index==0
+        assert oob is data, "the buffer should not be copied"
+        #send it and parse it back:
+        items = []
+        def raw_write(write_items, *_args):
+            items.extend(write_items)
+        p.raw_write = raw_write
+        p._add_packet_to_queue(packet)
+        received = []
+        def process_packet_cb(proto, packet):
+            received.append(packet)
+            proto._closed = True
+        proto = self.make_memory_protocol(process_packet_cb=process_packet_cb)
+        proto._process_read(b"".join(items))
+        proto.do_read_parse_thread_loop()
+        assert len(received)==1
+        assert received[0][0]=="clipboard-contents"
+        assert received[0][2]["data"]==data
+        assert received[0][2]["small"]==b"x"
+
+    def test_oob_buffers_limit(self):
+        if self.protocol_class!=socket_handler.SocketProtocol:
+            return
+        def parse(indexes):
+            data = b"".join(pack_header(FLAGS_RENCODEPLUS | FLAGS_OOB, 0, i, 4)+b"oob!" for i in indexes)
+            errors = []
+            proto = self.make_memory_protocol()
+            proto.invalid = lambda msg, _data: errors.append(msg)
+            proto.invalid_header = lambda _proto, _data, msg: errors.append(msg)
+            proto._process_read(data)
+            proto._process_read(b"")
+            proto.do_read_parse_thread_loop()
+            return errors
+        assert not parse(range(MAX_OOB_BUFFERS))
+        for indexes in (range(MAX_OOB_BUFFERS+1), (MAX_OOB_BUFFERS, ), (200, ), (1, 1)):
+            assert parse(indexes), f"{indexes} should have been rejected"
+
+    def test_aead_encryption(self):
+        from xpra.net.crypto import crypto_backend_init, get_ciphers, get_modes, AEAD_MODE
+        if not crypto_backend_init() or AEAD_MODE not in get_modes():
+            return
+        args = "0000000000000000", "secret", "salt", "SHA256", 32, 1000, "PKCS#7"
+        for cipher in get_ciphers():
+            ciphername = f"{cipher}-{AEAD_MODE}"
+            writer = self.make_memory_protocol()
+            writer.enable_encoder("rencodeplus")
+            writer.set_cipher_out(ciphername, *args)
+            items = []
+            def raw_write(write_items, *_args):
+                items.extend(write_items)
+            writer.raw_write = raw_write
+            packets = (
+                ("ping", 1, 2, 3),
+                ("draw", 1, 0, 0, 512, 512, "rgb32", Compressed("pixels", os.urandom(100000)), 1, 2048, {}),
+                ("ping", 4, 5, 6),
+                )
+            for packet in packets:
+                writer._add_packet_to_queue(packet)
+            data = b"".join(memoryview_to_bytes(item) for item in items)
+            for tamper in (False, True):
+                received = []
+                errors = []
+                def process_packet_cb(proto, packet):
+                    received.append(packet)
+                    if len(received)==len(packets):
+                        proto._closed = True
+                proto = self.make_memory_protocol(process_packet_cb=process_packet_cb)
+                proto.set_cipher_in(ciphername, *args)
+                proto._internal_error = errors.append
+                if tamper:
+                    #corrupt the tag of the last packet:
+                    proto._process_read(data[:-1]+bytes([data[-1]^1]))
+                else:
+                    proto._process_read(data)
+                proto._process_read(b"")
+                proto.do_read_parse_thread_loop()
+                if tamper:
+                    assert errors and len(received)<len(packets)
+                else:
+                    assert not errors
+                    assert [p[0] for p in received]==[p[0] for p in packets]
+                    assert received[1][7]==packets[1][7].data
+
+    def test_read_into(self):
+        writer = self.make_memory_protocol()
+        writer.enable_encoder("rencodeplus")
+        items = []
+        def raw_write(write_items, *_args):
+            items.extend(write_items)
+        writer.raw_write = raw_write
+        pixels = os.urandom(1024*1024)
+        packets = (
+            ("ping", 1, 2, 3),
+            ("draw", 1, 0, 0, 512, 512, "rgb32", Compressed("pixels", pixels), 1, 2048, {}),
+            ("cursor", "png", Compressed("pixels", pixels)),
+            ("ping", 4, 5, 6),
+            )
+        for packet in packets:
+            writer._add_packet_to_queue(packet)
+        sock, other = socket.socketpair()
+        received = []
+        done = Event()
+        def process_packet_cb(_proto, packet):
+            received.append(packet)
+            if len(received)==len(packets):
+                done.set()
+        conn = SocketConnection(sock, "local", "remote", "target", "socket")
+        proto = self.protocol_class(GLib, conn, process_packet_cb)
+        try:
+            proto._read_thread.start()
+            other.sendall(b"".join(memoryview_to_bytes(item) for item in items))
+            assert done.wait(TIMEOUT)
+        finally:
+            proto.close()
+            other.close()
+        assert [p[0] for p in received]==[p[0] for p in packets]
+        draw = received[1]
+        assert draw[7]==pixels
+        if self.protocol_class==socket_handler.SocketProtocol:
+            assert proto._packet_reader
+            assert isinstance(draw[7], memoryview), "pixel data should be received directly"
+        #other packet types don't get a memoryview:
+        assert received[2][2]==pixels and isinstance(received[2][2], bytes)
+
+    def test_write_coalescing(self):
+        sock, other = socket.socketpair()
+        conn = SocketConnection(sock, "local", "remote", "target", "socket")
+        proto = self.protocol_class(GLib, conn, noop)
+        proto.enable_encoder("rencodeplus")
+        #don't start the write thread, we call _write() ourselves:
+        proto._write_thread = Thread(target=noop)
+        started = []
+        ended = []
+        packets = [("ping", i, 0, 0) for i in range(10)]
+        packets.insert(5, ("draw", 1, 0, 0, 512, 512, "rgb32", Compressed("pixels", os.urandom(64*1024)), 1, 2048, {}))
+        for packet in packets:
+            proto._add_packet_to_queue(packet, started.append, ended.append)
+        try:
+            assert proto.output_backlog>64*1024
+            #the 5 pings before the draw packet are merged, then the draw packet is sent on its own:
+            assert proto._write()
+            assert proto.output_coalesced==5
+            assert proto.output_packetcount==6
+            assert proto._write()
+            assert proto.output_coalesced==10
+            assert proto.output_packetcount==len(packets)
+            assert proto.output_backlog==0
+            assert len(started)==len(ended)==len(packets)
+            assert started==sorted(started) and ended==sorted(ended)
+            size = conn.output_bytecount
+            received = b""
+            while len(received)<size:
+                received += other.recv(size-len(received))
+            writes = conn.output_writecount
+            assert writes<len(packets), f"expected fewer than {len(packets)} writes, got {writes}"
+            info = proto.get_info()
+            assert info["output"]["coalesce"]["packets"]==10
+        finally:
+            proto.close()
+            other.close()
+
     def test_read_speed(self):
         if not SHOW_PERF:
             return
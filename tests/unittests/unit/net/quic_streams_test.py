@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+from queue import Queue, Empty
+from subprocess import run, DEVNULL
+
+from xpra.net.websockets.header import encode_hybi_header
+from xpra.net.websockets.common import OPCODE_BINARY
+
+try:
+    from xpra.net.quic import connection
+except ImportError:
+    connection = None
+
+
+def frame(data:bytes) -> bytes:
+    return encode_hybi_header(OPCODE_BINARY, len(data)) + data
+
+
+def make_cert(dirname:str):
+    cert = os.path.join(dirname, "cert.pem")
+    key = os.path.join(dirname, "key.pem")
+    cmd = ["openssl", "req", "-x509", "-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:prime256v1",
+           "-nodes", "-days", "1", "-subj", "/CN=localhost", "-keyout", key, "-out", cert]
+    run(cmd, stdout=DEVNULL, stderr=DEVNULL, check=True)
+    return cert, key
+
+
+class FakeServer:
+    def __init__(self, cert, key):
+        self.cert = cert
+        self.key = key
+        self.connections = Queue()
+
+    def get_ssl_socket_options(self, _options):
+        return {"cert" : self.cert, "key" : self.key}
+
+    def make_protocol(self, _socktype, conn, _options, protocol_class=None):
+        assert protocol_class
+        self.connections.put(conn)
+
+
+@unittest.skipIf(connection is None, "aioquic not found")
+class TestQuicStreams(unittest.TestCase):
+
+    def test_stream_types(self):
+        get_stream_type = connection.get_stream_type
+        assert get_stream_type("") == ""
+        assert get_stream_type("hello") == ""
+        assert get_stream_type("pointer-position") == ""
+        assert get_stream_type("sound-data") == "audio"
+        assert get_stream_type("send-file-chunk") == "bulk"
+        n = connection.WINDOW_STREAMS
+        assert get_stream_type("draw:1") == f"window-{1 % n}"
+        assert get_stream_type("eos:1") == get_stream_type("draw:1")
+        #the window lifecycle packets stay on the main stream:
+        assert get_stream_type("new-window:1") == ""
+        assert get_stream_type("window-metadata:1") == ""
+        assert get_stream_type("draw:1:datagram") == get_stream_type("draw:1")
+        assert get_stream_type(f"draw:{n+2}") == get_stream_type("draw:2")
+        #not a window packet type:
+        assert get_stream_type("hello:1") == ""
+        #fewer window streams:
+        assert get_stream_type("draw:3", 2) == "window-1"
+        assert get_stream_type("draw:3", 0) == ""
+
+    def test_substreams_limit(self):
+        for limit, window_streams in ((-1, connection.WINDOW_STREAMS), (0, 0), (2, 0), (5, 2), (100, connection.WINDOW_STREAMS)):
+            conn = connection.XpraQuicConnection(None, 0, lambda : None, "localhost", 0)
+            conn.substreams = conn.hello_sent = True
+            conn.get_substreams_limit = lambda limit=limit : limit
+            allocated = []
+            def allocate(_stream_type):
+                allocated.append(4*(len(allocated)+1))
+                return allocated[-1]
+            conn.allocate_new_stream_id = allocate
+            for wid in range(20):
+                conn.get_packet_stream_id(f"draw:{wid}")
+            for packet_type in ("sound-data", "webcam-frame", "send-file-chunk"):
+                conn.get_packet_stream_id(packet_type)
+            assert conn.window_streams==window_streams
+            if limit>=0:
+                assert len(allocated)<=limit, f"{len(allocated)} substreams allocated, limit is {limit}"
+            #the draw packets of a window always use the same stream:
+            assert conn.get_packet_stream_id("draw:7")==conn.get_packet_stream_id("eos:7")
+            assert conn.get_packet_stream_id("draw:7")==conn.get_packet_stream_id("draw:7:datagram")
+
+    def test_stream_frames(self):
+        frames = [frame(b"a"*n) for n in (0, 1, 125, 126, 1000, 65535, 65536, 100000)]
+        data = b"".join(frames)
+        for chunk_size in (1, 2, 7, 1024, len(data)):
+            sf = connection.StreamFrames()
+            out = []
+            for i in range(0, len(data), chunk_size):
+                out += sf.add(memoryview(data)[i:i+chunk_size])
+            assert out == frames, f"failed with chunk size {chunk_size}"
+            assert sf.size == 0 and not sf.chunks
+
+    def test_interleaved_streams(self):
+        conn = connection.XpraQuicConnection(None, 0, lambda : None, "localhost", 0)
+        a = [frame(b"a"*1000), frame(b"b"*200000)]
+        b = [frame(b"c"*10), frame(b"d"*70000)]
+        da = b"".join(a)
+        db = b"".join(b)
+        size = 1200
+        for i in range(0, max(len(da), len(db)), size):
+            if i<len(db):
+                conn.stream_data_received(4, db[i:i+size])
+            if i<len(da):
+                conn.stream_data_received(0, da[i:i+size])
+        received = []
+        while conn.read_queue.qsize():
+            received.append(conn.read_queue.get())
+        #each frame is intact and the order within each stream is preserved:
+        assert [x for x in received if x in a] == a
+        assert [x for x in received if x in b] == b
+        assert len(received) == 4
+
+    def test_invalid_substream_header(self):
+        from aioquic.h3.events import HeadersReceived
+        from xpra.net.quic.listener import HttpServerProtocol
+        class FakeProtocol:
+            _handlers = {}
+        for value in (b"foo", b"", b"12"):
+            event = HeadersReceived(headers=[(b"substream", value)], stream_id=4, stream_ended=False)
+            assert HttpServerProtocol.get_substream_parent(FakeProtocol(), event) is None
+
+    def test_encrypted_substreams(self):
+        from xpra.net.crypto import crypto_backend_init, get_ciphers, get_modes
+        if not crypto_backend_init() or not get_ciphers():
+            self.skipTest("no crypto backend")
+        try:
+            from gi.repository import GLib  # @UnresolvedImport
+        except ImportError:
+            self.skipTest("GLib not found")
+        from xpra.os_util import memoryview_to_bytes
+        from xpra.common import noop
+        from xpra.net import packet_encoding, compression
+        from xpra.net.compression import Compressed
+        from xpra.net.protocol.socket_handler import SocketProtocol
+        packet_encoding.init_all()
+        compression.init_all()
+        args = "0000000000000000", "secret", "salt", "SHA256", 32, 1000, "PKCS#7"
+        cipher = get_ciphers()[0]
+        packets = (
+            ("ping", 1, 2, 3),
+            ("draw", 1, 0, 0, 64, 64, "rgb32", Compressed("pixels", os.urandom(16384)), 1, 256, {}),
+            ("sound-data", "opus", b"a"*1000, {}),
+            ("draw", 2, 0, 0, 16, 16, "rgb32", Compressed("pixels", os.urandom(1024)), 2, 64, {"datagram" : 1}),
+            ("send-file-chunk", "chunk-id", 1, b"f"*10000, False),
+            ("ping", 4, 5, 6),
+            )
+        for mode in get_modes():
+            ciphername = f"{cipher}-{mode}"
+            conn = connection.XpraQuicConnection(None, 0, lambda : None, "localhost", 0)
+            #as if both ends had agreed to use substreams and datagrams:
+            conn.substreams = conn.hello_sent = conn.draw_datagrams = True
+            conn.allocate_new_stream_id = lambda _stream_type : 4*(len(conn._stream_ids)+1)
+            writer = SocketProtocol(GLib, conn, noop)
+            writer.enable_encoder("rencodeplus")
+            writer.set_cipher_out(ciphername, *args)
+            streams = {}
+            def raw_write(items, packet_type, *_args):
+                assert not conn.use_datagram(packet_type), f"{packet_type} sent as a datagram"
+                stream_id = conn.get_packet_stream_id(packet_type)
+                streams.setdefault(stream_id, []).extend(memoryview_to_bytes(item) for item in items)
+            writer.raw_write = raw_write
+            for packet in packets:
+                writer._add_packet_to_queue(packet)
+            assert list(streams.keys())==[conn.stream_id], f"{ciphername} used streams {list(streams.keys())}"
+            #quic may deliver the streams in any order, start with the last one:
+            data = b"".join(b"".join(streams[stream_id]) for stream_id in sorted(streams, reverse=True))
+            received = []
+            errors = []
+            def process_packet_cb(proto, packet):
+                received.append(packet)
+                if len(received)==len(packets):
+                    proto._closed = True
+            rconn = connection.XpraQuicConnection(None, 0, lambda : None, "localhost", 0)
+            reader = SocketProtocol(GLib, rconn, process_packet_cb)
+            reader.set_cipher_in(ciphername, *args)
+            reader._internal_error = errors.append
+            reader._process_read(data)
+            reader._process_read(b"")
+            reader.do_read_parse_thread_loop()
+            assert not errors, f"{ciphername} errors: {errors}"
+            assert [p[0] for p in received]==[p[0] for p in packets]
+            assert received[1][7]==packets[1][7].data
+
+    @unittest.skipIf(not shutil.which("openssl"), "openssl not found")
+    def test_loopback(self):
+        from xpra.net.quic.listener import listen_quic
+        from xpra.net.quic.client import quic_connect
+        from xpra.net.socket_util import create_udp_socket
+        with tempfile.TemporaryDirectory() as d:
+            cert, key = make_cert(d)
+            server = FakeServer(cert, key)
+            sock = create_udp_socket("127.0.0.1", 0, socket.AF_INET)
+            port = sock.getsockname()[1]
+            listen_quic(sock, server, {})
+            client = quic_connect("127.0.0.1", port, "/", "", "", "", None, "none", "")
+            try:
+                client.write(frame(b"hello"), "hello")
+                client.write(frame(b"file"*1000), "send-file-chunk")
+                sconn = server.connections.get(timeout=10)
+                received = [sconn.read(65536), sconn.read(65536)]
+                assert frame(b"hello") in received
+                assert frame(b"file"*1000) in received
+                assert sconn.substreams and client.substreams
+                #the client opened a stream for the bulk data:
+                assert "bulk" in client._stream_ids
+
+                pixels = frame(b"p"*500000)
+                #not until the 'hello' has been sent:
+                assert sconn.get_packet_stream_id("draw:1")==sconn.stream_id
+                sconn.write(frame(b"hello"), "hello")
+                assert client.read_queue.get(timeout=10)==frame(b"hello")
+                sconn.write(pixels, "draw:1")
+                sconn.write(frame(b"pong"), "pointer-position")
+                received = [client.read_queue.get(timeout=10) for _ in range(2)]
+                assert pixels in received and frame(b"pong") in received
+                window_stream = sconn._stream_ids.get(connection.get_stream_type("draw:1"))
+                assert window_stream not in (None, sconn.stream_id)
+            finally:
+                client.close()
+                try:
+                    while True:
+                        server.connections.get_nowait().close()
+                except Empty:
+                    pass
+
+    @unittest.skipIf(not shutil.which("openssl"), "openssl not found")
+    def test_draw_datagrams(self):
+        from xpra.net.quic import client as quic_client
+        from xpra.net.quic.listener import listen_quic
+        from xpra.net.socket_util import create_udp_socket
+        saved = quic_client.DRAW_DATAGRAMS, dict(quic_client.WS_HEADERS)
+        quic_client.DRAW_DATAGRAMS = True
+        quic_client.WS_HEADERS[connection.DATAGRAMS_HEADER] = 1
+        with tempfile.TemporaryDirectory() as d:
+            cert, key = make_cert(d)
+            server = FakeServer(cert, key)
+            sock = create_udp_socket("127.0.0.1", 0, socket.AF_INET)
+            listen_quic(sock, server, {})
+            client = quic_client.quic_connect("127.0.0.1", sock.getsockname()[1], "/", "", "", "", None, "none", "")
+            try:
+                client.write(frame(b"hello"), "hello")
+                sconn = server.connections.get(timeout=10)
+                assert sconn.read(65536)==frame(b"hello")
+                assert sconn.draw_datagrams and client.draw_datagrams
+                datagrams = []
+                send_datagram = sconn.connection.send_datagram
+                def record_datagram(stream_id, data):
+                    datagrams.append(data)
+                    send_datagram(stream_id, data)
+                sconn.connection.send_datagram = record_datagram
+                #written in multiple parts, like the protocol layer does:
+                small = frame(b"s"*500)
+                sconn.write(small[:10], "draw:1:datagram")
+                sconn.write(small[10:], "draw:1:datagram")
+                large = frame(b"l"*5000)
+                sconn.write(large[:10], "draw:1:datagram")
+                sconn.write(large[10:], "draw:1:datagram")
+                #the server did not allow this one to be lost:
+                reliable = frame(b"r"*500)
+                sconn.write(reliable, "draw:1")
+                received = [client.read_queue.get(timeout=10) for _ in range(3)]
+                assert small in received and large in received and reliable in received
+                assert datagrams==[small]
+            finally:
+                quic_client.DRAW_DATAGRAMS, quic_client.WS_HEADERS = saved
+                client.close()
+                try:
+                    while True:
+                        server.connections.get_nowait().close()
+                except Empty:
+                    pass
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
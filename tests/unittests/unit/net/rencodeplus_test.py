@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import unittest
+
+try:
+    from xpra.net.rencodeplus import rencodeplus    # type: ignore[attr-defined]
+except ImportError:
+    rencodeplus = None
+
+
+#values on both sides of each encoding boundary:
+VALUES = (
+    0, 1, 43, 44, -1, -32, -33, 127, 128, -128, -129, 32767, 32768, -32768, -32769,
+    2**31-1, 2**31, -2**31, -2**31-1, 2**63-1, 2**63, -2**63, -2**63-1, 10**30,
+    0.5, -1e100,
+    "", "a", "x"*63, "x"*64, "é"*31, "é"*32, "日本"*1000,
+    b"", b"a", b"\0"*1000, memoryview(b"view"),
+    None, True, False,
+    (), tuple(range(63)), tuple(range(64)), tuple(range(1000)),
+    {}, {i : str(i) for i in range(24)}, {i : str(i) for i in range(25)},
+    ("draw", 1, 0, 0, 640, 480, "png", b"\xff"*10000, 5, 0, {"flush" : 0, "delta" : (1, 2)}),
+    )
+
+
+@unittest.skipIf(rencodeplus is None, "rencodeplus is not installed")
+class TestRencodePlus(unittest.TestCase):
+
+    def test_round_trip(self):
+        for v in VALUES:
+            expected = bytes(v) if isinstance(v, memoryview) else v
+            assert rencodeplus.loads(rencodeplus.dumps(v))==expected, f"failed for {v!r}"
+        assert rencodeplus.loads(rencodeplus.dumps(list(VALUES)))==tuple(
+            bytes(v) if isinstance(v, memoryview) else v for v in VALUES)
+
+    def test_invalid(self):
+        for v in (object(), {1, 2}, bytearray(b"foo"), 10**100):
+            with self.assertRaises(ValueError):
+                rencodeplus.dumps(v)
+
+    def test_oob(self):
+        large = b"L"*100000
+        view = memoryview(b"V"*70000)
+        packet = ("clipboard", {"data" : large, "small" : b"s"}, [view, large])
+        buffers = []
+        data = rencodeplus.dumps(packet, buffers.append)
+        assert len(data)<100
+        assert len(buffers)==3 and buffers[0] is large and buffers[1] is view
+        r = rencodeplus.loads(data, buffers)
+        assert r[1]["data"] is large and r[1]["small"]==b"s"
+        assert r[2][0] is view and r[2][1] is large
+        #the buffers are required:
+        with self.assertRaises(ValueError):
+            rencodeplus.loads(data)
+        #without a callback, everything is inline:
+        assert len(rencodeplus.dumps(packet))>270000
+
+    def test_oob_limits(self):
+        buffers = []
+        items = [b"x"*20 for _ in range(5)]
+        data = rencodeplus.dumps(items, buffers.append, 20, 3)
+        assert len(buffers)==3
+        assert rencodeplus.loads(data, buffers)==tuple(items)
+        #below the threshold:
+        buffers = []
+        data = rencodeplus.dumps(items, buffers.append, 21)
+        assert not buffers
+        assert rencodeplus.loads(data)==tuple(items)
+        with self.assertRaises(ValueError):
+            rencodeplus.dumps(items, buffers.append, 20, 1000)
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -6,7 +6,7 @@
 
 import unittest
 
-from xpra.net.websockets.header import encode_hybi_header, decode_hybi
+from xpra.net.websockets.header import encode_hybi_header, decode_hybi, hybi_frame_length
 from xpra.log import Logger
 
 log = Logger("network")
@@ -47,6 +47,17 @@ class WebsocketHeaderTest(unittest.TestCase):
                         v = decode_hybi(packet[:int(has_mask)*4+i])
                         assert v is None, "got %s" % (v,)
 
+    def test_frame_length(self):
+        for l in (0, 10, 125, 126, 65535, 65536):
+            for has_mask in (True, False):
+                h = encode_hybi_header(0, l, has_mask, True)
+                size = len(h)+int(has_mask)*4+l
+                assert hybi_frame_length(h+b"9"*4)==size
+                assert hybi_frame_length(memoryview(h))==size
+                assert hybi_frame_length(h[:1])==0
+                if len(h)>2:
+                    assert hybi_frame_length(h[:3])==0
+
 def main():
     unittest.main()
 
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import os
+import tempfile
+import unittest
+
+from xpra.os_util import OSEnvContext
+from xpra.scripts import config
+
+
+class TestConfigCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.conf_dir = os.path.join(self.tmpdir.name, "etc")
+        self.user_dir = os.path.join(self.tmpdir.name, "user")
+        os.makedirs(os.path.join(self.conf_dir, "conf.d"))
+        os.makedirs(self.user_dir)
+        self.write("user/xpra.conf", "#user config\n")
+        self.env = OSEnvContext()
+        self.env.__enter__()
+        os.environ.update({
+            "XPRA_DEFAULT_CONF_DIRS"    : "",
+            "XPRA_SYSTEM_CONF_DIRS"     : self.conf_dir,
+            "XPRA_USER_CONF_DIRS"       : self.user_dir,
+            "XPRA_USER_CACHE_DIR"       : os.path.join(self.tmpdir.name, "cache"),
+            })
+        self.saved = config.CONFIG_CACHE, config.read_xpra_defaults
+        config.CONFIG_CACHE = True
+        self.reads = 0
+        def read_xpra_defaults(*args):
+            self.reads += 1
+            return self.saved[1](*args)
+        config.read_xpra_defaults = read_xpra_defaults
+
+    def tearDown(self):
+        config.CONFIG_CACHE, config.read_xpra_defaults = self.saved
+        self.env.__exit__()
+        self.tmpdir.cleanup()
+
+    def write(self, path, contents):
+        with open(os.path.join(self.tmpdir.name, path), "w", encoding="utf8") as f:
+            f.write(contents)
+
+    def load(self):
+        return config.make_defaults_struct(username="test", uid=1000, gid=1000)
+
+    def test_cache(self):
+        self.write("etc/conf.d/10_test.conf", "speaker=off\ndpi=144\n")
+        assert self.load().dpi==144
+        assert self.reads==1
+        assert os.path.exists(config.get_config_cache_filename())
+        #cached:
+        c = self.load()
+        assert c.dpi==144 and c.speaker=="off"
+        assert self.reads==1
+        #modifying a file invalidates the cache:
+        self.write("etc/conf.d/10_test.conf", "speaker=off\ndpi=96\n#a longer file\n")
+        assert self.load().dpi==96
+        assert self.reads==2
+        #so does adding a new file:
+        self.write("etc/conf.d/20_test.conf", "dpi=120\n")
+        os.utime(os.path.join(self.conf_dir, "conf.d"), ns=(0, 0))
+        assert self.load().dpi==120
+        assert self.reads==3
+
+    def test_invalid_config(self):
+        self.write("etc/xpra.conf", "not-an-option=1\n")
+        self.load()
+        self.load()
+        #not cached, so that the warning is shown every time:
+        assert self.reads==2
+        assert not os.path.exists(config.get_config_cache_filename())
+
+    def test_disabled(self):
+        config.CONFIG_CACHE = False
+        self.load()
+        self.load()
+        assert self.reads==2
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
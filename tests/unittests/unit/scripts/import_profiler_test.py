@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import sys
+import json
+import unittest
+from subprocess import check_output
+
+#modules which are slow to import and not needed for parsing the command line:
+SLOW_MODULES = ["uuid", "tempfile", "yaml", "inspect", "urllib.parse", "platform"]
+if sys.version_info>=(3, 10):
+    SLOW_MODULES.append("typing_extensions")
+
+
+def run_python(code:str) -> str:
+    return check_output([sys.executable, "-c", code]).decode()
+
+
+class TestImportProfiler(unittest.TestCase):
+
+    def test_profile(self):
+        out = run_python("\n".join((
+            "import json",
+            "from xpra.scripts.import_profiler import start_profiling, stop_profiling",
+            "p = start_profiling()",
+            "import xpra.scripts.main",
+            "results = p.get_results()",
+            "print(json.dumps(results))",
+            )))
+        results = json.loads(out.splitlines()[-1])
+        times = {name : (cumulative, self_time) for name, cumulative, self_time in results}
+        assert "xpra.scripts.main" in times
+        assert "xpra.scripts.config" in times
+        for name, (cumulative, self_time) in times.items():
+            assert 0<=self_time<=cumulative+0.0001, f"invalid times for {name}: {cumulative}, {self_time}"
+        #sorted by cumulative time:
+        cumulative = [x[1] for x in results]
+        assert cumulative==sorted(cumulative, reverse=True)
+        assert times["xpra.scripts.main"][0]>=times["xpra.scripts.parsing"][0]
+
+    def test_check_argv(self):
+        from xpra.scripts import import_profiler
+        argv = ["xpra", "list"]
+        import_profiler.check_argv(argv)
+        assert argv==["xpra", "list"]
+        assert import_profiler.profiler is None
+
+    def test_lazy_imports(self):
+        #some interpreters (or site customizations) load these modules at startup:
+        code = f"import sys, json; print(json.dumps([x for x in {SLOW_MODULES!r} if x in sys.modules]))"
+        baseline = set(json.loads(run_python(code).splitlines()[-1]))
+        out = run_python("\n".join((
+            "import sys, json",
+            "from xpra.scripts.main import main",
+            "from xpra.scripts.config import make_defaults_struct",
+            "from xpra.scripts.parsing import fixup_defaults, do_parse_cmdline",
+            "defaults = make_defaults_struct()",
+            "fixup_defaults(defaults)",
+            "do_parse_cmdline(['xpra', 'list'], defaults)",
+            f"print(json.dumps([x for x in {SLOW_MODULES!r} if x in sys.modules]))",
+            )))
+        loaded = set(json.loads(out.splitlines()[-1])) - baseline
+        assert not loaded, f"slow modules should not be imported: {loaded}"
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
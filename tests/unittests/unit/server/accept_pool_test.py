@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import socket
+import unittest
+from threading import Event
+from time import monotonic, sleep
+
+from xpra.common import noop
+from xpra.net.bytestreams import SocketConnection
+from xpra.net.socket_util import peek_connection
+from xpra.server.accept_pool import AcceptPool, OVERLOADED, RATE_LIMITED, CLOSED
+
+
+class TestAcceptPool(unittest.TestCase):
+
+    def test_overload(self):
+        pool = AcceptPool(workers=2, queue_size=3, rate=0)
+        release = Event()
+        done = []
+        def work(i):
+            release.wait()
+            done.append(i)
+        results = [pool.submit("127.0.0.1", work, i) for i in range(10)]
+        assert results[:5]==[""]*5, results
+        assert results[5:]==[OVERLOADED]*5, results
+        assert len(pool.workers)==2
+        release.set()
+        start = monotonic()
+        while len(done)<5 and monotonic()-start<5:
+            sleep(0.01)
+        assert sorted(done)==list(range(5))
+        info = pool.get_info()
+        assert info["accepted"]==5 and info["rejected"][OVERLOADED]==5
+        pool.stop()
+        assert pool.submit(None, work, 0)==CLOSED
+
+    def test_rate_limit(self):
+        pool = AcceptPool(workers=1, queue_size=100, rate=10, burst=5)
+        def work():
+            pass
+        results = [pool.submit("10.0.0.1", work) for _ in range(10)]
+        assert results.count("")==5 and results.count(RATE_LIMITED)==5, results
+        #other addresses are not affected:
+        assert pool.submit("10.0.0.2", work)==""
+        #and unix domain sockets are never rate limited:
+        assert all(pool.submit(None, work)=="" for _ in range(10))
+        #the bucket refills over time:
+        sleep(0.25)
+        assert pool.submit("10.0.0.1", work)==""
+        pool.stop()
+
+    def test_blocked_workers(self):
+        #slow authentication does not stall the new connections:
+        accept_pool = AcceptPool(workers=2, queue_size=2, rate=0)
+        auth_pool = AcceptPool(workers=2, queue_size=2, rate=0, name="auth")
+        release = Event()
+        for _ in range(4):
+            assert auth_pool.submit(None, release.wait)==""
+        assert auth_pool.submit(None, release.wait)==OVERLOADED
+        accepted = Event()
+        assert accept_pool.submit(None, accepted.set)==""
+        assert accepted.wait(5)
+        release.set()
+        accept_pool.stop()
+        auth_pool.stop()
+
+    def test_timeout(self):
+        #clients which connect and then send nothing are cancelled:
+        pool = AcceptPool(workers=2, queue_size=0, rate=0, timeout=0.1)
+        blocked = [Event(), Event()]
+        for event in blocked:
+            assert pool.submit(None, event.wait, cancel=event.set)==""
+        start = monotonic()
+        while pool.busy<2 and monotonic()-start<5:
+            sleep(0.01)
+        assert pool.submit(None, noop)==OVERLOADED
+        assert not any(event.is_set() for event in blocked)
+        sleep(0.2)
+        #new work expires the stalled connections:
+        pool.submit(None, noop)
+        assert all(event.is_set() for event in blocked)
+        assert pool.expired==2
+        start = monotonic()
+        while pool.busy and monotonic()-start<5:
+            sleep(0.01)
+        accepted = Event()
+        assert pool.submit(None, accepted.set)==""
+        assert accepted.wait(5)
+        pool.stop()
+
+    def test_peek_timeout(self):
+        sock, other = socket.socketpair()
+        conn = SocketConnection(sock, "local", "remote", "target", "socket")
+        try:
+            start = monotonic()
+            assert peek_connection(conn, 200)==b""
+            assert monotonic()-start<1
+        finally:
+            sock.close()
+            other.close()
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import os
+import tempfile
+import unittest
+from time import time
+
+from xpra.os_util import POSIX
+from xpra.server import cpu_budget
+from xpra.server.cpu_budget import (
+    CPUBudget, get_priority,
+    PRIORITY_FOCUSED, PRIORITY_NORMAL, PRIORITY_BACKGROUND,
+    )
+
+
+def make_budget(threads, filename=""):
+    budget = CPUBudget(threads, filename)
+    budget.get_load = lambda : 0
+    return budget
+
+
+class TestCPUBudget(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = cpu_budget.ENCODER_THREADS
+        cpu_budget.ENCODER_THREADS = 4
+
+    def tearDown(self):
+        cpu_budget.ENCODER_THREADS = self.saved
+
+    def test_priority(self):
+        assert get_priority(True, False)==PRIORITY_FOCUSED
+        assert get_priority(False, True)==PRIORITY_FOCUSED
+        assert get_priority(False, False)==PRIORITY_NORMAL
+        assert get_priority(False, False, True)==PRIORITY_BACKGROUND
+
+    def test_allocation(self):
+        budget = make_budget(8)
+        #uncontended:
+        budget.set_priority("a", PRIORITY_FOCUSED)
+        assert budget.get_threads("a")==4
+        assert budget.get_min_speed("a")==0
+        budget.set_priority("b", PRIORITY_NORMAL)
+        budget.set_priority("c", PRIORITY_NORMAL)
+        #8 threads shared 4:2:2
+        assert [budget.get_threads(x) for x in "abc"]==[4, 2, 2]
+        assert budget.get_min_speed("b")>0
+        for i in range(10):
+            budget.set_priority(i, PRIORITY_BACKGROUND)
+        assert budget.get_threads("a")==1
+        assert budget.get_threads(0)==1
+        assert budget.get_min_speed(0)==60
+        #windows going away free their threads:
+        for i in range(10):
+            budget.release(i)
+        assert [budget.get_threads(x) for x in "abc"]==[4, 2, 2]
+        #unknown encoders get the default:
+        assert budget.get_threads("unknown")==4
+        assert budget.get_info()["encoders"]==3
+
+    def test_load(self):
+        budget = make_budget(8)
+        budget.cpu_count = 8
+        budget.get_load = lambda : 16
+        budget.set_priority("a", PRIORITY_NORMAL)
+        budget.set_priority("b", PRIORITY_NORMAL)
+        assert budget.available==4
+        assert budget.get_threads("a")==2
+
+    @unittest.skipUnless(POSIX, "posix only")
+    def test_shared(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "cpu-budget")
+            budget = make_budget(16, filename)
+            budget.set_priority("a", PRIORITY_NORMAL)
+            assert budget.share==1 and budget.get_threads("a")==4
+            #another process with 3 times our weight:
+            budget.shared.write_slot(10, 1, 3*PRIORITY_NORMAL, int(time()))
+            #and one that has not updated its slot for a long time:
+            budget.shared.write_slot(11, 2, 100, int(time())-60)
+            budget.set_priority("b", PRIORITY_NORMAL)
+            assert budget.share==0.4
+            assert budget.available==6
+            assert budget.get_threads("a")==3
+            slot = budget.shared.slot
+            budget.cleanup()
+            #our slot is free again:
+            other = make_budget(16, filename)
+            other.set_priority("a", PRIORITY_NORMAL)
+            assert other.shared.slot==slot
+            other.cleanup()
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import unittest
+import threading
+
+from xpra.server.server_base import ServerBase
+
+
+class TestInfoCategories(unittest.TestCase):
+
+    def make_server(self):
+        #avoid the full server initialization:
+        server = ServerBase.__new__(ServerBase)
+        server._info_request = threading.local()
+        server._info_providers = {}
+        return server
+
+    def test_info_wanted(self):
+        server = self.make_server()
+        assert server.info_wanted("anything")
+        server._info_request.categories = ("display", "windows")
+        assert server.info_wanted("windows")
+        assert server.info_wanted("network", "display")
+        assert not server.info_wanted("network")
+
+    def test_provider_info(self):
+        server = self.make_server()
+        calls = []
+        def display_info(_server, *args):
+            calls.append(args)
+            return {"display" : {"size" : args}}
+        def network_info(_server, *_args):
+            calls.append("network")
+            return {"network" : {}}
+        req = server._info_request
+        #the first call always collects everything:
+        req.categories = ("network", )
+        assert server.get_provider_info(display_info, 1, 2)=={"display" : {"size" : (1, 2)}}
+        assert calls==[(1, 2)]
+        assert req.categories==("network", )
+        assert server.get_provider_info(network_info)=={"network" : {}}
+        #now that we know what it provides, it is skipped:
+        assert server.get_provider_info(display_info)=={}
+        assert calls==[(1, 2), "network"]
+        req.categories = ("display", )
+        assert server.get_provider_info(display_info)
+        assert not server.get_provider_info(network_info)
+        assert calls==[(1, 2), "network", ()]
+        req.categories = ()
+        assert server.get_provider_info(network_info)
+        assert calls[-1]=="network"
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
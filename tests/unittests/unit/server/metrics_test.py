@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import unittest
+
+from xpra.server import metrics
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_histogram(self):
+        for v in (0.0005, 0.003, 0.003, 10):
+            metrics.observe("test_seconds", v, encoder="jpeg")
+        text = metrics.format_metrics()
+        lines = text.splitlines()
+        assert lines[-1]=="# EOF"
+        assert "# TYPE test_seconds histogram" in lines
+        assert 'test_seconds_bucket{encoder="jpeg",le="0.001"} 1' in lines
+        assert 'test_seconds_bucket{encoder="jpeg",le="0.005"} 3' in lines
+        assert 'test_seconds_bucket{encoder="jpeg",le="5.0"} 3' in lines
+        assert 'test_seconds_bucket{encoder="jpeg",le="+Inf"} 4' in lines
+        assert 'test_seconds_count{encoder="jpeg"} 4' in lines
+
+    def test_counters_and_gauges(self):
+        metrics.increase("test_bytes", 100, encoder="png")
+        metrics.increase("test_bytes", 50, encoder="png")
+        text = metrics.format_metrics({"test_queue_size" : {(("client", "1"), ) : 3}},
+                                      {"test_sent_bytes" : {() : 1000}})
+        lines = text.splitlines()
+        assert "# TYPE test_queue_size gauge" in lines
+        assert 'test_queue_size{client="1"} 3' in lines
+        assert "# TYPE test_bytes counter" in lines
+        assert 'test_bytes_total{encoder="png"} 150' in lines
+        assert "test_sent_bytes_total 1000" in lines
+
+    def test_escaping(self):
+        assert metrics.format_labels((("name", 'a"b\\c'), ))=='{name="a\\"b\\\\c"}'
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
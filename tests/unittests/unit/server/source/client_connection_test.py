@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import unittest
+from time import monotonic
+
+from xpra.net.compression import Compressed
+
+
+class FakeProtocol:
+
+    def __init__(self):
+        self.has_more = 0
+
+    def source_has_more(self):
+        self.has_more += 1
+
+    def get_info(self):
+        return {}
+
+
+def make_source():
+    from xpra.server.source.client_connection import ClientConnection
+    protocol = FakeProtocol()
+    cc = ClientConnection(protocol, None, "test", None, "", (), True, 0, True)
+    cc.init_state()
+    cc.timers = []
+    def timeout_add(delay, fn, *args):
+        cc.timers.append((delay, fn, args))
+        return len(cc.timers)
+    cc.timeout_add = timeout_add
+    cc.source_remove = lambda _timer : None
+    return cc
+
+
+class TestBulkLane(unittest.TestCase):
+
+    def next_type(self, cc):
+        packet = cc.next_packet()[0]
+        return packet[0] if packet else None
+
+    def test_priority(self):
+        cc = make_source()
+        cc.send("send-file-chunk", "id", 0, b"0"*1024, True)
+        cc.send("cursor", "")
+        cc.queue_packet(("draw", 1, 0, 0, 10, 10, "png", b"0"*100), 1, 100)
+        cc.queue_packet(("clipboard-contents", 1, "CLIPBOARD", "UTF8_STRING", 8, "bytes", b"foo"))
+        assert len(cc.bulk_packets)==2
+        assert [self.next_type(cc) for _ in range(5)]==["cursor", "draw", "send-file-chunk", "clipboard-contents", None]
+        info = cc.get_info()
+        assert info["bulk"]["bytes"]>=1024
+        assert info["interactive"]["bytes"]>=100
+
+    def test_overdue(self):
+        from xpra.server.source import client_connection
+        cc = make_source()
+        cc.send("send-file-chunk", "id", 0, b"0"*1024, True)
+        cc.send("cursor", "")
+        #pretend the bulk packet has been waiting for too long:
+        packet = cc.bulk_packets.popleft()
+        cc.bulk_packets.append(packet[:-1]+(monotonic()-client_connection.BULK_MAX_WAIT/1000-1, ))
+        assert self.next_type(cc)=="send-file-chunk"
+        assert self.next_type(cc)=="cursor"
+
+    def test_rate_limit(self):
+        cc = make_source()
+        cc.soft_bandwidth_limit = 8*1024*1024
+        cc.update_bulk_limit()
+        assert cc.bulk_rate_limit==1024*1024
+        data = Compressed("raw", b"0"*512*1024)
+        for i in range(3):
+            cc.send("send-file-chunk", "id", i, data, i<2)
+        assert self.next_type(cc)=="send-file-chunk"
+        #the budget is now exhausted:
+        assert self.next_type(cc) is None
+        assert len(cc.timers)==1
+        delay = cc.timers[0][0]
+        assert 300<=delay<=600, "unexpected delay %i" % delay
+        #interactive packets are not affected:
+        cc.send("cursor", "")
+        assert self.next_type(cc)=="cursor"
+        #the minimum share is used after a congestion event:
+        cc.statistics.last_congestion_time = monotonic()
+        assert cc.get_bulk_rate_limit()==cc.bulk_min_rate
+
+
+class TestSupersede(unittest.TestCase):
+
+    def test_ordinary_packets(self):
+        from xpra.server.source.windows import merge_metadata_packets
+        cc = make_source()
+        cc.send("cursor", "png", 1, supersede="cursor")
+        cc.send("window-metadata", 1, {"title" : "a", "iconic" : False},
+                supersede=("window-metadata", 1), merge=merge_metadata_packets)
+        cc.send("window-metadata", 2, {"title" : "other"},
+                supersede=("window-metadata", 2), merge=merge_metadata_packets)
+        cc.send("bell", 1)
+        cc.send("cursor", "png", 2, supersede="cursor")
+        cc.send("window-metadata", 1, {"title" : "b"},
+                supersede=("window-metadata", 1), merge=merge_metadata_packets)
+        packets = [x[0] for x in cc.ordinary_packets]
+        #the newer packets replace the older ones,
+        #but are still sent after the packets queued before them:
+        assert packets==[
+            ("window-metadata", 2, {"title" : "other"}),
+            ("bell", 1),
+            ("cursor", "png", 2),
+            ("window-metadata", 1, {"title" : "b", "iconic" : False}),
+            ], packets
+        assert cc.get_info()["superseded"]==2
+        #once sent, the packet can no longer be replaced:
+        for packet in packets[:3]:
+            assert cc.next_packet()[0]==packet
+        cc.send("cursor", "", supersede="cursor")
+        assert len(cc.ordinary_packets)==2
+
+    def test_draw_packets(self):
+        cc = make_source()
+        def draw(wid, x, y, w, h, supersede=True, coding="png"):
+            packet = ("draw", wid, x, y, w, h, coding, b"0"*100)
+            return cc.queue_packet(packet, wid, w*h, supersede=supersede)
+        assert not draw(1, 0, 0, 100, 100)
+        assert not draw(1, 10, 10, 10, 10)
+        assert not draw(2, 0, 0, 50, 50)
+        #not fully covered by the new packet:
+        assert not draw(1, 90, 90, 20, 20)
+        superseded = draw(1, 0, 0, 100, 100)
+        assert [p[2:6] for p in superseded]==[(0, 0, 100, 100), (10, 10, 10, 10)]
+        queued = [x[0][1:6] for x in cc.packet_queue]
+        assert queued==[(2, 0, 0, 50, 50), (1, 90, 90, 20, 20), (1, 0, 0, 100, 100)], queued
+        #packets which depend on the previous ones stop the search:
+        draw(1, 0, 0, 10, 10)
+        draw(1, 0, 0, 10, 10, False, "scroll")
+        assert not draw(1, 0, 0, 200, 200)
+        assert len(cc.packet_queue)==6
+        assert cc.next_packet()[0][1]==2
+
+    def test_draw_datagrams(self):
+        cc = make_source()
+        #the client would see the superseded packets as lost:
+        class FakeConnection:
+            draw_datagrams = True
+        conn = cc.protocol._conn = FakeConnection()
+        for _ in range(2):
+            assert not cc.queue_packet(("draw", 1, 0, 0, 100, 100, "png", b"0"*100), 1, 100*100, supersede=True)
+        assert len(cc.packet_queue)==2
+        #the connection stopped using datagrams, so we read the current value:
+        conn.draw_datagrams = False
+        superseded = cc.queue_packet(("draw", 1, 0, 0, 100, 100, "png", b"0"*100), 1, 100*100, supersede=True)
+        assert len(superseded)==2 and len(cc.packet_queue)==1
+
+
+class TestInfoSubscription(unittest.TestCase):
+
+    def test_info_delta(self):
+        cc = make_source()
+        cc.info_interval = 1000
+        cc.send_info_delta({"server" : {"elapsed_time" : 1, "pid" : 10}, "old" : 1})
+        cc.send_info_delta({"server" : {"elapsed_time" : 2, "pid" : 10}})
+        #no changes, nothing is sent:
+        cc.send_info_delta({"server" : {"elapsed_time" : 2, "pid" : 10}})
+        packets = [x[0] for x in cc.ordinary_packets]
+        assert len(packets)==2
+        assert packets[0][0]=="info-delta" and packets[0][3] is True
+        assert packets[1][1]=={"server" : {"elapsed_time" : 2}}
+        assert packets[1][2]==[("old", )]
+        assert packets[1][3] is False
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import heapq
+import unittest
+
+from xpra.server.source.congestion_control import get_congestion_control, ALGORITHMS, MAX_CONGESTION
+
+MB = 1024*1024
+
+
+def simulate(cc, bandwidth:int, delay:float, duration:float=20, demand:int=100*MB, fps:int=50, max_inflight:int=4):
+    """
+        Sends frames over a simulated link with the given bandwidth (in bits per second)
+        and one-way delay (in seconds), using virtual time.
+        The frames are as big as the congestion control allows, up to `demand` bits per second,
+        and like the window sources, we skip frames when too many are waiting for an ack.
+        Returns the average rtt over the last 2 seconds.
+    """
+    events = []
+    link_free = 0.0
+    rtts = []
+    seq = 0
+    inflight = set()
+    def send(now):
+        nonlocal link_free, seq
+        if len(inflight)>=max_inflight:
+            return
+        rate = min(demand, cc.bandwidth or demand)
+        size = max(1024, int(rate/fps/8))
+        seq += 1
+        cc.on_packet_sent(seq, now, size)
+        inflight.add(seq)
+        link_free = max(now, link_free)+size*8/bandwidth
+        heapq.heappush(events, (link_free+2*delay, seq, "ack", (seq, now, size)))
+    for i in range(int(duration*fps)):
+        heapq.heappush(events, (i/fps, -i, "send", None))
+    for i in range(int(duration*10)):
+        heapq.heappush(events, (i/10, -i, "update", None))
+    while events:
+        now, _, event, args = heapq.heappop(events)
+        if event=="send":
+            send(now)
+        elif event=="update":
+            cc.update(now)
+        else:
+            key, sent_at, size = args
+            cc.on_ack(key, now)
+            inflight.discard(key)
+            rtt = now-sent_at
+            if now>duration-2:
+                rtts.append(rtt)
+            late_by = rtt-(2*delay+0.05)
+            if late_by>0:
+                cc.on_late(now, int(100*late_by/rtt), int(size*8/(rtt-2*delay)))
+    return sum(rtts)/len(rtts)
+
+
+class TestCongestionControl(unittest.TestCase):
+
+    def test_get(self):
+        for name in ALGORITHMS:
+            assert get_congestion_control(name).name==name
+        assert get_congestion_control("invalid").name=="heuristic"
+
+    def test_delivery_rate(self):
+        cc = get_congestion_control("bbr")
+        cc.on_packet_sent(1, 0, 125000)
+        #acked after 1 second, including 0.5s of decoding:
+        cc.on_ack(1, 1, 0.5)
+        assert cc.rate_samples[-1][1]==2000000
+        assert cc.rtt_samples[-1][1]==0.5
+        #unknown or already acked:
+        cc.on_ack(1, 2)
+        assert len(cc.rtt_samples)==1
+        info = cc.get_info()
+        assert info["delivered"]==125000 and info["inflight"]==0
+
+    def test_heuristic(self):
+        cc = get_congestion_control("heuristic")
+        cc.update(10)
+        assert cc.bandwidth==0 and cc.congestion==0
+        assert cc.on_late(10, 50, 4*MB)
+        assert cc.on_late(10.5, 50, 2*MB)
+        cc.update(10.5)
+        assert 2*MB<cc.bandwidth<4*MB
+        assert cc.congestion>0
+        assert cc.congestion_time==10.5
+
+    def check_convergence(self, name:str, bandwidth:int, delay:float):
+        cc = get_congestion_control(name)
+        rtt = simulate(cc, bandwidth, delay)
+        assert bandwidth*0.5<=cc.bandwidth<=bandwidth*1.5, \
+            f"{name} bandwidth estimate {cc.bandwidth//1024}Kbps for {bandwidth//1024}Kbps link"
+        #the queue is drained:
+        assert rtt<2*delay+0.1, f"{name} rtt={int(rtt*1000)}ms"
+        return cc
+
+    def test_bbr(self):
+        for bandwidth, delay in ((10*MB, 0.02), (2*MB, 0.05)):
+            self.check_convergence("bbr", bandwidth, delay)
+
+    def test_delay(self):
+        for bandwidth, delay in ((10*MB, 0.02), (2*MB, 0.05)):
+            cc = self.check_convergence("delay", bandwidth, delay)
+            assert cc.congestion<MAX_CONGESTION
+
+    def test_unlimited(self):
+        #without any feedback, the rtt grows and we detect congestion:
+        for name in ("bbr", "delay"):
+            cc = get_congestion_control(name)
+            cc.update = lambda now: None
+            simulate(cc, 10*MB, 0.02, duration=2)
+            type(cc).update(cc, 2)
+            assert cc.congestion>0, f"{name} did not detect congestion"
+            assert cc.events
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
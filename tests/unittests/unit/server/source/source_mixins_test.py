@@ -149,6 +149,25 @@ class SourceMixinsTest(unittest.TestCase):
             "machine_id"    : "123",
             })
 
+    def test_fileprint_peer_identity(self):
+        from xpra.server.source.fileprint import get_peer_identity
+        def make_protocol(endpoint, *usernames):
+            protocol = AdHocStruct()
+            protocol._conn = AdHocStruct()
+            protocol._conn.endpoint = endpoint
+            protocol.authenticators = []
+            for username in usernames:
+                authenticator = AdHocStruct()
+                authenticator.username = username
+                protocol.authenticators.append(authenticator)
+            return protocol
+        identity = get_peer_identity(make_protocol(("10.0.0.1", 10000), "foo"))
+        #the port changes when the client reconnects:
+        assert identity==get_peer_identity(make_protocol(("10.0.0.1", 10001), "foo"))
+        assert identity!=get_peer_identity(make_protocol(("10.0.0.1", 10000), "bar"))
+        assert identity!=get_peer_identity(make_protocol(("10.0.0.2", 10000), "foo"))
+        assert not get_peer_identity(AdHocStruct())
+
     def test_idle(self):
         from xpra.server.source.idle_mixin import IdleMixin
         def idle_test(_c, m):
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import unittest
+from math import sin, cos
+
+try:
+    from xpra.server.window import tiles
+except ImportError:
+    tiles = None
+
+
+def make_image(width, height, pixel_fn):
+    buf = bytearray(width*height*4)
+    for y in range(height):
+        for x in range(width):
+            i = (y*width+x)*4
+            buf[i:i+4] = pixel_fn(x, y)
+    return bytes(buf)
+
+def photo_pixel(x, y):
+    v = int(128+60*sin(x/7)+40*cos(y/5)+((x*7+y*13)%21)-10)
+    return bytes((v&0xff, (v+30)&0xff, (v*2)&0xff, 0xff))
+
+def text_pixel(x, y):
+    c = 0 if (x//3+y//5)%4==0 else 0xff
+    return bytes((c, c, c, 0xff))
+
+def flat_pixel(_x, _y):
+    return b"\xc0\xc0\xc0\xff"
+
+
+@unittest.skipIf(tiles is None, "the tiles extension is not compiled")
+class TestTiles(unittest.TestCase):
+
+    def classify(self, width, height, pixel_fn, tile_size=64):
+        pixels = make_image(width, height, pixel_fn)
+        return tiles.classify_tiles(pixels, width, height, width*4, 4, tile_size)
+
+    def test_uniform(self):
+        for pixel_fn, tile_class in (
+            (flat_pixel, tiles.TILE_FLAT),
+            (text_pixel, tiles.TILE_TEXT),
+            (photo_pixel, tiles.TILE_PHOTO),
+            ):
+            cols, rows, classes = self.classify(128, 64, pixel_fn)
+            assert cols==2 and rows==1
+            assert classes==bytes((tile_class, tile_class)), "expected %s but got %s for %s" % (
+                tiles.TILE_NAMES[tile_class], classes, pixel_fn)
+
+    def test_partial_tiles(self):
+        cols, rows, classes = self.classify(100, 70, text_pixel)
+        assert cols==2 and rows==2
+        assert len(classes)==4
+
+    def test_mixed(self):
+        def mixed_pixel(x, y):
+            if x<128:
+                return photo_pixel(x, y)
+            if x<256:
+                return text_pixel(x, y)
+            return flat_pixel(x, y)
+        width, height = 320, 192
+        cols, rows, classes = self.classify(width, height, mixed_pixel)
+        regions = tiles.merge_tiles(classes, cols, rows, 64, width, height)
+        #the flat column is merged with the text tiles:
+        assert regions==[
+            (0, 0, 128, 192, tiles.TILE_PHOTO),
+            (128, 0, 192, 192, tiles.TILE_TEXT),
+            ], "unexpected regions: %s" % (regions,)
+
+    def test_merge_coverage(self):
+        t, p, f = tiles.TILE_TEXT, tiles.TILE_PHOTO, tiles.TILE_FLAT
+        classes = bytes((
+            t, t, p,
+            p, f, p,
+            t, t, t,
+            ))
+        width, height = 150, 130
+        regions = tiles.merge_tiles(classes, 3, 3, 64, width, height)
+        area = sum(w*h for _, _, w, h, _ in regions)
+        assert area==width*height, "regions %s do not cover %ix%i" % (regions, width, height)
+        for x, y, w, h, _ in regions:
+            assert x+w<=width and y+h<=height
+
+    def test_invalid(self):
+        with self.assertRaises(AssertionError):
+            tiles.classify_tiles(b"\0"*16, 4, 4, 8, 4)
+
+
+def main():
+    if tiles:
+        unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -7,41 +7,54 @@
 import unittest
 
 from xpra.util import AdHocStruct
+from xpra.codecs.codec_constants import video_spec, csc_spec
+from xpra.codecs.video_helper import VideoHelper
 from xpra.server.window.video_scoring import (
     get_quality_score, get_speed_score,
     get_pipeline_score, get_encoder_dimensions,
+    get_pipeline_options, get_score_bucket, PipelineScores,
     )
 
 
+def make_video_helper():
+    vh = VideoHelper(init=True)
+    vh.add_encoder_spec("h264", "YUV420P", video_spec("h264", "YUV420P", ("YUV420P", ), False,
+                                                      AdHocStruct, "yuv-encoder", max_w=4096, max_h=4096))
+    vh.add_encoder_spec("h264", "BGRX", video_spec("h264", "BGRX", ("YUV444P", ), True,
+                                                   AdHocStruct, "rgb-encoder", max_w=2048, max_h=2048))
+    vh.add_csc_spec("BGRX", "YUV420P", csc_spec("BGRX", "YUV420P", AdHocStruct, "csc"))
+    return vh
+
+
 class TestVideoScoring(unittest.TestCase):
 
     def test_quality_score(self):
-        csc_spec = AdHocStruct()
-        csc_spec.quality = 50
+        cspec = AdHocStruct()
+        cspec.quality = 50
         encoder_spec = AdHocStruct()
         encoder_spec.quality = 50
         encoder_spec.has_lossless_mode = False
-        s1 = get_quality_score("YUV420P", csc_spec, encoder_spec, (1, 1))
-        s2 = get_quality_score("BGRA", csc_spec, encoder_spec, (1, 1))
+        s1 = get_quality_score("YUV420P", cspec, encoder_spec, (1, 1))
+        s2 = get_quality_score("BGRA", cspec, encoder_spec, (1, 1))
         assert s2>s1
         encoder_spec.has_lossless_mode = True
-        s3 = get_quality_score("BGRA", csc_spec, encoder_spec, (1, 1))
+        s3 = get_quality_score("BGRA", cspec, encoder_spec, (1, 1))
         assert s3>s2
-        s4 = get_quality_score("YUV420P", csc_spec, encoder_spec, (1, 1), min_quality=50)
+        s4 = get_quality_score("YUV420P", cspec, encoder_spec, (1, 1), min_quality=50)
         assert s4<s1
-        s5 = get_quality_score("YUV420P", csc_spec, encoder_spec, (2, 2))
+        s5 = get_quality_score("YUV420P", cspec, encoder_spec, (2, 2))
         assert s5>s2
 
     def test_speed_score(self):
-        csc_spec = AdHocStruct()
-        csc_spec.speed = 50
+        cspec = AdHocStruct()
+        cspec.speed = 50
         encoder_spec = AdHocStruct()
         encoder_spec.speed = 50
         encoder_spec.has_lossless_mode = True
-        s1 = get_speed_score("YUV420P", csc_spec, encoder_spec, (1, 1))
-        s2 = get_speed_score("YUV420P", csc_spec, encoder_spec, (2, 2))
+        s1 = get_speed_score("YUV420P", cspec, encoder_spec, (1, 1))
+        s2 = get_speed_score("YUV420P", cspec, encoder_spec, (2, 2))
         assert s2>s1
-        s3 = get_speed_score("YUV420P", csc_spec, encoder_spec, (1, 1), min_speed=60)
+        s3 = get_speed_score("YUV420P", cspec, encoder_spec, (1, 1), min_speed=60)
         assert s3<s2
 
     def test_pipeline_score(self):
@@ -78,7 +91,7 @@ class TestVideoScoring(unittest.TestCase):
         current_csc.get_src_height = lambda : 1080
         current_csc.get_src_width = lambda : 1920
         for rgb_format in ("BGRA", "RGB"):
-            for csc_spec in (None, test_csc_spec):
+            for cspec in (None, test_csc_spec):
                 for can_scale in (True, False):
                     test_csc_spec.can_scale = can_scale
                     encoder_spec.can_scale = can_scale
@@ -87,7 +100,7 @@ class TestVideoScoring(unittest.TestCase):
                         for scaling in ((1, 1), (2, 3)):
                             #too small:
                             for w, h in ((MINW-1, MINH+1), (MINW+1, MINH-1)):
-                                s = get_pipeline_score(rgb_format, csc_spec, encoder_spec,
+                                s = get_pipeline_score(rgb_format, cspec, encoder_spec,
                                                w, h, scaling,
                                                100, 10,
                                                100, 10,
@@ -95,7 +108,7 @@ class TestVideoScoring(unittest.TestCase):
                                                0, 10, True)
                                 assert s is None
 
-                            s = get_pipeline_score(rgb_format, csc_spec, encoder_spec,
+                            s = get_pipeline_score(rgb_format, cspec, encoder_spec,
                                            1920, 1080, scaling,
                                            100, 10,
                                            100, 10,
@@ -105,7 +118,7 @@ class TestVideoScoring(unittest.TestCase):
                                 assert s is None
                                 continue
                             #mask will round down, so this should be OK:
-                            s = get_pipeline_score(rgb_format, csc_spec, encoder_spec,
+                            s = get_pipeline_score(rgb_format, cspec, encoder_spec,
                                            MAXW+1, MAXH+1, scaling,
                                            100, 10,
                                            100, 10,
@@ -114,7 +127,7 @@ class TestVideoScoring(unittest.TestCase):
                             assert s
                             if scaling==(1, 1):
                                 #but this is not:
-                                s = get_pipeline_score(rgb_format, csc_spec, encoder_spec,
+                                s = get_pipeline_score(rgb_format, cspec, encoder_spec,
                                                MAXW+2, MAXH+2, scaling,
                                                100, 10,
                                                100, 10,
@@ -134,6 +147,69 @@ class TestVideoScoring(unittest.TestCase):
         w, h = get_encoder_dimensions(encoder_spec, 102, 102, (1, 2))
         assert w==50 and h==50
 
+    def get_options(self, vh, csc_modes, width=1920, height=1080):
+        return get_pipeline_options(vh, ("h264", ), width, height, "BGRX",
+                                    {"h264" : csc_modes}, {"h264" : 0}, {}, (8192, 8192),
+                                    50, 0, 50, 0,
+                                    None, None, 10, True, False)
+
+    def test_pipeline_options(self):
+        vh = make_video_helper()
+        #the client can only handle YUV420P, so we must use the csc step:
+        options = self.get_options(vh, ("YUV420P", ))
+        assert len(options)==1
+        assert options[0][5].codec_type=="csc"
+        assert options[0][-1].codec_type=="yuv-encoder"
+        options = self.get_options(vh, ("YUV420P", "YUV444P"))
+        assert len(options)==2
+        assert options[0][0]>=options[1][0]
+        #too big for the rgb encoder:
+        options = self.get_options(vh, ("YUV420P", "YUV444P"), 3000, 2000)
+        assert len(options)==1
+        assert not self.get_options(vh, ())
+
+    def test_score_bucket(self):
+        assert get_score_bucket(100)==100
+        assert get_score_bucket(99)<99
+        assert get_score_bucket(0)==0
+        assert get_score_bucket(get_score_bucket(57))==get_score_bucket(57)
+
+    def test_pipeline_scores(self):
+        pscores = PipelineScores(2)
+        calls = []
+        def score(*args):
+            calls.append(args)
+            return args
+        assert pscores.get(1, score, 1)==(1, )
+        assert pscores.get(1, score, 1)==(1, )
+        assert len(calls)==1
+        pscores.get(2, score, 2)
+        pscores.get(3, score, 3)
+        #the oldest one has been discarded:
+        assert pscores.get(1, score, 1)==(1, )
+        assert len(calls)==4
+        info = pscores.get_info()
+        assert info["hits"]==1 and info["misses"]==4 and info["entries"]==2
+        pscores.invalidate()
+        assert pscores.get_info()["entries"]==0
+
+    def test_spec_limits(self):
+        vh = make_video_helper()
+        pscores = PipelineScores()
+        max_sizes, limited = pscores.get_spec_limits(vh, ("h264", ), "BGRX")
+        assert max_sizes==((2048, 2048), (4096, 4096))
+        assert not limited
+        #adding codecs changes the generation:
+        generation = vh.generation
+        spec = csc_spec("BGRX", "YUV444P", AdHocStruct, "limited-csc")
+        spec.max_instances = 1
+        vh.add_csc_spec("BGRX", "YUV444P", spec)
+        assert vh.generation!=generation
+        _, limited = pscores.get_spec_limits(vh, ("h264", ), "BGRX")
+        assert limited==(spec, )
+        #clones share the same specs:
+        assert vh.clone().generation==vh.generation
+
 
 def main():
     unittest.main()
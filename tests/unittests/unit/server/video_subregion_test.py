@@ -115,6 +115,16 @@ class TestVideoSubregion(unittest.TestCase):
         r.remove_refresh_region(rectangle.rectangle(0, 0, 10, 10))
         r.cleanup()
 
+    def test_new_region_cb(self):
+        new_regions = []
+        r = video_subregion.VideoSubregion(lambda window, regions : None, 150, True, new_regions.append)
+        vr = (monotonic(), 100, 100, 320, 240)
+        for _ in range(2):
+            r.identify_video_subregion(1024, 768, 50, [vr]*50)
+        #only called once for the same region:
+        assert new_regions==[rectangle.rectangle(*vr[1:])]
+        r.cleanup()
+
     def test_cases(self):
         from xpra.server.window.video_subregion import scoreinout   #, sslog
         #sslog.enable_debug()
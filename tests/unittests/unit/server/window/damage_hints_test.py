@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import unittest
+
+from xpra.server.window.damage_hints import DamageHints
+
+
+class TestDamageHints(unittest.TestCase):
+
+    def test_hints(self):
+        dh = DamageHints()
+        #no hints until the encoder has compressed this area:
+        dh.add_frame(dh.take_damage())
+        assert dh.get_hints(0, 0, 640, 480, 640, 480)==()
+        dh.compressed(0, 0, 640, 480)
+        dh.add_damage(10, 20, 30, 40)
+        dh.add_damage(600, 400, 100, 100)
+        dh.add_frame(dh.take_damage())
+        assert dh.get_hints(0, 0, 640, 480, 640, 480)==((10, 20, 30, 40), (600, 400, 40, 80))
+        #a different area of the window:
+        assert dh.get_hints(100, 0, 640, 480, 640, 480)==()
+        dh.compressed(0, 0, 640, 480)
+        assert dh.get_hints(0, 0, 640, 480, 640, 480)==()
+
+    def test_video_region(self):
+        dh = DamageHints()
+        dh.compressed(100, 100, 200, 200)
+        dh.add_damage(0, 0, 150, 120)
+        dh.add_frame(dh.take_damage())
+        assert dh.get_hints(100, 100, 200, 200, 200, 200)==((0, 0, 50, 20), )
+
+    def test_not_compressed(self):
+        dh = DamageHints()
+        dh.compressed(0, 0, 100, 100)
+        #a frame sent using a non-video encoding:
+        dh.add_damage(0, 0, 10, 10)
+        dh.add_frame(dh.take_damage())
+        dh.add_damage(50, 50, 10, 10)
+        dh.add_frame(dh.take_damage())
+        assert dh.get_hints(0, 0, 100, 100, 100, 100)==((0, 0, 10, 10), (50, 50, 10, 10))
+
+    def test_scaled(self):
+        dh = DamageHints()
+        dh.compressed(0, 0, 1000, 1000)
+        dh.add_damage(100, 100, 100, 100)
+        dh.add_frame(dh.take_damage())
+        x, y, w, h = dh.get_hints(0, 0, 1000, 1000, 500, 500)[0]
+        assert x<=50 and y<=50 and x+w>=100 and y+h>=100
+
+    def test_unknown(self):
+        dh = DamageHints(max_regions=4)
+        dh.compressed(0, 0, 100, 100)
+        for i in range(5):
+            dh.add_damage(i, i, 1, 1)
+        assert dh.take_damage() is None
+        dh.add_frame(None)
+        dh.add_damage(1, 1, 1, 1)
+        dh.add_frame(dh.take_damage())
+        #the video encoder must encode the whole picture:
+        assert dh.get_hints(0, 0, 100, 100, 100, 100)==()
+        dh.compressed(0, 0, 100, 100)
+        dh.add_damage(1, 1, 1, 1)
+        dh.add_frame(dh.take_damage())
+        assert dh.get_hints(0, 0, 100, 100, 100, 100)==((1, 1, 1, 1), )
+        for _ in range(4):
+            dh.add_frame(((0, 0, 1, 1), ))
+        assert dh.get_hints(0, 0, 100, 100, 100, 100)==()
+        dh.compressed(0, 0, 100, 100)
+        dh.add_frame(((0, 0, 1, 1), ))
+        assert dh.get_hints(0, 0, 100, 100, 100, 100)==((0, 0, 1, 1), )
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
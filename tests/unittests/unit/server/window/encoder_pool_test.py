@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import unittest
+from time import sleep
+
+from xpra.server.window.encoder_pool import EncoderPool
+
+
+class FakeContext:
+
+    def __init__(self):
+        self.closed = False
+
+    def clean(self):
+        self.closed = True
+
+
+class TestEncoderPool(unittest.TestCase):
+
+    def test_take_put(self):
+        pool = EncoderPool(2, 10)
+        key = ("encoder", "x264", 640, 480)
+        assert pool.take(key) is None
+        c = FakeContext()
+        pool.put(key, c)
+        assert pool.take(key) is c
+        assert pool.take(key) is None
+        info = pool.get_info()
+        assert info["hits"]==1 and info["misses"]==2 and info["contexts"]==0
+        assert not c.closed
+
+    def test_size(self):
+        pool = EncoderPool(2, 10)
+        contexts = [FakeContext() for _ in range(3)]
+        for i, c in enumerate(contexts):
+            pool.put(i, c)
+        #the oldest one was freed:
+        assert contexts[0].closed
+        assert len(pool)==2
+        assert pool.take(0) is None
+        assert pool.take(2) is contexts[2]
+
+    def test_expire(self):
+        pool = EncoderPool(2, 0)
+        c = FakeContext()
+        pool.put("key", c)
+        sleep(0.01)
+        assert pool.take("key") is None
+        assert c.closed
+        assert pool.get_info()["expired"]==1
+
+    def test_expire_contexts(self):
+        pool = EncoderPool(2, 0)
+        c = FakeContext()
+        pool.put("key", c)
+        sleep(0.01)
+        #without using the pool:
+        assert pool.expire_contexts()==0
+        assert c.closed
+
+    def test_pending(self):
+        pool = EncoderPool(2, 10)
+        assert pool.set_pending("key")
+        assert not pool.set_pending("key")
+        pool.put("key", FakeContext())
+        assert not pool.set_pending("key")
+        pool.take("key")
+        assert pool.set_pending("key")
+        pool.set_pending("key", False)
+        assert pool.set_pending("key")
+
+    def test_cleanup(self):
+        pool = EncoderPool(2, 10)
+        c1 = FakeContext()
+        pool.put("key", c1)
+        pool.cleanup()
+        assert c1.closed
+        #contexts added after cleanup are freed immediately:
+        c2 = FakeContext()
+        pool.put("key", c2)
+        assert c2.closed and not len(pool)
+
+    def test_info(self):
+        pool = EncoderPool()
+        pool.record_setup("x264", 0.05, False)
+        pool.record_setup("x264", 0.001, True)
+        info = pool.get_info()["setup-time"]
+        assert info["new"]["avg"]==50000
+        assert info["pool"]["max"]==1000
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
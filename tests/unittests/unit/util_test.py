@@ -6,7 +6,10 @@
 
 import unittest
 
-from xpra.util import AtomicInteger, MutableInteger, typedict, log_screen_sizes, updict, pver, std, alnum, nonl
+from xpra.util import (
+    AtomicInteger, MutableInteger, typedict, log_screen_sizes, updict, pver, std, alnum, nonl,
+    dict_delta, apply_dict_delta,
+    )
 
 
 class TestIntegerClasses(unittest.TestCase):
@@ -143,6 +146,31 @@ class TestModuleFunctions(unittest.TestCase):
         updict(d, "d3", d3, "hat")
         self.assertEqual(d.get("d3.moo.hat"), "cow")
 
+    def test_dict_delta(self):
+        old = {
+            "server"    : {"elapsed_time" : 10, "pid" : 100},
+            "client"    : {0 : {"batch" : {"delay" : 5}}, 1 : {"batch" : {"delay" : 8}}},
+            "windows"   : (1, 2),
+            "gone"      : True,
+            }
+        new = {
+            "server"    : {"elapsed_time" : 11, "pid" : 100},
+            "client"    : {0 : {"batch" : {"delay" : 5}}},
+            "windows"   : (1, 2, 3),
+            "new"       : {"key" : "value"},
+            }
+        changed, removed = dict_delta(old, new)
+        self.assertEqual(changed, {
+            "server"    : {"elapsed_time" : 11},
+            "windows"   : (1, 2, 3),
+            "new"       : {"key" : "value"},
+            })
+        self.assertEqual(sorted(removed, key=str), [("client", 1), ("gone", )])
+        self.assertEqual(dict_delta(new, new), ({}, []))
+        #applying the delta to a copy of the old dict gives us the new one:
+        import copy
+        self.assertEqual(apply_dict_delta(copy.deepcopy(old), changed, removed), new)
+
 
     def test_pver(self):
         self.assertEqual(pver(""), "")
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+# Measures the time it takes for audio buffers captured by the audio subprocess
+# to reach the parent process, with and without the shared memory ring.
+# The 'audiotestsrc' source is used with 10ms buffers,
+# usage: benchmark_audio_latency.py [CODEC [SECONDS]]
+
+import os
+import sys
+from time import monotonic
+
+os.environ.setdefault("XPRA_SOUND_SOURCE_BUFFER_TIME", "20")
+os.environ.setdefault("XPRA_SOUND_SOURCE_LATENCY_TIME", "10")
+
+from gi.repository import GLib  # @UnresolvedImport
+
+from xpra.audio import wrapper
+
+
+def measure(codec, duration, use_mmap):
+    wrapper.AUDIO_MMAP = use_mmap
+    latencies = []
+    loop = GLib.MainLoop()
+    source = wrapper.source_subprocess_wrapper("audiotestsrc", {"wave" : 2}, [codec], 1.0, {})
+    def new_buffer(_source, _data, metadata, _packet_metadata):
+        #the audio source records the time it emitted the buffer,
+        #the monotonic clock is shared with the subprocess:
+        latencies.append(monotonic()*1000-metadata["time"])
+    source.connect("new-buffer", new_buffer)
+    source.start()
+    ring = {}
+    def stop():
+        ring.update(source.get_info().get("ring", {}))
+        source.cleanup()
+        GLib.timeout_add(2000, loop.quit)
+    GLib.timeout_add(duration*1000, stop)
+    loop.run()
+    #skip the pipeline startup:
+    latencies = sorted(latencies[len(latencies)//10:])
+    if not latencies:
+        print("no audio buffers received")
+        return
+    def pct(p):
+        return latencies[min(len(latencies)-1, len(latencies)*p//100)]
+    print(f"mmap={use_mmap!s:5} : {len(latencies):5} buffers, "+
+          f"median={pct(50):.2f}ms, 99th percentile={pct(99):.2f}ms, max={latencies[-1]:.2f}ms, "+
+          f"ring reads={ring.get('reads', 0)}")
+
+
+def main(args):
+    codec = args[0] if args else "wav"
+    duration = int(args[1]) if len(args)>1 else 10
+    for use_mmap in (False, True):
+        measure(codec, duration, use_mmap)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+# Encodes a mostly static 1080p picture where only a small area changes,
+# like a progress bar or a blinking cursor, with and without the damage hints
+# telling the video encoders which macroblocks they can skip.
+# usage: benchmark_damage_hints.py [FRAMES [SPEED]]
+
+import os
+import sys
+from time import monotonic
+
+from xpra.util import typedict
+from xpra.codecs.image_wrapper import ImageWrapper
+from xpra.codecs.codec_constants import get_damage_map
+from xpra.codecs.loader import load_codec
+
+W, H = 1920, 1080
+#the area that changes with every frame:
+BAR = (400, 600, 320, 24)
+
+
+def make_planes():
+    #a static picture with some detail, so the unchanged areas are not trivial to encode:
+    y = bytearray((x*7+(x//W)*13) % 251 for x in range(W*H))
+    u = bytearray(b"\x80"*(W//2*H//2))
+    v = bytearray(b"\x80"*(W//2*H//2))
+    return y, u, v
+
+
+def update_bar(y, frame:int) -> None:
+    bx, by, bw, bh = BAR
+    filled = (frame*8) % bw
+    row = bytes(255 if i<filled else 16 for i in range(bw))
+    for r in range(by, by+bh):
+        y[r*W+bx:r*W+bx+bw] = row
+
+
+def encode(enc, encoding:str, frames:int, speed:int, hints:bool):
+    encoder = enc.Encoder()
+    options = typedict({"quality" : 60, "speed" : speed})
+    encoder.init_context(encoding, W, H, "YUV420P", options)
+    y, u, v = make_planes()
+    size = 0
+    elapsed = 0
+    try:
+        for i in range(frames):
+            update_bar(y, i)
+            image = ImageWrapper(0, 0, W, H, (bytes(y), bytes(u), bytes(v)), "YUV420P", 24,
+                                 (W, W//2, W//2), planes=ImageWrapper.PLANAR_3, thread_safe=True)
+            frame_options = {"quality" : 60, "speed" : speed}
+            if hints:
+                frame_options["damage-hints"] = (BAR, )
+            start = monotonic()
+            r = encoder.compress_image(image, frame_options)
+            elapsed += monotonic()-start
+            if r and r[0]:
+                size += len(r[0])
+    finally:
+        encoder.clean()
+    return elapsed, size
+
+
+def main(args):
+    frames = int(args[1]) if len(args)>1 else 100
+    speed = int(args[2]) if len(args)>2 else 50
+    start = monotonic()
+    for _ in range(frames):
+        get_damage_map((BAR, ), W, H)
+    print("damage map: %.1fus per frame" % (1000*1000*(monotonic()-start)/frames))
+    found = False
+    for name in os.environ.get("XPRA_ENCODERS", "enc_x264,enc_vpx").split(","):
+        enc = load_codec(name)
+        if not enc:
+            print(f"{name} not found")
+            continue
+        for encoding in enc.get_encodings():
+            if "YUV420P" not in enc.get_input_colorspaces(encoding):
+                continue
+            found = True
+            results = {}
+            for hints in (False, True):
+                results[hints] = encode(enc, encoding, frames, speed, hints)
+                elapsed, size = results[hints]
+                print("%10s %5s %14s: %7.2fms per frame, %8i bytes" % (
+                    name, encoding, "with hints" if hints else "without hints", 1000*elapsed/frames, size))
+            print("%10s %5s %14s: %.1fx faster" % (name, encoding, "", results[False][0]/max(0.000001, results[True][0])))
+    if not found:
+        print("no video encoders found")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
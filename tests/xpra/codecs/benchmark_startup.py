@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+# Measures the startup cost of the codecs,
+# usage: benchmark_startup.py [codecs|window] [COMMAND]
+# 'codecs' (the default) loads all the codecs and initializes the video helper
+# in a new process for each configuration: serial without the probe cache,
+# parallel without the probe cache, and parallel with a warm probe cache.
+# 'window' starts a server running COMMAND (default: xterm)
+# and reports the time until its first window is mapped.
+
+import os
+import re
+import sys
+import tempfile
+import subprocess
+from time import monotonic, sleep
+
+XPRA = os.environ.get("XPRA", "xpra")
+
+MEASURE = """
+from time import monotonic
+start = monotonic()
+from xpra.codecs.loader import load_codecs
+from xpra.codecs import video_helper as vh
+load_codecs()
+helper = vh.getVideoHelper()
+helper.set_modules(vh.ALL_VIDEO_ENCODER_OPTIONS, vh.ALL_CSC_MODULE_OPTIONS, vh.ALL_VIDEO_DECODER_OPTIONS)
+helper.init()
+print(monotonic()-start)
+"""
+
+
+def time_codecs(threads:int, cache_file:str, cache:bool=True) -> float:
+    env = os.environ.copy()
+    env.update({
+        "XPRA_CODEC_LOAD_THREADS"   : str(threads),
+        "XPRA_CODEC_CACHE"          : str(int(cache)),
+        "XPRA_CODEC_CACHE_FILE"     : cache_file,
+        })
+    out = subprocess.check_output([sys.executable, "-c", MEASURE], env=env)
+    return float(out.decode().splitlines()[-1])
+
+
+def benchmark_codecs() -> None:
+    with tempfile.TemporaryDirectory() as d:
+        cache_file = os.path.join(d, "codecs.json")
+        for name, threads, cache in (
+            ("serial, no cache", 1, False),
+            ("parallel, no cache", 4, False),
+            ("parallel, cold cache", 4, True),
+            ("parallel, warm cache", 4, True),
+            ):
+            elapsed = time_codecs(threads, cache_file, cache)
+            print(f"{name:24}: {elapsed*1000:.0f}ms")
+
+
+def benchmark_window(command:str) -> None:
+    display = f":{100+os.getpid()%1000}"
+    start = monotonic()
+    server = subprocess.Popen([XPRA, "start", display, "--daemon=no", f"--start-child={command}",
+                               "--exit-with-children=yes", "--notifications=no", "--mdns=no"],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    window_re = re.compile(r"^windows\.\d+\.", re.MULTILINE)
+    try:
+        while server.poll() is None and monotonic()-start<60:
+            info = subprocess.run([XPRA, "info", display], capture_output=True, check=False)
+            if info.returncode==0 and window_re.search(info.stdout.decode(errors="replace")):
+                print(f"time to first window: {(monotonic()-start)*1000:.0f}ms")
+                return
+            sleep(0.05)
+        print("no window found")
+    finally:
+        subprocess.run([XPRA, "stop", display], capture_output=True, check=False)
+        server.wait()
+
+
+def main(args):
+    mode = args[0] if args else "codecs"
+    if mode=="window":
+        benchmark_window(args[1] if len(args)>1 else "xterm")
+    else:
+        benchmark_codecs()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+# Compares the bandwidth and quality of whole image encodings
+# with the per-tile encoding selection used by the window source:
+# text-like tiles are encoded losslessly, photo-like tiles use a lossy encoding.
+
+import os
+import sys
+import glob
+from io import BytesIO
+from math import log10
+from time import monotonic
+from PIL import Image, ImageChops, ImageStat
+
+from xpra.net import compression
+from xpra.codecs.image_wrapper import ImageWrapper
+from xpra.codecs.loader import load_codec
+from xpra.server.window.tiles import classify_tiles, merge_tiles, TILE_PHOTO, TILE_NAMES  #@UnresolvedImport
+
+TILE_SIZE = int(os.environ.get("XPRA_TILE_SIZE", "64"))
+QUALITY = int(os.environ.get("XPRA_QUALITY", "50"))
+TEST_IMAGES = os.path.join(os.path.dirname(__file__), "..", "..", "test-images")
+
+
+def psnr(src, decoded):
+    diff = ImageChops.difference(src.convert("RGB"), decoded.convert("RGB"))
+    mse = sum(v**2 for v in ImageStat.Stat(diff).rms)/3
+    if mse==0:
+        return float("inf")
+    return 20*log10(255/mse**0.5)
+
+def decode(cdata):
+    return Image.open(BytesIO(getattr(cdata, "data", cdata)))
+
+
+def main(files=()):
+    files = files or sorted(glob.glob(os.path.join(TEST_IMAGES, "*.png")))
+    assert files, "no images to use for benchmark"
+    compression.init_all()
+    encoder = load_codec("enc_pillow")
+    assert encoder, "the pillow encoder is required"
+    lossy = {"quality" : QUALITY, "speed" : 50}
+    lossless = {"quality" : 100, "speed" : 50}
+    for f in files:
+        src = Image.open(f).convert("RGBX")
+        w, h = src.size
+        rgb_data = src.tobytes("raw", "BGRX")
+        image = ImageWrapper(0, 0, w, h, rgb_data, "BGRX", 24, w*4,
+                             planes=ImageWrapper.PACKED, thread_safe=True)
+        print(f"{os.path.basename(f):40} : {w}x{h}")
+        for encoding, options in (("jpeg", lossy), ("webp", lossy), ("png", lossless)):
+            if encoding not in encoder.get_encodings():
+                continue
+            start = monotonic()
+            r = encoder.encode(encoding, image, options)
+            elapsed = monotonic()-start
+            cdata = r[1]
+            q = psnr(src, decode(cdata))
+            print(f"  {encoding:10} {len(cdata):>10} bytes  PSNR={q:5.1f}dB  {elapsed*1000:6.1f}ms")
+        #now the tiled version:
+        start = monotonic()
+        cols, rows, classes = classify_tiles(rgb_data, w, h, w*4, 4, TILE_SIZE)
+        regions = merge_tiles(classes, cols, rows, TILE_SIZE, w, h)
+        classify_time = monotonic()-start
+        decoded = Image.new("RGB", (w, h))
+        size = 0
+        for x, y, tw, th, tile_class in regions:
+            sub = image.get_sub_image(x, y, tw, th)
+            if tile_class==TILE_PHOTO:
+                encoding, options = "jpeg", lossy
+            else:
+                encoding, options = "png", lossless
+            cdata = encoder.encode(encoding, sub, options)[1]
+            size += len(cdata)
+            decoded.paste(decode(cdata).convert("RGB"), (x, y))
+        elapsed = monotonic()-start
+        q = psnr(src, decoded)
+        summary = ", ".join(f"{TILE_NAMES[c]}={classes.count(c)}" for c in sorted(set(classes)))
+        print(f"  {'tiles':10} {size:>10} bytes  PSNR={q:5.1f}dB  {elapsed*1000:6.1f}ms"+
+              f"  (classified {cols}x{rows} tiles in {classify_time*1000:.1f}ms: {summary}, {len(regions)} regions)")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+# Compares how the congestion control algorithms converge:
+# frames are sent over an emulated link, sized using the bandwidth estimate,
+# and the link bandwidth is halved half way through.
+# usage: benchmark_congestion_control.py [BANDWIDTH_MBPS [DELAY_MS [DURATION [ALGORITHM,..]]]]
+
+import sys
+import struct
+from threading import Thread, Lock
+from time import monotonic, sleep
+
+from tests.xpra.net.netem import NetEm
+from xpra.server.source.congestion_control import get_congestion_control, ALGORITHMS
+
+MB = 1024*1024
+FPS = 50
+MAX_INFLIGHT = 4
+DEMAND = 100*MB
+HEADER = struct.Struct("!II")
+
+
+def recv_exact(sock, size:int) -> bytes:
+    data = b""
+    while len(data)<size:
+        chunk = sock.recv(size-len(data))
+        if not chunk:
+            raise EOFError()
+        data += chunk
+    return data
+
+
+def run(name:str, bandwidth:int, delay:float, duration:float):
+    cc = get_congestion_control(name)
+    forward = NetEm(bandwidth, delay)
+    backward = NetEm(100*MB, delay)
+    lock = Lock()
+    inflight = {}
+    stats = {"bytes" : 0, "rtts" : []}
+
+    def receive_frames():
+        #the client: acks every frame once it has been received
+        try:
+            while True:
+                seq, size = HEADER.unpack(recv_exact(forward.receiver, HEADER.size))
+                recv_exact(forward.receiver, size)
+                backward.sender.sendall(HEADER.pack(seq, size))
+        except (OSError, EOFError):
+            pass
+
+    def receive_acks():
+        try:
+            while True:
+                seq, size = HEADER.unpack(recv_exact(backward.receiver, HEADER.size))
+                now = monotonic()
+                cc.on_ack(seq, now)
+                with lock:
+                    sent_at = inflight.pop(seq)
+                    stats["bytes"] += size
+                    rtt = now-sent_at
+                    stats["rtts"].append(rtt)
+                #the window sources' late ack heuristic, simplified:
+                late_by = rtt-(2*delay+0.05)
+                if late_by>0:
+                    cc.on_late(now, int(100*late_by/rtt), int(size*8/max(0.001, rtt-2*delay)))
+        except (OSError, EOFError):
+            pass
+
+    def send_frames():
+        seq = 0
+        start = monotonic()
+        while monotonic()-start<duration:
+            with lock:
+                skip = len(inflight)>=MAX_INFLIGHT
+            if not skip:
+                seq += 1
+                size = max(1024, int(min(DEMAND, cc.bandwidth or DEMAND)/FPS/8))
+                now = monotonic()
+                with lock:
+                    inflight[seq] = now
+                cc.on_packet_sent(seq, now, size)
+                forward.sender.sendall(HEADER.pack(seq, size)+b"\0"*size)
+            sleep(1/FPS)
+
+    threads = [Thread(target=fn, daemon=True) for fn in (receive_frames, receive_acks, send_frames)]
+    for t in threads:
+        t.start()
+    start = monotonic()
+    results = []
+    elapsed = 0
+    while elapsed<duration:
+        sleep(0.1)
+        now = monotonic()
+        cc.update(now)
+        elapsed = now-start
+        if elapsed>duration/2 and forward.bandwidth==bandwidth:
+            forward.bandwidth = bandwidth//2
+        if int(elapsed*10)%10==0:
+            with lock:
+                rtts = stats["rtts"]
+                rtt = sum(rtts)/len(rtts) if rtts else 0
+                goodput = stats["bytes"]*8
+                stats["bytes"] = 0
+                stats["rtts"] = []
+            results.append((int(elapsed), forward.bandwidth, cc.bandwidth, goodput, rtt, cc.congestion))
+    forward.close()
+    backward.close()
+    return results
+
+
+def main(args):
+    bandwidth = int(float(args[1])*MB) if len(args)>1 else 10*MB
+    delay = int(args[2])/1000 if len(args)>2 else 0.02
+    duration = int(args[3]) if len(args)>3 else 20
+    algorithms = args[4].split(",") if len(args)>4 else tuple(ALGORITHMS.keys())
+    print(f"link: {bandwidth//1024}Kbps, {int(delay*1000)}ms delay, halved after {duration//2} seconds")
+    for name in algorithms:
+        print()
+        print(f"{name}:")
+        print("  time    link  estimate   goodput     rtt  congestion")
+        converged = []
+        for elapsed, link, estimate, goodput, rtt, congestion in run(name, bandwidth, delay, duration):
+            print("  %3is %6iK %8iK %8iK %5ims %10.3f" % (elapsed, link//1024, estimate//1024,
+                                                           goodput//1024, rtt*1000, congestion))
+            if link*0.75<=estimate<=link*1.25:
+                converged.append(elapsed)
+        print(f"  estimate within 25% of the link bandwidth for {len(converged)} seconds")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
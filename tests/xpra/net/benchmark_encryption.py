@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+# Streams the draw packets of a 4K video session over a socketpair,
+# encrypting them with each cipher available, and measures the throughput.
+# usage: benchmark_encryption.py [TOTAL_MB [FRAME_KB]]
+
+import os
+import sys
+import socket
+from threading import Thread, Event
+from time import monotonic, process_time
+
+from xpra.os_util import memoryview_to_bytes
+from xpra.net import packet_encoding, compression
+from xpra.net.compression import Compressed
+from xpra.net.bytestreams import SocketConnection
+from xpra.net.crypto import crypto_backend_init, get_ciphers, get_modes, AEAD_MODE
+from xpra.net.protocol.socket_handler import SocketProtocol
+
+CIPHER_ARGS = ("0000000000000000", "secret", "salt", "SHA256", 32, 1000, "PKCS#7")
+
+
+class Scheduler:
+    @staticmethod
+    def idle_add(fn, *args):
+        fn(*args)
+    @staticmethod
+    def timeout_add(_delay, _fn, *_args):
+        return 0
+    @staticmethod
+    def source_remove(_tid):
+        pass
+
+
+def get_ciphernames():
+    names = [""]
+    for cipher in get_ciphers():
+        for mode in get_modes():
+            if cipher=="AES" or mode==AEAD_MODE:
+                names.append(f"{cipher}-{mode}")
+    return names
+
+
+def run(ciphername:str, total_mb:int, frame_kb:int) -> None:
+    frame = Compressed("h264", os.urandom(frame_kb*1024))
+    count = total_mb*1024//frame_kb
+    sock, other = socket.socketpair()
+    writer = SocketProtocol(Scheduler, SocketConnection(other, "local", "remote", "target", "socket"), None)
+    writer.enable_encoder("rencodeplus")
+    def raw_write(items, *_args):
+        for item in items:
+            other.sendall(memoryview_to_bytes(item) if isinstance(item, memoryview) else item)
+    writer.raw_write = raw_write
+    received = 0
+    done = Event()
+    def process_packet_cb(_proto, _packet):
+        nonlocal received
+        received += 1
+        if received==count:
+            done.set()
+    proto = SocketProtocol(Scheduler, SocketConnection(sock, "local", "remote", "target", "socket"), process_packet_cb)
+    if ciphername:
+        try:
+            writer.set_cipher_out(ciphername, *CIPHER_ARGS)
+            proto.set_cipher_in(ciphername, *CIPHER_ARGS)
+        except Exception as e:
+            print(f"{ciphername:16} not available: {e}")
+            return
+    def send():
+        for i in range(count):
+            writer._add_packet_to_queue(("draw", 1, 0, 0, 3840, 2160, "h264", frame, i, 0, {"frame" : i}))
+    start = monotonic()
+    cpu_start = process_time()
+    proto._read_thread.start()
+    Thread(target=send, daemon=True).start()
+    done.wait()
+    elapsed = monotonic()-start
+    cpu = process_time()-cpu_start
+    print(f"{ciphername or 'none':16} {total_mb/elapsed:8.0f}MB/s {count/elapsed:8.0f} frames/s  cpu {cpu:.2f}s")
+    proto.close()
+    other.close()
+
+
+def main(args):
+    total_mb = int(args[0]) if args else 1024
+    frame_kb = int(args[1]) if len(args)>1 else 256
+    packet_encoding.init_encoders("rencodeplus", "none")
+    compression.init_compressors("none")
+    if not crypto_backend_init():
+        print("python-cryptography is not available")
+        return
+    print(f"{total_mb}MB of {frame_kb}KB video frames")
+    for ciphername in get_ciphernames():
+        run(ciphername, total_mb, frame_kb)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
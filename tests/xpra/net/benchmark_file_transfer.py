@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+# Sends a file between two file transfer handlers over a loopback "link"
+# which delays every packet by half the round trip time,
+# usage: benchmark_file_transfer.py [SIZE_MB [RTT_MS [compare]]]
+# 'compare' also runs the transfer using stop-and-wait with 64KB chunks.
+# The file is read from disk as it is sent, so the memory usage does not grow with its size.
+
+import os
+import sys
+import heapq
+import resource
+import tempfile
+from time import monotonic, sleep
+
+from xpra.util import typedict
+from xpra.net import file_transfer
+from xpra.net.file_transfer import FileTransferHandler, load_file_data
+
+
+class EventLoop:
+
+    def __init__(self):
+        self.events = []
+        self.counter = 0
+        self.cancelled = set()
+
+    def call_at(self, when, fn, *args):
+        self.counter += 1
+        heapq.heappush(self.events, (when, self.counter, fn, args))
+        return self.counter
+
+    def timeout_add(self, delay, fn, *args):
+        return self.call_at(monotonic()+delay/1000, fn, *args)
+
+    def source_remove(self, timer):
+        self.cancelled.add(timer)
+
+    def run(self, done):
+        while self.events and not done():
+            when, counter, fn, args = heapq.heappop(self.events)
+            if counter in self.cancelled:
+                self.cancelled.discard(counter)
+                continue
+            delay = when-monotonic()
+            if delay>0:
+                sleep(delay)
+            fn(*args)
+
+
+class LinkFileTransferHandler(FileTransferHandler):
+
+    def __init__(self, loop, latency):
+        self.loop = loop
+        self.latency = latency
+        self.timeout_add = loop.timeout_add
+        self.idle_add = loop.timeout_add
+        self.source_remove = loop.source_remove
+        self.peer = None
+        self.completed = False
+        super().__init__()
+        self.init_attributes("yes", "100G", "no", "no", "no")
+
+    def connect(self, peer):
+        self.peer = peer
+        self.parse_file_transfer_caps(typedict({"file" : peer.get_file_transfer_info()}))
+
+    def send(self, *packet):
+        handler = {
+            "send-file"         : self.peer._process_send_file,
+            "send-file-chunk"   : self.peer._process_send_file_chunk,
+            "ack-file-chunk"    : self.peer._process_ack_file_chunk,
+            }[packet[0]]
+        self.loop.call_at(monotonic()+self.latency/2, handler, packet)
+
+    def compressed_wrapper(self, datatype, data, level=5):
+        return data
+
+    def process_downloaded_file(self, filename, *_args):
+        self.completed = True
+        os.unlink(filename)
+
+
+def run_transfer(filename, rtt, window, chunk_size, max_chunk_size):
+    file_transfer.FILE_CHUNKS_WINDOW = window
+    file_transfer.MAX_FILE_CHUNKS_SIZE = max_chunk_size
+    loop = EventLoop()
+    sender = LinkFileTransferHandler(loop, rtt/1000)
+    receiver = LinkFileTransferHandler(loop, rtt/1000)
+    for h in (sender, receiver):
+        h.file_chunks = chunk_size
+    sender.connect(receiver)
+    receiver.connect(sender)
+    data = load_file_data(filename)
+    size = len(data)
+    start = monotonic()
+    sender.send_file(filename, "", data, size)
+    loop.run(lambda : receiver.completed)
+    elapsed = monotonic()-start
+    assert receiver.completed, "transfer failed"
+    print(f"window={window:3} chunks={chunk_size//1024}KB-{max_chunk_size//1024}KB : "+
+          f"{size//1024//1024}MB in {elapsed:.1f}s, {size/elapsed/1024/1024:.1f}MB/s, "+
+          f"max RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss//1024}MB")
+
+
+def main(args):
+    size_mb = int(args[0]) if args else 2048
+    rtt = int(args[1]) if len(args)>1 else 50
+    compare = len(args)>2 and args[2]=="compare"
+    with tempfile.TemporaryDirectory() as d:
+        os.environ["XPRA_DOWNLOAD_DIR"] = d
+        filename = os.path.join(d, "benchmark-source")
+        with open(filename, "wb") as f:
+            block = os.urandom(1024*1024)
+            for _ in range(size_mb):
+                f.write(block)
+        print(f"sending {size_mb}MB with a round trip time of {rtt}ms")
+        run_transfer(filename, rtt, 8, 65536, 4*1024*1024)
+        if compare:
+            run_transfer(filename, rtt, 1, 65536, 65536)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+# Measures the input echo latency over a lossy QUIC loopback connection,
+# while the server is sending large draw packets,
+# with and without the substreams.
+# usage: benchmark_quic_streams.py [LOSS_PCT [DURATION]]
+
+import os
+import sys
+import socket
+import random
+import tempfile
+import subprocess
+from threading import Thread, Event
+from time import monotonic, sleep
+
+from xpra.net.websockets.header import encode_hybi_header
+from xpra.net.websockets.common import OPCODE_BINARY
+
+DRAW_SIZE = 256*1024
+DRAW_DELAY = 0.02
+PING_DELAY = 0.01
+
+
+def frame(data:bytes) -> bytes:
+    return encode_hybi_header(OPCODE_BINARY, len(data)) + data
+
+
+class LossyRelay:
+    """ forwards udp datagrams to the server, dropping some of them """
+
+    def __init__(self, target, loss_pct:int):
+        self.target = target
+        self.loss = loss_pct/100
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.upstream = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.client = None
+        self.dropped = 0
+        self.forwarded = 0
+        Thread(target=self.forward_up, daemon=True).start()
+        Thread(target=self.forward_down, daemon=True).start()
+
+    def port(self) -> int:
+        return self.sock.getsockname()[1]
+
+    def lost(self) -> bool:
+        if random.random()<self.loss:
+            self.dropped += 1
+            return True
+        self.forwarded += 1
+        return False
+
+    def forward_up(self):
+        while True:
+            data, self.client = self.sock.recvfrom(65536)
+            if not self.lost():
+                self.upstream.sendto(data, self.target)
+
+    def forward_down(self):
+        while True:
+            data = self.upstream.recv(65536)
+            if self.client and not self.lost():
+                self.sock.sendto(data, self.client)
+
+
+class Server:
+    def __init__(self, cert, key):
+        self.cert = cert
+        self.key = key
+        self.connected = Event()
+        self.conn = None
+
+    def get_ssl_socket_options(self, _options):
+        return {"cert" : self.cert, "key" : self.key}
+
+    def make_protocol(self, _socktype, conn, _options, protocol_class=None):
+        assert protocol_class
+        self.conn = conn
+        self.connected.set()
+        Thread(target=self.echo, daemon=True).start()
+        Thread(target=self.draw, daemon=True).start()
+
+    def echo(self):
+        while not self.conn.closed:
+            data = self.conn.read(65536)
+            if data:
+                self.conn.write(data, "pointer-position")
+
+    def draw(self):
+        pixels = frame(os.urandom(DRAW_SIZE))
+        while not self.conn.closed:
+            self.conn.write(pixels, "draw:1")
+            sleep(DRAW_DELAY)
+
+
+def run(loss_pct:int, duration:float) -> None:
+    from xpra.net.quic.listener import listen_quic
+    from xpra.net.quic.client import quic_connect
+    from xpra.net.socket_util import create_udp_socket
+    with tempfile.TemporaryDirectory() as d:
+        cert = os.path.join(d, "cert.pem")
+        key = os.path.join(d, "key.pem")
+        subprocess.run(["openssl", "req", "-x509", "-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:prime256v1",
+                        "-nodes", "-days", "1", "-subj", "/CN=localhost", "-keyout", key, "-out", cert],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        server = Server(cert, key)
+        sock = create_udp_socket("127.0.0.1", 0, socket.AF_INET)
+        listen_quic(sock, server, {})
+        relay = LossyRelay(sock.getsockname(), loss_pct)
+        client = quic_connect("127.0.0.1", relay.port(), "/", "", "", "", None, "none", "")
+        client.write(frame(b"start"), "pointer-position")
+        server.connected.wait(10)
+        draws = 0
+        latencies = []
+        start = monotonic()
+        while monotonic()-start<duration:
+            ping = str(monotonic()).encode()
+            client.write(frame(ping), "pointer-position")
+            #skip the draw packets and any late echo:
+            while True:
+                data = client.read_queue.get()
+                if len(data)>1024:
+                    draws += 1
+                    continue
+                if data.endswith(ping):
+                    break
+            latencies.append(monotonic()-float(ping))
+            sleep(PING_DELAY)
+        latencies.sort()
+        def pct(p):
+            return latencies[min(len(latencies)-1, int(len(latencies)*p/100))]*1000
+        print(f"substreams={client.substreams}, loss={loss_pct}%, dropped {relay.dropped} datagrams")
+        print(f"  {len(latencies)} echos, median {pct(50):.1f}ms, 90th {pct(90):.1f}ms, 99th {pct(99):.1f}ms, max {pct(100):.1f}ms")
+        print(f"  {draws} draw packets received")
+        client.close()
+
+
+def main(args):
+    loss_pct = int(args[0]) if args else 2
+    duration = float(args[1]) if len(args)>1 else 10
+    if os.environ.get("XPRA_QUIC_SUBSTREAMS") is not None:
+        run(loss_pct, duration)
+        return
+    #the setting is read when the module is loaded, so use a new process for each mode:
+    for substreams in ("0", "1"):
+        env = os.environ.copy()
+        env["XPRA_QUIC_SUBSTREAMS"] = substreams
+        subprocess.run([sys.executable, __file__]+list(args), env=env, check=False)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
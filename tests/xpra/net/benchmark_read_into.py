@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+# Streams draw packets over a socketpair and measures how fast the protocol receives them,
+# with and without `read_into`.
+# usage: benchmark_read_into.py [TOTAL_MB [PIXELS_KB]]
+
+import os
+import sys
+import socket
+import subprocess
+from threading import Thread, Event
+from time import monotonic, process_time
+
+from xpra.os_util import memoryview_to_bytes
+from xpra.net import packet_encoding, compression
+from xpra.net.compression import Compressed
+from xpra.net.bytestreams import SocketConnection
+from xpra.net.protocol.socket_handler import SocketProtocol, READ_INTO
+
+
+class Scheduler:
+    @staticmethod
+    def idle_add(fn, *args):
+        fn(*args)
+    @staticmethod
+    def timeout_add(_delay, _fn, *_args):
+        return 0
+    @staticmethod
+    def source_remove(_tid):
+        pass
+
+
+def encode_draw_packet(pixels_size:int) -> bytes:
+    proto = SocketProtocol(Scheduler, SocketConnection(None, "", "", "", "socket"), None)
+    proto.enable_encoder("rencodeplus")
+    items = []
+    def raw_write(write_items, *_args):
+        items.extend(write_items)
+    proto.raw_write = raw_write
+    pixels = Compressed("pixels", os.urandom(pixels_size))
+    proto._add_packet_to_queue(("draw", 1, 0, 0, 1920, 1080, "rgb32", pixels, 1, 7680, {}))
+    return b"".join(memoryview_to_bytes(item) for item in items)
+
+
+def run(total_mb:int, pixels_kb:int) -> None:
+    packet_encoding.init_encoders("rencodeplus", "none")
+    compression.init_compressors("none")
+    data = encode_draw_packet(pixels_kb*1024)
+    count = total_mb*1024*1024//len(data)
+    received = 0
+    done = Event()
+    def process_packet_cb(_proto, _packet):
+        nonlocal received
+        received += 1
+        if received==count:
+            done.set()
+    sock, other = socket.socketpair()
+    conn = SocketConnection(sock, "local", "remote", "target", "socket")
+    proto = SocketProtocol(Scheduler, conn, process_packet_cb)
+    def send():
+        for _ in range(count):
+            other.sendall(data)
+    start = monotonic()
+    cpu_start = process_time()
+    proto._read_thread.start()
+    Thread(target=send, daemon=True).start()
+    done.wait()
+    elapsed = monotonic()-start
+    cpu = process_time()-cpu_start
+    mb = count*len(data)/1024/1024
+    print(f"read_into={READ_INTO}: {count} draw packets of {pixels_kb}KB, {mb:.0f}MB")
+    print(f"  {elapsed:.2f}s, {mb/elapsed:.0f}MB/s, {count/elapsed:.0f} packets/s, cpu {cpu:.2f}s")
+    reader = proto._packet_reader
+    if reader:
+        print(f"  read size: {reader.read_size}")
+    proto.close()
+    other.close()
+
+
+def main(args):
+    total_mb = int(args[0]) if args else 1024
+    pixels_kb = int(args[1]) if len(args)>1 else 512
+    if os.environ.get("XPRA_READ_INTO") is not None:
+        run(total_mb, pixels_kb)
+        return
+    #the setting is read when the module is loaded, so use a new process for each mode:
+    for read_into in ("0", "1"):
+        env = os.environ.copy()
+        env["XPRA_READ_INTO"] = read_into
+        subprocess.run([sys.executable, __file__]+list(args), env=env, check=False)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+# Measures the rencodeplus encode and decode throughput for typical packets,
+# with and without out-of-band buffers.
+# usage: benchmark_rencodeplus.py [DURATION]
+
+import os
+import sys
+from time import monotonic
+
+from xpra.net.rencodeplus import rencodeplus    # type: ignore[attr-defined]
+
+
+def make_packets():
+    caps = {f"key{i}" : (i, f"value{i}", True, {"sub" : [1, 2, 3]}) for i in range(200)}
+    return {
+        "pointer-position"  : ("pointer-position", 1, (100, 200), ("mod1", "shift"), [], {}),
+        "hello"             : ("hello", caps),
+        "draw"              : ("draw", 1, 0, 0, 1920, 1080, "webp", os.urandom(256*1024), 5, 0, {"flush" : 0}),
+        "window-icon"       : ("window-icon", 1, 64, 64, "png", os.urandom(16*1024)),
+        "cursor"            : ("cursor", "png", (0, 0, 48, 48, 8, 8, 0, os.urandom(48*48*4), "default"), ()),
+        "clipboard"         : ("clipboard-contents", 1, "CLIPBOARD", "UTF8_STRING", 8, "bytes",
+                               {"data" : os.urandom(1024*1024)}),
+        "send-file-chunk"   : ("send-file-chunk", "id", 1, memoryview(os.urandom(256*1024)), True),
+        }
+
+
+def rate(fn, duration:float):
+    n = 0
+    start = monotonic()
+    while True:
+        for _ in range(10):
+            fn()
+        n += 10
+        elapsed = monotonic()-start
+        if elapsed>=duration:
+            return n/elapsed
+
+
+def main(args):
+    duration = float(args[0]) if args else 1
+    print(f"rencodeplus {rencodeplus.__version__}")
+    print(f"{'packet':20} {'size':>10} {'dumps/s':>10} {'MB/s':>8} {'oob/s':>10} {'MB/s':>8} {'loads/s':>10} {'MB/s':>8}")
+    for name, packet in make_packets().items():
+        data = rencodeplus.dumps(packet)
+        size = len(data)
+        def dumps():
+            rencodeplus.dumps(packet)
+        def dumps_oob():
+            rencodeplus.dumps(packet, [].append)
+        def loads():
+            rencodeplus.loads(data)
+        r = rate(dumps, duration)
+        roob = rate(dumps_oob, duration)
+        rl = rate(loads, duration)
+        mb = size/1024/1024
+        print(f"{name:20} {size:10} {r:10.0f} {r*mb:8.0f} {roob:10.0f} {roob*mb:8.0f} {rl:10.0f} {rl*mb:8.0f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
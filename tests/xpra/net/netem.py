@@ -0,0 +1,90 @@
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+# A network link emulator in pure python, similar to linux 'netem':
+# the data written to `sender` comes out of `receiver` after a delay,
+# and no faster than the bandwidth allows.
+
+import socket
+from collections import deque
+from threading import Thread, Condition
+from time import monotonic, sleep
+
+
+class NetEm:
+
+    def __init__(self, bandwidth:int, delay:float, queue_size:int=256*1024, chunk:int=16*1024):
+        """
+            `bandwidth` is in bits per second, `delay` in seconds,
+            `queue_size` is the size of the bottleneck queue in bytes,
+            once it is full the sender blocks, like a TCP connection would.
+        """
+        self.bandwidth = bandwidth
+        self.delay = delay
+        self.queue_size = queue_size
+        self.chunk = chunk
+        self.sender, self.rx = socket.socketpair()
+        self.tx, self.receiver = socket.socketpair()
+        self.pending = deque()
+        self.cond = Condition()
+        self.departure = 0.0
+        self.closed = False
+        self.threads = (
+            Thread(target=self.read_loop, name="netem-read", daemon=True),
+            Thread(target=self.write_loop, name="netem-write", daemon=True),
+            )
+        for t in self.threads:
+            t.start()
+
+    def backlog(self, now:float) -> int:
+        """ the number of bytes waiting in the bottleneck queue """
+        return int(max(0, self.departure-now)*self.bandwidth/8)
+
+    def read_loop(self) -> None:
+        while not self.closed:
+            try:
+                data = self.rx.recv(self.chunk)
+            except OSError:
+                data = b""
+            if not data:
+                break
+            now = monotonic()
+            #the bottleneck queue is full, stop reading:
+            while self.backlog(now)>self.queue_size:
+                sleep((self.backlog(now)-self.queue_size)*8/self.bandwidth)
+                now = monotonic()
+            self.departure = max(now, self.departure)+len(data)*8/self.bandwidth
+            with self.cond:
+                self.pending.append((self.departure+self.delay, data))
+                self.cond.notify()
+        self.close()
+
+    def write_loop(self) -> None:
+        while not self.closed:
+            with self.cond:
+                while not self.pending and not self.closed:
+                    self.cond.wait(1)
+                if self.closed:
+                    break
+                when, data = self.pending.popleft()
+            delay = when-monotonic()
+            if delay>0:
+                sleep(delay)
+            try:
+                self.tx.sendall(data)
+            except OSError:
+                break
+        self.close()
+
+    def close(self) -> None:
+        self.closed = True
+        with self.cond:
+            self.cond.notify()
+        for sock in (self.sender, self.rx, self.tx, self.receiver):
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+# Compares loading the configuration with and without the config cache,
+# usage: benchmark_config.py [CONF_DIR [RUNS]]
+# CONF_DIR defaults to a copy of the config templates from the source tree,
+# each measurement runs in a new process.
+
+import os
+import sys
+import glob
+import shutil
+import tempfile
+import subprocess
+
+MEASURE = """
+from time import perf_counter
+from xpra.scripts.config import make_defaults_struct, get_defaults
+from xpra.scripts.parsing import fixup_defaults, do_parse_cmdline
+#probing the system defaults is not affected by the cache:
+get_defaults()
+start = perf_counter()
+defaults = make_defaults_struct()
+loaded = perf_counter()
+fixup_defaults(defaults)
+do_parse_cmdline(["xpra", "list"], defaults)
+parsed = perf_counter()
+print(loaded-start, parsed-loaded)
+"""
+
+
+def copy_templates(dst:str) -> None:
+    """ copy the config templates, without the lines that need substitutions """
+    src = os.path.join(os.path.dirname(__file__), "..", "..", "..", "fs", "etc", "xpra")
+    os.makedirs(os.path.join(dst, "conf.d"))
+    for template in glob.glob(os.path.join(src, "conf.d", "*.conf.in"))+[os.path.join(src, "xpra.conf.in")]:
+        filename = os.path.relpath(template, src)[:-len(".in")]
+        with open(template, "r", encoding="utf8") as f:
+            lines = [line for line in f if line.find("%(")<0]
+        with open(os.path.join(dst, filename), "w", encoding="utf8") as f:
+            f.writelines(lines)
+
+
+def measure(env) -> tuple:
+    out = subprocess.check_output([sys.executable, "-c", MEASURE], env=env)
+    return tuple(float(x) for x in out.decode().splitlines()[-1].split())
+
+
+def main(args):
+    runs = int(args[1]) if len(args)>1 else 10
+    tmpdir = tempfile.mkdtemp()
+    try:
+        conf_dir = args[0] if args else os.path.join(tmpdir, "etc")
+        if not args:
+            copy_templates(conf_dir)
+        env = os.environ.copy()
+        env.update({
+            "XPRA_DEFAULT_CONF_DIRS"    : "",
+            "XPRA_SYSTEM_CONF_DIRS"     : conf_dir,
+            "XPRA_USER_CONF_DIRS"       : "",
+            "XPRA_USER_CACHE_DIR"       : os.path.join(tmpdir, "cache"),
+            })
+        print(f"config files: {len(glob.glob(os.path.join(conf_dir, '**', '*.conf'), recursive=True))}")
+        for name, cache in (("cold", "0"), ("warm", "1")):
+            env["XPRA_CONFIG_CACHE"] = cache
+            if cache=="1":
+                #populate the cache:
+                measure(env)
+            results = [measure(env) for _ in range(runs)]
+            load = min(x[0] for x in results)
+            parse = min(x[1] for x in results)
+            print(f"{name}: config loading {load*1000:.2f}ms, command line parsing {parse*1000:.2f}ms")
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+# Measures the cost of scoring the video pipelines for many windows,
+# with and without the shared score cache:
+# each window is re-scored at every round, like update_pipeline_scores does,
+# with a few different sizes and slowly changing speed and quality targets.
+# usage: benchmark_pipeline_scores.py [WINDOWS [ROUNDS]]
+
+import sys
+from time import monotonic
+
+from xpra.util import AdHocStruct
+from xpra.codecs.codec_constants import video_spec, csc_spec
+from xpra.codecs.video_helper import VideoHelper, getVideoHelper
+from xpra.server.window.video_scoring import (
+    get_pipeline_options, get_score_bucket, get_encoding_score_delta, get_context_key, PipelineScores,
+    )
+
+SIZES = ((1920, 1080), (1280, 720), (800, 600), (640, 480), (500, 400))
+YUV = ("YUV420P", "YUV422P", "YUV444P")
+
+
+def make_video_helper() -> VideoHelper:
+    """ use the real codecs if we have them, or some fake ones with the same shape """
+    vh = getVideoHelper()
+    vh.init()
+    if vh.get_encodings():
+        return vh
+    vh = VideoHelper(init=True)
+    for encoding in ("h264", "vp8", "vp9", "h265"):
+        for i, fmt in enumerate(YUV+("BGRX", )):
+            out = (fmt, ) if fmt in YUV else ("YUV444P", )
+            spec = video_spec(encoding, fmt, out, fmt!="YUV420P", AdHocStruct, f"{encoding}-{i}",
+                              quality=50+i*10, speed=80-i*10, max_w=4096, max_h=4096)
+            vh.add_encoder_spec(encoding, fmt, spec)
+    for csc_type in ("libyuv", "swscale", "cython"):
+        for fmt in YUV:
+            vh.add_csc_spec("BGRX", fmt, csc_spec("BGRX", fmt, AdHocStruct, csc_type, can_scale=csc_type!="cython"))
+    return vh
+
+
+def score_window(vh, encodings, window, i:int, pscores=None):
+    width, height = SIZES[window % len(SIZES)]
+    target_q = get_score_bucket(50+(window+i//10)%20)
+    target_s = get_score_bucket(60+(window+i//20)%10)
+    csc_modes = {encoding : YUV for encoding in encodings}
+    score_deltas = {encoding : get_encoding_score_delta(encoding) for encoding in encodings}
+    args = (vh, encodings, width, height, "BGRX",
+            csc_modes, score_deltas, {}, (8192, 8192),
+            target_q, 0, target_s, 0,
+            None, None, 4, True, False)
+    if not pscores:
+        return get_pipeline_options(*args)
+    key = (vh.generation, encodings, width, height, "BGRX",
+           tuple(csc_modes.items()), tuple(score_deltas.items()), (), (8192, 8192),
+           target_q, 0, target_s, 0, get_context_key(None, None), 4, True, False, ())
+    return pscores.get(key, get_pipeline_options, *args)
+
+
+def main(args):
+    windows = int(args[1]) if len(args)>1 else 100
+    rounds = int(args[2]) if len(args)>2 else 50
+    vh = make_video_helper()
+    encodings = tuple(vh.get_encodings())
+    print(f"scoring {windows} windows {rounds} times, encodings: {encodings}")
+    pscores = PipelineScores()
+    results = {}
+    for name, cache in (("uncached", None), ("cached", pscores)):
+        start = monotonic()
+        for i in range(rounds):
+            for window in range(windows):
+                results.setdefault(name, []).append(score_window(vh, encodings, window, i, cache))
+        elapsed = monotonic()-start
+        print("%10s: %8.2fms per round, %6.1fus per window" % (
+            name, elapsed*1000/rounds, elapsed*1000*1000/rounds/windows))
+    assert results["cached"]==results["uncached"]
+    print(f"cache: {pscores.get_info()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+# Simulates a reconnect storm against the connection accept pool:
+# opens COUNT concurrent loopback connections from a few source addresses,
+# each one is handled by a worker which spends HANDSHAKE_MS on it (like peeking would),
+# and reports how many threads were used and how quickly the overload was rejected.
+# usage: load_accept.py [COUNT [HANDSHAKE_MS]]
+
+import sys
+import socket
+import resource
+import threading
+from time import monotonic, sleep
+
+from xpra.server.accept_pool import AcceptPool
+
+
+def raise_fd_limit(count):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = min(hard, max(soft, count*2+256))
+    if wanted>soft:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+    return wanted
+
+
+def main(args):
+    count = int(args[0]) if args else 2000
+    handshake = int(args[1]) if len(args)>1 else 50
+    limit = raise_fd_limit(count)
+    if limit<count*2:
+        print(f"warning: the file descriptor limit is {limit}, some connections may fail")
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(socket.SOMAXCONN)
+    port = listener.getsockname()[1]
+    pool = AcceptPool()
+    handled = []
+    rejected = []
+    def handle(sock):
+        sleep(handshake/1000)
+        handled.append(monotonic())
+        sock.close()
+    def accept_loop():
+        while True:
+            try:
+                sock, addr = listener.accept()
+            except OSError:
+                return
+            if pool.submit(addr[0], handle, sock):
+                rejected.append(monotonic())
+                sock.close()
+    threading.Thread(target=accept_loop, daemon=True).start()
+    peak_threads = threading.active_count()
+    start = monotonic()
+    clients = []
+    for i in range(count):
+        #spread the connections over a few loopback source addresses:
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.bind((f"127.0.0.{2+i%8}", 0))
+        try:
+            s.connect(("127.0.0.1", port))
+        except OSError as e:
+            print(f"connection {i} failed: {e}")
+            s.close()
+            continue
+        clients.append(s)
+        peak_threads = max(peak_threads, threading.active_count())
+    connect_time = monotonic()-start
+    while len(handled)+len(rejected)<len(clients) and monotonic()-start<60:
+        peak_threads = max(peak_threads, threading.active_count())
+        sleep(0.01)
+    elapsed = monotonic()-start
+    #now that the storm is over, how long does a new connection wait?
+    probe_start = monotonic()
+    n = len(handled)
+    probe = socket.create_connection(("127.0.0.1", port))
+    while len(handled)==n and monotonic()-probe_start<5:
+        sleep(0.001)
+    probe_time = monotonic()-probe_start
+    for s in clients+[probe]:
+        s.close()
+    listener.close()
+    pool.stop()
+    info = pool.get_info()
+    print(f"{len(clients)} connections opened in {connect_time*1000:.0f}ms")
+    print(f"handled={len(handled)}, rejected={info['rejected']}, all done in {elapsed*1000:.0f}ms")
+    print(f"peak threads={peak_threads}, workers={info['workers']}, max queue depth={info['queue']['max-depth']}")
+    if rejected:
+        print(f"first rejection after {(rejected[0]-start)*1000:.1f}ms")
+    print(f"new connection handled {probe_time*1000:.0f}ms after the storm")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,121 @@
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import os
+from typing import List, Tuple, Optional, Any, Dict
+
+from xpra.net.mmap_pipe import mmap_write, int_from_buffer, init_server_mmap
+from xpra.util import envint
+from xpra.log import Logger
+
+log = Logger("audio")
+
+AUDIO_MMAP_SIZE = envint("XPRA_AUDIO_MMAP_SIZE", 4*1024*1024)
+#the environment variable used for passing the filename to the audio subprocess:
+AUDIO_MMAP_ENV = "XPRA_AUDIO_MMAP_FILE"
+
+
+class AudioRing:
+    """
+        A shared memory ring buffer for passing audio buffers
+        between the audio subprocess and its parent process.
+        It uses the same layout as the mmap pixel transport (see mmap_pipe),
+        so there must only be one writer and one reader.
+        The writer sends the list of chunks used through the pipe,
+        the reader uses it to copy the data out and release the space.
+    """
+
+    def __init__(self, mmap_area, size:int, filename:str="", temp_file=None):
+        self.mmap_area = mmap_area
+        self.size = size
+        self.filename = filename
+        self.temp_file = temp_file
+        self.writes = 0
+        self.reads = 0
+        self.overflows = 0
+
+    def __repr__(self):
+        return f"AudioRing({self.filename!r}, {self.size})"
+
+    @classmethod
+    def create(cls, size:int=AUDIO_MMAP_SIZE) -> Optional["AudioRing"]:
+        """ used by the parent process, which owns the backing file """
+        # pylint: disable=import-outside-toplevel
+        import mmap
+        import tempfile
+        try:
+            #mkstemp ensures that only the current user can access the file:
+            temp = tempfile.NamedTemporaryFile(prefix="xpra-audio.", suffix=".mmap")
+            temp.truncate(size)
+            mmap_area = mmap.mmap(temp.fileno(), size)
+        except OSError as e:
+            log("AudioRing.create(%i)", size, exc_info=True)
+            log.warn("Warning: failed to create the audio shared memory area")
+            log.warn(" %s", e)
+            return None
+        log("created audio ring %s of size %i", temp.name, size)
+        return cls(mmap_area, size, temp.name, temp)
+
+    @classmethod
+    def open(cls, filename:str) -> Optional["AudioRing"]:
+        """ used by the audio subprocess """
+        if not filename or not os.path.exists(filename):
+            return None
+        mmap_area, size = init_server_mmap(filename)
+        if not mmap_area:
+            return None
+        return cls(mmap_area, size, filename)
+
+    def write(self, data) -> Optional[List[Tuple[int,int]]]:
+        """
+            Copies the data into the ring,
+            returns the chunks used or None if the data does not fit
+            and must be sent through the pipe instead.
+        """
+        area = self.mmap_area
+        if not area or not isinstance(data, (bytes, memoryview)) or len(data)>self.size//4:
+            return None
+        #the reader may just be late, so overflows are expected and only counted:
+        chunks = mmap_write(area, self.size, data, warn=False)[0]
+        if not chunks:
+            self.overflows += 1
+            return None
+        self.writes += 1
+        return chunks
+
+    def read(self, chunks) -> Optional[bytes]:
+        area = self.mmap_area
+        if not area:
+            return None
+        #copy the data before releasing the space to the writer:
+        data = b"".join(area[offset:offset+length] for offset, length in chunks)
+        offset, length = chunks[-1]
+        int_from_buffer(area, 0).value = offset+length
+        self.reads += 1
+        return data
+
+    def get_info(self) -> Dict[str,Any]:
+        return {
+            "size"      : self.size,
+            "writes"    : self.writes,
+            "reads"     : self.reads,
+            "overflows" : self.overflows,
+            }
+
+    def close(self) -> None:
+        area = self.mmap_area
+        if area:
+            self.mmap_area = None
+            try:
+                area.close()
+            except BufferError:
+                log("failed to close %s", self, exc_info=True)
+        temp = self.temp_file
+        if temp:
+            self.temp_file = None
+            try:
+                temp.close()
+            except OSError:
+                log("failed to remove %s", temp.name, exc_info=True)
@@ -15,9 +15,10 @@ from xpra.audio.gstreamer_util import (
     can_decode, can_encode, get_muxers, get_demuxers, get_all_plugin_names,
     )
 from xpra.net.subprocess_wrapper import subprocess_caller, subprocess_callee, exec_kwargs, exec_env
+from xpra.audio.ring import AudioRing, AUDIO_MMAP_SIZE, AUDIO_MMAP_ENV
 from xpra.platform.paths import get_audio_command
 from xpra.common import FULL_INFO
-from xpra.os_util import WIN32, OSX, POSIX, BITS
+from xpra.os_util import WIN32, OSX, POSIX, BITS, bytestostr
 from xpra.util import typedict, parse_simple_dict, envint, envbool
 from xpra.scripts.config import InitExit, InitException
 from xpra.log import Logger
@@ -29,6 +30,8 @@ FAKE_START_FAILURE = envbool("XPRA_SOUND_FAKE_START_FAILURE", False)
 FAKE_EXIT = envbool("XPRA_SOUND_FAKE_EXIT", False)
 FAKE_CRASH = envbool("XPRA_SOUND_FAKE_CRASH", False)
 SOUND_START_TIMEOUT = envint("XPRA_SOUND_START_TIMEOUT", 5000*(1+int(WIN32)))
+#pass the audio buffers through shared memory, the pipe only carries their location:
+AUDIO_MMAP = envbool("XPRA_AUDIO_MMAP", POSIX)
 
 DEFAULT_SOUND_COMMAND_ARGS = os.environ.get("XPRA_DEFAULT_SOUND_COMMAND_ARGS", "--windows=no").split(",")
 
@@ -86,6 +89,18 @@ class audio_subprocess(subprocess_callee):
         super().__init__(wrapped_object=wrapped_object, method_whitelist=methods)
         for x in exports:
             self.connect_export(x)
+        #the parent process creates the shared memory area:
+        self.ring = AudioRing.open(os.environ.get(AUDIO_MMAP_ENV, ""))
+        log("audio ring=%s", self.ring)
+
+    def export(self, *args):
+        signal_name = args[-1]
+        if signal_name=="info":
+            #let the parent know that it can use the shared memory area:
+            info = dict(args[1])
+            info["mmap"] = bool(self.ring)
+            args = (args[0], info)+args[2:]
+        super().export(*args)
 
     def start(self):
         if not FAKE_START_FAILURE:
@@ -113,6 +128,13 @@ class audio_subprocess(subprocess_callee):
                 log("cleanup() failed to clean %s", wo, exc_info=True)
         self.timeout_add(1000, self.do_stop)
 
+    def do_stop(self):
+        super().do_stop()
+        ring = self.ring
+        if ring:
+            self.ring = None
+            ring.close()
+
     def export_info(self):
         wo = self.wrapped_object
         if wo:
@@ -128,6 +150,15 @@ class audio_record(audio_subprocess):
         super().__init__(audio_pipeline, [], ["new-stream", "new-buffer"])
         self.large_packets = ["new-buffer"]
 
+    def export(self, *args):
+        ring = self.ring
+        if ring and args[-1]=="new-buffer":
+            chunks = ring.write(args[1])
+            if chunks:
+                self.send("new-buffer-mmap", chunks, *args[2:-1])
+                return
+        super().export(*args)
+
 class audio_play(audio_subprocess):
     """ wraps AudioSink as a subprocess """
     def __init__(self, *pipeline_args):
@@ -135,6 +166,15 @@ class audio_play(audio_subprocess):
         audio_pipeline = AudioSink(*pipeline_args)
         super().__init__(audio_pipeline, ["add_data"], [])
 
+    def process_packet(self, proto, packet) -> None:
+        ring = self.ring
+        if ring and bytestostr(packet[0])=="add_data_mmap":
+            data = ring.read(packet[1])
+            if data is None:
+                return
+            packet = ["add_data", data]+list(packet[2:])
+        super().process_packet(proto, packet)
+
 
 def run_audio(mode, error_cb, options, args):
     """ this function just parses command line arguments to feed into the audio subprocess class,
@@ -245,6 +285,7 @@ class audio_subprocess_wrapper(subprocess_caller):
         self.codec = "unknown"
         self.codec_description = ""
         self.info = {}
+        self.ring = None
         #hook some default packet handlers:
         self.connect("state-changed", self.state_changed)
         self.connect("info", self.info_update)
@@ -255,10 +296,14 @@ class audio_subprocess_wrapper(subprocess_caller):
         env.update(get_audio_wrapper_env())
         env.pop("DISPLAY", None)
         #env.pop("WAYLAND_DISPLAY", None)
+        if self.ring:
+            env[AUDIO_MMAP_ENV] = self.ring.filename
         return env
 
     def start(self):
         self.state = "starting"
+        if AUDIO_MMAP:
+            self.ring = AudioRing.create(AUDIO_MMAP_SIZE)
         super().start()
         log("start() %s subprocess(%s)=%s", self.description, self.command, self.process.pid)
         self.timeout_add(SOUND_START_TIMEOUT, self.verify_started)
@@ -272,6 +317,13 @@ class audio_subprocess_wrapper(subprocess_caller):
         self.timeout_add(1000, self.send, "exit")
         self.timeout_add(1500, self.stop)
 
+    def stop(self):
+        super().stop()
+        ring = self.ring
+        if ring:
+            self.ring = None
+            ring.close()
+
 
     def verify_started(self):
         p = self.process
@@ -302,7 +354,12 @@ class audio_subprocess_wrapper(subprocess_caller):
 
 
     def get_info(self) -> Dict:
-        return self.info
+        info = self.info
+        ring = self.ring
+        if ring:
+            info = dict(info)
+            info["ring"] = ring.get_info()
+        return info
 
     def info_update(self, _wrapper, info):
         log("info_update: %s", info)
@@ -334,6 +391,15 @@ class source_subprocess_wrapper(audio_subprocess_wrapper):
             ]
         _add_debug_args(self.command)
 
+    def process_packet(self, proto, packet) -> None:
+        ring = self.ring
+        if ring and bytestostr(packet[0])=="new-buffer-mmap":
+            data = ring.read(packet[1])
+            if data is not None:
+                self._fire_callback("new-buffer", [data]+list(packet[2:]))
+            return
+        super().process_packet(proto, packet)
+
     def __repr__(self):
         proc = self.process
         if proc:
@@ -361,6 +427,12 @@ class sink_subprocess_wrapper(audio_subprocess_wrapper):
     def add_data(self, data, metadata=None, packet_metadata=()):
         if DEBUG_SOUND:
             log("add_data(%s bytes, %s, %s) forwarding to %s", len(data), metadata, len(packet_metadata), self.protocol)
+        ring = self.ring
+        if ring and self.info.get("mmap"):
+            chunks = ring.write(data)
+            if chunks:
+                self.send("add_data_mmap", chunks, dict(metadata or {}), packet_metadata)
+                return
         self.send("add_data", data, dict(metadata or {}), packet_metadata)
 
     def __repr__(self):
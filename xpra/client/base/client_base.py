@@ -30,8 +30,8 @@ from xpra.net.net_util import get_network_caps
 from xpra.net.digest import get_salt, gendigest
 from xpra.net.crypto import (
     crypto_backend_init, get_iterations, get_iv, choose_padding,
-    get_ciphers, get_modes, get_key_hashes,
-    ENCRYPT_FIRST_PACKET, DEFAULT_IV, DEFAULT_SALT,
+    get_ciphers, get_modes, get_key_hashes, get_default_mode,
+    can_encrypt_first_packet, DEFAULT_IV, DEFAULT_SALT,
     DEFAULT_ITERATIONS, INITIAL_PADDING, DEFAULT_PADDING, ALL_PADDING_OPTIONS, PADDING_OPTIONS,
     DEFAULT_MODE, DEFAULT_KEYSIZE, DEFAULT_KEY_HASH, DEFAULT_KEY_STRETCH,
     )
@@ -352,7 +352,7 @@ class XpraClientBase(ServerInfoMixin, FilePrintMixin):
             protocol.enable_default_encoder()
             protocol.enable_default_compressor()
             encryption = self.get_encryption()
-            if encryption and ENCRYPT_FIRST_PACKET:
+            if encryption and can_encrypt_first_packet(encryption):
                 key = self.get_encryption_key()
                 protocol.set_cipher_out(encryption,
                                         DEFAULT_IV, key, DEFAULT_SALT,
@@ -479,7 +479,7 @@ class XpraClientBase(ServerInfoMixin, FilePrintMixin):
         crypto_backend_init()
         enc, mode = (encryption+"-").split("-")[:2]
         if not mode:
-            mode = DEFAULT_MODE
+            mode = get_default_mode(enc)
         ciphers = get_ciphers()
         if enc not in ciphers:
             raise ValueError(f"invalid encryption {enc!r}, options: {csv(ciphers) or 'none'}")
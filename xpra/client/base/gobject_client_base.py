@@ -7,12 +7,13 @@
 import os.path
 import sys
 from time import monotonic
-from typing import Dict, Any
+from typing import Dict, Any, Tuple
 
 from gi.repository import GLib, GObject  # @UnresolvedImport
 
 from xpra.util import (
-    u, net_utf8, nonl, sorted_nicely, print_nested_dict, envint, flatten_dict, typedict,
+    u, net_utf8, nonl, sorted_nicely, print_nested_dict, envint, envbool, flatten_dict, typedict,
+    apply_dict_delta,
     disconnect_is_an_error, ellipsizer, first_time, csv,
     repr_ellipsized, ConnectionMessage, stderr_print,
     )
@@ -421,9 +422,13 @@ class InfoTimerClient(MonitorXpraClient):
         and requesting info data
     """
     REFRESH_RATE = envint("XPRA_REFRESH_RATE", 1)
+    INFO_SUBSCRIBE = envbool("XPRA_INFO_SUBSCRIBE", True)
+    #the top-level info categories we need, empty for all of them:
+    INFO_CATEGORIES : Tuple[str,...] = ()
 
     def __init__(self, *args):
         super().__init__(*args)
+        self.info_subscribed = False
         self.info_request_pending = False
         self.server_last_info = typedict()
         self.server_last_info_time = 0
@@ -455,22 +460,43 @@ class InfoTimerClient(MonitorXpraClient):
         MonitorXpraClient.cleanup(self)
 
     def do_command(self, caps : typedict) -> None:
+        if self.INFO_SUBSCRIBE and "info-subscribe" in self.server_packet_types:
+            #the server will send us the info deltas at the refresh rate:
+            self.info_subscribed = True
+            self.send("info-subscribe", self.INFO_CATEGORIES, self.REFRESH_RATE*1000)
+            self.schedule_info_timeout()
+            return
         self.send_info_request()
         self.timeout_add(self.REFRESH_RATE*1000, self.send_info_request)
 
     def send_info_request(self, *categories) -> bool:
+        categories = categories or self.INFO_CATEGORIES
         self.log("send_info_request%s" % (categories,))
+        if self.info_subscribed:
+            #the subscription keeps 'server_last_info' up to date
+            return True
         if not self.info_request_pending:
             self.info_request_pending = True
             window_ids = ()    #no longer used or supported by servers
             self.send("info-request", [self.uuid], window_ids, categories)
         if not self.info_timer:
-            self.info_timer = self.timeout_add((self.REFRESH_RATE+2)*1000, self.info_timeout)
+            self.schedule_info_timeout()
         return True
 
+    def subscribe_info(self, _subscriber) -> bool:
+        #we subscribe for the whole connection, if the server supports it
+        return self.info_subscribed
+
+    def unsubscribe_info(self, _subscriber) -> None:
+        """ the subscription ends with the connection """
+
+    def schedule_info_timeout(self) -> None:
+        self.info_timer = self.timeout_add((self.REFRESH_RATE+2)*1000, self.info_timeout)
+
     def init_packet_handlers(self) -> None:
         MonitorXpraClient.init_packet_handlers(self)
         self.add_packet_handler("info-response", self._process_info_response, False)
+        self.add_packet_handler("info-delta", self._process_info_delta, False)
 
     def _process_server_event(self, packet : PacketType) -> None:
         self.log("server event: %s" % (packet,))
@@ -486,6 +512,18 @@ class InfoTimerClient(MonitorXpraClient):
         #log.info("server_last_info=%s", self.server_last_info)
         self.update_screen()
 
+    def _process_info_delta(self, packet : PacketType) -> None:
+        changed, removed, full = packet[1:4]
+        self.log("info delta: full=%s, %i changed, %i removed" % (full, len(changed), len(removed)))
+        self.cancel_info_timer()
+        if full:
+            self.server_last_info = typedict(changed)
+        else:
+            apply_dict_delta(self.server_last_info, changed, removed)
+        self.server_last_info_time = monotonic()
+        self.schedule_info_timeout()
+        self.update_screen()
+
     def cancel_info_timer(self) -> None:
         it = self.info_timer
         if it:
@@ -393,6 +393,11 @@ class TopClient:
 
 
 class TopSessionClient(InfoTimerClient):
+    #only the info shown on screen:
+    INFO_CATEGORIES = (
+        "server", "proxy", "clients", "client", "load", "cpuinfo", "threads",
+        "display", "cursor", "windows", "features",
+        )
 
     def __init__(self, *args):
         super().__init__(*args)
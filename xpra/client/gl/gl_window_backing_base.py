@@ -269,6 +269,7 @@ class GLWindowBackingBase(WindowBackingBase):
 
     RGB_MODES : List[str] = ["YUV420P", "YUV422P", "YUV444P", "GBRP", "BGRA", "BGRX", "RGBA", "RGBX", "RGB", "BGR", "NV12"]
     HAS_ALPHA : bool = GL_ALPHA_SUPPORTED
+    PRESENT_STAGE : str = "gl-present"
 
     def __init__(self, wid : int, window_alpha : bool, pixel_depth : int=0):
         self.wid : int = wid
@@ -765,6 +766,7 @@ class GLWindowBackingBase(WindowBackingBase):
             self.last_present_fbo_error = str(e)
 
     def do_present_fbo(self) -> None:
+        start = monotonic()
         bw, bh = self.size
         ww, wh = self.render_size
         rect_count = len(self.pending_fbo_paint)
@@ -851,6 +853,7 @@ class GLWindowBackingBase(WindowBackingBase):
         glTexParameteri(target, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
         glTexParameteri(target, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
         glBindFramebuffer(GL_FRAMEBUFFER, self.offscreen_fbo)
+        self.trace_presented(start, monotonic())
         log("%s.do_present_fbo() done", self)
 
     def save_FBO(self) -> None:
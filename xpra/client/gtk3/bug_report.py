@@ -34,6 +34,7 @@ class BugReport:
         self.server_log = None
         self.show_about = True
         self.get_server_info : Optional[Callable] = None
+        self.close_callback : Optional[Callable] = None
         self.opengl_info : Dict = {}
         self.includes : Dict = {}
         self.window : Optional[Gtk.Window] = None
@@ -42,9 +43,10 @@ class BugReport:
 
     def init(self, show_about:bool=True,
              get_server_info:Optional[Callable]=None,
-             opengl_info=None, includes=None):
+             opengl_info=None, includes=None, close_callback:Optional[Callable]=None):
         self.show_about = show_about
         self.get_server_info = get_server_info
+        self.close_callback = close_callback
         self.opengl_info = opengl_info
         self.includes = includes or {}
         self.setup_window()
@@ -259,6 +261,8 @@ class BugReport:
         if self.window:
             self.hide()
             self.window = None
+        if self.close_callback:
+            self.close_callback()
         return True
 
     def destroy(self, *args):
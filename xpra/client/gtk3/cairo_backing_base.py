@@ -62,6 +62,7 @@ def cairo_paint_pointer_overlay(context, cursor_data, px : int, py : int, start_
 class CairoBackingBase(WindowBackingBase):
 
     HAS_ALPHA = envbool("XPRA_ALPHA", True)
+    PRESENT_STAGE = "cairo-paint"
 
     def __init__(self, wid, window_alpha, _pixel_depth=0):
         super().__init__(wid, window_alpha and self.HAS_ALPHA)
@@ -285,6 +286,7 @@ class CairoBackingBase(WindowBackingBase):
             backing, self.size, self.render_size, self.offsets, self.pointer_overlay)
         if backing is None:
             return
+        start = monotonic()
         #try:
         #    log("clip rectangles=%s", context.copy_clip_rectangle_list())
         #except:
@@ -322,3 +324,4 @@ class CairoBackingBase(WindowBackingBase):
                     rw, rh = self.render_size
                     self.repaint(0, 0, rw, rh)
             self.fps_refresh_timer = GLib.timeout_add(1000, refresh_screen)
+        self.trace_presented(start, monotonic())
@@ -700,7 +700,9 @@ class GTKXpraClient(GObjectXpraClient, UIXpraClient):
         self.session_info.show_all()
 
     def show_bug_report(self, *_args) -> None:
-        self.send_info_request()
+        #keep 'server_last_info' up to date until the bug report is closed:
+        if not self.subscribe_info(self.bug_report_closed):
+            self.send_info_request()
         if self.bug_report:
             force_focus()
             self.bug_report.show()
@@ -718,7 +720,8 @@ class GTKXpraClient(GObjectXpraClient, UIXpraClient):
             self.bug_report.init(show_about=False,
                                  get_server_info=get_server_info,
                                  opengl_info=self.opengl_props,
-                                 includes=includes)
+                                 includes=includes,
+                                 close_callback=self.bug_report_closed)
             self.bug_report.show()
         #gives the server time to send an info response..
         #(by the time the user clicks on copy, it should have arrived, we hope!)
@@ -729,6 +732,8 @@ class GTKXpraClient(GObjectXpraClient, UIXpraClient):
         self.download_server_log(got_server_log)
         self.timeout_add(200, init_bug_report)
 
+    def bug_report_closed(self) -> None:
+        self.unsubscribe_info(self.bug_report_closed)
 
     def get_image(self, icon_name, size=None):
         try:
@@ -483,7 +483,10 @@ class SessionInfo(Gtk.Window):
         self.add(self.tab_box)
         def window_deleted(*_args):
             self.is_closed = True
+            self.client.unsubscribe_info(self)
         self.connect('delete_event', window_deleted)
+        #the server will keep 'server_last_info' up to date, otherwise we have to request it:
+        self.info_subscribed = self.client.subscribe_info(self)
         self.show_tab(self.tabs[0][2])
         self.set_size_request(-1, -1)
         self.init_counters()
@@ -1019,7 +1022,8 @@ class SessionInfo(Gtk.Window):
             #don't repopulate more than every second
             return True
         self.last_populate_statistics = monotonic()
-        self.client.send_info_request()
+        if not self.info_subscribed:
+            self.client.send_info_request()
         def setall(labels, values):
             assert len(labels)==len(values), "%s labels and %s values (%s vs %s)" % (
                 len(labels), len(values), labels, values)
@@ -1140,7 +1144,8 @@ class SessionInfo(Gtk.Window):
     def populate_graphs(self, *_args):
         #older servers have 'batch' at top level,
         #newer servers store it under client
-        self.client.send_info_request("network", "damage", "state", "batch", "client")
+        if not self.info_subscribed:
+            self.client.send_info_request("network", "damage", "state", "batch", "client")
         box = self.tab_box
         h = box.get_preferred_height()[0]
         bh = self.tab_button_box.get_preferred_height()[0]
@@ -1284,6 +1289,7 @@ class SessionInfo(Gtk.Window):
     def destroy(self, *args):
         log("SessionInfo.destroy(%s) is_closed=%s", args, self.is_closed)
         self.is_closed = True
+        self.client.unsubscribe_info(self)
         super().destroy()
         log("SessionInfo.destroy(%s) done", args)
 
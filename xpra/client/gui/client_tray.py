@@ -145,7 +145,7 @@ class ClientTray(ClientWidgetBase):
             data = self._backing.data
         self._backing = TrayBacking(self.wid, w, h, self._has_alpha, data)
         if self.mmap_enabled:
-            self._backing.enable_mmap(self.mmap)
+            self._backing.enable_mmap(self.mmap, getattr(self._client, "mmap_reader", None))
 
     def update_metadata(self, metadata) -> None:
         log("%s.update_metadata(%s)", self, metadata)
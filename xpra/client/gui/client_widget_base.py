@@ -64,7 +64,7 @@ class ClientWidgetBase:
                 (backing_class, ww, wh, ww, wh), bc, self._has_alpha, self._window_alpha)
             backing = bc(self.wid, self._window_alpha, self.pixel_depth)
             if self._client.mmap_enabled:
-                backing.enable_mmap(self._client.mmap)
+                backing.enable_mmap(self._client.mmap, getattr(self._client, "mmap_reader", None))
         backing.init(ww, wh, bw, bh)
         return backing
 
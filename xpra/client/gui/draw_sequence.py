@@ -0,0 +1,84 @@
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+from threading import Lock
+from collections import deque
+from typing import Dict, Deque, List, Tuple
+
+from xpra.util import envint
+
+#how long we wait for a missing packet before reporting it as lost:
+LOSS_DELAY = envint("XPRA_DRAW_LOSS_DELAY", 250)
+#how many of the most recent regions we keep for detecting stale packets:
+MAX_REGIONS = envint("XPRA_DRAW_SEQUENCE_REGIONS", 64)
+#how many datagram sequence numbers we remember having received or reported:
+MAX_SEEN = 256
+
+
+def overlaps(r1:Tuple[int,int,int,int], r2:Tuple[int,int,int,int]) -> bool:
+    x1, y1, w1, h1 = r1
+    x2, y2, w2, h2 = r2
+    return x1<x2+w2 and x2<x1+w1 and y1<y2+h2 and y2<y1+h1
+
+
+class DrawSequence:
+    """
+        Tracks the draw packet sequence numbers of a window,
+        for transports which can lose or reorder some of the draw packets (ie: quic datagrams).
+        The server only sends some of the draw packets as datagrams,
+        each one carries the sequence number of the previous datagram packet,
+        so we can tell which ones are missing without waiting for the reliable ones.
+        A datagram packet which arrives after a newer one for the same area is stale,
+        and a datagram packet which does not arrive at all is lost:
+        the server must refresh the window in both cases.
+    """
+
+    def __init__(self, loss_delay:int=LOSS_DELAY):
+        self.loss_delay : float = loss_delay/1000
+        self.lock = Lock()
+        #datagram sequence -> time we noticed it was missing:
+        self.missing : Dict[int,float] = {}
+        #the datagram sequence numbers we have received or reported as lost:
+        self.seen : Deque[int] = deque(maxlen=MAX_SEEN)
+        #(sequence, region) of the most recent packets:
+        self.regions : Deque[Tuple[int,Tuple[int,int,int,int]]] = deque(maxlen=MAX_REGIONS)
+
+    def received(self, sequence:int, previous:int, x:int, y:int, w:int, h:int, now:float) -> bool:
+        """
+            `previous` is the sequence number of the datagram packet sent before this one,
+            0 if there isn't one, or -1 if this packet was not sent as a datagram.
+            Returns False if the packet is stale and must not be painted.
+        """
+        region = (x, y, w, h)
+        with self.lock:
+            if previous>=0:
+                self.missing.pop(sequence, None)
+                if sequence in self.seen:
+                    #already reported as lost, or a duplicate
+                    return False
+                self.seen.append(sequence)
+                if previous>0 and previous not in self.seen and previous not in self.missing:
+                    self.missing[previous] = now
+                if any(s>sequence and overlaps(r, region) for s, r in self.regions):
+                    #painting it would overwrite newer pixels
+                    return False
+            else:
+                #packets sent reliably must always be painted,
+                #but this one may overwrite the pixels of newer datagram packets,
+                #so those must be reported as lost straight away:
+                for s, r in self.regions:
+                    if s>sequence and s in self.seen and overlaps(r, region):
+                        self.missing[s] = now-self.loss_delay
+            self.regions.append((sequence, region))
+            return True
+
+    def get_lost(self, now:float) -> List[int]:
+        """ the sequence numbers which have been missing for too long """
+        with self.lock:
+            lost = sorted(s for s, t in self.missing.items() if now-t>=self.loss_delay)
+            for s in lost:
+                del self.missing[s]
+                self.seen.append(s)
+            return lost
@@ -9,16 +9,17 @@ import hashlib
 from time import monotonic
 from threading import Lock
 from collections import deque
-from typing import Dict, Any, Tuple, Callable, Union, Iterable
+from typing import Dict, Any, Tuple, List, Callable, Union, Iterable, Optional
 from gi.repository import GLib  # @UnresolvedImport
 
-from xpra.net.mmap_pipe import mmap_read
+from xpra.net.mmap_pipe import mmap_read, MmapRingReader
 from xpra.net import compression
 from xpra.util import typedict, csv, envint, envbool, first_time
 from xpra.codecs.loader import get_codec
 from xpra.codecs.video_helper import getVideoHelper
 from xpra.os_util import bytestostr
 from xpra.common import Gravity
+from xpra.latency_trace import to_us
 from xpra.log import Logger
 
 log = Logger("paint")
@@ -30,6 +31,7 @@ WEBP_PILLOW = envbool("XPRA_WEBP_PILLOW", False)
 SCROLL_ENCODING = envbool("XPRA_SCROLL_ENCODING", True)
 REPAINT_ALL = envbool("XPRA_REPAINT_ALL", False)
 SHOW_FPS = envbool("XPRA_SHOW_FPS", False)
+MAX_TRACE_PENDING = 100
 
 
 _PIL_font = None
@@ -127,6 +129,8 @@ class WindowBackingBase:
     see CairoBackingBase and GTK2WindowBacking subclasses for actual implementations
     """
     RGB_MODES : Tuple[str, ...] = ()
+    #the name of the latency trace stage which puts the pixels on screen:
+    PRESENT_STAGE : str = "present"
 
     def __init__(self, wid : int, window_alpha : bool):
         load_csc_options()
@@ -166,16 +170,42 @@ class WindowBackingBase:
         self.repaint_all : bool = REPAINT_ALL
         self.mmap = None
         self.mmap_enabled : bool = False
+        self.mmap_reader : Optional[MmapRingReader] = None
+        #the ring regions we are painting from: region id -> ring
+        self.mmap_regions : Dict[int,int] = {}
         self.fps_events : deque = deque(maxlen=120)
         self.fps_buffer_size : Tuple[int,int] = (0, 0)
         self.fps_buffer_update_time : float = 0
         self.fps_value : int = 0
         self.fps_refresh_timer : int = 0
         self.paint_stats : Dict[str,int] = {}
+        #only used for latency tracing:
+        self.last_present : Tuple[float,float] = (0, 0)
+        self.trace_pending : List[Tuple[Any,int,int]] = []
 
     def idle_add(self, *_args, **_kwargs):
         raise NotImplementedError()
 
+    def trace_painted(self, trace, wid:int, packet_sequence:int, start:float) -> None:
+        """
+            Called once a traced frame has been painted,
+            the presentation stage is added once it is on screen:
+            which may have happened already (ie: opengl) or not (ie: cairo).
+        """
+        present_start, present_end = self.last_present
+        if present_start>=start:
+            trace.spans(wid, packet_sequence, ((self.PRESENT_STAGE, to_us(present_start), to_us(present_end)), ))
+        elif len(self.trace_pending)<MAX_TRACE_PENDING:
+            self.trace_pending.append((trace, wid, packet_sequence))
+
+    def trace_presented(self, start:float, end:float) -> None:
+        self.last_present = (start, end)
+        pending = self.trace_pending
+        if pending:
+            self.trace_pending = []
+            for trace, wid, packet_sequence in pending:
+                trace.spans(wid, packet_sequence, ((self.PRESENT_STAGE, to_us(start), to_us(end)), ))
+
     def recpaint(self, encoding):
         self.paint_stats[encoding] = self.paint_stats.get(encoding, 0) + 1
 
@@ -262,8 +292,9 @@ class WindowBackingBase:
             GLib.source_remove(frt)
 
 
-    def enable_mmap(self, mmap_area) -> None:
+    def enable_mmap(self, mmap_area, mmap_reader:Optional[MmapRingReader]=None) -> None:
         self.mmap = mmap_area
+        self.mmap_reader = mmap_reader or MmapRingReader(mmap_area)
         self.mmap_enabled = True
 
     def gravity_copy_coords(self, oldw:int, oldh:int, bw:int, bh:int):
@@ -407,6 +438,9 @@ class WindowBackingBase:
         self.free_cuda_context()
         self.cancel_fps_refresh()
         self._backing = None
+        #the paints which are still pending will never happen,
+        #release their space so the server can re-use this window's ring:
+        self.release_mmap_regions()
         log("%s.close() video_decoder=%s", self, self._video_decoder)
         #try without blocking, if that fails then
         #the lock is held by the decoding thread,
@@ -414,6 +448,12 @@ class WindowBackingBase:
         #(it checks for self._backing None)
         self.close_decoder(False)
 
+    def release_mmap_regions(self) -> None:
+        regions = self.mmap_regions
+        self.mmap_regions = {}
+        for rid, ring in regions.items():
+            self.mmap_reader.release(ring, rid)
+
     def close_decoder(self, blocking=False) -> bool:
         videolog("close_decoder(%s)", blocking)
         dl = self._decoder_lock
@@ -862,11 +902,27 @@ class WindowBackingBase:
         """ must be called from UI thread
             see _mmap_send() in server.py for details """
         assert self.mmap_enabled
-        data = mmap_read(self.mmap, *img_data)
         rgb_format = options.strget("rgb_format", "RGB")
         #Note: BGR(A) is only handled by gl_window_backing
         x, y = self.gravity_adjust(x, y, options)
-        self.do_paint_rgb(rgb_format, data, x, y, width, height, width, height, rowstride, options, callbacks)
+        ring = options.intget("mmap-ring", -1)
+        if ring<0:
+            data = mmap_read(self.mmap, *img_data)
+            self.do_paint_rgb(rgb_format, data, x, y, width, height, width, height, rowstride, options, callbacks)
+            return
+        #the data is never split when using rings, so we can paint it directly,
+        #and only release the space once we're done with it:
+        offset, length = img_data[0]
+        reader = self.mmap_reader
+        rid, data = reader.read(ring, offset, length)
+        self.mmap_regions[rid] = ring
+        def release_ring_space(*_args):
+            #the paint may have been deferred (ie: until the opengl window is realized),
+            #so we can only do this once the paint callbacks fire:
+            if self.mmap_regions.pop(rid, None) is not None:
+                reader.release(ring, rid)
+        self.do_paint_rgb(rgb_format, data, x, y, width, height, width, height, rowstride, options,
+                          [release_ring_space]+list(callbacks))
 
     def paint_scroll(self, img_data, options, callbacks):
         log("paint_scroll%s", (img_data, options, callbacks))
@@ -41,6 +41,7 @@ class ClipboardClient(StubClientMixin):
         self.server_clipboard_greedy : bool = False
         self.server_clipboard_want_targets : bool = False
         self.server_clipboard_selections : Tuple[str, ...] = ()
+        self.server_clipboard_contents_digest : bool = False
         self.clipboard_helper = None
         self.local_clipboard_requests : int = 0
         self.remote_clipboard_requests : int = 0
@@ -102,6 +103,7 @@ class ClipboardClient(StubClientMixin):
             "preferred-targets"         : CLIPBOARD_PREFERRED_TARGETS,
             "set_enabled"               : True,     #v4 servers no longer use or show this flag
             "contents-slice-fix"        : True,     #fixed in v2.4, removed check in v4.3
+            "contents-digest"           : True,
             }
         #legacy flat format:
         caps = flatten_dict({"clipboard" : ccaps})
@@ -148,6 +150,7 @@ class ClipboardClient(StubClientMixin):
         self.server_clipboard_want_targets = c.boolget("clipboard.want_targets")
         self.server_clipboard_selections = c.strtupleget("clipboard.selections", CLIPBOARDS)
         self.server_clipboard_preferred_targets = c.strtupleget("clipboard.preferred-targets", ())
+        self.server_clipboard_contents_digest = c.boolget("clipboard.contents-digest")
         log("server clipboard: greedy=%s, want_targets=%s, selections=%s",
             self.server_clipboard_greedy, self.server_clipboard_want_targets, self.server_clipboard_selections)
         log("parse_clipboard_caps() clipboard enabled=%s", self.clipboard_enabled)
@@ -179,6 +182,7 @@ class ClipboardClient(StubClientMixin):
         for x in (
             "token", "request",
             "contents", "contents-none",
+            "contents-digest", "contents-ack", "contents-chunk",
             "pending-requests", "enable-selections",
             ):
             self.add_packet_handler("clipboard-%s" % x, self._process_clipboard_packet)
@@ -281,7 +285,8 @@ class ClipboardClient(StubClientMixin):
                  #the local clipboard we want to sync to (with the translated clipboard only):
                  "clipboard.local"      : self.local_clipboard,
                  #the remote clipboard we want to we sync to (with the translated clipboard only):
-                 "clipboard.remote"     : self.remote_clipboard
+                 "clipboard.remote"     : self.remote_clipboard,
+                 "contents-digest"      : self.server_clipboard_contents_digest,
                  }
         log("setup_clipboard_helper() kwargs=%s", kwargs)
         def clipboard_send(*parts):
@@ -16,6 +16,7 @@ from xpra.net.common import PacketType
 from xpra.net import compression
 from xpra.util import envint, envbool, updict, csv, typedict
 from xpra.client.base.stub_client_mixin import StubClientMixin
+from xpra.latency_trace import get_latency_trace
 from xpra.log import Logger
 
 log = Logger("client", "encoding")
@@ -115,7 +116,8 @@ class Encodings(StubClientMixin):
         if "avif" in ae:
             load_codec("dec_avif")
         vh = getVideoHelper()
-        vh.set_modules(video_decoders=opts.video_decoders, csc_modules=opts.csc_modules)
+        vh.set_modules(video_decoders=opts.video_decoders, csc_modules=opts.csc_modules,
+                       encodings=ae)
         vh.init()
 
 
@@ -210,6 +212,8 @@ class Encodings(StubClientMixin):
             "video_max_size"            : self.video_max_size,
             "max-soft-expired"          : MAX_SOFT_EXPIRED,
             "send-timestamps"           : SEND_TIMESTAMPS,
+            #ask the server to include its timestamps in the draw packets:
+            "latency-trace"             : bool(get_latency_trace("client")),
             }
         if self.video_scaling is not None:
             caps["scaling.control"] = self.video_scaling
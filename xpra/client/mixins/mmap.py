@@ -29,6 +29,7 @@ class MmapClient(StubClientMixin):
         super().__init__()
         self.mmap_enabled : bool = False
         self.mmap = None
+        self.mmap_reader = None
         self.mmap_token : int = 0
         self.mmap_token_index : int = 0
         self.mmap_token_bytes : int = 0
@@ -51,6 +52,11 @@ class MmapClient(StubClientMixin):
 
     def cleanup(self) -> None:
         self.clean_mmap()
+        reader = self.mmap_reader
+        if reader:
+            self.mmap_reader = None
+            self.mmap = None
+            reader.close()
 
 
     def setup_connection(self, conn) -> None:
@@ -125,13 +131,15 @@ class MmapClient(StubClientMixin):
             "token"         : self.mmap_token,
             "token_index"   : self.mmap_token_index,
             "token_bytes"   : self.mmap_token_bytes,
+            #we can paint from a separate ring for each window:
+            "rings"         : True,
             }
 
     def init_mmap(self, mmap_filename, mmap_group, socket_filename) -> None:
         log("init_mmap(%s, %s, %s)", mmap_filename, mmap_group, socket_filename)
         from xpra.net.mmap_pipe import (  #pylint: disable=import-outside-toplevel
             init_client_mmap, write_mmap_token,
-            DEFAULT_TOKEN_BYTES,
+            DEFAULT_TOKEN_BYTES, MmapRingReader,
             )
         #calculate size:
         root_w, root_h = self.get_root_size()
@@ -145,6 +153,8 @@ class MmapClient(StubClientMixin):
             self.mmap_token_bytes = DEFAULT_TOKEN_BYTES
             self.mmap_token_index = randint(0, self.mmap_size - DEFAULT_TOKEN_BYTES)
             write_mmap_token(self.mmap, self.mmap_token, self.mmap_token_index, self.mmap_token_bytes)
+            #the windows paint straight from the rings:
+            self.mmap_reader = MmapRingReader(self.mmap)
 
     def clean_mmap(self) -> None:
         log("XpraClient.clean_mmap() mmap_filename=%s", self.mmap_filename)
@@ -9,11 +9,11 @@ import re
 import sys
 from time import monotonic
 from collections import deque
-from typing import Dict, Any, Tuple, Callable
+from typing import Dict, Any, Tuple, Callable, Set
 from gi.repository import GLib
 
 from xpra.os_util import POSIX
-from xpra.util import envint, envbool, csv, typedict
+from xpra.util import envint, envbool, csv, typedict, apply_dict_delta
 from xpra.exit_codes import ExitCode
 from xpra.net.common import PacketType
 from xpra.net.packet_encoding import ALL_ENCODERS
@@ -32,6 +32,8 @@ MAX_PING_TIMEOUT : int = envint("XPRA_MAX_PING_TIMEOUT", 10)
 SWALLOW_PINGS : bool = envbool("XPRA_SWALLOW_PINGS", False)
 #LOG_INFO_RESPONSE = ("^window.*position", "^window.*size$")
 LOG_INFO_RESPONSE : str = os.environ.get("XPRA_LOG_INFO_RESPONSE", "")
+INFO_SUBSCRIBE : bool = envbool("XPRA_INFO_SUBSCRIBE", True)
+INFO_INTERVAL : int = envint("XPRA_INFO_INTERVAL", 1000)
 AUTO_BANDWIDTH_PCT : int = envint("XPRA_AUTO_BANDWIDTH_PCT", 80)
 assert 1<AUTO_BANDWIDTH_PCT<=100, "invalid value for XPRA_AUTO_BANDWIDTH_PCT: %i" % AUTO_BANDWIDTH_PCT
 
@@ -167,6 +169,9 @@ class NetworkState(StubClientMixin):
         #info requests
         self.server_last_info : Dict = {}
         self.info_request_pending : bool = False
+        #the server keeps 'server_last_info' up to date while we have subscribers:
+        self.info_subscribers : Set[Any] = set()
+        self.info_subscribed : bool = False
 
         #network state:
         self.server_packet_encoders : Tuple[str, ...] = ()
@@ -306,7 +311,37 @@ class NetworkState(StubClientMixin):
                 if LOG_INFO_RESPONSE=="all" or any(lr.match(k) for lr in logres):
                     log.info(" %s=%s", k, self.server_last_info[k])
 
+    def _process_info_delta(self, packet : PacketType) -> None:
+        changed, removed, full = packet[1:4]
+        log("info-delta: full=%s, %i changed, %i removed", full, len(changed), len(removed))
+        if full:
+            self.server_last_info = dict(changed)
+        else:
+            apply_dict_delta(self.server_last_info, changed, removed)
+
+    def subscribe_info(self, subscriber) -> bool:
+        """
+            Asks the server to keep sending us the info updates until all the subscribers are gone,
+            returns False if the server does not support subscriptions, the caller must then use `send_info_request`.
+        """
+        if not INFO_SUBSCRIBE or "info-subscribe" not in self.server_packet_types:
+            return False
+        self.info_subscribers.add(subscriber)
+        if not self.info_subscribed:
+            self.info_subscribed = True
+            self.send("info-subscribe", (), INFO_INTERVAL)
+        return True
+
+    def unsubscribe_info(self, subscriber) -> None:
+        self.info_subscribers.discard(subscriber)
+        if self.info_subscribed and not self.info_subscribers:
+            self.info_subscribed = False
+            self.send("info-subscribe", (), 0)
+
     def send_info_request(self, *categories) -> None:
+        if self.info_subscribed:
+            #the subscription keeps 'server_last_info' up to date
+            return
         if not self.info_request_pending:
             self.info_request_pending = True
             window_ids = () #no longer used or supported by servers
@@ -431,3 +466,4 @@ class NetworkState(StubClientMixin):
         self.add_packet_handler("ping", self._process_ping, False)
         self.add_packet_handler("ping_echo", self._process_ping_echo, False)
         self.add_packet_handler("info-response", self._process_info_response, False)
+        self.add_packet_handler("info-delta", self._process_info_delta, False)
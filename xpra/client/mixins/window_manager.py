@@ -24,7 +24,7 @@ from xpra.platform.gui import (
     get_double_click_time, get_double_click_distance, get_native_system_tray_classes,
     )
 from xpra.net.common import PacketType
-from xpra.common import WINDOW_NOT_FOUND, WINDOW_DECODE_SKIPPED, WINDOW_DECODE_ERROR
+from xpra.common import WINDOW_NOT_FOUND, WINDOW_DECODE_SKIPPED, WINDOW_DECODE_ERROR, WINDOW_PACKET_LOST
 from xpra.platform.paths import get_icon_filename, get_resources_dir, get_python_exec_command
 from xpra.scripts.config import FALSE_OPTIONS
 from xpra.make_thread import start_thread
@@ -37,6 +37,8 @@ from xpra.util import (
     make_instance, updict, repr_ellipsized, u, noerr, first_time,
     )
 from xpra.client.base.stub_client_mixin import StubClientMixin
+from xpra.client.gui.draw_sequence import DrawSequence, LOSS_DELAY
+from xpra.latency_trace import get_latency_trace, get_server_stages, to_us
 from xpra.log import Logger
 
 log = Logger("window")
@@ -148,6 +150,10 @@ class WindowClient(StubClientMixin):
         self._draw_queue = Queue()
         self._draw_thread : Optional[Thread] = None
         self._draw_counter : int = 0
+        #only used when draw packets can be lost:
+        self._draw_sequences : Dict[int,DrawSequence] = {}
+        self._draw_loss_timer : int = 0
+        self._latency_trace = None
 
         #statistics and server info:
         self.pixel_counter : deque = deque(maxlen=1000)
@@ -199,6 +205,7 @@ class WindowClient(StubClientMixin):
         self._button_state = {}
 
     def init(self, opts) -> None:
+        self._latency_trace = get_latency_trace("client")
         if opts.system_tray:
             try:
                 from xpra.client.gui import client_tray
@@ -316,6 +323,7 @@ class WindowClient(StubClientMixin):
         #(cleaner and needed when we run embedded in the client launcher)
         self.destroy_all_windows()
         self.cancel_lost_focus_timer()
+        self.cancel_draw_loss_timer()
         if dq:
             dq.put(None)
         dt = self._draw_thread
@@ -1261,6 +1269,7 @@ class WindowClient(StubClientMixin):
             del self._id_to_window[wid]
             del self._window_to_id[window]
             self.destroy_window(wid, window)
+        self._draw_sequences.pop(wid, None)
         self.set_tray_icon()
 
     def may_reenable_modal_windows(self, window) -> None:
@@ -1478,6 +1487,10 @@ class WindowClient(StubClientMixin):
     ######################################################################
     # painting windows:
     def _process_draw(self, packet : PacketType) -> None:
+        trace = self._latency_trace
+        if trace:
+            #when the packet was received, keyed by window and sequence:
+            trace.mark((packet[1], packet[8]))
         if PAINT_DELAY>=0:
             GLib.timeout_add(PAINT_DELAY, self._draw_queue.put, packet)
         else:
@@ -1491,6 +1504,49 @@ class WindowClient(StubClientMixin):
         drawlog("sending ack: %s", packet)
         self.send_now(*packet)
 
+    def draw_packets_may_be_lost(self) -> bool:
+        #ie: quic connections can send draw packets as datagrams
+        conn = getattr(self._protocol, "_conn", None)
+        return getattr(conn, "draw_datagrams", False)
+
+    def check_draw_sequence(self, wid:int, packet_sequence:int, previous:int,
+                            x:int, y:int, width:int, height:int) -> bool:
+        """ returns False if this draw packet is stale and must be dropped """
+        ds = self._draw_sequences.get(wid)
+        if ds is None:
+            ds = self._draw_sequences[wid] = DrawSequence()
+        if not ds.received(packet_sequence, previous, x, y, width, height, monotonic()):
+            drawlog("dropping stale draw packet %i for window %i", packet_sequence, wid)
+            self.idle_add(self.send_damage_sequence, wid, packet_sequence, width, height,
+                          WINDOW_PACKET_LOST, "stale packet")
+            return False
+        if ds.missing:
+            self.idle_add(self.schedule_lost_draws_check)
+        return True
+
+    def schedule_lost_draws_check(self) -> None:
+        if not self._draw_loss_timer:
+            self._draw_loss_timer = self.timeout_add(LOSS_DELAY, self.check_lost_draws)
+
+    def cancel_draw_loss_timer(self) -> None:
+        dlt = self._draw_loss_timer
+        if dlt:
+            self._draw_loss_timer = 0
+            GLib.source_remove(dlt)
+
+    def check_lost_draws(self) -> bool:
+        self._draw_loss_timer = 0
+        now = monotonic()
+        pending = False
+        for wid, ds in tuple(self._draw_sequences.items()):
+            for packet_sequence in ds.get_lost(now):
+                drawlog("draw packet %i for window %i is lost", packet_sequence, wid)
+                self.send_damage_sequence(wid, packet_sequence, 0, 0, WINDOW_PACKET_LOST, "packet lost")
+            pending |= bool(ds.missing)
+        if pending:
+            self.schedule_lost_draws_check()
+        return False
+
     def _draw_thread_loop(self):
         while self.exit_code is None:
             packet = self._draw_queue.get()
@@ -1522,11 +1578,14 @@ class WindowClient(StubClientMixin):
             def draw_cleanup():
                 if coding=="mmap":
                     assert self.mmap_enabled
-                    from xpra.net.mmap_pipe import int_from_buffer
                     #we need to ack the data to free the space!
-                    data_start = int_from_buffer(self.mmap, 0)
+                    ring = typedict(packet[10]).intget("mmap-ring", 0) if len(packet)>10 else 0
                     offset, length = data[-1]
-                    data_start.value = offset+length
+                    if ring:
+                        self.mmap_reader.skip(ring, offset, length)
+                    else:
+                        from xpra.net.mmap_pipe import mmap_ack
+                        mmap_ack(self.mmap, ring, offset+length)
                     #clear the mmap area via idle_add so any pending draw requests
                     #will get a chance to run first (preserving the order)
                 self.send_damage_sequence(wid, packet_sequence, width, height, WINDOW_NOT_FOUND, "window not found")
@@ -1537,15 +1596,24 @@ class WindowClient(StubClientMixin):
         if len(packet)>10:
             options = packet[10]
         options = typedict(options)
+        if self.draw_packets_may_be_lost():
+            #only the packets with the "datagram" option can be lost:
+            previous = options.intget("datagram", -1)
+            if not self.check_draw_sequence(wid, packet_sequence, previous, x, y, width, height):
+                return
         dtype = DRAW_TYPES.get(type(data), type(data))
         drawlog("process_draw: %7i %8s for window %3i, sequence %8i, %4ix%-4i at %4i,%-4i using %6s encoding with options=%s",
                 len(data), dtype, wid, packet_sequence, width, height, x, y, coding, options)
         start = monotonic()
+        trace = self._latency_trace
+        stamps = options.inttupleget("trace") if trace else ()
         def record_decode_time(success, message=""):
             if success>0:
                 end = monotonic()
                 decode_time = round(end*1000*1000-start*1000*1000)
                 self.pixel_counter.append((start, end, width*height))
+                if stamps:
+                    self.trace_draw(window, wid, packet_sequence, stamps, start, end)
                 dms = "%sms" % (int(decode_time/100)/10.0)
                 paintlog("record_decode_time(%s, %s) wid=%s, %s: %sx%s, %s",
                          success, message, wid, coding, width, height, dms)
@@ -1578,6 +1646,25 @@ class WindowClient(StubClientMixin):
             raise
 
 
+    def trace_draw(self, window, wid:int, packet_sequence:int, stamps, start:float, end:float) -> None:
+        """
+            Records all the stages of this draw packet, from the damage event on the server
+            to the paint on the client, the backing will add the presentation on screen.
+        """
+        trace = self._latency_trace
+        received = to_us(trace.pop_mark((wid, packet_sequence)) or start)
+        trace.flow(wid, packet_sequence, received, False)
+        #'network' includes the time spent in the server's send queue:
+        trace.spans(wid, packet_sequence, get_server_stages(stamps) + [
+            ("network", stamps[-1], received),
+            ("draw-queue", received, to_us(start)),
+            ("decode", to_us(start), to_us(end)),
+            ])
+        backing = getattr(window, "_backing", None)
+        if backing:
+            backing.trace_painted(trace, wid, packet_sequence, start)
+
+
     ######################################################################
     # screen scaling:
     @staticmethod
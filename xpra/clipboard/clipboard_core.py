@@ -7,6 +7,8 @@
 import os
 import struct
 import re
+import hashlib
+from collections import OrderedDict
 from time import monotonic
 from io import BytesIO
 from typing import Tuple, List, Dict, Callable, Optional, Any, Iterable
@@ -26,6 +28,15 @@ MIN_CLIPBOARD_COMPRESS_SIZE : int = envint("XPRA_MIN_CLIPBOARD_COMPRESS_SIZE", 5
 MAX_CLIPBOARD_PACKET_SIZE : int = 16*1024*1024
 MAX_CLIPBOARD_RECEIVE_SIZE : int = envint("XPRA_MAX_CLIPBOARD_RECEIVE_SIZE", -1)
 MAX_CLIPBOARD_SEND_SIZE : int = envint("XPRA_MAX_CLIPBOARD_SEND_SIZE", -1)
+#contents larger than this are announced using their digest first,
+#then streamed in chunks if the peer does not have them cached already:
+MIN_CLIPBOARD_DIGEST_SIZE : int = envint("XPRA_MIN_CLIPBOARD_DIGEST_SIZE", 64*1024)
+CLIPBOARD_CHUNK_SIZE : int = envint("XPRA_CLIPBOARD_CHUNK_SIZE", 1024*1024)
+MAX_CLIPBOARD_TRANSFER_SIZE : int = envint("XPRA_MAX_CLIPBOARD_TRANSFER_SIZE", 256*1024*1024)
+CLIPBOARD_TRANSFER_TIMEOUT : int = envint("XPRA_CLIPBOARD_TRANSFER_TIMEOUT", 60)
+#per selection:
+CLIPBOARD_CACHE_ENTRIES : int = envint("XPRA_CLIPBOARD_CACHE_ENTRIES", 4)
+CLIPBOARD_CACHE_SIZE : int = envint("XPRA_CLIPBOARD_CACHE_SIZE", 128*1024*1024)
 
 ALL_CLIPBOARDS : Tuple[str, ...] = tuple(PLATFORM_CLIPBOARDS)
 CLIPBOARDS : List[str] = list(PLATFORM_CLIPBOARDS)
@@ -96,6 +107,55 @@ def get_format_size(dformat:int) -> int:
     return max(8, {32 : CARD32_SIZE}.get(dformat, dformat))
 
 
+def contents_digest(data) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class ContentsCache:
+    """
+        A bounded LRU cache of the clipboard contents received for one selection,
+        indexed by their digest.
+    """
+    __slots__ = ("entries", "max_entries", "max_size", "size", "hits", "misses")
+
+    def __init__(self, max_entries:int=CLIPBOARD_CACHE_ENTRIES, max_size:int=CLIPBOARD_CACHE_SIZE):
+        self.entries : OrderedDict = OrderedDict()
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, digest:str) -> Optional[bytes]:
+        data = self.entries.get(digest)
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(digest)
+        return data
+
+    def add(self, digest:str, data:bytes) -> None:
+        if self.max_entries<=0 or len(data)>self.max_size or digest in self.entries:
+            return
+        self.entries[digest] = data
+        self.size += len(data)
+        while len(self.entries)>self.max_entries or self.size>self.max_size:
+            self.size -= len(self.entries.popitem(last=False)[1])
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.size = 0
+
+    def get_info(self) -> Dict[str,Any]:
+        return {
+            "entries"   : len(self.entries),
+            "size"      : self.size,
+            "hits"      : self.hits,
+            "misses"    : self.misses,
+            }
+
+
 class ClipboardProxyCore:
     def __init__(self, selection):
         self._selection : str = selection
@@ -324,6 +384,13 @@ class ClipboardProtocolHelperCore:
         self.max_clipboard_packet_size : int = d.intget("max-packet-size", MAX_CLIPBOARD_PACKET_SIZE)
         self.max_clipboard_receive_size : int = d.intget("max-receive-size", MAX_CLIPBOARD_RECEIVE_SIZE)
         self.max_clipboard_send_size : int = d.intget("max-send-size", MAX_CLIPBOARD_SEND_SIZE)
+        #whether the peer supports the digest and chunks packets:
+        self.contents_digest : bool = d.boolget("contents-digest", False)
+        #outgoing contents waiting for the peer to tell us if it needs them: request_id -> (time, data)
+        self._clipboard_outgoing : Dict[int,Tuple[float,bytes]] = {}
+        #incoming contents being streamed: request_id -> transfer attributes and buffer
+        self._clipboard_incoming : Dict[int,Dict[str,Any]] = {}
+        self._clipboard_cache : Dict[str,ContentsCache] = {}
         self.filter_res = []
         filter_res : Tuple[str,...] = d.strtupleget("filters")
         if filter_res:
@@ -395,6 +462,10 @@ class ClipboardProtocolHelperCore:
                 "can-send"      : self.can_send,
                 "can-receive"   : self.can_receive,
                 "want_targets"  : self._want_targets,
+                "contents-digest"   : self.contents_digest,
+                "outgoing"      : tuple(self._clipboard_outgoing.keys()),
+                "incoming"      : tuple(self._clipboard_incoming.keys()),
+                "cache"         : {selection : cache.get_info() for selection, cache in self._clipboard_cache.items()},
                 }
         for clipboard, proxy in self._clipboard_proxies.items():
             info[clipboard] = proxy.get_info()
@@ -407,6 +478,9 @@ class ClipboardProtocolHelperCore:
         for x in self._clipboard_proxies.values():
             x.cleanup()
         self._clipboard_proxies = {}
+        self._clipboard_outgoing = {}
+        self._clipboard_incoming = {}
+        self._clipboard_cache = {}
 
     def client_reset(self) -> None:
         """ overriden in subclasses to try to reset the state """
@@ -419,6 +493,10 @@ class ClipboardProtocolHelperCore:
         for proxy in self._clipboard_proxies.values():
             proxy.set_direction(can_send, can_receive)
 
+    def set_contents_digest(self, contents_digest:bool) -> None:
+        log("set_contents_digest(%s)", contents_digest)
+        self.contents_digest = contents_digest
+
     def set_limits(self, max_send_size:Optional[int], max_receive_size:Optional[int]) -> None:
         if max_send_size is not None:
             self.max_clipboard_send_size = max_send_size
@@ -452,6 +530,9 @@ class ClipboardProtocolHelperCore:
             "clipboard-request"             : self._process_clipboard_request,
             "clipboard-contents"            : self._process_clipboard_contents,
             "clipboard-contents-none"       : self._process_clipboard_contents_none,
+            "clipboard-contents-digest"     : self._process_clipboard_contents_digest,
+            "clipboard-contents-ack"        : self._process_clipboard_contents_ack,
+            "clipboard-contents-chunk"      : self._process_clipboard_contents_chunk,
             "clipboard-pending-requests"    : self._process_clipboard_pending_requests,
             "clipboard-enable-selections"   : self._process_clipboard_enable_selections,
             }
@@ -665,6 +746,10 @@ class ClipboardProtocolHelperCore:
         if wire_encoding is None:
             no_contents()
             return
+        if (self.contents_digest and isinstance(wire_data, (str, bytes, memoryview))
+            and len(wire_data)>=MIN_CLIPBOARD_DIGEST_SIZE):
+            self.send_contents_digest(request_id, selection, dtype, dformat, wire_encoding, wire_data, truncated)
+            return
         wire_data = self._may_compress(dtype, dformat, wire_data)
         if wire_data is not None:
             packet = ["clipboard-contents", request_id, selection,
@@ -699,6 +784,119 @@ class ClipboardProtocolHelperCore:
         assert isinstance(request_id, int) and isinstance(dformat, int)
         self._clipboard_got_contents(request_id, dtype, dformat, raw_data)
 
+    def send_contents_digest(self, request_id:int, selection:str, dtype:str, dformat:int,
+                             wire_encoding, wire_data, truncated:int) -> None:
+        if isinstance(wire_data, str):
+            wire_data = wire_data.encode("utf8")
+        else:
+            wire_data = bytes(wire_data)
+        size = len(wire_data)
+        if size>MAX_CLIPBOARD_TRANSFER_SIZE:
+            log.warn("Warning: clipboard contents are too big and have not been sent")
+            log.warn(" %s bytes dropped (maximum is %s)", size, MAX_CLIPBOARD_TRANSFER_SIZE)
+            self.send("clipboard-contents-none", request_id, selection)
+            return
+        digest = contents_digest(wire_data)
+        log("sending digest %s for %i bytes of clipboard contents, request id %i", digest, size, request_id)
+        now = monotonic()
+        #expire the transfers the peer never replied to:
+        for rid, (queued, _) in tuple(self._clipboard_outgoing.items()):
+            if now-queued>CLIPBOARD_TRANSFER_TIMEOUT:
+                self._clipboard_outgoing.pop(rid, None)
+        self._clipboard_outgoing[request_id] = (now, wire_data)
+        self.send("clipboard-contents-digest", request_id, selection,
+                  dtype, dformat, wire_encoding, digest, size, truncated)
+
+    def _process_clipboard_contents_ack(self, packet : PacketType) -> None:
+        request_id = packet[1]
+        status = bytestostr(packet[2])
+        entry = self._clipboard_outgoing.pop(request_id, None)
+        log("process clipboard contents ack for request id %s: %s", request_id, status)
+        if status!="send" or entry is None:
+            return
+        data = entry[1]
+        size = len(data)
+        chunk_size = max(1024, min(CLIPBOARD_CHUNK_SIZE, self.max_clipboard_packet_size))
+        for offset in range(0, size, chunk_size):
+            chunk = data[offset:offset+chunk_size]
+            more = offset+chunk_size<size
+            self.send("clipboard-contents-chunk", request_id, offset,
+                      Compressible("clipboard: chunk", chunk), more)
+
+    def _process_clipboard_contents_digest(self, packet : PacketType) -> None:
+        request_id, selection, dtype, dformat, wire_encoding, digest, size, truncated = packet[1:9]
+        selection = bytestostr(selection)
+        digest = bytestostr(digest)
+        log("process clipboard contents digest %s, selection=%s, size=%i, request id=%i",
+            digest, selection, size, request_id)
+        assert isinstance(request_id, int) and isinstance(dformat, int) and isinstance(size, int)
+        if size>MAX_CLIPBOARD_TRANSFER_SIZE:
+            log.warn("Warning: clipboard contents are too big and have been dropped")
+            log.warn(" %s bytes (maximum is %s)", size, MAX_CLIPBOARD_TRANSFER_SIZE)
+            self.send("clipboard-contents-ack", request_id, "cancel")
+            self._clipboard_got_contents(request_id, "", 0, None)
+            return
+        transfer = {
+            "selection"     : selection,
+            "dtype"         : bytestostr(dtype),
+            "dformat"       : dformat,
+            "wire-encoding" : bytestostr(wire_encoding),
+            "digest"        : digest,
+            "size"          : size,
+            "truncated"     : truncated,
+            }
+        for cache in self._clipboard_cache.values():
+            data = cache.get(digest)
+            if data is not None:
+                log("clipboard contents found in the %r cache", selection)
+                self.send("clipboard-contents-ack", request_id, "cached")
+                self.clipboard_transfer_complete(request_id, transfer, data)
+                return
+        transfer["buffer"] = bytearray()
+        self._clipboard_incoming[request_id] = transfer
+        self.send("clipboard-contents-ack", request_id, "send")
+        self._clipboard_transfer_progress(request_id)
+
+    def _process_clipboard_contents_chunk(self, packet : PacketType) -> None:
+        request_id, offset, data, more = packet[1:5]
+        transfer = self._clipboard_incoming.get(request_id)
+        if not transfer:
+            log.warn("Warning: clipboard contents chunk for unknown request id %s", request_id)
+            return
+        buf = transfer["buffer"]
+        if offset!=len(buf) or offset+len(data)>transfer["size"]:
+            log.warn("Warning: invalid clipboard contents chunk for request id %s", request_id)
+            log.warn(" %i bytes at offset %i, expected offset %i", len(data), offset, len(buf))
+            self.cancel_incoming_transfer(request_id)
+            return
+        buf += data
+        if more:
+            self._clipboard_transfer_progress(request_id)
+            return
+        del self._clipboard_incoming[request_id]
+        data = bytes(buf)
+        if len(data)!=transfer["size"] or contents_digest(data)!=transfer["digest"]:
+            log.warn("Warning: clipboard contents do not match their digest, request id %s", request_id)
+            self._clipboard_got_contents(request_id, "", 0, None)
+            return
+        self._clipboard_cache.setdefault(transfer["selection"], ContentsCache()).add(transfer["digest"], data)
+        self.clipboard_transfer_complete(request_id, transfer, data)
+
+    def cancel_incoming_transfer(self, request_id:int) -> None:
+        if self._clipboard_incoming.pop(request_id, None):
+            self.send("clipboard-contents-ack", request_id, "cancel")
+            self._clipboard_got_contents(request_id, "", 0, None)
+
+    def clipboard_transfer_complete(self, request_id:int, transfer:Dict[str,Any], wire_data:bytes) -> None:
+        dtype = transfer["dtype"]
+        dformat = transfer["dformat"]
+        raw_data = self._munge_wire_selection_to_raw(transfer["wire-encoding"], dtype, dformat, wire_data)
+        log("clipboard transfer complete for request id %i: %i bytes", request_id, len(raw_data or b""))
+        self._clipboard_got_contents(request_id, dtype, dformat, raw_data)
+
+    def _clipboard_transfer_progress(self, request_id:int) -> None:
+        """ subclasses may want to extend the timeout of this request """
+
     def _process_clipboard_contents_none(self, packet : PacketType) -> None:
         log("process clipboard contents none")
         request_id = packet[1]
@@ -91,7 +91,17 @@ class ClipboardTimeoutHelper(ClipboardProtocolHelperCore):
         self.progress()
         self.send("clipboard-request", request_id, remote, target)
 
+    def _clipboard_transfer_progress(self, request_id:int) -> None:
+        #the contents are being streamed, restart the timer:
+        request = self._clipboard_outstanding_requests.get(request_id)
+        if request:
+            GLib.source_remove(request[0])
+            timer = GLib.timeout_add(REMOTE_TIMEOUT, self.timeout_request, request_id)
+            self._clipboard_outstanding_requests[request_id] = (timer, )+request[1:]
+
     def timeout_request(self, request_id:int) -> None:
+        if self._clipboard_incoming.pop(request_id, None):
+            self.send("clipboard-contents-ack", request_id, "cancel")
         try:
             selection, target = self._clipboard_outstanding_requests.pop(request_id)[1:]
         except KeyError:
@@ -111,6 +111,26 @@ def get_x264_preset(speed:int=50, fast_decode:bool=False) -> int:
         return 0
     return 5 - max(0, min(4, speed // 20))
 
+def get_damage_map(rects, width:int, height:int, block_size:int=16) -> bytearray:
+    """
+        Returns one byte per block of the picture, in rows:
+        1 for the blocks touched by any of the damage rectangles `(x, y, w, h)`, 0 for the others.
+    """
+    cols = (width+block_size-1)//block_size
+    rows = (height+block_size-1)//block_size
+    damage_map = bytearray(cols*rows)
+    for x, y, w, h in rects:
+        x1 = max(0, x)//block_size
+        y1 = max(0, y)//block_size
+        x2 = min(cols, (min(width, x+w)+block_size-1)//block_size)
+        y2 = min(rows, (min(height, y+h)+block_size-1)//block_size)
+        if x2<=x1:
+            continue
+        row = b"\1"*(x2-x1)
+        for r in range(y1, y2):
+            damage_map[r*cols+x1:r*cols+x2] = row
+    return damage_map
+
 
 RGB_FORMATS : Tuple[str, ...] = (
                "XRGB",
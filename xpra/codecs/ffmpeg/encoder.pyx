@@ -1439,10 +1439,14 @@ cdef class Encoder:
             if self.encoding.find("mpeg4")>=0:
                 self.video_ctx.thread_count = MPEG4_THREAD_COUNT     #avoid ffmpeg warnings
             else:
-                self.video_ctx.thread_count = THREAD_COUNT
+                #the server's cpu budget replaces the automatic thread count:
+                thread_count = options.intget("threads", THREAD_COUNT)
+                if THREAD_COUNT>0:
+                    thread_count = min(THREAD_COUNT, thread_count)
+                self.video_ctx.thread_count = thread_count
             self.video_ctx.flags |= AV_CODEC_FLAG_GLOBAL_HEADER
             self.video_ctx.flags2 |= AV_CODEC_FLAG2_FAST   #may cause "no deblock across slices" - which should be fine
-            log("init_encoder() thread-type=%i, thread-count=%i", THREAD_TYPE, THREAD_COUNT)
+            log("init_encoder() thread-type=%i, thread-count=%i", THREAD_TYPE, self.video_ctx.thread_count)
             log("init_encoder() codec flags: %s", flagscsv(CODEC_FLAGS, self.video_ctx.flags))
             log("init_encoder() codec flags2: %s", flagscsv(CODEC_FLAGS2, self.video_ctx.flags2))
             if self.encoding.startswith("h264") or self.encoding.find("mpeg4")>=0:
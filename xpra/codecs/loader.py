@@ -6,10 +6,11 @@
 
 import sys
 import os.path
+from threading import Lock
 from types import ModuleType
 from typing import Tuple, List, Dict, Any
 
-from xpra.util import envbool, csv
+from xpra.util import envbool, envint, csv
 from xpra.os_util import OSX, WIN32
 from xpra.version_util import parse_version
 from xpra.codecs.codec_constants import HELP_ORDER
@@ -27,8 +28,20 @@ FULL_SELFTEST = envbool("XPRA_CODEC_FULL_SELFTEST", False)
 CODEC_FAIL_IMPORT = os.environ.get("XPRA_CODEC_FAIL_IMPORT", "").split(",")
 CODEC_FAIL_SELFTEST = os.environ.get("XPRA_CODEC_FAIL_SELFTEST", "").split(",")
 
+#remember which codecs have passed their self test,
+#so that we don't need to run it again until the module or xpra is updated:
+CODEC_CACHE = envbool("XPRA_CODEC_CACHE", True)
+CODEC_CACHE_FILE = os.environ.get("XPRA_CODEC_CACHE_FILE", "")
+#the self test results of these codecs depend on the hardware available:
+NOCACHE = ["nvenc", "nvdec", "enc_nvjpeg", "dec_nvjpeg", "nvfbc", "v4l2", "evdi", "drm", "enc_gstreamer", "dec_gstreamer"]
+CODEC_LOAD_THREADS = envint("XPRA_CODEC_LOAD_THREADS", 4)
+#these initialize CUDA or the GPU driver when they are loaded, so they are loaded one at a time:
+GPU_CODECS = ("nvenc", "nvdec", "enc_nvjpeg", "dec_nvjpeg", "nvfbc")
+
 log("codec loader settings: SELFTEST=%s, FULL_SELFTEST=%s, CODEC_FAIL_IMPORT=%s, CODEC_FAIL_SELFTEST=%s",
         SELFTEST, FULL_SELFTEST, CODEC_FAIL_IMPORT, CODEC_FAIL_SELFTEST)
+log(" CODEC_CACHE=%s, CODEC_CACHE_FILE=%s, CODEC_LOAD_THREADS=%s",
+        CODEC_CACHE, CODEC_CACHE_FILE, CODEC_LOAD_THREADS)
 
 
 SKIP_LIST : Tuple[str,...] = ()
@@ -53,6 +66,100 @@ ALL_CODECS : Tuple[str,...] = filt(*set(
     SOURCES))
 
 
+probe_lock = Lock()
+probe_cache : Dict[str,List[Any]] = {}
+probe_cache_state = {"loaded" : False, "modified" : False}
+
+def get_probe_cache_filename() -> str:
+    # pylint: disable=import-outside-toplevel
+    from xpra.os_util import osexpand
+    from xpra.platform.paths import get_user_cache_dir
+    return osexpand(CODEC_CACHE_FILE or os.path.join(get_user_cache_dir(), "codecs.json"))
+
+def load_probe_cache() -> None:
+    """ must be called with the probe lock held """
+    if probe_cache_state["loaded"]:
+        return
+    probe_cache_state["loaded"] = True
+    filename = get_probe_cache_filename()
+    if not os.path.exists(filename):
+        return
+    try:
+        import json  # pylint: disable=import-outside-toplevel
+        with open(filename, "r", encoding="utf8") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            probe_cache.update((k, v) for k, v in data.items() if isinstance(v, list))
+    except (OSError, ValueError) as e:
+        log("load_probe_cache() %s", filename, exc_info=True)
+        log.warn(f"Warning: failed to load the codec cache file {filename!r}")
+        log.warn(f" {e}")
+    log("loaded %i codec probe results from %r", len(probe_cache), filename)
+
+def save_probe_cache() -> None:
+    if not CODEC_CACHE:
+        return
+    with probe_lock:
+        if not probe_cache_state["modified"]:
+            return
+        probe_cache_state["modified"] = False
+        data = dict(probe_cache)
+    filename = get_probe_cache_filename()
+    try:
+        import json  # pylint: disable=import-outside-toplevel
+        os.makedirs(os.path.dirname(filename), mode=0o700, exist_ok=True)
+        #write to a temporary file first, so concurrent readers never see a partial file:
+        tmp = f"{filename}.{os.getpid()}"
+        with open(tmp, "w", encoding="utf8") as f:
+            json.dump(data, f)
+        os.replace(tmp, filename)
+    except OSError as e:
+        log("save_probe_cache() %s", filename, exc_info=True)
+        log.warn(f"Warning: failed to save the codec cache file {filename!r}")
+        log.warn(f" {e}")
+
+def get_probe_key(module:ModuleType) -> List[Any]:
+    """
+        The cached probe result is only valid for this exact version of the module:
+        same filename, modification time and size, same xpra and codec version.
+    """
+    # pylint: disable=import-outside-toplevel
+    from xpra import __version__
+    filename = getattr(module, "__file__", "") or ""
+    try:
+        stat = os.stat(filename)
+        mtime, size = stat.st_mtime, stat.st_size
+    except OSError:
+        mtime = size = 0
+    version = ""
+    get_version = getattr(module, "get_version", None)
+    if get_version:
+        try:
+            version = str(get_version())
+        except Exception:
+            log("%s.get_version()", module, exc_info=True)
+    return [filename, mtime, size, __version__, version]
+
+def probe_cached(name:str, module:ModuleType) -> bool:
+    """ returns True if this codec module has already passed its self test """
+    if not CODEC_CACHE or name in NOCACHE:
+        return False
+    key = get_probe_key(module)
+    with probe_lock:
+        load_probe_cache()
+        return probe_cache.get(name)==key
+
+def record_probe(name:str, module:ModuleType) -> None:
+    if not CODEC_CACHE or name in NOCACHE:
+        return
+    key = get_probe_key(module)
+    with probe_lock:
+        load_probe_cache()
+        if probe_cache.get(name)!=key:
+            probe_cache[name] = key
+            probe_cache_state["modified"] = True
+
+
 codec_errors : Dict[str,str] = {}
 codecs : Dict[str,ModuleType] = {}
 def codec_import_check(name:str, description:str, top_module, class_module, classnames):
@@ -107,15 +214,19 @@ def codec_import_check(name:str, description:str, top_module, class_module, clas
                 if SELFTEST and selftest:
                     if name in CODEC_FAIL_SELFTEST:
                         raise ImportError("codec found in fail selftest list")
-                    try:
-                        selftest(FULL_SELFTEST)
-                    except Exception as e:
-                        log(f"{selftest} failed", exc_info=True)
-                        if not isinstance(e, ImportError):
-                            log.warn(f"Warning: {name} failed its self test")
-                            for x in str(e).splitlines():
-                                log.warn(f" {x}")
-                        return None
+                    if probe_cached(name, ic):
+                        log(f" {name} has already passed its self test")
+                    else:
+                        try:
+                            selftest(FULL_SELFTEST)
+                        except Exception as e:
+                            log(f"{selftest} failed", exc_info=True)
+                            if not isinstance(e, ImportError):
+                                log.warn(f"Warning: {name} failed its self test")
+                                for x in str(e).splitlines():
+                                    log.warn(f" {x}")
+                            return None
+                        record_probe(name, ic)
             finally:
                 cleanup_module = getattr(ic, "cleanup_module", None)
                 log(f"{class_module} cleanup_module={cleanup_module}")
@@ -238,6 +349,10 @@ if OSX or WIN32:
     NOLOAD += ["v4l2", "evdi", "drm"]
 
 
+#one lock per codec name, so that the same codec is never loaded twice
+#when different threads request it at the same time:
+load_locks : Dict[str,Lock] = {}
+
 def load_codec(name:str):
     log("load_codec(%s)", name)
     name = name.replace("-", "_")
@@ -249,36 +364,67 @@ def load_codec(name:str):
             log("load_codec(%s)", name, exc_info=True)
             log.error("Error: invalid codec name '%s'", name)
         else:
-            xpra_codec_import(name, description, top_module, class_module, classnames)
+            with probe_lock:
+                lock = load_locks.setdefault(name, Lock())
+            with lock:
+                if not has_codec(name):
+                    xpra_codec_import(name, description, top_module, class_module, classnames)
     return get_codec(name)
 
+def load_codecs_parallel(*names, threads:int=CODEC_LOAD_THREADS) -> None:
+    """
+        Loads the codecs using multiple threads,
+        most of the time is spent in the self tests and in native code
+        which does not hold the GIL.
+    """
+    pending = [name for name in names if not has_codec(name) and name not in NOLOAD]
+    log("load_codecs_parallel%s pending=%s", names, pending)
+    #the GPU codecs are all loaded by the same thread, starting first since they are the slowest:
+    gpu = [name for name in pending if name in GPU_CODECS]
+    jobs = ([gpu] if gpu else []) + [[name] for name in pending if name not in GPU_CODECS]
+    if threads<=1 or len(jobs)<=1:
+        for name in pending:
+            load_codec(name)
+    else:
+        # pylint: disable=import-outside-toplevel
+        from xpra.make_thread import start_thread
+        jobs.reverse()
+        def load_pending():
+            while True:
+                try:
+                    job = jobs.pop()
+                except IndexError:
+                    return
+                for name in job:
+                    load_codec(name)
+        workers = [start_thread(load_pending, f"codec-loader-{i}", daemon=True)
+                   for i in range(min(threads, len(jobs)))]
+        for worker in workers:
+            worker.join()
+    save_probe_cache()
+
 
 def load_codecs(encoders=True, decoders=True, csc=True, video=True, sources=False) -> Tuple[str,...]:
     log("loading codecs")
-    loaded : List[str] = []
-    def load(*names):
-        for name in names:
-            if has_codec(name):
-                continue
-            if name in NOLOAD:
-                log(f"{name} is in the NOLOAD list for this platform: {NOLOAD}")
-                continue
-            load_codec(name)
-            if has_codec(name) and name not in loaded:
-                loaded.append(name)
-
+    names : List[str] = []
     if encoders:
-        load(*ENCODER_CODECS)
+        names += ENCODER_CODECS
         if video:
-            load(*ENCODER_VIDEO_CODECS)
+            names += ENCODER_VIDEO_CODECS
     if csc and video:
-        load(*CSC_CODECS)
+        names += CSC_CODECS
     if decoders:
-        load(*DECODER_CODECS)
+        names += DECODER_CODECS
         if video:
-            load(*DECODER_VIDEO_CODECS)
+            names += DECODER_VIDEO_CODECS
     if sources:
-        load(*SOURCES)
+        names += SOURCES
+    for name in names:
+        if name in NOLOAD:
+            log(f"{name} is in the NOLOAD list for this platform: {NOLOAD}")
+    before = set(codecs.keys())
+    load_codecs_parallel(*names)
+    loaded = [name for name in names if has_codec(name) and name not in before]
     log("done loading codecs: %s", loaded)
     return tuple(loaded)
 
@@ -7,16 +7,21 @@
 
 import sys
 import traceback
+from itertools import count
 from threading import Lock
 from typing import Dict, Tuple, List, Any
 
 from xpra.scripts.config import csvstrl
-from xpra.codecs.loader import load_codec, get_codec, get_codec_error
+from xpra.codecs.loader import load_codec, load_codecs_parallel, get_codec, get_codec_error
 from xpra.util import csv
 from xpra.log import Logger
 
 log = Logger("codec", "video")
 
+#changes whenever the codecs available change,
+#so that anything derived from the specs can be discarded:
+generation_counter = count(1)
+
 #the codec loader uses the names...
 #but we need the module name to be able to probe without loading the codec:
 CODEC_TO_MODULE : Dict[str,str] = {
@@ -41,6 +46,17 @@ CODEC_TO_MODULE : Dict[str,str] = {
     "enc_gstreamer" : "gstreamer.encoder",
     }
 
+#the encodings each module can handle, when this is known without loading it:
+#(modules which are not listed are always loaded)
+CODEC_ENCODINGS : Dict[str,Tuple[str,...]] = {
+    "enc_vpx"       : ("vp8", "vp9"),
+    "dec_vpx"       : ("vp8", "vp9"),
+    "enc_x264"      : ("h264", ),
+    "enc_x265"      : ("h265", ),
+    "enc_openh264"  : ("h264", ),
+    "dec_openh264"  : ("h264", ),
+    }
+
 def has_codec_module(module_name:str) -> bool:
     top_module = f"xpra.codecs.{module_name}"
     try:
@@ -126,6 +142,18 @@ def filt(prefix, name, inlist, all_fn, all_list):
         log.warn("Warning: %s not found: %s", name, csv(notfound))
     return apl(x for x in inclist if x not in exclist and x!="none")
 
+def filt_encodings(modules:List[str], encodings) -> List[str]:
+    """ removes the modules which cannot handle any of the encodings specified """
+    if not encodings:
+        return modules
+    def usable(module):
+        module_encodings = CODEC_ENCODINGS.get(module)
+        return module_encodings is None or any(e in encodings for e in module_encodings)
+    skipped = [x for x in modules if not usable(x)]
+    if skipped:
+        log("not loading %s: no encodings in %s", csv(skipped), csv(encodings))
+    return [x for x in modules if x not in skipped]
+
 
 VDictEntry = Dict[str,List[str]]
 VDict = Dict[str,VDictEntry]
@@ -142,6 +170,7 @@ class VideoHelper:
         self._video_encoder_specs : VDict = vencspecs or {}
         self._csc_encoder_specs : VDict = cscspecs or {}
         self._video_decoder_specs : VDict = vdecspecs or {}
+        self.generation = next(generation_counter)
         self.video_encoders = []
         self.csc_modules = []
         self.video_decoders = []
@@ -154,8 +183,12 @@ class VideoHelper:
         self._init_from = []
         self._lock = Lock()
 
-    def set_modules(self, video_encoders=(), csc_modules=(), video_decoders=()):
-        log("set_modules%s", (video_encoders, csc_modules, video_decoders))
+    def set_modules(self, video_encoders=(), csc_modules=(), video_decoders=(), encodings=()):
+        """
+            Specifies the modules to load when `init` is called,
+            if `encodings` is specified, the modules which cannot handle any of them are skipped.
+        """
+        log("set_modules%s", (video_encoders, csc_modules, video_decoders, encodings))
         if self._initialized:
             log.error("Error: video helper modules have already been initialized")
             for ifrom in self._init_from:
@@ -166,6 +199,8 @@ class VideoHelper:
         self.video_encoders = filt("enc", "video encoders" , video_encoders,   get_video_encoders,  ALL_VIDEO_ENCODER_OPTIONS)
         self.csc_modules    = filt("csc", "csc modules"    , csc_modules,      get_csc_modules,     ALL_CSC_MODULE_OPTIONS)
         self.video_decoders = filt("dec", "video decoders" , video_decoders,   get_video_decoders,  ALL_VIDEO_DECODER_OPTIONS)
+        self.video_encoders = filt_encodings(self.video_encoders, encodings)
+        self.video_decoders = filt_encodings(self.video_decoders, encodings)
         log("VideoHelper.set_modules(%r, %r, %r) video encoders=%s, csc=%s, video decoders=%s",
             csv(video_encoders), csv(csc_modules), csv(video_decoders),
             csv(self.video_encoders), csv(self.csc_modules), csv(self.video_decoders))
@@ -190,6 +225,7 @@ class VideoHelper:
             self.csc_modules = []
             self.video_decoders = []
             self._initialized = False
+            self.generation = next(generation_counter)
 
     def clone(self):
         if not self._initialized:
@@ -206,7 +242,10 @@ class VideoHelper:
         ves = deepish_clone_dict(self._video_encoder_specs)
         ces = deepish_clone_dict(self._csc_encoder_specs)
         vds = deepish_clone_dict(self._video_decoder_specs)
-        return VideoHelper(ves, ces, vds, True)
+        vh = VideoHelper(ves, ces, vds, True)
+        #same specs:
+        vh.generation = self.generation
+        return vh
 
     def get_info(self) -> Dict[str,Any]:
         d : Dict[str,Any] = {}
@@ -248,10 +287,17 @@ class VideoHelper:
             log("VideoHelper.init() initialized=%s", self._initialized)
             if self._initialized:
                 return
+            #load all the modules in parallel first:
+            load_codecs_parallel(*(
+                [get_encoder_module_name(x) for x in self.video_encoders]+
+                [get_csc_module_name(x) for x in self.csc_modules]+
+                [get_decoder_module_name(x) for x in self.video_decoders]
+                ))
             self.init_video_encoders_options()
             self.init_csc_options()
             self.init_video_decoders_options()
             self._initialized = True
+            self.generation = next(generation_counter)
         log("VideoHelper.init() done")
 
     def get_encodings(self) -> Tuple[str,...]:
@@ -318,6 +364,7 @@ class VideoHelper:
 
     def add_encoder_spec(self, encoding:str, colorspace:str, spec):
         self._video_encoder_specs.setdefault(encoding, {}).setdefault(colorspace, []).append(spec)
+        self.generation = next(generation_counter)
 
 
     def init_csc_options(self) -> None:
@@ -355,6 +402,7 @@ class VideoHelper:
 
     def add_csc_spec(self, in_csc:str, out_csc:str, spec) -> None:
         self._csc_encoder_specs.setdefault(in_csc, {}).setdefault(out_csc, []).append(spec)
+        self.generation = next(generation_counter)
 
 
     def init_video_decoders_options(self) -> None:
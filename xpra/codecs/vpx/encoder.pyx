@@ -12,7 +12,7 @@ from typing import Dict, Any
 from xpra.log import Logger
 log = Logger("encoder", "vpx")
 
-from xpra.codecs.codec_constants import video_spec, get_subsampling_divs
+from xpra.codecs.codec_constants import video_spec, get_subsampling_divs, get_damage_map
 from xpra.os_util import WIN32, OSX, POSIX
 from xpra.util import AtomicInteger, envint, envbool, typedict
 
@@ -41,6 +41,8 @@ cdef inline int roundup(int n, int m):
     return (n + m - 1) & ~(m - 1)
 
 cdef int ENABLE_VP9_TILING = envbool("XPRA_VP9_TILING", False)
+#use the damage hints to skip the macroblocks that have not changed:
+cdef int ACTIVE_MAP = envbool("XPRA_VPX_ACTIVE_MAP", True)
 
 
 cdef inline int MIN(int a, int b):
@@ -69,6 +71,13 @@ cdef extern from "Python.h":
 cdef extern from "vpx/vp8cx.h":
     const vpx_codec_iface_t *vpx_codec_vp8_cx()
     const vpx_codec_iface_t *vpx_codec_vp9_cx()
+    ctypedef struct vpx_active_map_t:
+        unsigned char *active_map   #one byte per 16x16 macroblock, 0 for inactive
+        unsigned int rows
+        unsigned int cols
+    int VP8E_SET_ACTIVEMAP
+    #the same function as vpx_codec_control_, for setting the active map:
+    vpx_codec_err_t vpx_codec_control_active_map "vpx_codec_control_"(vpx_codec_ctx_t *ctx, int ctrl_id, vpx_active_map_t *active_map)
 
 cdef extern from "vpx/vpx_encoder.h":
     int VPX_ENCODER_ABI_VERSION
@@ -324,6 +333,8 @@ cdef class Encoder:
     cdef int speed
     cdef int quality
     cdef int lossless
+    cdef int active_map
+    cdef unsigned long skip_hints
     cdef object last_frame_times
     cdef object file
 
@@ -349,12 +360,15 @@ cdef class Encoder:
         self.speed = options.intget("speed", 50)
         self.bandwidth_limit = options.intget("bandwidth-limit", 0)
         self.lossless = 0
+        self.active_map = 0
+        self.skip_hints = 0
         self.frames = 0
         self.last_frame_times = deque(maxlen=200)
         self.pixfmt = get_vpx_colorspace(self.src_format)
         try:
             #no point having too many threads if the height is small, also avoids a warning:
-            self.max_threads = max(0, min(int(options.intget("threads", VPX_THREADS)), roundup(height, 64)//64, 32))
+            #(and the server's cpu budget may give us fewer threads)
+            self.max_threads = max(0, min(int(options.intget("threads", VPX_THREADS)), VPX_THREADS, roundup(height, 64)//64, 32))
         except Exception as e:
             log.error("Error parsing number of threads: %s", e)
             self.max_threads = 2
@@ -483,6 +497,7 @@ cdef class Encoder:
             "src_format": self.src_format,
             "max_threads": self.max_threads,
             "bandwidth-limit" : int(self.bandwidth_limit),
+            "skip-hints" : int(self.skip_hints),
             })
         #calculate fps:
         cdef unsigned int f = 0
@@ -573,6 +588,8 @@ cdef class Encoder:
         cdef int quality = options.get("quality", 50)
         if quality>=0:
             self.set_encoding_quality(quality)
+        if ACTIVE_MAP and self.frames>0:
+            self.set_active_map(options.get("damage-hints"))
 
         cdef Py_buffer py_buf[3]
         for i in range(3):
@@ -598,6 +615,34 @@ cdef class Encoder:
                 if py_buf[i].buf:
                     PyBuffer_Release(&py_buf[i])
 
+    cdef set_active_map(self, damage):
+        """
+            The macroblocks outside the damage rectangles are identical to the previous frame,
+            so they are marked as inactive and the encoder can skip them.
+            The map applies to all the following frames, so we must clear it
+            when we don't have any damage hints.
+        """
+        cdef vpx_active_map_t active_map
+        active_map.rows = (self.height+15)//16
+        active_map.cols = (self.width+15)//16
+        active_map.active_map = NULL
+        cdef unsigned char *buf
+        if damage:
+            damage_map = get_damage_map(damage, self.width, self.height, 16)
+            if 0 in damage_map:
+                buf = damage_map
+                active_map.active_map = buf
+        if active_map.active_map==NULL and not self.active_map:
+            return
+        #the encoder copies the map:
+        cdef vpx_codec_err_t ret = vpx_codec_control_active_map(self.context, VP8E_SET_ACTIVEMAP, &active_map)
+        if ret!=0:
+            log("failed to set the active map: %s (%s)", get_error_string(ret), ret)
+            self.active_map = 0
+            return
+        self.active_map = int(active_map.active_map!=NULL)
+        self.skip_hints += self.active_map
+
     cdef do_compress_image(self, uint8_t *pic_in[3], int strides[3]):
         #actual compression (no gil):
         cdef vpx_codec_iter_t iter = NULL
@@ -14,10 +14,11 @@ log = Logger("encoder", "x264")
 
 from xpra.util import envint, envbool, csv, typedict, AtomicInteger
 from xpra.os_util import bytestostr, strtobytes
-from xpra.codecs.codec_constants import video_spec, get_profile, get_x264_quality, get_x264_preset
+from xpra.codecs.codec_constants import video_spec, get_profile, get_x264_quality, get_x264_preset, get_damage_map
 from collections import deque
 
 from libc.string cimport memset
+from libc.stdlib cimport free, malloc
 from libc.stdint cimport int64_t, uint64_t, uint8_t, uintptr_t
 
 
@@ -31,6 +32,8 @@ TUNE = os.environ.get("XPRA_X264_TUNE")
 LOG_NALS = envbool("XPRA_X264_LOG_NALS")
 SAVE_TO_FILE = os.environ.get("XPRA_SAVE_TO_FILE")
 BLANK_VIDEO = envbool("XPRA_X264_BLANK_VIDEO")
+#use the damage hints to skip the macroblocks that have not changed:
+MB_INFO = envbool("XPRA_X264_MB_INFO", True)
 
 
 cdef extern from "Python.h":
@@ -53,6 +56,7 @@ cdef extern from "stdarg.h":
 
 cdef extern from "x264.h":
     int X264_KEYINT_MAX_INFINITE
+    int X264_MBINFO_CONSTANT
 
     int X264_BUILD
 
@@ -162,6 +166,8 @@ cdef extern from "x264.h":
         int         i_subpel_refine     # subpixel motion estimation quality */
         int         i_weighted_pred     # weighting for P-frames
         int         b_weighted_bipred   # implicit weighting for B-frames
+        int         b_mb_info           # use input mb_info data in x264_picture_t
+        int         b_mb_info_update    # update mb_info data in x264_picture_t
 
     ctypedef struct x264_param_t:
         unsigned int cpu
@@ -226,7 +232,10 @@ cdef extern from "x264.h":
         int i_stride[4]     #Strides for each plane
         uint8_t *plane[4]   #Pointers to each plane
     ctypedef struct x264_image_properties_t:
-        pass
+        float *quant_offsets                #per-macroblock quantizer offsets
+        void (*quant_offsets_free)(void*)   #called when x264 is done with quant_offsets
+        uint8_t *mb_info                    #per-macroblock flags, ie: X264_MBINFO_CONSTANT
+        void (*mb_info_free)(void*)         #called when x264 is done with mb_info
     ctypedef struct x264_hrd_t:
         pass
     ctypedef struct x264_sei_t:
@@ -487,6 +496,7 @@ cdef class Encoder:
     cdef object blank_buffer
     cdef uint64_t first_frame_timestamp
     cdef uint8_t ready
+    cdef unsigned long skip_hints
 
     cdef object __weakref__
 
@@ -521,6 +531,7 @@ cdef class Encoder:
         self.last_frame_times = deque(maxlen=200)
         self.time = 0
         self.first_frame_timestamp = 0
+        self.skip_hints = 0
         self.bandwidth_limit = options.intget("bandwidth-limit", 0)
         default_profile = os.environ.get("XPRA_X264_PROFILE")
         self.profile = get_profile(options, csc_mode=self.src_format, default_profile=default_profile)
@@ -583,12 +594,14 @@ cdef class Encoder:
 
     cdef tune_param(self, x264_param_t *param, options:typedict):
         param.i_lookahead_threads = 0
+        #the server's cpu budget may give us fewer threads:
+        cdef int threads = max(1, min(THREADS, options.intget("threads", THREADS)))
         if MIN_SLICED_THREADS_SPEED>0 and self.speed>=MIN_SLICED_THREADS_SPEED and not self.fast_decode:
             param.b_sliced_threads = 1
-            param.i_threads = THREADS
+            param.i_threads = threads
         else:
             #cap i_threads since i_thread_frames will be set to i_threads
-            param.i_threads = min(self.max_delayed, THREADS)
+            param.i_threads = min(self.max_delayed, threads)
         #we never lose frames or use seeking, so no need for regular I-frames:
         param.i_keyint_max = X264_KEYINT_MAX_INFINITE
         #we don't want IDR frames either:
@@ -638,6 +651,8 @@ cdef class Encoder:
             param.i_bitdepth = 10
         else:
             param.i_bitdepth = 8
+        #so we can tell x264 which macroblocks have not changed:
+        param.analyse.b_mb_info = MB_INFO
         #logging hook:
         param.pf_log = <void *> X264_log
         param.i_log_level = LOG_LEVEL
@@ -696,6 +711,7 @@ cdef class Encoder:
             "frame-types"   : self.frame_types,
             "delayed"       : self.delayed_frames,
             "bandwidth-limit" : int(self.bandwidth_limit),
+            "skip-hints"    : int(self.skip_hints),
             })
         cdef x264_param_t param
         x264_encoder_parameters(self.context, &param)
@@ -873,12 +889,35 @@ cdef class Encoder:
                 pic_in.img.i_plane = 3
             pic_in.img.i_csp = self.colorspace
             pic_in.i_pts = image.get_timestamp()-self.first_frame_timestamp
+            damage = options.tupleget("damage-hints")
+            if MB_INFO and damage and self.frames>0:
+                self.set_mb_info(&pic_in, damage)
             return self.do_compress_image(&pic_in, quality, speed)
         finally:
             for i in range(3):
                 if py_buf[i].buf:
                     PyBuffer_Release(&py_buf[i])
 
+    cdef set_mb_info(self, x264_picture_t *pic_in, damage):
+        """
+            The macroblocks outside the damage rectangles are identical to the previous frame,
+            x264 can encode them as skip blocks without analyzing them.
+        """
+        damage_map = get_damage_map(damage, self.width, self.height, 16)
+        if 0 not in damage_map:
+            return
+        cdef unsigned int size = len(damage_map)
+        cdef uint8_t *mb_info = <uint8_t*> malloc(size)
+        if mb_info==NULL:
+            return
+        cdef unsigned int i
+        for i in range(size):
+            mb_info[i] = 0 if damage_map[i] else X264_MBINFO_CONSTANT
+        #x264 frees it once the frame has been encoded:
+        pic_in.prop.mb_info = mb_info
+        pic_in.prop.mb_info_free = free
+        self.skip_hints += 1
+
     cdef do_compress_image(self, x264_picture_t *pic_in, int quality=-1, int speed=-1):
         cdef x264_nal_t *nals = NULL
         cdef int i_nals = 0
@@ -101,6 +101,8 @@ def noop(*_args) -> None:
 WINDOW_DECODE_SKIPPED : int = 0
 WINDOW_DECODE_ERROR : int = -1
 WINDOW_NOT_FOUND : int = -2
+#the packet was lost or arrived too late (ie: quic datagrams):
+WINDOW_PACKET_LOST : int = -3
 
 
 ScreenshotData = Tuple[int,int,str,int,bytes]
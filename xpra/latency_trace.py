@@ -0,0 +1,147 @@
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+# Records the time spent in each stage of the damage-to-paint path of every frame,
+# using the Chrome trace event format, which can be loaded in https://ui.perfetto.dev
+# or chrome://tracing.
+# The timestamps use the wall clock so that the server and client traces can be loaded together,
+# (this assumes that both clocks are synchronized)
+
+import os
+import json
+import tempfile
+from time import time, monotonic
+from threading import Lock
+from typing import Dict, Tuple, List, Optional, Any, Sequence
+
+from xpra.util import envint
+from xpra.log import Logger
+
+log = Logger("stats")
+
+#a directory, or "1" to use the temporary directory:
+LATENCY_TRACE = os.environ.get("XPRA_LATENCY_TRACE", "")
+MAX_EVENTS = envint("XPRA_LATENCY_TRACE_MAX_EVENTS", 1000000)
+MAX_MARKS = 1024
+FLUSH_EVENTS = 100
+
+#the server sends 4 timestamps with each traced draw packet:
+#damage, process damage, encode start and encode end
+#the stages are the intervals between them:
+SERVER_STAGES : Tuple[str, ...] = ("batch", "capture", "encode")
+
+
+def to_us(t:float) -> int:
+    """ converts a monotonic timestamp to wall clock microseconds """
+    return round((t+time()-monotonic())*1000000)
+
+def get_server_stages(stamps:Sequence[int]) -> List[Tuple[str,int,int]]:
+    return [(name, stamps[i], stamps[i+1]) for i, name in enumerate(SERVER_STAGES) if i+1<len(stamps)]
+
+
+class LatencyTrace:
+    """
+        Writes 'complete' trace events, one track for each window.
+        The file is written as an unterminated JSON array,
+        which the trace viewers accept, so it can be loaded even if we exit without closing it.
+    """
+
+    def __init__(self, filename:str, process_name:str):
+        self.filename = filename
+        self.pid = os.getpid()
+        self.lock = Lock()
+        self.events = 0
+        self.tracks = set()
+        self.marks : Dict[Any,float] = {}
+        self.file = open(filename, "w", encoding="utf8")     #pylint: disable=consider-using-with
+        self.file.write("[\n")
+        self.write({"name" : "process_name", "ph" : "M", "pid" : self.pid, "args" : {"name" : process_name}})
+
+    def __repr__(self):
+        return f"LatencyTrace({self.filename!r})"
+
+    def write(self, event:Dict[str,Any]) -> None:
+        """ the lock must be held, except from the constructor """
+        f = self.file
+        if not f or self.events>=MAX_EVENTS:
+            return
+        f.write(json.dumps(event, separators=(",", ":"))+",\n")
+        self.events += 1
+        if self.events%FLUSH_EVENTS==0:
+            f.flush()
+
+    def add_track(self, wid:int) -> None:
+        if wid not in self.tracks:
+            self.tracks.add(wid)
+            self.write({"name" : "thread_name", "ph" : "M", "pid" : self.pid, "tid" : wid,
+                        "args" : {"name" : f"window {wid}"}})
+
+    def spans(self, wid:int, sequence:int, stages:Sequence[Tuple[str,int,int]]) -> None:
+        """ adds the (name, start, end) stages of this frame, timestamps in wall clock microseconds """
+        with self.lock:
+            self.add_track(wid)
+            for name, start, end in stages:
+                if start<=0 or end<start:
+                    continue
+                self.write({"name" : name, "cat" : "latency", "ph" : "X", "pid" : self.pid, "tid" : wid,
+                            "ts" : start, "dur" : end-start, "args" : {"sequence" : sequence}})
+
+    def flow(self, wid:int, sequence:int, ts:int, start:bool) -> None:
+        """ links the server and client events of the same frame """
+        with self.lock:
+            self.add_track(wid)
+            event = {"name" : "draw", "cat" : "latency", "ph" : "s" if start else "f",
+                     "id" : (wid<<32) | sequence, "pid" : self.pid, "tid" : wid, "ts" : ts}
+            if not start:
+                event["bp"] = "e"
+            self.write(event)
+
+    def mark(self, key, t:float=0) -> None:
+        """ records a timestamp, to be retrieved later using `pop_mark` """
+        with self.lock:
+            self.marks[key] = t or monotonic()
+            if len(self.marks)>MAX_MARKS:
+                #drop the oldest one:
+                self.marks.pop(next(iter(self.marks)))
+
+    def pop_mark(self, key) -> float:
+        with self.lock:
+            return self.marks.pop(key, 0)
+
+    def close(self) -> None:
+        with self.lock:
+            f = self.file
+            if f:
+                self.file = None
+                f.write("{}]\n")
+                f.close()
+                log.info("latency trace saved to %r", self.filename)
+
+
+traces : Dict[str,Optional[LatencyTrace]] = {}
+
+def get_latency_trace(role:str) -> Optional[LatencyTrace]:
+    """ returns the trace for this role ('server' or 'client'), if enabled """
+    try:
+        return traces[role]
+    except KeyError:
+        pass
+    trace = None
+    if LATENCY_TRACE and LATENCY_TRACE.lower() not in ("0", "no", "false", "off"):
+        dirname = LATENCY_TRACE
+        if dirname.lower() in ("1", "yes", "true", "on"):
+            dirname = tempfile.gettempdir()
+        filename = os.path.join(os.path.expanduser(dirname), f"xpra-{role}-latency-{os.getpid()}.json")
+        try:
+            trace = LatencyTrace(filename, f"xpra {role}")
+        except OSError as e:
+            log.error(f"Error: cannot create latency trace file {filename!r}")
+            log.estr(e)
+        else:
+            log.info(f"recording {role} latency trace to {filename!r}")
+            import atexit  # pylint: disable=import-outside-toplevel
+            atexit.register(trace.close)
+    traces[role] = trace
+    return trace
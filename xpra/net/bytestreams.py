@@ -31,6 +31,10 @@ if SOCKET_CORK:
 SOCKET_NODELAY : Optional[bool] = None
 if hasenv("XPRA_SOCKET_NODELAY"):
     SOCKET_NODELAY = envbool("XPRA_SOCKET_NODELAY")
+#limit the amount of unsent data queued in the kernel,
+#so that the backlog stays in our own queues where stale data can still be replaced:
+TCP_NOTSENT_LOWAT : int = getattr(socket, "TCP_NOTSENT_LOWAT", 25 if LINUX else 0)
+SOCKET_NOTSENT_LOWAT : int = envint("XPRA_SOCKET_NOTSENT_LOWAT", 128*1024 if TCP_NOTSENT_LOWAT else 0)
 SOCKET_KEEPALIVE : bool = envbool("XPRA_SOCKET_KEEPALIVE", True)
 VSOCK_TIMEOUT : int = envint("XPRA_VSOCK_TIMEOUT", 5)
 SOCKET_TIMEOUT : int = envint("XPRA_SOCKET_TIMEOUT", 20)
@@ -166,6 +170,13 @@ class Connection:
         self.input_readcount += 1
         return r
 
+    def _read_into(self, *args) -> int:
+        """ wraps do_read_into with packet accounting """
+        n = self.untilConcludes(*args) or 0
+        self.input_bytecount += n
+        self.input_readcount += 1
+        return n
+
     def get_info(self) -> Dict[str,Any]:
         info = self.info.copy()
         if self.socktype_wrapped!=self.socktype:
@@ -287,6 +298,16 @@ class SocketConnection(Connection):
             log("%s options: cork=%s, nodelay=%s", self.socktype_wrapped, self.cork, self.nodelay)
             if self.nodelay:
                 self.do_set_nodelay(self.nodelay)
+            try:
+                self.notsent_lowat = int(self.options.get("notsent-lowat", SOCKET_NOTSENT_LOWAT))
+            except ValueError:
+                self.notsent_lowat = SOCKET_NOTSENT_LOWAT
+            if self.notsent_lowat>0 and TCP_NOTSENT_LOWAT:
+                try:
+                    self._setsockopt(socket.IPPROTO_TCP, TCP_NOTSENT_LOWAT, self.notsent_lowat)
+                except OSError:
+                    log("cannot set TCP_NOTSENT_LOWAT", exc_info=True)
+                    self.notsent_lowat = 0
             keepalive = boolget("keepalive", SOCKET_KEEPALIVE)
             try:
                 self._setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, int(keepalive))
@@ -311,6 +332,7 @@ class SocketConnection(Connection):
         else:
             self.cork = False
             self.nodelay = False
+            self.notsent_lowat = 0
         self.nodelay_value = None
         self.cork_value = None
         if isinstance(remote, str):
@@ -347,6 +369,12 @@ class SocketConnection(Connection):
     def read(self, n : int) -> bytes:
         return self._read(self._socket.recv, n)
 
+    def can_read_into(self) -> bool:
+        return hasattr(self._socket, "recv_into")
+
+    def read_into(self, buf) -> int:
+        return self._read_into(self._socket.recv_into, buf)
+
     def write(self, buf, _packet_type:str=""):
         return self._write(self._socket.send, buf)
 
@@ -411,6 +439,7 @@ class SocketConnection(Connection):
                 "family"        : FAMILY_STR.get(s.family, int(s.family)),
                 "type"          : PROTOCOL_STR.get(s.type, int(s.type)),
                 "cork"          : self.cork,
+                "notsent-lowat" : self.notsent_lowat,
                 })
         except AttributeError:
             log("do_get_socket_info()", exc_info=True)
@@ -547,6 +576,8 @@ class SocketPeekWrapper:
             return self.makefile
         if attr=="recv":
             return self.recv
+        if attr=="recv_into":
+            return self.recv_into
         return getattr(self.socket, attr)
 
     def makefile(self, mode, bufsize=None):
@@ -576,6 +607,14 @@ class SocketPeekWrapper:
             return peeked
         return self.socket.recv(bufsize, flags)
 
+    def recv_into(self, buf, nbytes=0, flags=0) -> int:
+        if self.peeked:
+            n = min(len(buf), nbytes or len(buf), len(self.peeked))
+            buf[:n] = self.peeked[:n]
+            self.peeked = self.peeked[n:]
+            return n
+        return self.socket.recv_into(buf, nbytes, flags)
+
 
 class PeekableSocketConnection(SocketConnection):
 
@@ -6,7 +6,11 @@
 import os
 import threading
 from typing import Tuple, Callable, List, Dict, Any, ByteString, Union
-from typing_extensions import TypeAlias
+try:
+    from typing import TypeAlias
+except ImportError:
+    #python 3.9 and older, typing_extensions is slow to import:
+    from typing_extensions import TypeAlias
 
 from xpra.net.compression import Compressed, Compressible, LargeStructure
 from xpra.util import repr_ellipsized, envint, envbool
@@ -82,7 +86,7 @@ PACKET_TYPES : List[str] = [
     "hello",
     "challenge",
     "ssl-upgrade",
-    "info", "info-response",
+    "info", "info-response", "info-delta",
     #server state:
     "server-event", "startup-complete",
     "setting-change", "control",
@@ -117,6 +121,7 @@ PACKET_TYPES : List[str] = [
     #clipboard:
     "set-clipboard-enabled", "clipboard-token", "clipboard-request",
     "clipboard-contents", "clipboard-contents-none", "clipboard-pending-requests", "clipboard-enable-selections",
+    "clipboard-contents-digest", "clipboard-contents-ack", "clipboard-contents-chunk",
     #notifications:
     "notify_show", "notify_close",
     #rpc:
@@ -7,6 +7,7 @@
 import os
 import sys
 import secrets
+from hashlib import sha256
 from struct import pack
 from typing import Dict, Tuple, Any, Iterable, List
 
@@ -35,6 +36,12 @@ MAX_ITERATIONS = envint("XPRA_CRYPTO_STRETCH_MIN_ITERATIONS", 10000)
 DEFAULT_MODE = os.environ.get("XPRA_CRYPTO_MODE", "CBC")
 DEFAULT_KEY_HASH = os.environ.get("XPRA_CRYPTO_KEY_HASH", "SHA1")
 DEFAULT_KEY_STRETCH = "PBKDF2"
+#authenticated encryption of each packet chunk, without padding:
+AEAD_MODE = "AEAD"
+AEAD_TAG_SIZE = 16
+AEAD_NONCE_SIZE = 12
+#the ciphers which can only be used in AEAD mode:
+AEAD_CIPHERS = ("ChaCha20", )
 
 #other option "PKCS#7", "legacy"
 PADDING_LEGACY = "legacy"
@@ -72,11 +79,13 @@ def crypto_backend_init():
             patch_crypto_be_discovery()
         import cryptography as pc
         cryptography = pc
-        MODES = tuple(x for x in os.environ.get("XPRA_CRYPTO_MODES", "CBC,GCM,CFB,CTR").split(",")
-              if x in ("CBC", "GCM", "CFB", "CTR"))
+        MODES = tuple(x for x in os.environ.get("XPRA_CRYPTO_MODES", "CBC,GCM,CFB,CTR,AEAD").split(",")
+              if x in ("CBC", "GCM", "CFB", "CTR", AEAD_MODE))
         KEY_HASHES = ("SHA1", "SHA224", "SHA256", "SHA384", "SHA512")
         KEY_STRETCHING = ("PBKDF2", )
         CIPHERS = ("AES", )
+        if AEAD_MODE in MODES:
+            CIPHERS += get_aead_ciphers()
         from cryptography.hazmat.backends import default_backend
         backend = default_backend()
         log("default_backend()=%s", backend)
@@ -121,6 +130,16 @@ def patch_crypto_be_discovery() -> None:
         be for be in available if be is not None
     ])
 
+def get_aead_ciphers() -> Tuple[str, ...]:
+    #ChaCha20-Poly1305 is not available with all the openssl builds:
+    try:
+        from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
+        ChaCha20Poly1305(b"0"*32)
+    except Exception as e:
+        log("ChaCha20Poly1305 is not available: %s", e)
+        return ()
+    return AEAD_CIPHERS
+
 def get_ciphers() -> Tuple[str, ...]:
     return CIPHERS
 
@@ -131,40 +150,90 @@ def get_key_hashes() -> Tuple[str, ...]:
     return KEY_HASHES
 
 def validate_backend() -> None:
+    """
+        Each mode and AEAD cipher is validated separately,
+        the ones that fail are removed from MODES and CIPHERS.
+    """
+    global MODES, CIPHERS
     log("validate_backend() will validate AES modes: "+csv(MODES))
-    message = b"some message1234"*8
     password = "this is our secret"
     key_salt = DEFAULT_SALT
     iterations = DEFAULT_ITERATIONS
+    failed = []
     for mode in MODES:
-        log("testing AES-%s", mode)
-        key = None
-        for key_hash in KEY_HASHES:
-            key = get_key(password, key_salt, key_hash, DEFAULT_KEYSIZE, iterations)
-            assert key
-        block_size = get_block_size(mode)
-        log(" key=%s, block_size=%s", hexstr(key), block_size)
-        assert key is not None, "pycryptography failed to generate a key"
-        enc = get_cipher_encryptor(key, DEFAULT_IV, mode)
-        log(" encryptor=%s", enc)
-        assert enc is not None, "pycryptography failed to generate an encryptor"
-        dec = get_cipher_decryptor(key, DEFAULT_IV, mode)
-        log(" decryptor=%s", dec)
-        assert dec is not None, "pycryptography failed to generate a decryptor"
-        test_messages = [message*(1+block_size)]
-        if block_size==0:
-            test_messages.append(message[:29])
-        else:
-            test_messages.append(message[:block_size])
-        for m in test_messages:
-            ev = enc.encrypt(m)
-            evs = hexstr(ev)
-            log(" encrypted(%s)=%s", m, evs)
-            dv = dec.decrypt(ev)
-            log(" decrypted(%s)=%s", evs, dv)
-            if dv!=m:
-                raise RuntimeError(f"expected {m!r} but got {dv!r}")
-            log(" test passed")
+        try:
+            if mode==AEAD_MODE:
+                #AES is required, the other AEAD ciphers are optional:
+                validate_aead("AES", password, key_salt, iterations)
+            else:
+                validate_mode(mode, password, key_salt, iterations)
+        except Exception as e:
+            log("validate_backend() AES-%s", mode, exc_info=True)
+            log(" AES-%s failed: %s", mode, e)
+            failed.append(mode)
+    if failed:
+        log.warn("Warning: disabling the encryption modes which failed validation: %s", csv(failed))
+        MODES = tuple(mode for mode in MODES if mode not in failed)
+    for cipher in CIPHERS:
+        if cipher=="AES":
+            continue
+        try:
+            if AEAD_MODE not in MODES:
+                raise RuntimeError(f"{AEAD_MODE} mode is not available")
+            validate_aead(cipher, password, key_salt, iterations)
+        except Exception as e:
+            log("validate_backend() %s", cipher, exc_info=True)
+            log.warn(f"Warning: disabling {cipher}: {e}")
+            CIPHERS = tuple(c for c in CIPHERS if c!=cipher)
+    if not MODES:
+        raise RuntimeError("no valid encryption modes")
+
+def validate_mode(mode:str, password:str, key_salt:str, iterations:int) -> None:
+    log("testing AES-%s", mode)
+    message = b"some message1234"*8
+    key = None
+    for key_hash in KEY_HASHES:
+        key = get_key(password, key_salt, key_hash, DEFAULT_KEYSIZE, iterations)
+        assert key
+    block_size = get_block_size(mode)
+    log(" key=%s, block_size=%s", hexstr(key), block_size)
+    assert key is not None, "pycryptography failed to generate a key"
+    enc = get_cipher_encryptor(key, DEFAULT_IV, mode)
+    log(" encryptor=%s", enc)
+    assert enc is not None, "pycryptography failed to generate an encryptor"
+    dec = get_cipher_decryptor(key, DEFAULT_IV, mode)
+    log(" decryptor=%s", dec)
+    assert dec is not None, "pycryptography failed to generate a decryptor"
+    test_messages = [message*(1+block_size)]
+    if block_size==0:
+        test_messages.append(message[:29])
+    else:
+        test_messages.append(message[:block_size])
+    for m in test_messages:
+        ev = enc.encrypt(m)
+        evs = hexstr(ev)
+        log(" encrypted(%s)=%s", m, evs)
+        dv = dec.decrypt(ev)
+        log(" decrypted(%s)=%s", evs, dv)
+        if dv!=m:
+            raise RuntimeError(f"expected {m!r} but got {dv!r}")
+        log(" test passed")
+
+
+def validate_aead(cipher:str, password:str, key_salt:str, iterations:int) -> None:
+    log("testing %s-%s", cipher, AEAD_MODE)
+    key = get_key(password, key_salt, DEFAULT_KEY_HASH, 32, iterations)
+    enc = AEADCipher(cipher, key, DEFAULT_IV)
+    dec = AEADCipher(cipher, key, DEFAULT_IV)
+    header = b"P\x02\x00\x00\x00\x00\x00\x80"
+    for m in (b"some message1234"*8, b"x"):
+        ev = enc.encrypt(m, header)
+        if len(ev)!=len(m)+AEAD_TAG_SIZE:
+            raise RuntimeError(f"expected {len(m)+AEAD_TAG_SIZE} bytes but got {len(ev)}")
+        dv = dec.decrypt(ev, header)
+        if dv!=m:
+            raise RuntimeError(f"expected {m!r} but got {dv!r}")
+    log(" test passed")
 
 
 def pad(padding:str, size:int) -> bytes:
@@ -244,12 +313,43 @@ def get_encryptor(ciphername : str, iv:str, password, key_salt, key_hash : str,
     assert key_size>=16
     if iterations<MIN_ITERATIONS or iterations>MAX_ITERATIONS:
         raise ValueError(f"invalid number of iterations {iterations}, range is {MIN_ITERATIONS} to {MAX_ITERATIONS}")
-    assert ciphername.startswith("AES")
     assert password and iv, "password or iv missing"
-    mode = (ciphername+"-").split("-")[1] or DEFAULT_MODE
+    cipher, mode = parse_ciphername(ciphername)
     key = get_key(password, key_salt, key_hash, key_size, iterations)
+    if mode==AEAD_MODE:
+        return AEADCipher(cipher, key, iv), 0
     return get_cipher_encryptor(key, iv, mode), get_block_size(mode)
 
+def get_default_mode(cipher:str) -> str:
+    if cipher in AEAD_CIPHERS:
+        return AEAD_MODE
+    return DEFAULT_MODE
+
+def parse_ciphername(ciphername:str) -> Tuple[str,str]:
+    cipher, mode = (ciphername+"-").split("-")[:2]
+    mode = mode or get_default_mode(cipher)
+    if cipher not in CIPHERS:
+        raise ValueError(f"unsupported cipher {cipher!r}, should be one of: "+csv(CIPHERS))
+    if cipher in AEAD_CIPHERS and mode!=AEAD_MODE:
+        raise ValueError(f"{cipher} can only be used in {AEAD_MODE} mode")
+    return cipher, mode
+
+def can_encrypt_first_packet(ciphername:str) -> bool:
+    """
+        The first packet is encrypted using the default iv and salt,
+        which are the same for all the connections using the same key,
+        so the AEAD modes would re-use the same nonces:
+        the first packet is sent in clear and the AEAD cipher is negotiated as usual.
+        Both ends must use this function to decide.
+    """
+    if not ENCRYPT_FIRST_PACKET:
+        return False
+    cipher, mode = (ciphername+"-").split("-")[:2]
+    if (mode or get_default_mode(cipher))==AEAD_MODE:
+        log.warn(f"Warning: the first packet cannot be encrypted using {ciphername!r}")
+        return False
+    return True
+
 def get_cipher_encryptor(key, iv:str, mode:str):
     encryptor = _get_cipher(key, iv, mode).encryptor()
     encryptor.encrypt = encryptor.update
@@ -262,10 +362,11 @@ def get_decryptor(ciphername : str, iv:str, password, key_salt, key_hash : str,
     assert key_size>=16
     if iterations<MIN_ITERATIONS or iterations>MAX_ITERATIONS:
         raise ValueError(f"invalid number of iterations {iterations}, range is {MIN_ITERATIONS} to {MAX_ITERATIONS}")
-    assert ciphername.startswith("AES")
     assert password and iv, "password or iv missing"
-    mode = (ciphername+"-").split("-")[1] or DEFAULT_MODE
+    cipher, mode = parse_ciphername(ciphername)
     key = get_key(password, key_salt, key_hash, key_size, iterations)
+    if mode==AEAD_MODE:
+        return AEADCipher(cipher, key, iv), 0
     return get_cipher_decryptor(key, iv, mode), get_block_size(mode)
 
 def get_cipher_decryptor(key, iv:str, mode:str):
@@ -320,6 +421,54 @@ def get_key(password, key_salt, key_hash, block_size:int, iterations:int):
     key = kdf.derive(strtobytes(password))
     return key
 
+class AEADCipher:
+    """
+        Authenticated encryption of each packet chunk,
+        using a nonce derived from the iv and a counter which is incremented for every chunk:
+        both ends must process the chunks in the same order.
+        The packet header is authenticated as associated data,
+        and the encrypted payload is followed by the tag: there is no padding.
+    """
+    __slots__ = ("cipher", "aead", "iv", "counter")
+    tag_size = AEAD_TAG_SIZE
+
+    def __init__(self, cipher:str, key:bytes, iv:str):
+        from cryptography.hazmat.primitives.ciphers import aead
+        self.cipher = cipher
+        if cipher=="ChaCha20":
+            self.aead = aead.ChaCha20Poly1305(key)
+        elif cipher=="AES":
+            self.aead = aead.AESGCM(key)
+        else:
+            raise ValueError(f"unsupported {AEAD_MODE} cipher {cipher!r}")
+        self.iv = int.from_bytes(sha256(strtobytes(iv)).digest()[:AEAD_NONCE_SIZE], "big")
+        self.counter = 0
+
+    def __repr__(self):
+        return f"AEADCipher({self.cipher})"
+
+    def next_nonce(self) -> bytes:
+        nonce = (self.iv ^ self.counter).to_bytes(AEAD_NONCE_SIZE, "big")
+        self.counter += 1
+        return nonce
+
+    def encrypt_into(self, data, aad:bytes, buf:memoryview) -> None:
+        """ the buffer must have room for the data and the tag """
+        encrypt_into = getattr(self.aead, "encrypt_into", None)
+        if encrypt_into:
+            #python-cryptography 45 onwards:
+            encrypt_into(self.next_nonce(), data, aad, buf)
+        else:
+            buf[:] = self.encrypt(data, aad)
+
+    def encrypt(self, data, aad:bytes) -> bytes:
+        return self.aead.encrypt(self.next_nonce(), memoryview_to_bytes(data), aad)
+
+    def decrypt(self, data, aad:bytes) -> bytes:
+        """ raises `cryptography.exceptions.InvalidTag` if the data or the header have been tampered with """
+        return self.aead.decrypt(self.next_nonce(), data, aad)
+
+
 def _get_cipher(key, iv:str, mode:str=DEFAULT_MODE):
     assert mode in MODES
     from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
@@ -11,7 +11,7 @@ import subprocess
 import hashlib
 import uuid
 from time import monotonic
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Dict, Any, Optional, Callable, Set, Tuple
 
 from xpra.child_reaper import getChildReaper
@@ -28,6 +28,16 @@ filelog = Logger("file")
 
 DELETE_PRINTER_FILE = envbool("XPRA_DELETE_PRINTER_FILE", True)
 FILE_CHUNKS_SIZE = max(0, envint("XPRA_FILE_CHUNKS_SIZE", 65536))
+#maximum number of chunks sent without waiting for their 'ack-file-chunk':
+FILE_CHUNKS_WINDOW = max(1, envint("XPRA_FILE_CHUNKS_WINDOW", 8))
+#the chunk size grows with the bandwidth, up to this limit:
+MAX_FILE_CHUNKS_SIZE = max(FILE_CHUNKS_SIZE, envint("XPRA_MAX_FILE_CHUNKS_SIZE", 4*1024*1024))
+#how long each chunk should take to send at the measured rate (in milliseconds):
+FILE_CHUNKS_TARGET_DELAY = max(1, envint("XPRA_FILE_CHUNKS_TARGET_DELAY", 50))
+FILE_RESUME = envbool("XPRA_FILE_RESUME", True)
+RESUME_TIMEOUT = max(0, envint("XPRA_FILE_RESUME_TIMEOUT", 600))
+RESUME_DELAY = max(0, envint("XPRA_FILE_RESUME_DELAY", 2000))
+MAX_RESUME_ATTEMPTS = max(0, envint("XPRA_FILE_MAX_RESUME_ATTEMPTS", 3))
 MAX_CONCURRENT_FILES = max(1, envint("XPRA_MAX_CONCURRENT_FILES", 10))
 PRINT_JOB_TIMEOUT = max(60, envint("XPRA_PRINT_JOB_TIMEOUT", 3600))
 SEND_REQUEST_TIMEOUT = max(300, envint("XPRA_SEND_REQUEST_TIMEOUT", 3600))
@@ -69,6 +79,98 @@ def basename(filename:str) -> str:
             tmp += char
     return tmp
 
+class FileSource:
+    """
+        A file which is sent from disk:
+        its size and modification time are recorded when it is loaded,
+        each transfer then reads the chunks using its own file descriptor.
+    """
+    def __init__(self, filename:str):
+        self.filename = filename
+        stat = os.stat(filename)
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime_ns
+
+    def __repr__(self):
+        return f"FileSource({self.filename!r})"
+
+    def __len__(self) -> int:
+        return self.size
+
+    def open(self) -> FileReader:
+        return FileReader(self.filename, self.size, self.mtime)
+
+
+class FileReader:
+    """
+        Reads the chunks from disk on demand,
+        raises an OSError if the file has been modified since it was offered.
+    """
+    def __init__(self, filename:str, size:int, mtime:int):
+        self.filename = filename
+        self.size = size
+        self.mtime = mtime
+        flags = os.O_RDONLY
+        try:
+            flags |= os.O_BINARY                #@UndefinedVariable (win32 only)
+        except AttributeError:
+            pass
+        self.fd = os.open(filename, flags)
+        try:
+            self.check()
+        except OSError:
+            self.close()
+            raise
+
+    def __repr__(self):
+        return f"FileReader({self.filename!r})"
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, s:slice) -> bytes:
+        start, stop, _ = s.indices(self.size)
+        return self.read(start, max(0, stop-start))
+
+    def check(self) -> None:
+        if self.fd<0:
+            raise OSError(f"{self.filename!r} is closed")
+        stat = os.fstat(self.fd)
+        if stat.st_size!=self.size or stat.st_mtime_ns!=self.mtime:
+            raise OSError(f"{self.filename!r} has been modified")
+
+    def read(self, position:int, size:int) -> bytes:
+        self.check()
+        if POSIX:
+            data = os.pread(self.fd, size, position)
+        else:
+            os.lseek(self.fd, position, os.SEEK_SET)
+            data = os.read(self.fd, size)
+        if len(data)!=size:
+            raise OSError(f"short read from {self.filename!r}: {len(data)} bytes instead of {size}")
+        return data
+
+    def update_digest(self, digest) -> None:
+        position = 0
+        while position<self.size:
+            size = min(MAX_FILE_CHUNKS_SIZE, self.size-position)
+            digest.update(self.read(position, size))
+            position += size
+
+    def close(self) -> None:
+        fd = self.fd
+        if fd>=0:
+            self.fd = -1
+            osclose(fd)
+
+
+def load_file_data(filename:str) -> FileSource:
+    """
+        Returns a file source which reads the file contents from disk when it is sent,
+        so large files are never loaded in memory.
+    """
+    return FileSource(filename)
+
 def safe_open_download_file(basefilename:str, mimetype:str):
     from xpra.platform.paths import get_download_dir  # pylint: disable=import-outside-toplevel
     dd = os.path.expanduser(get_download_dir())
@@ -113,13 +215,75 @@ class ReceiveChunkState:
     send_id: str
     timer: int
     chunk: int
+    peer: str = ""
+    interrupted: float = 0
 @dataclass
 class SendChunkState:
     start: float
-    data: bytes
+    data: Any           #bytes, memoryview or FileReader
     chunk_size: int
     timer: int
-    chunk: int
+    chunk: int          #last chunk acknowledged
+    sent: int = 0       #last chunk sent
+    position: int = 0   #offset of the next chunk to send
+    acked: int = 0      #bytes acknowledged by the receiver
+    #chunks sent but not acknowledged yet: chunk number -> end offset
+    in_flight: Dict[int,int] = field(default_factory=dict)
+    #the arguments of the 'send-file' packet, used for resuming:
+    send_file_args: Tuple = ()
+    peer: str = ""
+    resuming: bool = False
+    attempts: int = 0
+    interrupted: float = 0
+
+    def close(self) -> None:
+        close = getattr(self.data, "close", None)
+        if close:
+            close()
+
+#chunked transfers interrupted by a timeout or a disconnection,
+#these can be resumed using the same 'file-chunk-id' for up to RESUME_TIMEOUT seconds:
+resumable_receives : Dict[str,ReceiveChunkState] = {}
+resumable_sends : Dict[str,SendChunkState] = {}
+
+def expire_resumable() -> None:
+    expired = monotonic()-RESUME_TIMEOUT
+    for chunk_id, rstate in tuple(resumable_receives.items()):
+        if rstate.interrupted<expired:
+            filelog("expired interrupted download %r", rstate.filename)
+            resumable_receives.pop(chunk_id, None)
+            osclose(rstate.fd)
+            try:
+                os.unlink(rstate.filename)
+            except OSError:
+                filelog("os.unlink(%r)", rstate.filename, exc_info=True)
+    for chunk_id, sstate in tuple(resumable_sends.items()):
+        if sstate.interrupted<expired:
+            filelog("expired interrupted upload %s", chunk_id)
+            resumable_sends.pop(chunk_id, None)
+            sstate.close()
+
+expire_timer : int = 0
+
+def schedule_expire_resumable(timeout_add:Callable) -> None:
+    """
+        Expires the interrupted transfers once they can no longer be resumed,
+        even if no other transfer is ever interrupted or resumed.
+    """
+    global expire_timer
+    if expire_timer:
+        return
+    interrupted = tuple(state.interrupted for state in (*resumable_receives.values(), *resumable_sends.values()))
+    if not interrupted:
+        return
+    delay = max(0, min(interrupted)+RESUME_TIMEOUT-monotonic())
+    def expire() -> bool:
+        global expire_timer
+        expire_timer = 0
+        expire_resumable()
+        schedule_expire_resumable(timeout_add)
+        return False
+    expire_timer = timeout_add(int(delay*1000)+100, expire)
 
 
 class FileTransferAttributes:
@@ -193,6 +357,9 @@ class FileTransferAttributes:
                 "ask"               : self.file_transfer_ask,
                 "size-limit"        : self.file_size_limit,
                 "chunks"            : self.file_chunks,
+                "max-chunks"        : MAX_FILE_CHUNKS_SIZE,
+                "chunks-window"     : FILE_CHUNKS_WINDOW,
+                "resume"            : FILE_RESUME,
                 "open"              : self.open_files,
                 "open-ask"          : self.open_files_ask,
                 "open-url"          : self.open_url,
@@ -222,6 +389,8 @@ class FileTransferHandler(FileTransferAttributes):
         self.remote_file_ask_timeout = SEND_REQUEST_TIMEOUT
         self.remote_file_size_limit = 0
         self.remote_file_chunks = 0
+        self.remote_max_file_chunks = 0
+        self.remote_file_resume = False
         self.pending_send_data : Dict[str,Tuple[str,str,str,bytes,int,bool,bool,Dict]] = {}
         self.pending_send_data_timers : Dict[str,int] = {}
         self.send_chunks_in_progress : Dict[str,SendChunkState] = {}
@@ -237,9 +406,7 @@ class FileTransferHandler(FileTransferAttributes):
         for t in self.pending_send_data_timers.values():
             self.source_remove(t)
         self.pending_send_data_timers = {}
-        for v in self.receive_chunks_in_progress.values():
-            self.source_remove(v.timer)
-        self.receive_chunks_in_progress = {}
+        self.interrupt_file_transfers()
         for x in tuple(self.file_descriptors):
             try:
                 os.close(x)
@@ -266,6 +433,8 @@ class FileTransferHandler(FileTransferAttributes):
             self.remote_file_ask_timeout = fc.intget("ask-timeout")
             self.remote_file_size_limit = fc.intget("max-file-size") or fc.intget("size-limit")
             self.remote_file_chunks = max(0, fc.intget("chunks"))
+            self.remote_max_file_chunks = max(0, fc.intget("max-chunks"))
+            self.remote_file_resume = fc.boolget("resume")
         else:
             #legacy - to be removed:
             self.remote_file_transfer = c.boolget("file-transfer")
@@ -280,6 +449,8 @@ class FileTransferHandler(FileTransferAttributes):
             self.remote_file_size_limit = c.intget("max-file-size") or c.intget("file-size-limit")*1024*1024
             self.remote_file_chunks = max(0, min(self.remote_file_size_limit, c.intget("file-chunks")))
         self.dump_remote_caps()
+        if self.remote_file_resume and resumable_sends:
+            self.timeout_add(RESUME_DELAY, self.resume_file_transfers)
 
     def dump_remote_caps(self) -> None:
         filelog("file transfer remote caps:")
@@ -291,11 +462,15 @@ class FileTransferHandler(FileTransferAttributes):
 
     def get_info(self) -> Dict[str,Any]:
         info = super().get_info()
+        info["sending"] = len(self.send_chunks_in_progress)
+        info["receiving"] = len(self.receive_chunks_in_progress)
         info["remote"] = {
             "file-transfer"     : self.remote_file_transfer,
             "file-transfer-ask" : self.remote_file_transfer_ask,
             "file-size-limit"   : self.remote_file_size_limit,
             "file-chunks"       : self.remote_file_chunks,
+            "max-file-chunks"   : self.remote_max_file_chunks,
+            "file-resume"       : self.remote_file_resume,
             "open-files"        : self.remote_open_files,
             "open-files-ask"    : self.remote_open_files_ask,
             "open-url"          : self.remote_open_url,
@@ -330,8 +505,67 @@ class FileTransferHandler(FileTransferAttributes):
             return
         chunk_state.timer = 0     #this timer has been used
         if chunk_state.chunk==chunk_no:
-            filelog.error(f"Error: chunked file transfer f{chunk_id} timed out")
-            self.receive_chunks_in_progress.pop(chunk_id, None)
+            filelog.error(f"Error: chunked file transfer {chunk_id} timed out")
+            self.interrupt_receive(chunk_id)
+
+    def get_file_transfer_peer_id(self) -> str:
+        """
+            Transfers interrupted by a disconnection can only be resumed
+            if we can identify the peer when it connects again,
+            subclasses can override this method to return a stable identifier.
+        """
+        return ""
+
+    def interrupt_file_transfers(self) -> None:
+        for chunk_id in tuple(self.receive_chunks_in_progress.keys()):
+            self.interrupt_receive(chunk_id)
+        for chunk_id in tuple(self.send_chunks_in_progress.keys()):
+            self.interrupt_send(chunk_id)
+
+    def interrupt_receive(self, chunk_id:str) -> None:
+        chunk_state = self.receive_chunks_in_progress.pop(chunk_id, None)
+        if not chunk_state:
+            return
+        if chunk_state.timer:
+            self.source_remove(chunk_state.timer)
+            chunk_state.timer = 0
+        if chunk_state.cancelled:
+            return
+        self.file_descriptors.discard(chunk_state.fd)
+        if not FILE_RESUME or not RESUME_TIMEOUT or not self.remote_file_resume or not chunk_state.peer:
+            osclose(chunk_state.fd)
+            return
+        #keep the file open so the sender can resume this transfer:
+        filelog("download of %r interrupted after %i bytes", chunk_state.filename, chunk_state.written)
+        chunk_state.interrupted = monotonic()
+        resumable_receives[chunk_id] = chunk_state
+        expire_resumable()
+        schedule_expire_resumable(self.timeout_add)
+
+    def resume_receive(self, chunk_id:str, filesize:int) -> bool:
+        expire_resumable()
+        chunk_state = self.receive_chunks_in_progress.pop(chunk_id, None) or resumable_receives.pop(chunk_id, None)
+        if not chunk_state:
+            return False
+        if chunk_state.filesize!=filesize or chunk_state.peer!=self.get_file_transfer_peer_id():
+            filelog.warn("Warning: cannot resume download of %r", chunk_state.filename)
+            filelog.warn(" the transfer attributes do not match")
+            osclose(chunk_state.fd)
+            try:
+                os.unlink(chunk_state.filename)
+            except OSError:
+                filelog("os.unlink(%r)", chunk_state.filename, exc_info=True)
+            return False
+        if chunk_state.timer:
+            self.source_remove(chunk_state.timer)
+        chunk_state.interrupted = 0
+        chunk_state.timer = self.timeout_add(CHUNK_TIMEOUT, self._check_chunk_receiving, chunk_id, chunk_state.chunk)
+        self.file_descriptors.add(chunk_state.fd)
+        self.receive_chunks_in_progress[chunk_id] = chunk_state
+        filelog.info("resuming download of %r from %sB", chunk_state.filename, std_unit(chunk_state.written))
+        #tell the sender where to resume from:
+        self.send("ack-file-chunk", chunk_id, True, "", chunk_state.chunk, chunk_state.written)
+        return True
 
     def cancel_download(self, send_id:str, message="Cancelled") -> None:
         filelog("cancel_download(%s, %s)", send_id, message)
@@ -492,6 +726,10 @@ class FileTransferHandler(FileTransferAttributes):
             filelog.error("Error: invalid file size: %s", filesize)
             filelog.error(" file transfer aborted for %r", basefilename)
             return
+        options = typedict(options)
+        chunk_id = options.strget("file-chunk-id")
+        if chunk_id and options.boolget("file-chunk-resume") and self.resume_receive(chunk_id, filesize):
+            return
         args = (send_id, "file", basefilename, printit, openit)
         r = self.accept_data(*args)
         filelog("%s%s=%s", self.accept_data, args, r)
@@ -502,7 +740,6 @@ class FileTransferHandler(FileTransferAttributes):
             return
         #accept_data can override the flags:
         printit, openit = r
-        options = typedict(options)
         if printit:
             log = printlog
             assert self.printing
@@ -516,7 +753,6 @@ class FileTransferHandler(FileTransferAttributes):
             log.error(" %sB, the file size limit is %sB",
                     std_unit(filesize), std_unit(self.file_size_limit))
             return
-        chunk_id = options.strget("file-chunk-id")
         try:
             filename, fd = safe_open_download_file(basefilename, mimetype)
         except OSError as e:
@@ -544,7 +780,7 @@ class FileTransferHandler(FileTransferAttributes):
                                                                    fd, filename, mimetype,
                                                                    printit, openit, filesize,
                                                                    options, digest, 0, False, send_id,
-                                                                   timer, chunk)
+                                                                   timer, chunk, self.get_file_transfer_peer_id())
             self.send("ack-file-chunk", chunk_id, True, b"", chunk)
             return
         #not chunked, full file:
@@ -785,7 +1021,8 @@ class FileTransferHandler(FileTransferAttributes):
                     ask |= self.remote_open_files_ask
                     action = "open"
         assert len(data)>=filesize, "data is smaller then the given file size!"
-        data = data[:filesize]          #gio may null terminate it
+        if len(data)>filesize:
+            data = data[:filesize]          #gio may null terminate it
         l("send_file%s action=%s, ask=%s",
           (filename, mimetype, type(data), f"{filesize} bytes", printit, openit, options), action, ask)
         self.dump_remote_caps()
@@ -937,8 +1174,33 @@ class FileTransferHandler(FileTransferAttributes):
         l("do_send_file%s", (u(filename), mimetype, type(data), f"{filesize} bytes", printit, openit, options))
         if not self.check_file_size(action, filename, filesize):
             return False
+        if isinstance(data, FileSource):
+            try:
+                data = data.open()
+            except OSError as e:
+                l("%s.open()", data, exc_info=True)
+                l.error(f"Error: cannot {action} {filename!r}")
+                l.estr(e)
+                return False
+        try:
+            return self.do_send_file_data(filename, mimetype, data, filesize, printit, openit, options, send_id)
+        except OSError as e:
+            l("do_send_file_data%s", (filename, mimetype, data, filesize), exc_info=True)
+            l.error(f"Error: cannot {action} {filename!r}")
+            l.estr(e)
+            return False
+        finally:
+            #chunked transfers keep reading from the file until they are completed or cancelled:
+            if isinstance(data, FileReader) and not any(state.data is data for state in self.send_chunks_in_progress.values()):
+                data.close()
+
+    def do_send_file_data(self, filename:str, mimetype:str, data, filesize:int,
+                          printit:bool, openit:bool, options, send_id:str) -> bool:
         h = hashlib.sha256()
-        h.update(data)
+        if isinstance(data, FileReader):
+            data.update_digest(h)
+        else:
+            h.update(data)
         absfile = os.path.abspath(filename)
         filelog("sha256 digest('%s')=%s", u(absfile), h.hexdigest())
         options = options or {}
@@ -954,13 +1216,17 @@ class FileTransferHandler(FileTransferAttributes):
             #timer to check that the other end is requesting more chunks:
             chunk_no = 0
             timer = self.timeout_add(CHUNK_TIMEOUT, self._check_chunk_sending, chunk_id, chunk_no)
-            self.send_chunks_in_progress[chunk_id] = SendChunkState(monotonic(), data, chunk_size, timer, chunk_no)
+            basefilename = os.path.basename(filename)
+            send_file_args = (basefilename, mimetype, printit, openit, filesize, options, send_id)
+            self.send_chunks_in_progress[chunk_id] = SendChunkState(monotonic(), data, chunk_size, timer, chunk_no,
+                                                                    send_file_args=send_file_args,
+                                                                    peer=self.get_file_transfer_peer_id())
             cdata = b""
             filelog("using chunks, sending initial file-chunk-id=%s, for chunk size=%s",
                     chunk_id, chunk_size)
         else:
             #send everything now:
-            cdata = self.compressed_wrapper("file-data", data)
+            cdata = self.compressed_wrapper("file-data", data[:filesize])
             assert len(cdata)<=filesize     #compressed wrapper ensures this is true
             filelog("sending full file: %i bytes (chunk size=%i)", filesize, chunk_size)
         basefilename = os.path.basename(filename)
@@ -977,7 +1243,57 @@ class FileTransferHandler(FileTransferAttributes):
         if chunk_state.chunk==chunk_no:
             filelog.error(f"Error: chunked file transfer {chunk_id} timed out")
             filelog.error(f" on chunk {chunk_no}")
-            self.cancel_sending(chunk_id)
+            if self.remote_file_resume and chunk_state.attempts<MAX_RESUME_ATTEMPTS:
+                self.resume_sending(chunk_id, chunk_state)
+            else:
+                self.cancel_sending(chunk_id)
+
+    def interrupt_send(self, chunk_id:str) -> None:
+        chunk_state = self.send_chunks_in_progress.pop(chunk_id, None)
+        if not chunk_state:
+            return
+        if chunk_state.timer:
+            self.source_remove(chunk_state.timer)
+            chunk_state.timer = 0
+        if not FILE_RESUME or not RESUME_TIMEOUT or not self.remote_file_resume or not chunk_state.peer:
+            chunk_state.close()
+            return
+        filelog("upload %s interrupted after %i bytes", chunk_id, chunk_state.acked)
+        chunk_state.interrupted = monotonic()
+        resumable_sends[chunk_id] = chunk_state
+        expire_resumable()
+        schedule_expire_resumable(self.timeout_add)
+
+    def resume_file_transfers(self) -> bool:
+        expire_resumable()
+        peer = self.get_file_transfer_peer_id()
+        for chunk_id, chunk_state in tuple(resumable_sends.items()):
+            if peer and chunk_state.peer==peer:
+                resumable_sends.pop(chunk_id, None)
+                self.resume_sending(chunk_id, chunk_state)
+        return False
+
+    def resume_sending(self, chunk_id:str, chunk_state:SendChunkState) -> None:
+        """
+            Offer the same transfer again, re-using the same 'file-chunk-id',
+            the receiver will reply with the offset to resume from.
+            (or from the start if it does not have this transfer anymore)
+        """
+        chunk_state.attempts += 1
+        chunk_state.resuming = True
+        chunk_state.interrupted = 0
+        chunk_state.chunk = chunk_state.sent = chunk_state.position = chunk_state.acked = 0
+        chunk_state.in_flight = {}
+        chunk_state.start = monotonic()
+        if chunk_state.timer:
+            self.source_remove(chunk_state.timer)
+        chunk_state.timer = self.timeout_add(CHUNK_TIMEOUT, self._check_chunk_sending, chunk_id, 0)
+        self.send_chunks_in_progress[chunk_id] = chunk_state
+        basefilename, mimetype, printit, openit, filesize, options, send_id = chunk_state.send_file_args
+        options = dict(options)
+        options["file-chunk-resume"] = True
+        filelog.info("trying to resume upload of %r (attempt %i)", basefilename, chunk_state.attempts)
+        self.send("send-file", basefilename, mimetype, printit, openit, filesize, b"", options, send_id)
 
     def cancel_sending(self, chunk_id:str) -> None:
         chunk_state = self.send_chunks_in_progress.pop(chunk_id, None)
@@ -988,6 +1304,7 @@ class FileTransferHandler(FileTransferAttributes):
         if timer:
             chunk_state.timer = 0
             self.source_remove(timer)
+        chunk_state.close()
 
     def _process_ack_file_chunk(self, packet : PacketType) -> None:
         #the other end received our send-file or send-file-chunk,
@@ -1004,28 +1321,82 @@ class FileTransferHandler(FileTransferAttributes):
         if not chunk_state:
             filelog.error(f"Error: cannot find the file transfer id {chunk_id!r}")
             return
-        if chunk_state.chunk!=chunk:
-            filelog.error("Error: chunk number mismatch (%i vs %i)", chunk_state.chunk, chunk)
+        if len(packet)>=6:
+            #the receiver is resuming an interrupted transfer from this offset:
+            position = packet[5]
+            if not 0<=position<=len(chunk_state.data):
+                filelog.error("Error: invalid resume position %i", position)
+                self.cancel_sending(chunk_id)
+                return
+            filelog("resuming from chunk %i at offset %i", chunk, position)
+            chunk_state.chunk = chunk_state.sent = chunk
+            chunk_state.position = chunk_state.acked = position
+            chunk_state.in_flight = {}
+            chunk_state.resuming = False
+        elif chunk_state.resuming:
+            if chunk!=0:
+                #stale ack from before the resume request
+                return
+            chunk_state.resuming = False
+        elif not chunk_state.chunk<=chunk<=chunk_state.sent:
+            filelog.error("Error: chunk number mismatch (%i not in %i-%i)",
+                          chunk, chunk_state.chunk, chunk_state.sent)
             self.cancel_sending(chunk_id)
             return
-        chunk_size = chunk_state.chunk_size
-        if not chunk_state.data:
+        #acknowledgements are cumulative:
+        for chunk_no in tuple(chunk_state.in_flight.keys()):
+            if chunk_no<=chunk:
+                chunk_state.acked = max(chunk_state.acked, chunk_state.in_flight.pop(chunk_no))
+        chunk_state.chunk = chunk
+        if chunk_state.acked>=len(chunk_state.data):
             #all sent!
-            elapsed = monotonic()-chunk_state.start
-            filelog("%i chunks of %i bytes sent in %ims (%sB/s)",
-                    chunk, chunk_size, elapsed*1000, std_unit(chunk*chunk_size/elapsed))
+            elapsed = max(0.001, monotonic()-chunk_state.start)
+            filelog("%i chunks, %i bytes sent in %ims (%sB/s)",
+                    chunk, chunk_state.acked, elapsed*1000, std_unit(chunk_state.acked/elapsed))
             self.cancel_sending(chunk_id)
             return
-        assert chunk_size>0
-        #carve out another chunk:
-        cdata = self.compressed_wrapper("file-data", chunk_state.data[:chunk_size])
-        chunk_state.data = chunk_state.data[chunk_size:]
-        chunk += 1
-        chunk_state.chunk = chunk
+        self.update_chunk_size(chunk_state)
+        self.send_file_chunks(chunk_id, chunk_state)
         if chunk_state.timer:
             self.source_remove(chunk_state.timer)
         chunk_state.timer = self.timeout_add(CHUNK_TIMEOUT, self._check_chunk_sending, chunk_id, chunk)
-        self.send("send-file-chunk", chunk_id, chunk, cdata, bool(chunk_state.data))
+
+    def update_chunk_size(self, chunk_state:SendChunkState) -> None:
+        #use larger chunks on faster links, so each chunk takes about FILE_CHUNKS_TARGET_DELAY to send:
+        min_chunk_size = min(self.file_chunks, self.remote_file_chunks)
+        max_chunk_size = min(MAX_FILE_CHUNKS_SIZE, self.remote_max_file_chunks)
+        if max_chunk_size<=min_chunk_size:
+            return
+        elapsed = monotonic()-chunk_state.start
+        if elapsed<=0 or not chunk_state.acked:
+            return
+        rate = chunk_state.acked/elapsed
+        target = int(rate*FILE_CHUNKS_TARGET_DELAY/1000)
+        chunk_state.chunk_size = max(min_chunk_size, min(max_chunk_size, target))
+
+    def send_file_chunks(self, chunk_id:str, chunk_state:SendChunkState) -> None:
+        #keep up to FILE_CHUNKS_WINDOW chunks in flight:
+        chunk_size = chunk_state.chunk_size
+        assert chunk_size>0
+        data = chunk_state.data
+        size = len(data)
+        while len(chunk_state.in_flight)<FILE_CHUNKS_WINDOW and chunk_state.position<size:
+            #carve out another chunk:
+            start = chunk_state.position
+            end = min(size, start+chunk_size)
+            try:
+                chunk = data[start:end]
+            except OSError as e:
+                filelog("reading chunk %i-%i from %s", start, end, data, exc_info=True)
+                filelog.error(f"Error: chunked file transfer {chunk_id} failed")
+                filelog.estr(e)
+                self.cancel_sending(chunk_id)
+                return
+            cdata = self.compressed_wrapper("file-data", chunk)
+            chunk_state.position = end
+            chunk_state.sent += 1
+            chunk_state.in_flight[chunk_state.sent] = end
+            self.send("send-file-chunk", chunk_id, chunk_state.sent, cdata, end<size)
 
     def send(self, *parts) -> None:
         raise NotImplementedError()
@@ -5,10 +5,12 @@
 
 import os
 import sys
+from struct import Struct
+from threading import Lock
 from ctypes import c_ubyte, c_char, c_uint32
-from typing import Tuple, Optional, Any
+from typing import Tuple, Optional, Any, Dict, List
 
-from xpra.util import roundup
+from xpra.util import roundup, envint, envbool
 from xpra.os_util import memoryview_to_bytes, shellsub, get_group_id, WIN32, POSIX
 from xpra.scripts.config import FALSE_OPTIONS, TRUE_OPTIONS
 from xpra.simple_stats import std_unit
@@ -17,6 +19,12 @@ from xpra.log import Logger
 log = Logger("mmap")
 
 MMAP_GROUP = os.environ.get("XPRA_MMAP_GROUP", "xpra")
+#use a separate ring for each window, if the client supports it:
+MMAP_RINGS = envbool("XPRA_MMAP_RINGS", True)
+#each ring can hold this many frames of the size requested:
+RING_FRAMES = envint("XPRA_MMAP_RING_FRAMES", 4)
+MIN_RING_SIZE = envint("XPRA_MMAP_MIN_RING_SIZE", 4*1024*1024)
+RING_ALIGN = 4096
 
 
 """
@@ -266,11 +274,12 @@ def mmap_read(mmap_area, *descr_data) -> bytes:
     return b"".join(data)
 
 
-def mmap_write(mmap_area, mmap_size:int, data):
+def mmap_write(mmap_area, mmap_size:int, data, warn:bool=True):
     """
         Sends 'data' to the client via the mmap shared memory region,
         returns the chunks of the mmap area used (or None if it failed)
         and the mmap area's free memory.
+        Callers which handle a full mmap area themselves can set `warn` to False.
     """
     #This is best explained using diagrams:
     #mmap_area=[&S&E-------------data-------------]
@@ -303,13 +312,14 @@ def mmap_write(mmap_area, mmap_size:int, data):
         available = chunk+(start-8)
     #update global mmap stats:
     mmap_free_size = available-l
+    logw = log.warn if warn else log
     if l>(mmap_size-8):
-        log.warn("Warning: mmap area is too small!")
-        log.warn(" we need to store %s bytes but the mmap area is limited to %i", l, (mmap_size-8))
+        logw("Warning: mmap area is too small!")
+        logw(" we need to store %s bytes but the mmap area is limited to %i", l, (mmap_size-8))
         return None, mmap_free_size
     if mmap_free_size<=0:
-        log.warn("Warning: mmap area is full!")
-        log.warn(" we need to store %s bytes but only have %s free space left", l, available)
+        logw("Warning: mmap area is full!")
+        logw(" we need to store %s bytes but only have %s free space left", l, available)
         return None, mmap_free_size
     if l<chunk:
         # data fits in the first chunk:
@@ -346,3 +356,298 @@ def mmap_write(mmap_area, mmap_size:int, data):
             mmap_data_end.value = 8+l2
     log("sending damage with mmap: %s bytes", len(data))
     return chunks, mmap_free_size
+
+
+#the ring header: read index (updated by the client), write index (updated by the server)
+_ring_header = Struct(b"=II")
+_ring_index = Struct(b"=I")
+RING_HEADER_SIZE = _ring_header.size
+
+def mmap_ack(mmap_area, ring:int, pos:int) -> None:
+    """ the client has finished reading up to `pos` in the ring whose header is at offset `ring` """
+    _ring_index.pack_into(mmap_area, ring, pos)
+
+
+class MmapRingReader:
+    """
+        The client side of the rings.
+        Keeps track of the regions which are being painted, in the order the server wrote them,
+        so that the read index of a ring is only moved past the regions which have all been released.
+        (the paints may complete in any order, ie: when some are deferred)
+    """
+
+    def __init__(self, mmap_area):
+        self.mmap_area = mmap_area
+        self.lock = Lock()
+        self.counter = 0
+        #ring offset -> {region id : [end of the region, memoryview or None once released]}
+        #(in the order the regions were received)
+        self.regions : Dict[int,Dict[int,List]] = {}
+        self.closed = False
+
+    def __repr__(self):
+        return f"MmapRingReader({sum(len(r) for r in self.regions.values())} regions)"
+
+    def read(self, ring:int, offset:int, length:int) -> Tuple[int,memoryview]:
+        """
+            Returns the id of the region and a view of its data,
+            the region must be released by calling `release` with this id once it has been painted.
+        """
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("the mmap area is closed")
+            self.counter += 1
+            rid = self.counter
+            view = memoryview(self.mmap_area)[offset:offset+length]
+            self.regions.setdefault(ring, {})[rid] = [offset+length, view]
+            return rid, view
+
+    def skip(self, ring:int, offset:int, length:int) -> None:
+        """ for the regions which will not be painted, ie: the window is gone """
+        rid = self.read(ring, offset, length)[0]
+        self.release(ring, rid)
+
+    def release(self, ring:int, rid:int) -> None:
+        with self.lock:
+            regions = self.regions.get(ring)
+            region = regions.get(rid) if regions else None
+            if not region:
+                return
+            view = region[1]
+            if view is not None:
+                region[1] = None
+                release_view(view)
+            #move the read index past all the regions which have been released:
+            pos = -1
+            while regions:
+                first = next(iter(regions))
+                end, view = regions[first]
+                if view is not None:
+                    break
+                pos = end
+                del regions[first]
+            if not regions:
+                del self.regions[ring]
+            if pos>=0 and not self.closed:
+                mmap_ack(self.mmap_area, ring, pos)
+
+    def close(self) -> None:
+        """ releases the views before closing the mmap area, which would fail otherwise """
+        with self.lock:
+            self.closed = True
+            for regions in self.regions.values():
+                for region in regions.values():
+                    view = region[1]
+                    if view is not None:
+                        region[1] = None
+                        release_view(view)
+            self.regions = {}
+            try:
+                self.mmap_area.close()
+            except BufferError:
+                log.warn("Warning: the mmap area is still in use and cannot be closed", exc_info=True)
+
+    def get_info(self) -> Dict[str,Any]:
+        with self.lock:
+            return {
+                "rings"     : len(self.regions),
+                "regions"   : sum(len(r) for r in self.regions.values()),
+                }
+
+
+def release_view(view:memoryview) -> None:
+    try:
+        view.release()
+    except BufferError:
+        #something is still using it, it will be released when it is garbage collected
+        log("failed to release %s", view, exc_info=True)
+
+
+class MmapRing:
+    """
+        A region of the mmap area used by a single window,
+        starting with its own header: the client updates the read index once it has painted the data,
+        the server updates the write index.
+        The data written is never split: when it does not fit at the end of the ring,
+        we start again from the beginning of the ring, so the client can always paint
+        straight from the mmap area.
+    """
+    __slots__ = ("mmap_area", "offset", "size", "data_start", "data_end", "writes", "fallbacks")
+
+    def __init__(self, mmap_area, offset:int, size:int):
+        self.mmap_area = mmap_area
+        self.offset = offset
+        self.size = size
+        self.data_start = offset+RING_HEADER_SIZE
+        self.data_end = offset+size
+        self.writes = 0
+        self.fallbacks = 0
+        _ring_header.pack_into(mmap_area, offset, self.data_start, self.data_start)
+
+    def __repr__(self):
+        return f"MmapRing({self.offset:#x}, {self.size:#x})"
+
+    def get_indexes(self) -> Tuple[int,int]:
+        return _ring_header.unpack_from(self.mmap_area, self.offset)
+
+    def is_empty(self) -> bool:
+        start, end = self.get_indexes()
+        return start==end
+
+    def used(self) -> int:
+        start, end = self.get_indexes()
+        if end>=start:
+            return end-start
+        #wrapped, this includes the space skipped at the end of the ring:
+        return self.data_end-start + end-self.data_start
+
+    def write(self, data) -> Optional[int]:
+        """
+            Copies the data to the ring and returns its offset,
+            or None if there is not enough contiguous space available.
+        """
+        l = len(data)
+        start, end = self.get_indexes()
+        if start==end:
+            #empty, so we can start from the beginning,
+            #the client has nothing left to read so we can also move the read index:
+            pos = self.data_start
+            if pos+l>self.data_end:
+                self.fallbacks += 1
+                return None
+            self.mmap_area[pos:pos+l] = data
+            _ring_header.pack_into(self.mmap_area, self.offset, pos, pos+l)
+            self.writes += 1
+            return pos
+        if end>start:
+            #[----S+++++E----]
+            if end+l<=self.data_end:
+                pos = end
+            elif self.data_start+l<start:
+                #wrap around, the client will skip the end of the ring:
+                pos = self.data_start
+            else:
+                pos = -1
+        elif end+l<start:
+            #[+++E------S+++]
+            pos = end
+        else:
+            pos = -1
+        if pos<0:
+            self.fallbacks += 1
+            return None
+        self.mmap_area[pos:pos+l] = data
+        _ring_index.pack_into(self.mmap_area, self.offset+4, pos+l)
+        self.writes += 1
+        return pos
+
+    def get_info(self) -> Dict[str,Any]:
+        used = self.used()
+        return {
+            "offset"    : self.offset,
+            "size"      : self.size,
+            "used"      : used,
+            "occupancy" : 100*used//(self.data_end-self.data_start),
+            "writes"    : self.writes,
+            "fallbacks" : self.fallbacks,
+            }
+
+
+class MmapRings:
+    """
+        Divides the mmap area into rings, one for each window,
+        so that a window sending a lot of data does not use up the space needed by the other windows.
+        The rings are allocated when a window first needs one,
+        and sized to hold a few frames of the size requested, rounded up to a power of two.
+        When a ring is released, the space is only re-used once the client has read all of its data,
+        the client releases all the regions of a window when it is destroyed, even the ones it never painted.
+    """
+
+    def __init__(self, mmap_area, mmap_size:int, min_ring_size:int=MIN_RING_SIZE, ring_frames:int=RING_FRAMES):
+        self.mmap_area = mmap_area
+        self.min_ring_size = min_ring_size
+        self.ring_frames = ring_frames
+        #the beginning of the area is used by the legacy ring header and the tokens:
+        start = RING_ALIGN
+        end = mmap_size & ~(RING_ALIGN-1)
+        self.max_ring_size = max(0, end-start)//2
+        self.free : List[Tuple[int,int]] = [(start, end-start)] if end>start else []
+        self.rings : Dict[int,MmapRing] = {}
+        #rings which have been released, but the client may still be reading from:
+        self.released : List[MmapRing] = []
+        self.allocation_failures = 0
+        self.lock = Lock()
+
+    def __repr__(self):
+        return f"MmapRings({len(self.rings)})"
+
+    def get_ring(self, wid:int, size:int) -> Optional[MmapRing]:
+        """ returns the ring for this window, allocating a bigger one if needed """
+        with self.lock:
+            ring = self.rings.get(wid)
+            if ring and size*2<=ring.size:
+                return ring
+            ring_size = self.min_ring_size
+            while ring_size<size*self.ring_frames+RING_HEADER_SIZE and ring_size<self.max_ring_size:
+                ring_size *= 2
+            ring_size = min(ring_size, self.max_ring_size)
+            if ring and ring.size>=ring_size:
+                return ring
+            offset = self.allocate(ring_size)
+            if offset<0:
+                self.allocation_failures += 1
+                #keep using the existing ring, if there is one:
+                return ring
+            if ring:
+                self.released.append(ring)
+            ring = MmapRing(self.mmap_area, offset, ring_size)
+            log("new %s for window %i", ring, wid)
+            self.rings[wid] = ring
+            return ring
+
+    def release(self, wid:int) -> None:
+        with self.lock:
+            ring = self.rings.pop(wid, None)
+            if ring:
+                self.released.append(ring)
+
+    def allocate(self, size:int) -> int:
+        """ first fit, the lock must be held """
+        for retry in (False, True):
+            if retry and not self.reclaim():
+                break
+            for i, (offset, free_size) in enumerate(self.free):
+                if free_size>=size:
+                    if free_size==size:
+                        self.free.pop(i)
+                    else:
+                        self.free[i] = (offset+size, free_size-size)
+                    return offset
+        return -1
+
+    def reclaim(self) -> bool:
+        """ returns the space used by released rings which the client has finished reading from """
+        reclaimed = [ring for ring in self.released if ring.is_empty()]
+        if not reclaimed:
+            return False
+        for ring in reclaimed:
+            self.released.remove(ring)
+            self.free.append((ring.offset, ring.size))
+        #merge adjacent free blocks:
+        merged : List[Tuple[int,int]] = []
+        for offset, size in sorted(self.free):
+            if merged and merged[-1][0]+merged[-1][1]==offset:
+                merged[-1] = (merged[-1][0], merged[-1][1]+size)
+            else:
+                merged.append((offset, size))
+        self.free = merged
+        return True
+
+    def get_info(self) -> Dict[str,Any]:
+        with self.lock:
+            return {
+                "rings"     : {wid : ring.get_info() for wid, ring in self.rings.items()},
+                "released"  : len(self.released),
+                "free"      : sum(size for _, size in self.free),
+                "allocation-failures" : self.allocation_failures,
+                }
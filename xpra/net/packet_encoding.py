@@ -17,7 +17,13 @@ from xpra.net.protocol.header import (
     pack_header,
     )
 from xpra.os_util import strtobytes
-from xpra.util import envbool
+from xpra.util import envbool, envint
+
+#large binary values can be sent as separate chunks (rencodeplus only):
+OOB_BUFFERS = envbool("XPRA_OOB_BUFFERS", True)
+OOB_THRESHOLD = envint("XPRA_OOB_THRESHOLD", 64*1024)
+#the packet index in the header must be lower than 16:
+MAX_OOB_BUFFERS = 16
 
 #all the encoders we know about, in the best compatibility order:
 ALL_ENCODERS : Tuple[str, ...] = ("rencode", "bencode", "yaml", "rencodeplus", "none")
@@ -41,7 +47,9 @@ def init_rencode() -> Encoding:
 def init_rencodeplus() -> Encoding:
     from xpra.net.rencodeplus import rencodeplus    # type: ignore[attr-defined]
     rencodeplus_dumps = rencodeplus.dumps  # @UndefinedVariable
-    def do_rencodeplus(v):
+    def do_rencodeplus(v, buffer_callback=None):
+        if buffer_callback:
+            return rencodeplus_dumps(v, buffer_callback, OOB_THRESHOLD, MAX_OOB_BUFFERS), FLAGS_RENCODEPLUS
         return rencodeplus_dumps(v), FLAGS_RENCODEPLUS
     return Encoding("rencodeplus", FLAGS_RENCODEPLUS, rencodeplus.__version__, do_rencodeplus, rencodeplus.loads)  # @UndefinedVariable
 
@@ -58,10 +66,21 @@ def init_bencode() -> Encoding:
 
 def init_yaml() -> Encoding:
     #json messes with strings and unicode (makes it unusable for us)
-    from yaml import dump, safe_load, __version__
+    #importing yaml is slow and it is rarely used,
+    #so only check that it is installed and import it when needed:
+    from importlib.util import find_spec
+    if not find_spec("yaml"):
+        raise ImportError("yaml is not installed")
     def yaml_dump(v):
+        from yaml import dump
         return dump(v).encode("latin1"), FLAGS_YAML
-    return Encoding("yaml", FLAGS_YAML, __version__, yaml_dump, safe_load)
+    def yaml_load(data):
+        from yaml import safe_load
+        return safe_load(data)
+    def yaml_version() -> str:
+        from yaml import __version__
+        return __version__
+    return Encoding("yaml", FLAGS_YAML, yaml_version, yaml_dump, yaml_load)
 
 def init_none() -> Encoding:
     def encode(data):
@@ -106,7 +125,10 @@ def get_packet_encoding_caps(full_info : int=1) -> Dict[str,Any]:
         if e is None:
             continue
         if full_info>1 and e.version:
-            d["version"] = e.version
+            #the version may be loaded on demand (ie: yaml):
+            d["version"] = e.version() if callable(e.version) else e.version
+        if name=="rencodeplus":
+            d["oob"] = True
     return caps
 
 def get_enabled_encoders(order: Tuple[str, ...]=ALL_ENCODERS) -> Tuple[str, ...]:
@@ -143,12 +165,16 @@ def pack_one_packet(packet:Tuple) -> bytes:
     return strtobytes(packet)
 
 
-def decode(data, protocol_flags:int):
+def decode(data, protocol_flags:int, buffers:Tuple=()):
     if isinstance(data, memoryview):
         data = data.tobytes()
     ptype = get_packet_encoding_type(protocol_flags)
     e = ENCODERS.get(ptype)
     if e:
+        if buffers:
+            if ptype!="rencodeplus":
+                raise InvalidPacketEncodingException(f"{ptype!r} does not support out-of-band buffers")
+            return e.decode(data, buffers)
         return e.decode(data)
     raise InvalidPacketEncodingException(f"{ptype!r} decoder is not available")
 
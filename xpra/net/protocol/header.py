@@ -18,6 +18,8 @@ FLAGS_RENCODEPLUS = 0x10
 #these flags can actually be combined with the encoders above:
 FLAGS_FLUSH     = 0x8
 FLAGS_CIPHER    = 0x2
+#an out-of-band buffer referenced by the next main packet (rencodeplus only):
+FLAGS_OOB       = 0x20
 
 #compression flags are carried in the "level" field,
 #the low bits contain the compression level, the high bits the compression algo:
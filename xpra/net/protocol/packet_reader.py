@@ -0,0 +1,137 @@
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+from typing import Callable, List, Optional, ByteString
+
+from xpra.net.protocol.header import HEADER_SIZE
+from xpra.util import envint
+from xpra.log import Logger
+
+log = Logger("network", "protocol")
+
+#payloads larger than this are received directly into a buffer of their own:
+DIRECT_SIZE = envint("XPRA_READ_DIRECT_SIZE", 65536)
+#the data is split at the end of payloads larger than this:
+SPLIT_SIZE = envint("XPRA_READ_SPLIT_SIZE", 4096)
+#the read size grows up to this value when the reads fill the buffer:
+MAX_READ_SIZE = envint("XPRA_MAX_READ_SIZE", 1024*1024)
+
+
+class PacketReader:
+    """
+        Reads from a connection using `read_into`,
+        re-using the same read buffer for every read.
+        The packet headers are followed so that large payloads
+        can be received directly into a buffer of the exact size,
+        which is then passed on as a single memoryview:
+        the parse thread does not need to join or slice anything.
+        If the headers stop making sense (ie: encryption starts before we know about it),
+        we just keep reading without following them: the parse thread deals with it.
+    """
+
+    def __init__(self, read_into:Callable[[memoryview],int], get_payload_size:Callable[[bytes],int],
+                 read_size:int, max_read_size:int=MAX_READ_SIZE, direct_size:int=DIRECT_SIZE):
+        self.read_into = read_into
+        self.get_payload_size = get_payload_size
+        self.min_read_size = max(1, read_size)
+        self.max_read_size = max(self.min_read_size, max_read_size)
+        self.read_size = self.min_read_size
+        self.direct_size = direct_size
+        self.buffer = memoryview(bytearray(self.read_size))
+        self.framing = True
+        #the header we are accumulating:
+        self.header = b""
+        #payload bytes left in the current packet:
+        self.remaining = 0
+        #the payload we are receiving directly:
+        self.payload : Optional[memoryview] = None
+        self.payload_pos = 0
+
+    def read(self) -> Optional[List[ByteString]]:
+        """
+            Returns the buffers read, which may be an empty list
+            if we are still receiving a payload, or None at the end of the stream.
+        """
+        payload = self.payload
+        if payload is not None:
+            n = self.read_into(payload[self.payload_pos:])
+            if not n:
+                return None
+            self.payload_pos += n
+            if self.payload_pos<len(payload):
+                return []
+            self.payload = None
+            return [payload]
+        n = self.read_into(self.buffer[:self.read_size])
+        if not n:
+            return None
+        data = self.buffer[:n]
+        self.adjust_read_size(n)
+        if not self.framing:
+            #the buffer is re-used, so we must copy what we have read:
+            return [data.tobytes()]
+        return self.split(data)
+
+    def adjust_read_size(self, n:int) -> None:
+        if n>=self.read_size and self.read_size<self.max_read_size:
+            #we may be able to read more at once:
+            self.read_size = min(self.max_read_size, self.read_size*2)
+            if self.read_size>len(self.buffer):
+                self.buffer = memoryview(bytearray(self.read_size))
+        elif n<self.read_size//4 and self.read_size>self.min_read_size:
+            self.read_size = max(self.min_read_size, self.read_size//2)
+
+    def split(self, data:memoryview) -> List[ByteString]:
+        """
+            Follows the packet headers in this data,
+            and cuts it after each payload larger than `SPLIT_SIZE`,
+            so the parse thread does not need to slice large buffers.
+            Payloads larger than `direct_size` are returned without their header.
+            Starts receiving the next payload directly if it is large
+            and does not fit in what we have already.
+            The data returned is always a copy.
+        """
+        data = memoryview(data)
+        bufs : List[ByteString] = []
+        start = pos = 0
+        size = len(data)
+        while pos<size:
+            if self.remaining:
+                used = min(self.remaining, size-pos)
+                self.remaining -= used
+                pos += used
+                continue
+            part = data[pos:pos+HEADER_SIZE-len(self.header)].tobytes()
+            self.header += part
+            pos += len(part)
+            if len(self.header)<HEADER_SIZE:
+                break
+            payload_size = self.get_payload_size(self.header)
+            self.header = b""
+            if payload_size<0:
+                log("stopped following the packet headers")
+                self.framing = False
+                break
+            available = size-pos
+            if payload_size>=self.direct_size and payload_size>available:
+                payload = memoryview(bytearray(payload_size))
+                payload[:available] = data[pos:]
+                self.payload = payload
+                self.payload_pos = available
+                bufs.append(data[start:pos].tobytes())
+                return bufs
+            if SPLIT_SIZE<=payload_size<=available:
+                if payload_size>=self.direct_size:
+                    #keep the large payload on its own:
+                    bufs.append(data[start:pos].tobytes())
+                    start = pos
+                pos += payload_size
+                bufs.append(data[start:pos].tobytes())
+                start = pos
+                continue
+            self.remaining = payload_size
+        if start<size:
+            bufs.append(data[start:].tobytes())
+        return bufs
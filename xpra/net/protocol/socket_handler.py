@@ -12,19 +12,20 @@ import os
 from enum import Enum
 from time import monotonic
 from socket import error as socket_error
-from threading import Lock, RLock, Event, Thread, current_thread
-from queue import Queue
+from threading import Lock, RLock, Event, Thread, Condition, current_thread
+from queue import Queue, Empty
 from typing import Dict, List, Tuple, Any, ByteString, Callable, Optional, Iterable
 
 from xpra.os_util import memoryview_to_bytes, strtobytes, bytestostr, hexstr
 from xpra.util import repr_ellipsized, ellipsizer, csv, envint, envbool, typedict
 from xpra.make_thread import make_thread, start_thread
-from xpra.net.bytestreams import SOCKET_TIMEOUT, set_socket_timeout
+from xpra.net.bytestreams import SOCKET_TIMEOUT, SocketConnection, set_socket_timeout
 from xpra.net.protocol.header import (
     unpack_header, pack_header, find_xpra_header,
-    FLAGS_CIPHER, FLAGS_NOHEADER, FLAGS_FLUSH, HEADER_SIZE,
+    FLAGS_CIPHER, FLAGS_NOHEADER, FLAGS_FLUSH, FLAGS_OOB, HEADER_SIZE,
     )
 from xpra.net.protocol.constants import CONNECTION_LOST, INVALID, GIBBERISH
+from xpra.net.protocol.packet_reader import PacketReader
 from xpra.net.common import (
     ConnectionClosedException, may_log_packet,
     MAX_PACKET_SIZE, FLUSH_HEADER,
@@ -41,6 +42,7 @@ from xpra.net.socket_util import guess_packet_type
 from xpra.net.packet_encoding import (
     decode,
     InvalidPacketEncodingException,
+    MAX_OOB_BUFFERS,
     )
 from xpra.net.crypto import get_encryptor, get_decryptor, pad, INITIAL_PADDING
 from xpra.log import Logger
@@ -51,6 +53,10 @@ cryptolog = Logger("network", "crypto")
 
 USE_ALIASES = envbool("XPRA_USE_ALIASES", True)
 READ_BUFFER_SIZE = envint("XPRA_READ_BUFFER_SIZE", 65536)
+#receive large payloads directly into their final buffer (socket connections only):
+READ_INTO = envbool("XPRA_READ_INTO", True)
+#the packet types whose handlers can use memoryviews for the payloads received this way:
+MEMORYVIEW_PACKET_TYPES = ("draw", )
 #merge header and packet if packet is smaller than:
 PACKET_JOIN_SIZE = envint("XPRA_PACKET_JOIN_SIZE", READ_BUFFER_SIZE)
 LARGE_PACKET_SIZE = envint("XPRA_LARGE_PACKET_SIZE", 8192)
@@ -59,6 +65,15 @@ LOG_RAW_PACKET_SIZE = envbool("XPRA_LOG_RAW_PACKET_SIZE", False)
 INLINE_SIZE = envint("XPRA_INLINE_SIZE", 32768)
 FAKE_JITTER = envint("XPRA_FAKE_JITTER", 0)
 MIN_COMPRESS_SIZE = envint("XPRA_MIN_COMPRESS_SIZE", 378)
+#merge the small packets waiting in the write queue into a single write, up to this size:
+WRITE_COALESCE_SIZE = envint("XPRA_WRITE_COALESCE_SIZE", 16384)
+#how long to wait for more small packets to merge, in milliseconds:
+#(the default is to only merge the packets which are already queued)
+WRITE_COALESCE_DELAY = envint("XPRA_WRITE_COALESCE_DELAY", 0)
+#when merging packets, the write queue can hold this many packets:
+WRITE_QUEUE_SIZE = envint("XPRA_WRITE_QUEUE_SIZE", 64)
+#but only up to this many bytes:
+WRITE_QUEUE_BYTES = envint("XPRA_WRITE_QUEUE_BYTES", 256*1024)
 SEND_INVALID_PACKET = envint("XPRA_SEND_INVALID_PACKET", 0)
 SEND_INVALID_PACKET_DATA = strtobytes(os.environ.get("XPRA_SEND_INVALID_PACKET_DATA", b"ZZinvalid-packetZZ"))
 
@@ -112,9 +127,17 @@ class SocketProtocol:
         self._process_packet_cb : Callable[[PacketType],None] = process_packet_cb
         self.make_chunk_header : Callable = self.make_xpra_header
         self.make_frame_header : Callable[[str,Iterable], ByteString] = self.noframe_header
-        self._write_queue : Queue[Tuple] = Queue(1)
+        #only plain stream sockets can merge packets into a single write,
+        #other connections may send each packet type differently (ie: quic streams):
+        self.write_coalesce_size : int = WRITE_COALESCE_SIZE if isinstance(conn, SocketConnection) else 0
+        #the small packets can only be merged if they can be queued together,
+        #the number of bytes queued is bounded instead:
+        self._write_queue : Queue[Tuple] = Queue(WRITE_QUEUE_SIZE if self.write_coalesce_size else 1)
+        self._write_queue_bytes = 0
+        self._write_queue_cond = Condition()
         self._read_queue : Queue[ByteString] = Queue(20)
         self._pre_read = None
+        self._packet_reader : Optional[PacketReader] = None
         self._process_read : Callable = self.read_queue_put
         self._read_queue_put : Callable = self.read_queue_put
         # Invariant: if .source is None, then _source_has_more == False
@@ -126,13 +149,24 @@ class SocketProtocol:
         self.output_stats = {}
         self.output_packetcount = 0
         self.output_raw_packetcount = 0
+        #number of packets sent as part of a merged write:
+        self.output_coalesced = 0
+        #bytes queued for writing which have not been handed to the connection yet:
+        self.output_backlog = 0
+        self.output_backlog_max = 0
+        self._backlog_lock = Lock()
         #initial value which may get increased by client/server after handshake:
         self.max_packet_size = MAX_PACKET_SIZE
         self.abs_max_packet_size = 256*1024*1024
         self.large_packets = ["hello", "window-metadata", "sound-data", "notify_show", "setting-change", "shell-reply"]
         self.send_aliases = {}
         self.send_flush_flag = False
+        #send large nested binary values as separate chunks:
+        self.send_oob_buffers = False
         self.receive_aliases = {}
+        #connections which can send each window on its own stream (ie: quic)
+        #need to know which window the packet belongs to:
+        self.window_packet_types : Tuple[str,...] = getattr(conn, "window_packet_types", ())
         self._log_stats = None          #None here means auto-detect
         self._closed = False
         self.encoder = "none"
@@ -144,10 +178,12 @@ class SocketProtocol:
         self.cipher_in_name = None
         self.cipher_in_block_size = 0
         self.cipher_in_padding = INITIAL_PADDING
+        self.cipher_in_tag_size = 0
         self.cipher_out = None
         self.cipher_out_name = None
         self.cipher_out_block_size = 0
         self.cipher_out_padding = INITIAL_PADDING
+        self.cipher_out_tag_size = 0
         self._threading_lock = RLock()
         self._write_lock = Lock()
         self._write_thread : Optional[Thread] = None
@@ -162,8 +198,8 @@ class SocketProtocol:
 
     STATE_FIELDS : Tuple[str,...] = (
         "max_packet_size", "large_packets", "send_aliases", "receive_aliases",
-        "cipher_in", "cipher_in_name", "cipher_in_block_size", "cipher_in_padding",
-        "cipher_out", "cipher_out_name", "cipher_out_block_size", "cipher_out_padding",
+        "cipher_in", "cipher_in_name", "cipher_in_block_size", "cipher_in_padding", "cipher_in_tag_size",
+        "cipher_out", "cipher_out_name", "cipher_out_block_size", "cipher_out_padding", "cipher_out_tag_size",
         "compression_level", "encoder", "compressor",
         )
 
@@ -213,6 +249,7 @@ class SocketProtocol:
                                                                   iv, password,
                                                                   key_salt,key_hash, key_size, iterations)
         self.cipher_in_padding = padding
+        self.cipher_in_tag_size = self.get_cipher_tag_size(self.cipher_in)
         if self.cipher_in_name!=ciphername:
             cryptolog.info("receiving data using %s encryption", ciphername)
             self.cipher_in_name = ciphername
@@ -223,10 +260,21 @@ class SocketProtocol:
                                                                     iv, password,
                                                                     key_salt, key_hash, key_size, iterations)
         self.cipher_out_padding = padding
+        self.cipher_out_tag_size = self.get_cipher_tag_size(self.cipher_out)
         if self.cipher_out_name!=ciphername:
             cryptolog.info("sending data using %s encryption", ciphername)
             self.cipher_out_name = ciphername
 
+    def get_cipher_tag_size(self, cipher) -> int:
+        if cipher:
+            #all the cipher modes expect to process the packets in order,
+            #(the AEAD nonces are derived from a counter)
+            #so connections which can deliver the packets out of order (ie: quic) must not do so:
+            set_ordered = getattr(self._conn, "set_ordered", None)
+            if set_ordered:
+                set_ordered()
+        return getattr(cipher, "tag_size", 0)
+
 
     def __repr__(self):
         return f"Protocol({self._conn})"
@@ -284,6 +332,7 @@ class SocketProtocol:
                        "count"                  : self.input_stats,
                        "cipher"                 : {"": self.cipher_in_name or "",
                                                    "padding"        : self.cipher_in_padding,
+                                                   "tag-size"       : self.cipher_in_tag_size,
                                                    },
                         })
         info.setdefault("output", {}).update({
@@ -293,9 +342,20 @@ class SocketProtocol:
                         "min-compress-size"     : MIN_COMPRESS_SIZE,
                         "packetcount"           : self.output_packetcount,
                         "raw_packetcount"       : self.output_raw_packetcount,
+                        "writes-per-packet"     : round(self.output_raw_packetcount/max(1, self.output_packetcount), 2),
+                        "coalesce"              : {
+                            "size"          : self.write_coalesce_size,
+                            "delay"         : WRITE_COALESCE_DELAY,
+                            "packets"       : self.output_coalesced,
+                            },
+                        "backlog"               : {
+                            ""              : self.output_backlog,
+                            "max"           : self.output_backlog_max,
+                            },
                         "count"                 : self.output_stats,
                         "cipher"                : {"": self.cipher_out_name or "",
-                                                   "padding" : self.cipher_out_padding
+                                                   "padding" : self.cipher_out_padding,
+                                                   "tag-size" : self.cipher_out_tag_size,
                                                    },
                         })
         for t in (self._write_thread, self._read_thread, self._read_parser_thread, self._write_format_thread):
@@ -372,6 +432,12 @@ class SocketProtocol:
             return
         #log("add_packet_to_queue(%s ... %s, %s, %s)", packet[0], synchronous, has_more, wait_for_more)
         packet_type : Union[str,int] = packet[0]
+        if packet_type=="draw" and len(packet)>10 and "datagram" in packet[10]:
+            #the server allows this packet to be lost, ie: "draw" -> "draw:1:datagram"
+            packet_type = f"{packet_type}:{packet[1]}:datagram"
+        elif packet_type in self.window_packet_types:
+            #ie: "draw" -> "draw:1"
+            packet_type = f"{packet_type}:{packet[1]}"
         chunks : NetPacketType = self.encode(packet)
         with self._write_lock:
             if self._closed:
@@ -395,6 +461,12 @@ class SocketProtocol:
             if not payload_size:
                 raise RuntimeError(f"missing data in chunk {index}")
             actual_size = payload_size
+            #if the other end can use this flag, expose it:
+            if self.send_flush_flag and not more and index==0 and not proto_flags & (FLAGS_OOB | FLAGS_NOHEADER):
+                proto_flags |= FLAGS_FLUSH
+            if self.cipher_out_tag_size:
+                items.append(self.aead_encrypt(packet_type, proto_flags | FLAGS_CIPHER, level, index, data))
+                continue
             if self.cipher_out:
                 proto_flags |= FLAGS_CIPHER
                 #note: since we are padding: l!=len(data)
@@ -421,9 +493,6 @@ class SocketProtocol:
                 log("sending %s bytes without header", payload_size)
                 items.append(data)
             else:
-                #if the other end can use this flag, expose it:
-                if self.send_flush_flag and not more and index==0:
-                    proto_flags |= FLAGS_FLUSH
                 #the xpra packet header:
                 #(WebSocketProtocol may also add a websocket header too)
                 header = self.make_chunk_header(packet_type, proto_flags, level, index, payload_size)
@@ -446,6 +515,21 @@ class SocketProtocol:
                 items.insert(0, frame_header)
         self.raw_write(items, packet_type, start_cb, end_cb, fail_cb, synchronous, more)
 
+    def aead_encrypt(self, packet_type:str, proto_flags:int, level:int, index:int, data:ByteString) -> bytearray:
+        """
+            Encrypts the chunk directly into a buffer which starts with its header,
+            the header is authenticated together with the payload.
+        """
+        assert not proto_flags & FLAGS_NOHEADER
+        payload_size = len(data)
+        header = self.make_chunk_header(packet_type, proto_flags, level, index, payload_size)
+        hsize = len(header)
+        buf = bytearray(hsize + payload_size + self.cipher_out_tag_size)
+        buf[:hsize] = header
+        self.cipher_out.encrypt_into(data, header, memoryview(buf)[hsize:])
+        cryptolog("sending %s bytes %s encrypted", payload_size, self.cipher_out_name)
+        return buf
+
     @staticmethod
     def make_xpra_header(_packet_type, proto_flags, level, index, payload_size) -> ByteString:
         return pack_header(proto_flags, level, index, payload_size)
@@ -467,8 +551,23 @@ class SocketProtocol:
         if self._write_thread is None:
             log("raw_write for %s, starting write thread", packet_type)
             self.start_write_thread()
+        size = sum(len(item) for item in items)
+        self.add_backlog(size)
+        with self._write_queue_cond:
+            #don't queue too much data, unless the queue is empty:
+            while self._write_queue_bytes>0 and self._write_queue_bytes+size>WRITE_QUEUE_BYTES and not self._closed:
+                self._write_queue_cond.wait(1)
+            self._write_queue_bytes += size
         self._write_queue.put((items, packet_type, start_cb, end_cb, fail_cb, synchronous, more))
 
+    def get_write_items(self, block:bool=True, timeout:Optional[float]=None):
+        items = self._write_queue.get(block, timeout)
+        if items:
+            with self._write_queue_cond:
+                self._write_queue_bytes -= self.get_write_size(items)
+                self._write_queue_cond.notify_all()
+        return items
+
 
     def enable_default_encoder(self) -> None:
         opts = packet_encoding.get_enabled_encoders()
@@ -481,6 +580,8 @@ class SocketProtocol:
         for e in opts:
             if caps.boolget(e, e=="bencode"):
                 self.enable_encoder(e)
+                self.send_oob_buffers = e=="rencodeplus" and packet_encoding.OOB_BUFFERS and \
+                    typedict(caps.dictget(e) or {}).boolget("oob")
                 return True
             log(f"client does not support {e}")
         log.error("no matching packet encoder found!")
@@ -616,8 +717,14 @@ class SocketProtocol:
                 packet[0] = alias
             else:
                 log("packet type send alias not found for '%s'", packet_type)
+        buffers : List[ByteString] = []
         try:
-            main_packet, proto_flags = self._encoder(packet)
+            if self.send_oob_buffers:
+                #large nested binary values are not copied into the main packet,
+                #they are passed to us and sent as separate chunks:
+                main_packet, proto_flags = self._encoder(packet, buffers.append)
+            else:
+                main_packet, proto_flags = self._encoder(packet)
         except Exception:
             if self._closed:
                 return []
@@ -627,6 +734,14 @@ class SocketProtocol:
             from xpra.net.protocol.check import verify_packet
             verify_packet(packet)
             raise
+        for i, buf in enumerate(buffers):
+            if level>0:
+                cl, cdata = self._compress(buf, level)
+                packets.append((proto_flags | FLAGS_OOB, i, cl, cdata))
+                payload_size += len(cdata)
+            else:
+                packets.append((proto_flags | FLAGS_OOB, i, 0, buf))
+                payload_size += len(buf)
         l = len(main_packet)
         payload_size += l
         if l>size_check and bytestostr(packet_in[0]) not in self.large_packets:
@@ -684,14 +799,98 @@ class SocketProtocol:
     def _write_thread_loop(self) -> None:
         self._io_thread_loop("write", self._write)
     def _write(self) -> bool:
-        items = self._write_queue.get()
+        items = self.get_write_items()
         # Used to signal that we should exit:
         if items is None:
             log("write thread: empty marker, exiting")
             self.close()
             return False
+        if self.write_coalesce_size and self.get_write_size(items)<self.write_coalesce_size:
+            return self.write_coalesced(items)
         return self.write_items(*items)
 
+    def add_backlog(self, size:int) -> None:
+        with self._backlog_lock:
+            self.output_backlog += size
+            self.output_backlog_max = max(self.output_backlog_max, self.output_backlog)
+
+    @staticmethod
+    def get_write_size(items) -> int:
+        return sum(len(buf) for buf in items[0])
+
+    def write_coalesced(self, items) -> bool:
+        """
+            Merges the small packets which follow this one in the write queue,
+            so that they can be sent with a single write.
+        """
+        batch = [items]
+        size = self.get_write_size(items)
+        deadline = monotonic()+WRITE_COALESCE_DELAY/1000
+        pending = ()
+        while size<self.write_coalesce_size:
+            try:
+                if WRITE_COALESCE_DELAY>0:
+                    timeout = deadline-monotonic()
+                    if timeout<=0:
+                        break
+                    next_items = self.get_write_items(timeout=timeout)
+                else:
+                    next_items = self.get_write_items(False)
+            except Empty:
+                break
+            if next_items is None:
+                pending = (None, )
+                break
+            next_size = self.get_write_size(next_items)
+            if size+next_size>self.write_coalesce_size:
+                pending = (next_items, )
+                break
+            batch.append(next_items)
+            size += next_size
+        if len(batch)==1:
+            r = self.write_items(*items)
+        else:
+            r = self.write_batch(batch)
+        for next_items in pending:
+            if next_items is None:
+                log("write thread: empty marker, exiting")
+                self.close()
+                return False
+            r = self.write_items(*next_items)
+        return r
+
+    def write_batch(self, batch) -> bool:
+        conn = self._conn
+        if not conn:
+            return False
+        more = batch[-1][6]
+        try:
+            conn.set_nodelay(not more)
+        except OSError:
+            log("write_batch(..)", exc_info=True)
+            if not self._closed:
+                raise
+        bytecount = conn.output_bytecount
+        for buf_data, _packet_type, start_cb, *_ in batch:
+            self.write_callback(start_cb, bytecount)
+            bytecount += sum(len(buf) for buf in buf_data)
+        data = b"".join(buf for items in batch for buf in items[0])
+        log("merged %i packets into a single %i bytes write", len(batch), len(data))
+        self.write_buffers((data, ), batch[-1][1], None, True)
+        self.output_packetcount += len(batch)-1
+        self.output_coalesced += len(batch)
+        for items in batch:
+            self.write_callback(items[3], conn.output_bytecount)
+        return True
+
+    def write_callback(self, cb:Optional[Callable], bytecount:int) -> None:
+        if cb:
+            try:
+                cb(bytecount)
+            except Exception:
+                if not self._closed:
+                    log.error(f"Error on write callback {cb}", exc_info=True)
+
     def write_items(self, buf_data, packet_type:str="",
                     start_cb:Optional[Callable]=None, end_cb:Optional[Callable]=None,
                     fail_cb:Optional[Callable]=None, synchronous:bool=True, more:bool=False):
@@ -707,12 +906,7 @@ class SocketProtocol:
             log("write_items(..)", exc_info=True)
             if not self._closed:
                 raise
-        if start_cb:
-            try:
-                start_cb(conn.output_bytecount)
-            except Exception:
-                if not self._closed:
-                    log.error(f"Error on write start callback {start_cb}", exc_info=True)
+        self.write_callback(start_cb, conn.output_bytecount)
         self.write_buffers(buf_data, packet_type, fail_cb, synchronous)
         try:
             if len(buf_data)>1:
@@ -723,12 +917,7 @@ class SocketProtocol:
             log("write_items(..)", exc_info=True)
             if not self._closed:
                 raise
-        if end_cb:
-            try:
-                end_cb(self._conn.output_bytecount)
-            except Exception:
-                if not self._closed:
-                    log.error(f"Error on write end callback {end_cb}", exc_info=True)
+        self.write_callback(end_cb, conn.output_bytecount)
         return True
 
     def write_buffers(self, buf_data, packet_type:str, _fail_cb:Optional[Callable], _synchronous:bool):
@@ -736,6 +925,7 @@ class SocketProtocol:
         if not con:
             return
         for buf in buf_data:
+            size = len(buf)
             while buf and not self._closed:
                 written = self.con_write(con, buf, packet_type)
                 #example test code, for sending small chunks very slowly:
@@ -745,6 +935,7 @@ class SocketProtocol:
                 if written:
                     buf = buf[written:]
                     self.output_raw_packetcount += 1
+            self.add_backlog(-size)
         self.output_packetcount += 1
 
     def con_write(self, con, buf:ByteString, packet_type:str):
@@ -752,9 +943,53 @@ class SocketProtocol:
 
 
     def _read_thread_loop(self) -> None:
+        self._packet_reader = self.make_packet_reader()
         self._io_thread_loop("read", self._read)
+
+    def make_packet_reader(self) -> Optional[PacketReader]:
+        if not READ_INTO or self.wait_for_header:
+            return None
+        #websocket and other framings process the data before the parse thread:
+        if self._process_read!=self.read_queue_put:
+            return None
+        conn = self._conn
+        can_read_into = getattr(conn, "can_read_into", None)
+        if not can_read_into or not can_read_into():
+            return None
+        log("using read_into with %s", conn)
+        return PacketReader(conn.read_into, self.get_payload_size, self.read_buffer_size)
+
+    def get_payload_size(self, header:bytes) -> int:
+        """ the size of the payload following this header, or -1 if we can't tell """
+        if header[0]!=ord("P"):
+            return -1
+        _, protocol_flags, _, _, data_size = unpack_header(header)
+        if data_size<=0 or data_size>self.abs_max_packet_size:
+            return -1
+        if protocol_flags & FLAGS_CIPHER:
+            if not self.cipher_in_name:
+                return -1
+            if self.cipher_in_block_size:
+                return data_size + self.cipher_in_block_size - (data_size % self.cipher_in_block_size)
+            return data_size + self.cipher_in_tag_size
+        return data_size
+
     def _read(self) -> bool:
-        buf = self.con_read()
+        reader = self._packet_reader
+        if not reader:
+            return self._process_read_buffer(self.con_read())
+        if self._pre_read:
+            bufs = reader.split(self.con_read())
+        else:
+            bufs = reader.read()
+            if bufs is None:
+                return self._process_read_buffer(b"")
+        for buf in bufs:
+            if not self._process_read_buffer(buf):
+                return False
+        return True
+
+    def _process_read_buffer(self, buf:ByteString) -> bool:
         #log("read thread: got data of size %s: %s", len(buf), repr_ellipsized(buf))
         #add to the read queue (or whatever takes its place - see steal_connection)
         self._process_read(buf)
@@ -863,6 +1098,17 @@ class SocketProtocol:
             this will be called from this parsing thread so any calls that need to be made
             from the UI thread will need to use a callback (usually via 'idle_add')
         """
+        #the chunks received for the packet being assembled:
+        raw_packets : Dict[int,ByteString] = {}
+        oob_buffers : Dict[int,bytes] = {}
+        try:
+            self.read_parse_packets(raw_packets, oob_buffers)
+        finally:
+            #don't hold on to partial packets, ie: after an error
+            raw_packets.clear()
+            oob_buffers.clear()
+
+    def read_parse_packets(self, raw_packets:Dict[int,ByteString], oob_buffers:Dict[int,bytes]) -> None:
         header = b""
         read_buffers = []
         payload_size = -1
@@ -871,7 +1117,6 @@ class SocketProtocol:
         protocol_flags = 0
         data_size = 0
         compression_level = 0
-        raw_packets = {}
         PACKET_HEADER_CHAR = ord("P")
         while not self._closed:
             #log("parse thread: %i items in read queue", self._read_queue.qsize())
@@ -943,7 +1188,8 @@ class SocketProtocol:
                             padding_size = 0
                         else:
                             padding_size = self.cipher_in_block_size - (data_size % self.cipher_in_block_size)
-                        payload_size = data_size + padding_size
+                        #AEAD modes append a tag instead of padding:
+                        payload_size = data_size + padding_size + self.cipher_in_tag_size
                     else:
                         #no cipher, no padding:
                         padding_size = 0
@@ -1000,7 +1246,15 @@ class SocketProtocol:
                         return
                     cryptolog("received %i %s encrypted bytes with %i padding",
                               payload_size, self.cipher_in_name, padding_size)
-                    data = self.cipher_in.decrypt(data)
+                    if self.cipher_in_tag_size:
+                        try:
+                            data = self.cipher_in.decrypt(data, header)
+                        except Exception:
+                            cryptolog("%s.decrypt(..)", self.cipher_in, exc_info=True)
+                            self._internal_error(f"{self.cipher_in_name} authentication failed - wrong key?")
+                            return
+                    else:
+                        data = self.cipher_in.decrypt(data)
                     if padding_size > 0:
                         def debug_str(s):
                             try:
@@ -1051,6 +1305,18 @@ class SocketProtocol:
                 #we're processing this packet,
                 #make sure we get a new header next time
                 header = b""
+                if protocol_flags & FLAGS_OOB:
+                    if packet_index in oob_buffers:
+                        self.invalid(f"duplicate out-of-band buffer at index {packet_index}", data)
+                        return
+                    if packet_index>=MAX_OOB_BUFFERS or len(oob_buffers)>=MAX_OOB_BUFFERS:
+                        self.invalid(f"too many out-of-band buffers: index {packet_index}", data)
+                        return
+                    #store it for the main packet that follows:
+                    oob_buffers[packet_index] = memoryview_to_bytes(data)
+                    payload_size = -1
+                    self.receive_pending = True
+                    continue
                 if packet_index>0:
                     if packet_index in raw_packets:
                         self.invalid(f"duplicate raw packet at index {packet_index}", data)
@@ -1066,8 +1332,13 @@ class SocketProtocol:
                     self.receive_pending = True
                     continue
                 #final packet (packet_index==0), decode it:
+                buffers = tuple(oob_buffers.get(i) for i in range(len(oob_buffers)))
+                oob_buffers.clear()
+                if None in buffers:
+                    self.invalid("missing out-of-band buffer", data)
+                    return
                 try:
-                    packet = list(decode(data, protocol_flags))
+                    packet = list(decode(data, protocol_flags, buffers))
                 except InvalidPacketEncodingException as e:
                     self.invalid(f"invalid packet encoding: {e}", data)
                     return
@@ -1087,15 +1358,7 @@ class SocketProtocol:
 
                 if self._closed:
                     return
-                payload_size = len(data)
-                #add any raw packets back into it:
-                if raw_packets:
-                    for index,raw_data in raw_packets.items():
-                        #replace placeholder with the raw_data packet data:
-                        packet[index] = raw_data
-                        payload_size += len(raw_data)
-                    raw_packets = {}
-
+                payload_size = len(data) + sum(len(buf) for buf in buffers)
                 packet_type = packet[0]
                 if self.receive_aliases and isinstance(packet_type, int):
                     packet_type = self.receive_aliases.get(packet_type)
@@ -1105,6 +1368,15 @@ class SocketProtocol:
                         raise ValueError(f"receive alias not found for packet type {packet_type}")
                 else:
                     packet_type = bytestostr(packet_type)
+                #add any raw packets back into it:
+                if raw_packets:
+                    for index,raw_data in raw_packets.items():
+                        if isinstance(raw_data, memoryview) and packet_type not in MEMORYVIEW_PACKET_TYPES:
+                            raw_data = raw_data.tobytes()
+                        #replace placeholder with the raw_data packet data:
+                        packet[index] = raw_data
+                        payload_size += len(raw_data)
+                    raw_packets.clear()
                 self.input_stats[packet_type] = self.output_stats.get(packet_type, 0)+1
                 if LOG_RAW_PACKET_SIZE and packet_type!="logging":
                     log.info(f"received {packet_type:<32}: %i bytes", HEADER_SIZE + payload_size)
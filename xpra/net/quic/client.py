@@ -16,6 +16,7 @@ from aioquic.h0.connection import H0Connection
 from aioquic.h3.connection import H3Connection
 from aioquic.h3.events import (
     DataReceived,
+    DatagramReceived,
     H3Event,
     HeadersReceived,
     PushPromiseReceived,
@@ -28,7 +29,10 @@ from xpra.scripts.config import InitExit
 from xpra.exit_codes import ExitCode
 from xpra.net.bytestreams import pretty_socket
 from xpra.net.socket_util import get_ssl_verify_mode, create_udp_socket
-from xpra.net.quic.connection import XpraQuicConnection
+from xpra.net.quic.connection import (
+    XpraQuicConnection, get_datagram_stream_id,
+    SUBSTREAMS, SUBSTREAMS_HEADER, DRAW_DATAGRAMS, DATAGRAMS_HEADER,
+    )
 from xpra.net.quic.asyncio_thread import get_threaded_loop
 from xpra.net.quic.common import USER_AGENT, MAX_DATAGRAM_FRAME_SIZE, binary_headers
 from xpra.util import ellipsizer, envbool, csv
@@ -49,6 +53,10 @@ WS_HEADERS = {
         "sec-websocket-protocol" : "xpra",
         "user-agent" : USER_AGENT,
         }
+if SUBSTREAMS:
+    WS_HEADERS[SUBSTREAMS_HEADER] = 1
+if DRAW_DATAGRAMS:
+    WS_HEADERS[DATAGRAMS_HEADER] = 1
 
 
 class ClientWebSocketConnection(XpraQuicConnection):
@@ -74,18 +82,36 @@ class ClientWebSocketConnection(XpraQuicConnection):
             return len(buf)
         return super().write(buf, packet_type)
 
+    def allocate_new_stream_id(self, stream_type:str) -> int:
+        #open a new request stream, the server uses the 'substream' header
+        #to associate it with this connection:
+        stream_id = self.connection._quic.get_next_available_stream_id()
+        log(f"new stream: {stream_id} for {stream_type!r}")
+        self.send_headers(stream_id=stream_id, headers={
+            ":method"   : "CONNECT",
+            ":scheme"   : "https",
+            ":authority" : self.endpoint[0],
+            ":path"     : "/",
+            "substream" : self.stream_id,
+            "stream-type" : stream_type,
+            })
+        return stream_id
+
     def http_event_received(self, event: H3Event) -> None:
         log("http_event_received(%s)", ellipsizer(event))
         if isinstance(event, HeadersReceived):
-            for header, value in event.headers:
-                if header == b"sec-websocket-protocol":
-                    subprotocols = value.decode().split(",")
-                    if "xpra" not in subprotocols:
-                        log.warn(f"Warning: unsupported websocket subprotocols {subprotocols}")
-                        self.close()
-                        return
-                    self.accepted = True
-                    self.flush_writes()
+            headers = dict(event.headers)
+            protocol = headers.get(b"sec-websocket-protocol")
+            if protocol is not None:
+                subprotocols = protocol.decode().split(",")
+                if "xpra" not in subprotocols:
+                    log.warn(f"Warning: unsupported websocket subprotocols {subprotocols}")
+                    self.close()
+                    return
+                self.accepted = True
+                self.substreams = SUBSTREAMS and headers.get(SUBSTREAMS_HEADER.encode())==b"1"
+                self.draw_datagrams = DRAW_DATAGRAMS and headers.get(DATAGRAMS_HEADER.encode())==b"1"
+                self.flush_writes()
             return
         if isinstance(event, PushPromiseReceived):
             log(f"PushPromiseReceived: {event}")
@@ -126,6 +152,11 @@ class WebSocketClient(QuicConnectionProtocol):
             self.http_event_received(http_event)
 
     def http_event_received(self, event: H3Event) -> None:
+        if isinstance(event, DatagramReceived):
+            websocket = self._websockets.get(get_datagram_stream_id(event))
+            if websocket:
+                websocket.http_event_received(event)
+            return
         if not isinstance(event, (HeadersReceived, DataReceived, PushPromiseReceived)):
             log.warn(f"Warning: unexpected http event type: {event}")
             return
@@ -137,7 +168,11 @@ class WebSocketClient(QuicConnectionProtocol):
             hdict = {}
             if isinstance(event, HeadersReceived):
                 hdict = dict((k.decode(),v.decode()) for k,v in event.headers)
-                sub = int(hdict.get("substream", -1))
+                try:
+                    sub = int(hdict.get("substream", -1))
+                except ValueError:
+                    log.warn(f"Warning: invalid substream header {hdict.get('substream')!r} for stream {stream_id}")
+                    return
             if sub<0:
                 log.warn(f"Warning: unexpected websocket stream id: {stream_id} in {event}")
                 return
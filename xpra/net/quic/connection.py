@@ -5,7 +5,7 @@
 
 import os
 from queue import Queue
-from typing import Callable, Union, Dict, Any
+from typing import Callable, Union, Dict, List, Tuple, Any, ByteString
 
 from aioquic.h0.connection import H0Connection
 from aioquic.h3.connection import H3Connection
@@ -13,9 +13,9 @@ from aioquic.h3.events import DataReceived, DatagramReceived, H3Event
 
 from xpra.net.quic.asyncio_thread import get_threaded_loop
 from xpra.net.bytestreams import Connection
-from xpra.net.websockets.header import close_packet
+from xpra.net.websockets.header import close_packet, hybi_frame_length
 from xpra.net.quic.common import binary_headers, override_aioquic_logger
-from xpra.util import ellipsizer, envbool
+from xpra.util import ellipsizer, envbool, envint
 from xpra.os_util import memoryview_to_bytes
 from xpra.log import Logger
 log = Logger("quic")
@@ -24,6 +24,93 @@ HttpConnection = Union[H0Connection, H3Connection]
 
 #DATAGRAM_PACKET_TYPES = os.environ.get("XPRA_QUIC_DATAGRAM_PACKET_TYPES", "pointer,pointer-button").split(",")
 DATAGRAM_PACKET_TYPES = tuple(x.strip() for x in os.environ.get("XPRA_QUIC_DATAGRAM_PACKET_TYPES", "").split(",") if x.strip())
+#the client can request that the draw packets which fit in a datagram are sent as datagrams,
+#the lost packets are refreshed instead of being retransmitted:
+DRAW_DATAGRAMS = envbool("XPRA_QUIC_DRAW_DATAGRAMS", False)
+#a datagram must fit in a single QUIC packet:
+MAX_DATAGRAM_PAYLOAD = envint("XPRA_QUIC_MAX_DATAGRAM_PAYLOAD", 1100)
+#the http header used for negotiating draw datagrams:
+DATAGRAMS_HEADER = "xpra-datagrams"
+
+#send the packets which can be delayed by a lost datagram on their own streams:
+SUBSTREAMS = envbool("XPRA_QUIC_SUBSTREAMS", True)
+#the draw packets of each window get their own stream, up to this limit:
+#(the connection may not allow that many, see `get_substreams_limit`)
+WINDOW_STREAMS = envint("XPRA_QUIC_WINDOW_STREAMS", 6)
+#the window lifecycle packets (new-window, lost-window, window-metadata, etc) stay on the main stream,
+#so they remain ordered with all the other packets,
+#'eos' ends the video stream so it must stay ordered with the draw packets:
+WINDOW_PACKET_TYPES : Tuple[str,...] = ("draw", "eos")
+#everything else uses the main stream:
+STREAM_TYPES : Dict[str,str] = {
+    "sound-data"                : "audio",
+    "webcam-frame"              : "webcam",
+    "send-file"                 : "bulk",
+    "send-file-chunk"           : "bulk",
+    "clipboard-contents"        : "bulk",
+    "clipboard-contents-chunk"  : "bulk",
+    }
+#the http header used for negotiating substreams:
+SUBSTREAMS_HEADER = "xpra-substreams"
+
+
+def get_stream_type(packet_type:str, window_streams:int=WINDOW_STREAMS) -> str:
+    """
+        the type of stream used for sending this packet,
+        an empty string for the main stream
+    """
+    if not packet_type:
+        return ""
+    #window packets are tagged with the window id, ie: "draw:1" or "draw:1:datagram"
+    ptype, _, wid = packet_type.partition(":")
+    wid = wid.partition(":")[0]
+    if wid and ptype in WINDOW_PACKET_TYPES:
+        if window_streams<=0:
+            return ""
+        return f"window-{int(wid) % window_streams}"
+    return STREAM_TYPES.get(packet_type, "")
+
+
+def get_datagram_stream_id(event:DatagramReceived) -> int:
+    #aioquic 1.0 renamed 'flow_id' to 'stream_id':
+    return getattr(event, "stream_id", getattr(event, "flow_id", 0))
+
+
+class StreamFrames:
+    """
+        Accumulates the data received on a stream
+        until we have complete websocket frames,
+        so that the frames received on different streams do not get mixed up.
+    """
+    __slots__ = ("chunks", "size", "frame_size")
+
+    def __init__(self):
+        self.chunks : List[ByteString] = []
+        self.size : int = 0
+        self.frame_size : int = 0
+
+    def add(self, data:ByteString) -> List[bytes]:
+        self.chunks.append(data)
+        self.size += len(data)
+        frames = []
+        while self.size:
+            if not self.frame_size:
+                if len(self.chunks)>1:
+                    #the header may be split:
+                    self.chunks = [b"".join(self.chunks)]
+                self.frame_size = hybi_frame_length(self.chunks[0])
+                if not self.frame_size:
+                    break
+            if self.size<self.frame_size:
+                break
+            buf = b"".join(self.chunks) if len(self.chunks)>1 else memoryview_to_bytes(self.chunks[0])
+            frames.append(buf[:self.frame_size])
+            rest = buf[self.frame_size:]
+            self.chunks = [rest] if rest else []
+            self.size = len(rest)
+            self.frame_size = 0
+        return frames
+
 
 if envbool("XPRA_QUIC_LOGGER", True):
     override_aioquic_logger()
@@ -40,6 +127,27 @@ class XpraQuicConnection(Connection):
         self.transmit: Callable[[], None] = transmit
         self.accepted : bool = False
         self.closed : bool = False
+        #enabled once both ends have agreed to use them:
+        self.substreams : bool = False
+        #substreams are only used once the 'hello' packet has been sent on the main stream:
+        self.hello_sent : bool = False
+        self.window_packet_types : Tuple[str,...] = WINDOW_PACKET_TYPES if SUBSTREAMS and WINDOW_STREAMS>0 else ()
+        #stream type -> stream id:
+        self._stream_ids : Dict[str,int] = {}
+        #how many window streams we can use, decided when the first substream is needed:
+        self.window_streams : int = -1
+        #how many more substreams the connection allows us to create, -1 for no limit:
+        self.substreams_limit : int = -1
+        #stream id -> partial frames:
+        self._stream_frames : Dict[int,StreamFrames] = {}
+        #draw packets may be sent as datagrams:
+        self.draw_datagrams : bool = False
+        #set when the packets must be received in the order they were sent (ie: encryption):
+        self.ordered : bool = False
+        #the websocket frame being written:
+        self._frame_remaining : int = 0
+        self._frame_datagram : bool = False
+        self._datagram_parts : List[bytes] = []
 
     def __repr__(self):
         return f"XpraQuicConnection<{self.stream_id}>"
@@ -61,6 +169,11 @@ class XpraQuicConnection(Connection):
         qinfo.update({
             "read-queue"    : self.read_queue.qsize(),
             "stream-id"     : self.stream_id,
+            "substreams"    : self.substreams,
+            "draw-datagrams" : self.draw_datagrams,
+            "ordered"       : self.ordered,
+            "streams"       : dict(self._stream_ids),
+            "window-streams" : self.window_streams,
             "accepted"      : self.accepted,
             "closed"        : self.closed,
             })
@@ -70,11 +183,20 @@ class XpraQuicConnection(Connection):
         log("quic:http_event_received(%s)", ellipsizer(event))
         if self.closed:
             return
-        if isinstance(event, (DataReceived, DatagramReceived)):
+        if isinstance(event, DataReceived):
+            self.stream_data_received(event.stream_id, event.data)
+        elif isinstance(event, DatagramReceived):
             self.read_queue.put(event.data)
         else:
             log.warn(f"Warning: unhandled websocket http event {event}")
 
+    def stream_data_received(self, stream_id:int, data:ByteString) -> None:
+        frames = self._stream_frames.get(stream_id)
+        if frames is None:
+            frames = self._stream_frames[stream_id] = StreamFrames()
+        for frame in frames.add(data):
+            self.read_queue.put(frame)
+
     def close(self):
         log("quic.close()")
         if not self.closed:
@@ -106,27 +228,126 @@ class XpraQuicConnection(Connection):
         data = memoryview_to_bytes(buf)
         if not packet_type:
             log.warn(f"Warning: missing packet type for {data}")
-        if packet_type in DATAGRAM_PACKET_TYPES:
-            self.connection.send_datagram(flow_id=self.stream_id, data=data)
-            log(f"sending {packet_type} using datagram")
+        if (self._frame_remaining or self.use_datagram(packet_type)) and self.datagram_write(data, packet_type):
             return len(buf)
-        stream_id = self.get_packet_stream_id(packet_type)
-        log("quic.stream_write(%s, %s) using stream id %s",
-            ellipsizer(buf), packet_type, stream_id)
         def do_write():
+            #runs in the event loop thread, which is where new streams can be allocated:
+            stream_id = self.get_packet_stream_id(packet_type)
+            log("quic.stream_write(%s, %s) using stream id %s",
+                ellipsizer(buf), packet_type, stream_id)
             try:
                 self.connection.send_data(stream_id=stream_id, data=data, end_stream=self.closed)
                 self.transmit()
             except AssertionError:
                 if self.closed:
-                    log("connection is already closed, packet {packet_type} dropped")
+                    log(f"connection is already closed, packet {packet_type} dropped")
                     return
                 raise
         get_threaded_loop().call(do_write)
         return len(buf)
 
-    def get_packet_stream_id(self, packet_type):
-        return self.stream_id
+    def set_ordered(self) -> None:
+        """
+            The cipher contexts must process the packets in the order they were sent,
+            but quic may deliver the packets from different streams and the datagrams in any order,
+            so we stop using them and send everything on the main stream.
+        """
+        if not self.ordered:
+            log(f"{self} sending all the packets in order on stream {self.stream_id}")
+        self.ordered = True
+        self.substreams = False
+        self.draw_datagrams = False
+
+    def use_datagram(self, packet_type:str) -> bool:
+        if self.ordered:
+            return False
+        if packet_type in DATAGRAM_PACKET_TYPES:
+            return True
+        #the server only tags the draw packets which can be lost, ie: "draw:1:datagram"
+        return self.draw_datagrams and bool(packet_type) and packet_type.endswith(":datagram")
+
+    def datagram_write(self, data:bytes, packet_type:str) -> bool:
+        """
+            The packets are written in multiple parts,
+            collect them until we have the whole websocket frame.
+            Returns False if the frame is too big and must be sent on a stream instead.
+        """
+        if not self._frame_remaining:
+            #this is the start of a new frame:
+            size = hybi_frame_length(data)
+            self._frame_datagram = 0<size<=MAX_DATAGRAM_PAYLOAD
+            self._frame_remaining = size
+        self._frame_remaining = max(0, self._frame_remaining-len(data))
+        if not self._frame_datagram:
+            return False
+        self._datagram_parts.append(data)
+        if self._frame_remaining:
+            return True
+        payload = b"".join(self._datagram_parts)
+        self._datagram_parts = []
+        def send_datagram():
+            log(f"sending {packet_type} using a {len(payload)} bytes datagram")
+            try:
+                self.connection.send_datagram(self.stream_id, payload)
+                self.transmit()
+            except AssertionError:
+                if self.closed:
+                    log(f"connection is already closed, packet {packet_type} dropped")
+                    return
+                raise
+        get_threaded_loop().call(send_datagram)
+        return True
+
+    def get_packet_stream_id(self, packet_type:str) -> int:
+        if packet_type=="hello":
+            self.hello_sent = True
+            return self.stream_id
+        if self.closed or self.ordered or not self.substreams or not self.hello_sent:
+            return self.stream_id
+        if self.window_streams<0:
+            self.init_substreams_limit()
+        stream_type = get_stream_type(packet_type, self.window_streams)
+        if not stream_type:
+            return self.stream_id
+        stream_id = self._stream_ids.get(stream_type)
+        if stream_id is not None:
+            #already allocated substream:
+            return stream_id
+        # allocate a new one and record it
+        # (even if it fails, so we don't retry to allocate it again and again):
+        stream_id = 0
+        if self.substreams_limit!=0:
+            stream_id = self.allocate_new_stream_id(stream_type)
+            if stream_id and self.substreams_limit>0:
+                self.substreams_limit -= 1
+        stream_id = stream_id or self.stream_id
+        self._stream_ids[stream_type] = stream_id
+        return stream_id
+
+    def init_substreams_limit(self) -> None:
+        """
+            The window streams share what is left once
+            each of the other stream types has had its own stream,
+            so that the limit never forces a window's draw packets onto the main stream
+            after they have started using a substream.
+        """
+        limit = self.get_substreams_limit()
+        window_streams = WINDOW_STREAMS
+        if limit>=0:
+            other_streams = len(set(STREAM_TYPES.values()))
+            window_streams = max(0, min(window_streams, limit-other_streams))
+        log(f"{self} substreams limit={limit}, using {window_streams} window streams")
+        self.substreams_limit = limit
+        self.window_streams = window_streams
+
+    def get_substreams_limit(self) -> int:
+        """ how many substreams the connection allows us to create, -1 for no limit """
+        return -1
+
+    def allocate_new_stream_id(self, stream_type:str) -> int:
+        """ returns the id of a new stream, or 0 if we cannot allocate one """
+        log(f"cannot allocate a stream for {stream_type!r}")
+        return 0
 
 
     def read(self, n):
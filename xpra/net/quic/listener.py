@@ -23,6 +23,7 @@ from aioquic.quic.events import DatagramFrameReceived, ProtocolNegotiated, QuicE
 
 from xpra.net.quic.common import MAX_DATAGRAM_FRAME_SIZE
 from xpra.net.quic.http import HttpRequestHandler
+from xpra.net.quic.connection import get_datagram_stream_id
 from xpra.net.quic.websocket import ServerWebSocketConnection
 from xpra.net.quic.webtransport import WebTransportHandler
 from xpra.net.quic.session_ticket_store import SessionTicketStore
@@ -64,10 +65,15 @@ class HttpServerProtocol(QuicConnectionProtocol):
                 self.http_event_received(http_event)
 
     def http_event_received(self, event: H3Event) -> None:
-        hid = event.flow_id if isinstance(event, DatagramReceived) else event.stream_id
+        hid = get_datagram_stream_id(event) if isinstance(event, DatagramReceived) else event.stream_id
         handler = self._handlers.get(hid)
         log(f"hsp:http_event_received(%s) handler {hid}: {handler}", ellipsizer(event))
         if isinstance(event, HeadersReceived) and not handler:
+            parent = self.get_substream_parent(event)
+            if parent:
+                log(f"new substream {event.stream_id} for {parent}")
+                self._handlers[event.stream_id] = parent
+                return
             handler = self.new_http_handler(event)
             handler.xpra_server = self._xpra_server
             self._handlers[event.stream_id] = handler
@@ -76,14 +82,29 @@ class HttpServerProtocol(QuicConnectionProtocol):
         if isinstance(event, (DataReceived, HeadersReceived)) and handler:
             handler.http_event_received(event)
             return
-        if isinstance(event, DatagramReceived):
-            handler = self._handlers[event.flow_id]
+        if isinstance(event, DatagramReceived) and handler:
             handler.http_event_received(event)
             return
         if isinstance(event, WebTransportStreamDataReceived):
             handler = self._handlers[event.session_id]
             handler.http_event_received(event)
 
+    def get_substream_parent(self, event:HeadersReceived) -> Optional[ServerWebSocketConnection]:
+        """ the websocket connection this new stream belongs to, if any """
+        for header, value in event.headers:
+            if header == b"substream":
+                try:
+                    parent_id = int(value)
+                except ValueError:
+                    log.warn(f"Warning: invalid substream header {value!r} for stream {event.stream_id}")
+                    return None
+                parent = self._handlers.get(parent_id)
+                if isinstance(parent, ServerWebSocketConnection) and parent.substreams:
+                    return parent
+                log.warn(f"Warning: invalid substream {parent_id} for stream {event.stream_id}")
+                return None
+        return None
+
     def new_http_handler(self, event) -> Handler:
         authority = None
         headers = []
@@ -3,31 +3,24 @@
 # Xpra is released under the terms of the GNU GPL v2, or, at your option, any
 # later version. See the file COPYING for details.
 
-import os
 from typing import Callable, Dict, Any
 
 from aioquic.h3.events import HeadersReceived, H3Event
 from aioquic.h3.exceptions import NoAvailablePushIDError
 
 from xpra.net.bytestreams import pretty_socket
-from xpra.net.quic.connection import XpraQuicConnection
+from xpra.net.quic.connection import XpraQuicConnection, SUBSTREAMS, SUBSTREAMS_HEADER, DATAGRAMS_HEADER
 from xpra.net.quic.common import SERVER_NAME, http_date, binary_headers
 from xpra.util import ellipsizer, first_time
 from xpra.log import Logger
 log = Logger("quic")
 
-#can be used to use substreams based on packet prefix: sound,webcam,draw
-SUBSTREAM_PACKET_TYPES = tuple(x.strip() for x in os.environ.get("XPRA_QUIC_SUBSTREAM_PACKET_TYPES", "").split(",") if x.strip())
-#SUBSTREAM_PACKET_LOSS_PCT = envint("XPRA_QUIC_SUBSTREAM_PACKET_LOSS_PCT", 0)
-
 
 class ServerWebSocketConnection(XpraQuicConnection):
     def __init__(self, connection, scope: Dict,
                  stream_id: int, transmit: Callable[[], None]) -> None:
         super().__init__(connection, stream_id, transmit, "", 0, info=None, options=None)
         self.scope: Dict = scope
-        self._packet_type_streams : Dict[str,int] = {}
-        self._use_substreams = bool(SUBSTREAM_PACKET_TYPES)
 
     def get_info(self) -> Dict[str,Any]:
         info = super().get_info()
@@ -52,35 +45,36 @@ class ServerWebSocketConnection(XpraQuicConnection):
                 return
             log.info("websocket request at %s", self.scope.get("path", "/"))
             self.accepted = True
+            headers = dict(self.scope.get("headers", ()))
+            self.substreams = SUBSTREAMS and headers.get(SUBSTREAMS_HEADER.encode())==b"1"
+            #the client decides if it wants to receive draw datagrams:
+            self.draw_datagrams = headers.get(DATAGRAMS_HEADER.encode())==b"1"
             self.send_accept(self.stream_id)
             self.transmit()
             return
         super().http_event_received(event)
 
     def send_accept(self, stream_id : int) -> None:
-        self.send_headers(stream_id=stream_id, headers={
+        headers = {
             ":status"   : 200,
             "server"    : SERVER_NAME,
             "date"      : http_date(),
             "sec-websocket-protocol" : "xpra",
-            })
+            }
+        if self.substreams:
+            headers[SUBSTREAMS_HEADER] = 1
+        if self.draw_datagrams:
+            headers[DATAGRAMS_HEADER] = 1
+        self.send_headers(stream_id=stream_id, headers=headers)
 
-    def get_packet_stream_id(self, packet_type) -> int:
-        if self.closed or not self._use_substreams or not packet_type:
-            return self.stream_id
-        if not any(packet_type.startswith(x) for x in SUBSTREAM_PACKET_TYPES):
-            return self.stream_id
-        #ie: "sound-data" -> "sound"
-        stream_type = packet_type.split("-", 1)[0]
-        stream_id = self._packet_type_streams.get(stream_type)
-        if stream_id is not None:
-            #already allocated substream:
-            return stream_id
-        # allocate a new one and record it
-        # (even if it fails, so we don't retry to allocate it again and again):
-        stream_id = self.allocate_new_stream_id(stream_type) or self.stream_id
-        self._packet_type_streams[stream_type] = stream_id
-        return stream_id
+    def get_substreams_limit(self) -> int:
+        #we create the substreams using push promises,
+        #and the client decides how many push ids we can use:
+        max_push_id = getattr(self.connection, "_max_push_id", None)
+        if max_push_id is None:
+            return 0
+        next_push_id = getattr(self.connection, "_next_push_id", 0)
+        return max(0, max_push_id-next_push_id)
 
     def allocate_new_stream_id(self, stream_type) -> int:
         log(f"allocate_new_stream_id({stream_type!r})")
@@ -97,13 +91,11 @@ class ServerWebSocketConnection(XpraQuicConnection):
             stream_id = self.connection.send_push_promise(self.stream_id, headers)
         except NoAvailablePushIDError:
             log(f"unable to allocate new stream-id using {self.stream_id} and {headers}", exc_info=True)
-            if first_time("quic-no-push-id"):
+            if first_time(f"quic-no-push-id-{self.stream_id}"):
                 log.warn(f"Warning: unable to allocate a new stream-id for {stream_type!r}")
-            else:
-                #more than one error, stop trying:
-                self._use_substreams = False
+                log.warn(" using the main stream instead")
             return 0
-        log.info(f"new stream: {stream_id} for {stream_type!r} with headers={headers}")
+        log(f"new stream: {stream_id} for {stream_type!r} with headers={headers}")
         self.send_headers(stream_id=stream_id, headers={
             ":status" : 200,
             "substream" : self.stream_id,
@@ -26,16 +26,19 @@
 import sys
 
 from cpython cimport bool
-from libc.stdlib cimport realloc, free
+from cpython.ref cimport PyObject
+from cpython.bytes cimport PyBytes_FromStringAndSize, PyBytes_AS_STRING
 from libc.string cimport memcpy
 
-__version__ = ("Cython", 1, 0, 8)
+__version__ = ("Cython", 1, 0, 9)
 
 
 cdef extern from "Python.h":
     int PyObject_GetBuffer(object obj, Py_buffer *view, int flags)
     void PyBuffer_Release(Py_buffer *view)
     int PyBUF_ANY_CONTIGUOUS
+    const char* PyUnicode_AsUTF8AndSize(object unicode, Py_ssize_t *size) except NULL
+    long long PyLong_AsLongLongAndOverflow(object pylong, int *overflow) except? -1
 
 
 cdef bool big_endian = sys.byteorder!="little"
@@ -56,6 +59,8 @@ cdef enum:
     CHR_INT8    = 65
     CHR_FLOAT32 = 66
     CHR_FLOAT64 = 44
+    # Reference to an out-of-band buffer, followed by its index.
+    CHR_BUFFER  = 46
     CHR_TRUE    = 67
     CHR_FALSE   = 68
     CHR_NONE    = 69
@@ -75,6 +80,9 @@ cdef enum:
     # Lists with length embedded in typecode.
     LIST_FIXED_START = STR_FIXED_START+STR_FIXED_COUNT
     LIST_FIXED_COUNT = 64
+    # Out-of-band buffers: default minimum size and maximum number per call.
+    OOB_THRESHOLD = 64*1024
+    MAX_BUFFERS = INT_POS_FIXED_COUNT
 #assert LIST_FIXED_START + LIST_FIXED_COUNT == 256
 
 cdef swap_byte_order_ushort(unsigned short *s):
@@ -144,201 +152,312 @@ cdef swap_byte_order_double(char *c):
     p[7] = c[0]
     return d
 
-cdef write_buffer_char(char **buf, unsigned int *pos, char c):
-    buf[0] = <char*>realloc(buf[0], pos[0] + 1)
-    if buf[0] == NULL:
-        raise MemoryError("Error in realloc, 1 byte needed")
-    memcpy(&buf[0][pos[0]], &c, 1)
-    pos[0] += 1
-
-cdef write_buffer(char **buf, unsigned int *pos, void* data, int size):
-    buf[0] = <char*>realloc(buf[0], pos[0] + size)
-    if buf[0] == NULL:
-        raise MemoryError(f"Error in realloc, {size} bytes needed")
-    memcpy(&buf[0][pos[0]], data, size)
-    pos[0] += size
-
-cdef encode_char(char **buf, unsigned int *pos, signed char x):
+cdef struct Buffer:
+    char *data
+    size_t pos
+    size_t size
+    #out-of-band buffers:
+    PyObject *buffer_callback
+    size_t oob_threshold
+    unsigned int max_buffers
+    unsigned int oob_count
+
+cdef inline write_buffer_char(Buffer *buf, char c):
+    if buf.pos + 1 > buf.size:
+        raise RuntimeError("encoded data does not fit in the output buffer")
+    buf.data[buf.pos] = c
+    buf.pos += 1
+
+cdef inline write_buffer(Buffer *buf, const void* data, size_t size):
+    if buf.pos + size > buf.size:
+        raise RuntimeError(f"encoded data does not fit in the output buffer, {size} bytes needed")
+    memcpy(&buf.data[buf.pos], data, size)
+    buf.pos += size
+
+cdef inline bint use_oob(Buffer *buf, size_t size):
+    return buf.buffer_callback!=NULL and size>=buf.oob_threshold and buf.oob_count<buf.max_buffers
+
+cdef encode_char(Buffer *buf, signed char x):
     if 0 <= x < INT_POS_FIXED_COUNT:
-        write_buffer_char(buf, pos, INT_POS_FIXED_START + x)
+        write_buffer_char(buf, INT_POS_FIXED_START + x)
     elif -INT_NEG_FIXED_COUNT <= x < 0:
-        write_buffer_char(buf, pos, INT_NEG_FIXED_START - 1 - x)
+        write_buffer_char(buf, INT_NEG_FIXED_START - 1 - x)
     else:
-        write_buffer_char(buf, pos, CHR_INT1)
-        write_buffer_char(buf, pos, x)
+        write_buffer_char(buf, CHR_INT1)
+        write_buffer_char(buf, x)
 
-cdef encode_short(char **buf, unsigned int *pos, short x):
-    write_buffer_char(buf, pos, CHR_INT2)
+cdef encode_short(Buffer *buf, short x):
+    write_buffer_char(buf, CHR_INT2)
     if not big_endian:
         if x > 0:
             swap_byte_order_ushort(<unsigned short*>&x)
         else:
             x = swap_byte_order_short(<char*>&x)
-    write_buffer(buf, pos, &x, sizeof(x))
+    write_buffer(buf, &x, sizeof(x))
 
-cdef encode_int(char **buf, unsigned int *pos, int x):
-    write_buffer_char(buf, pos, CHR_INT4)
+cdef encode_int(Buffer *buf, int x):
+    write_buffer_char(buf, CHR_INT4)
     if not big_endian:
         if x > 0:
             swap_byte_order_uint(&x)
         else:
             x = swap_byte_order_int(<char*>&x)
-    write_buffer(buf, pos, &x, sizeof(x))
+    write_buffer(buf, &x, sizeof(x))
 
-cdef encode_long_long(char **buf, unsigned int *pos, long long x):
-    write_buffer_char(buf, pos, CHR_INT8)
+cdef encode_long_long(Buffer *buf, long long x):
+    write_buffer_char(buf, CHR_INT8)
     if not big_endian:
         if x > 0:
             swap_byte_order_ulong_long(&x)
         else:
             x = swap_byte_order_long_long(<char*>&x)
-    write_buffer(buf, pos, &x, sizeof(x))
+    write_buffer(buf, &x, sizeof(x))
 
-cdef encode_big_number(char **buf, unsigned int *pos, char *x):
-    write_buffer_char(buf, pos, CHR_INT)
-    write_buffer(buf, pos, x, len(x))
-    write_buffer_char(buf, pos, CHR_TERM)
+cdef encode_big_number(Buffer *buf, char *x):
+    write_buffer_char(buf, CHR_INT)
+    write_buffer(buf, x, len(x))
+    write_buffer_char(buf, CHR_TERM)
 
-#cdef encode_float32(char **buf, unsigned int *pos, float x):
-#    write_buffer_char(buf, pos, CHR_FLOAT32)
+#cdef encode_float32(Buffer *buf, float x):
+#    write_buffer_char(buf, CHR_FLOAT32)
 #    if not big_endian:
 #        x = swap_byte_order_float(<char *>&x)
-#    write_buffer(buf, pos, &x, sizeof(x))
+#    write_buffer(buf, &x, sizeof(x))
 
-cdef encode_float64(char **buf, unsigned int *pos, double x):
-    write_buffer_char(buf, pos, CHR_FLOAT64)
+cdef encode_float64(Buffer *buf, double x):
+    write_buffer_char(buf, CHR_FLOAT64)
     if not big_endian:
         x = swap_byte_order_double(<char *>&x)
-    write_buffer(buf, pos, &x, sizeof(x))
+    write_buffer(buf, &x, sizeof(x))
+
+cdef encode_buffer_reference(Buffer *buf, data):
+    #the buffer is handed to the caller, we only write its index:
+    (<object> buf.buffer_callback)(data)
+    write_buffer_char(buf, CHR_BUFFER)
+    encode_char(buf, buf.oob_count)
+    buf.oob_count += 1
 
-cdef encode_memoryview(char **buf, unsigned int *pos, mem):
+cdef encode_memoryview(Buffer *buf, mem):
     cdef Py_buffer mv
     if PyObject_GetBuffer(mem, &mv, PyBUF_ANY_CONTIGUOUS):
         raise ValueError(f"failed to read data from {type(mem)}")
-    cdef int lx = mv.len
+    cdef size_t lx = mv.len
+    try:
+        if use_oob(buf, lx):
+            encode_buffer_reference(buf, mem)
+            return
+        s = b"%i/" % lx
+        write_buffer(buf, <char *> s, len(s))
+        write_buffer(buf, mv.buf, lx)
+    finally:
+        PyBuffer_Release(&mv)
+
+cdef encode_bytes(Buffer *buf, bytes x):
+    cdef size_t lx = len(x)
+    if use_oob(buf, lx):
+        encode_buffer_reference(buf, x)
+        return
     s = b"%i/" % lx
-    cdef char *p = s
-    write_buffer(buf, pos, p, len(s))
-    p = <char *> mv.buf
-    write_buffer(buf, pos, <char *>p, lx)
-    PyBuffer_Release(&mv)
-
-cdef encode_bytes(char **buf, unsigned int *pos, bytes x):
-    cdef char *p
-    cdef int lx = len(x)
-    s = b"%i/" % lx
-    p = s
-    write_buffer(buf, pos, p, len(s))
-    write_buffer(buf, pos, <char *>x, lx)
+    write_buffer(buf, <char *> s, len(s))
+    write_buffer(buf, <char *> x, lx)
 
-cdef encode_str(char **buf, unsigned int *pos, bytes x):
-    cdef char *p
-    cdef int lx = len(x)
+cdef encode_str(Buffer *buf, str x):
+    cdef Py_ssize_t lx
+    #the utf8 representation is cached in the string object by `str_size`:
+    cdef const char *p = PyUnicode_AsUTF8AndSize(x, &lx)
     if lx < STR_FIXED_COUNT:
-        write_buffer_char(buf, pos, STR_FIXED_START + lx)
-        write_buffer(buf, pos, <char *>x, lx)
+        write_buffer_char(buf, STR_FIXED_START + lx)
     else:
         s = b"%i:" % lx
-        p = s
-        write_buffer(buf, pos, p, len(s))
-        write_buffer(buf, pos, <char *>x, lx)
+        write_buffer(buf, <char *> s, len(s))
+    write_buffer(buf, p, lx)
 
-cdef encode_none(char **buf, unsigned int *pos):
-    write_buffer_char(buf, pos, CHR_NONE)
+cdef encode_none(Buffer *buf):
+    write_buffer_char(buf, CHR_NONE)
 
-cdef encode_bool(char **buf, unsigned int *pos, bool x):
-    write_buffer_char(buf, pos, CHR_TRUE if x else CHR_FALSE)
+cdef encode_bool(Buffer *buf, bool x):
+    write_buffer_char(buf, CHR_TRUE if x else CHR_FALSE)
 
-cdef encode_list(char **buf, unsigned int *pos, x):
+cdef encode_list(Buffer *buf, x):
     if len(x) < LIST_FIXED_COUNT:
-        write_buffer_char(buf, pos, LIST_FIXED_START + len(x))
+        write_buffer_char(buf, LIST_FIXED_START + len(x))
         for i in x:
-            encode(buf, pos, i)
+            encode(buf, i)
     else:
-        write_buffer_char(buf, pos, CHR_LIST)
+        write_buffer_char(buf, CHR_LIST)
         for i in x:
-            encode(buf, pos, i)
-        write_buffer_char(buf, pos, CHR_TERM)
+            encode(buf, i)
+        write_buffer_char(buf, CHR_TERM)
 
-cdef encode_dict(char **buf, unsigned int *pos, x):
+cdef encode_dict(Buffer *buf, x):
     if len(x) < DICT_FIXED_COUNT:
-        write_buffer_char(buf, pos, DICT_FIXED_START + len(x))
+        write_buffer_char(buf, DICT_FIXED_START + len(x))
         for k, v in x.items():
-            encode(buf, pos, k)
-            encode(buf, pos, v)
+            encode(buf, k)
+            encode(buf, v)
     else:
-        write_buffer_char(buf, pos, CHR_DICT)
+        write_buffer_char(buf, CHR_DICT)
         for k, v in x.items():
-            encode(buf, pos, k)
-            encode(buf, pos, v)
-        write_buffer_char(buf, pos, CHR_TERM)
-
-cdef object MAX_SIGNED_INT = 2**31
-cdef object MIN_SIGNED_INT = -MAX_SIGNED_INT
-#note: negating the Python value avoids compiler problems
-#(negating the "long long" constant can make it unsigned with some compilers!)
-cdef object MAX_SIGNED_LONGLONG = int(2**63)
-cdef object MIN_SIGNED_LONGLONG = -MAX_SIGNED_LONGLONG
-
-cdef encode(char **buf, unsigned int *pos, data):
+            encode(buf, k)
+            encode(buf, v)
+        write_buffer_char(buf, CHR_TERM)
+
+cdef encode_integer(Buffer *buf, data):
+    cdef int overflow = 0
+    cdef long long v = PyLong_AsLongLongAndOverflow(data, &overflow)
+    if overflow:
+        s = str(data).encode("ascii")
+        if len(s) >= MAX_INT_LENGTH:
+            raise ValueError(f"Number is longer than {MAX_INT_LENGTH} characters")
+        encode_big_number(buf, s)
+    elif -128 <= v < 128:
+        encode_char(buf, v)
+    elif -32768 <= v < 32768:
+        encode_short(buf, v)
+    elif -2147483648 <= v < 2147483648:
+        encode_int(buf, v)
+    else:
+        encode_long_long(buf, v)
+
+cdef encode(Buffer *buf, data):
     t = type(data)
-    if t == int:
-        if -128 <= data < 128:
-            encode_char(buf, pos, data)
-        elif -32768 <= data < 32768:
-            encode_short(buf, pos, data)
-        elif MIN_SIGNED_INT <= data < MAX_SIGNED_INT:
-            encode_int(buf, pos, data)
-        elif MIN_SIGNED_LONGLONG <= data < MAX_SIGNED_LONGLONG:
-            encode_long_long(buf, pos, data)
-        else:
-            s = str(data).encode("ascii")
-            if len(s) >= MAX_INT_LENGTH:
-                raise ValueError(f"Number is longer than {MAX_INT_LENGTH} characters")
-            encode_big_number(buf, pos, s)
+    if t is int:
+        encode_integer(buf, data)
 
-    elif t == float:
-        #if _float_bits == 32:
-        #    encode_float32(buf, pos, data)
-        encode_float64(buf, pos, data)
+    elif t is str:
+        encode_str(buf, data)
 
-    elif t == bytes:
-        encode_bytes(buf, pos, data)
+    elif t is bytes:
+        encode_bytes(buf, data)
 
-    elif t == memoryview:
-        encode_memoryview(buf, pos, data)
+    elif t is tuple or t is list:
+        encode_list(buf, data)
 
-    elif t == str:
-        encode_str(buf, pos, data.encode("utf8"))
+    elif data is None:
+        encode_none(buf)
 
-    elif t == type(None):
-        encode_none(buf, pos)
+    elif t is bool:
+        encode_bool(buf, data)
 
-    elif t == bool:
-        encode_bool(buf, pos, data)
+    elif t is float:
+        #if _float_bits == 32:
+        #    encode_float32(buf, data)
+        encode_float64(buf, data)
 
-    elif t == list or t == tuple:
-        encode_list(buf, pos, data)
+    elif t is memoryview:
+        encode_memoryview(buf, data)
 
-    elif t == dict:
-        encode_dict(buf, pos, data)
+    elif t is dict:
+        encode_dict(buf, data)
 
     else:
         raise ValueError(f"type {t} not handled")
 
 
-def dumps(data):
+#the size hinting pass,
+#which must match exactly what `encode` will write:
+
+cdef inline size_t digits_size(size_t v):
+    cdef size_t size = 1
+    while v >= 10:
+        v //= 10
+        size += 1
+    return size
+
+cdef inline size_t char_size(signed char x):
+    if 0 <= x < INT_POS_FIXED_COUNT or -INT_NEG_FIXED_COUNT <= x < 0:
+        return 1
+    return 2
+
+cdef size_t int_size(data) except 0:
+    cdef int overflow = 0
+    cdef long long v = PyLong_AsLongLongAndOverflow(data, &overflow)
+    if overflow:
+        #CHR_INT + digits + CHR_TERM:
+        return 2 + len(str(data))
+    if -128 <= v < 128:
+        return char_size(v)
+    if -32768 <= v < 32768:
+        return 1 + sizeof(short)
+    if -2147483648 <= v < 2147483648:
+        return 1 + sizeof(int)
+    return 1 + sizeof(long long)
+
+cdef size_t binary_size(Buffer *buf, size_t lx):
+    if use_oob(buf, lx):
+        buf.oob_count += 1
+        return 1 + char_size(buf.oob_count - 1)
+    return digits_size(lx) + 1 + lx
+
+cdef size_t str_size(str x) except 0:
+    cdef Py_ssize_t lx
+    if PyUnicode_AsUTF8AndSize(x, &lx) == NULL:
+        raise ValueError("failed to convert string to utf8")
+    if lx < STR_FIXED_COUNT:
+        return 1 + lx
+    return digits_size(lx) + 1 + lx
+
+cdef size_t encoded_size(Buffer *buf, data) except 0:
+    cdef size_t size
+    t = type(data)
+    if t is int:
+        return int_size(data)
+    if t is str:
+        return str_size(data)
+    if t is bytes:
+        return binary_size(buf, len(data))
+    if t is tuple or t is list:
+        size = 1 if len(data) < LIST_FIXED_COUNT else 2
+        for i in data:
+            size += encoded_size(buf, i)
+        return size
+    if data is None or t is bool:
+        return 1
+    if t is float:
+        return 1 + sizeof(double)
+    if t is memoryview:
+        return binary_size(buf, data.nbytes)
+    if t is dict:
+        size = 1 if len(data) < DICT_FIXED_COUNT else 2
+        for k, v in data.items():
+            size += encoded_size(buf, k)
+            size += encoded_size(buf, v)
+        return size
+    raise ValueError(f"type {t} not handled")
+
+
+def dumps(data, buffer_callback=None, size_t oob_threshold=OOB_THRESHOLD, unsigned int max_buffers=MAX_BUFFERS):
     """
     Encode the object data into a string.
 
+    The size of the encoded data is calculated first,
+    so the output is written directly into the bytes object returned.
+
+    When a `buffer_callback` is specified, `bytes` and `memoryview` values
+    larger than `oob_threshold` are passed to it instead of being copied,
+    and only a reference to them is encoded (like pickle protocol 5).
+    The same buffers must then be given to `loads`, in the same order.
+
     :param data: the object to encode
     :type data: object
     """
-    cdef char *buf = NULL
-    cdef unsigned int pos = 0
-    encode(&buf, &pos, data)
-    ret = buf[:pos]
-    free(buf)
+    if max_buffers > MAX_BUFFERS:
+        raise ValueError(f"too many out-of-band buffers: {max_buffers}, maximum is {MAX_BUFFERS}")
+    cdef Buffer buf
+    buf.data = NULL
+    buf.pos = 0
+    buf.size = 0
+    buf.buffer_callback = NULL if buffer_callback is None else <PyObject *> buffer_callback
+    buf.oob_threshold = oob_threshold
+    buf.max_buffers = max_buffers
+    buf.oob_count = 0
+    buf.size = encoded_size(&buf, data)
+    buf.oob_count = 0
+    ret = PyBytes_FromStringAndSize(NULL, buf.size)
+    buf.data = PyBytes_AS_STRING(ret)
+    encode(&buf, data)
+    if buf.pos != buf.size:
+        raise RuntimeError(f"expected {buf.size} bytes but encoded {buf.pos}")
     return ret
 
 
@@ -439,40 +558,47 @@ cdef decode_str(char *data, unsigned int *pos, long long data_length):
         return s
     return s.decode("utf8")
 
-cdef decode_fixed_list(char *data, unsigned int *pos, long long data_length):
+cdef decode_fixed_list(char *data, unsigned int *pos, long long data_length, tuple buffers):
     size = <unsigned char>data[pos[0]] - LIST_FIXED_START
     pos[0] += 1
-    return tuple(decode(data, pos, data_length) for _ in range(size))
+    return tuple(decode(data, pos, data_length, buffers) for _ in range(size))
 
-cdef decode_list(char *data, unsigned int *pos, long long data_length):
+cdef decode_list(char *data, unsigned int *pos, long long data_length, tuple buffers):
     l = []
     pos[0] += 1
     while data[pos[0]] != CHR_TERM:
-        l.append(decode(data, pos, data_length))
+        l.append(decode(data, pos, data_length, buffers))
     pos[0] += 1
     return tuple(l)
 
-cdef decode_fixed_dict(char *data, unsigned int *pos, long long data_length):
+cdef decode_fixed_dict(char *data, unsigned int *pos, long long data_length, tuple buffers):
     size = <unsigned char>data[pos[0]] - DICT_FIXED_START
     pos[0] += 1
-    return dict((decode(data, pos, data_length), decode(data, pos, data_length)) for _ in range(size))
+    return dict((decode(data, pos, data_length, buffers), decode(data, pos, data_length, buffers)) for _ in range(size))
 
-cdef decode_dict(char *data, unsigned int *pos, long long data_length):
+cdef decode_dict(char *data, unsigned int *pos, long long data_length, tuple buffers):
     d = {}
     pos[0] += 1
     check_pos(data, pos[0], data_length)
     while data[pos[0]] != CHR_TERM:
-        k = decode(data, pos, data_length)
-        d[k] = decode(data, pos, data_length)
+        k = decode(data, pos, data_length, buffers)
+        d[k] = decode(data, pos, data_length, buffers)
     pos[0] += 1
     return d
 
+cdef decode_buffer(char *data, unsigned int *pos, long long data_length, tuple buffers):
+    pos[0] += 1
+    index = decode(data, pos, data_length, ())
+    if type(index) != int or not 0 <= index < len(buffers):
+        raise ValueError(f"invalid out-of-band buffer reference {index!r}, {len(buffers)} buffers available")
+    return buffers[index]
+
 cdef inline check_pos(char *data, unsigned int pos, long long data_length):
     if pos >= data_length:
         raise IndexError(f"Tried to access data[{pos}] but data len is: {data_length}")
 
 
-cdef decode(char *data, unsigned int *pos, long long data_length):
+cdef decode(char *data, unsigned int *pos, long long data_length, tuple buffers):
     check_pos(data, pos[0], data_length)
     cdef unsigned char typecode = data[pos[0]]
     if typecode == CHR_INT1:
@@ -508,23 +634,26 @@ cdef decode(char *data, unsigned int *pos, long long data_length):
         return False
     elif LIST_FIXED_START <= typecode:
         #LIST_FIXED_START + LIST_FIXED_COUNT = 256
-        return decode_fixed_list(data, pos, data_length)
+        return decode_fixed_list(data, pos, data_length, buffers)
     elif typecode == CHR_LIST:
-        return decode_list(data, pos, data_length)
+        return decode_list(data, pos, data_length, buffers)
     elif DICT_FIXED_START <= typecode < DICT_FIXED_START + DICT_FIXED_COUNT:
-        return decode_fixed_dict(data, pos, data_length)
+        return decode_fixed_dict(data, pos, data_length, buffers)
     elif typecode == CHR_DICT:
-        return decode_dict(data, pos, data_length)
+        return decode_dict(data, pos, data_length, buffers)
+    elif typecode == CHR_BUFFER:
+        return decode_buffer(data, pos, data_length, buffers)
     else:
         raise ValueError(f"unsupported typecode {typecode}")
 
-def loads(data):
+def loads(data, buffers=()):
     """
     Decodes the string into an object
 
     :param data: the string to decode
     :type data: string
+    :param buffers: the out-of-band buffers, in the order `dumps` passed them to `buffer_callback`
 
     """
     cdef unsigned int pos = 0
-    return decode(data, &pos, len(data))
+    return decode(data, &pos, len(data), tuple(buffers))
@@ -194,8 +194,9 @@ def peek_connection(conn, timeout:int=PEEK_TIMEOUT_MS, size:int=PEEK_SIZE):
     peek_data = b""
     start = monotonic()
     elapsed = 0
-    set_socket_timeout(conn, PEEK_TIMEOUT_MS/1000)
     while elapsed<=timeout:
+        #never block for longer than the time we have left:
+        set_socket_timeout(conn, max(1, timeout-elapsed)/1000)
         try:
             peek_data = conn.peek(size)
             if peek_data:
@@ -208,6 +209,7 @@ def peek_connection(conn, timeout:int=PEEK_TIMEOUT_MS, size:int=PEEK_SIZE):
         sleep(timeout/4000.0)
         elapsed = int(1000*(monotonic()-start))
         log("peek: elapsed=%s, timeout=%s", elapsed, timeout)
+    set_socket_timeout(conn, PEEK_TIMEOUT_MS/1000)
     log("socket %s peek: got %i bytes", conn, len(peek_data))
     return peek_data
 
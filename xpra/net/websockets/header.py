@@ -34,6 +34,27 @@ def encode_hybi_header(opcode, payload_len, has_mask=False, fin=True) -> bytes:
     return struct.pack('>BBQ', b1, 127 | mask_bit, payload_len)
 
 
+def hybi_frame_length(buf:ByteString) -> int:
+    """ the total length of the frame at the start of the buffer, or 0 if the header is incomplete """
+    blen = len(buf)
+    if blen < 2:
+        return 0
+    b2 = buf[1]
+    hlen = 2 + 4*bool(b2 & 0x80)
+    payload_len = b2 & 0x7f
+    if payload_len == 126:
+        hlen += 2
+        if blen < 4:
+            return 0
+        payload_len = struct.unpack('>H', buf[2:4])[0]
+    elif payload_len == 127:
+        hlen += 8
+        if blen < 10:
+            return 0
+        payload_len = struct.unpack('>Q', buf[2:10])[0]
+    return hlen + payload_len
+
+
 def decode_hybi(buf:ByteString) -> Optional[Tuple[int,ByteString,int,int]]:
     """ Decode HyBi style WebSocket packets """
     blen = len(buf)
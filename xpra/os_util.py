@@ -9,7 +9,6 @@ import re
 import os
 import sys
 import stat
-import uuid
 import signal
 import socket
 import struct
@@ -254,9 +253,11 @@ def platform_name(sys_platform=sys.platform, release=None) -> str:
 
 
 def get_hex_uuid() -> str:
+    import uuid
     return uuid.uuid4().hex
 
 def get_int_uuid() -> int:
+    import uuid
     return uuid.uuid4().int
 
 def get_machine_id() -> str:
@@ -273,6 +274,7 @@ def get_machine_id() -> str:
                 v = bytestostr(b)
                 break
     elif WIN32:
+        import uuid
         v = str(uuid.getnode())
     return v.strip("\n\r")
 
@@ -422,6 +424,9 @@ def is_openSUSE() -> bool:
 
 
 def is_arm() -> bool:
+    if POSIX:
+        #much cheaper than importing the platform module:
+        return os.uname().machine.startswith("arm")
     import platform
     return platform.uname()[4].startswith("arm")
 
@@ -7,9 +7,7 @@
 
 import sys
 import shlex
-import inspect
 import os.path
-import tempfile
 from typing import Callable, List
 
 from xpra.platform import platform_import
@@ -122,12 +120,20 @@ def do_get_download_dir() -> str:
 def get_mmap_dir() -> str:
     return env_or_delegate("XPRA_MMAP_DIR", do_get_mmap_dir)
 def do_get_mmap_dir() -> str:
+    import tempfile  # pylint: disable=import-outside-toplevel
     return tempfile.gettempdir()
 
 
+def get_user_cache_dir() -> str:
+    return env_or_delegate("XPRA_USER_CACHE_DIR", do_get_user_cache_dir)
+def do_get_user_cache_dir() -> str:
+    return os.path.join(os.environ.get("XDG_CACHE_HOME", "~/.cache"), "xpra")
+
+
 def get_xpra_tmp_dir() -> str:
     return env_or_delegate("XPRA_TMP_DIR", do_get_xpra_tmp_dir)
 def do_get_xpra_tmp_dir() -> str:
+    import tempfile  # pylint: disable=import-outside-toplevel
     return tempfile.gettempdir()
 
 
@@ -180,6 +186,7 @@ def default_get_app_dir() -> str:
             adir = os.path.join(prefix, "share", "xpra")
             if valid_dir(adir):
                 return adir
+    import inspect  # pylint: disable=import-outside-toplevel
     adir = os.path.dirname(inspect.getfile(sys._getframe(1)))  #pylint: disable=protected-access
     def root_module(d):
         for psep in (os.path.sep, "/", "\\"):
@@ -317,6 +324,7 @@ platform_import(globals(), "paths", False,
                 "do_get_default_log_dirs",
                 "do_get_download_dir",
                 "do_get_mmap_dir",
+                "do_get_user_cache_dir",
                 "do_get_xpra_tmp_dir",
                 "do_get_script_bin_dirs",
                 "do_get_desktop_background_paths",
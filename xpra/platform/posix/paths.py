@@ -7,7 +7,6 @@
 import os.path
 import sys
 import site
-import tempfile
 
 # pylint: disable=import-outside-toplevel
 
@@ -64,6 +63,7 @@ def do_get_icon_dir():
     return os.path.join(get_app_dir(), "icons")
 
 def do_get_mmap_dir():
+    import tempfile
     return _get_xpra_runtime_dir() or tempfile.gettempdir()
 
 def do_get_xpra_tmp_dir():
@@ -159,6 +159,7 @@ def do_get_default_log_dirs():
     v = _get_xpra_runtime_dir()
     if v:
         log_dirs.append(v)
+    import tempfile
     log_dirs.append(tempfile.gettempdir())
     return log_dirs
 
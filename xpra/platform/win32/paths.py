@@ -72,6 +72,9 @@ def do_get_icon_dir() -> str:
     from xpra.platform.paths import get_resources_dir
     return os.path.join(get_resources_dir(), "icons")
 
+def do_get_user_cache_dir() -> str:
+    return os.path.join(_get_data_dir(False), "Cache")
+
 def do_get_default_log_dirs() -> List[str]:
     dd = _get_data_dir()
     temp = tempfile.gettempdir()
@@ -19,7 +19,11 @@ from xpra.os_util import (
     which,
     )
 
+warnings_count = 0
+
 def warn(msg:str) -> None:
+    global warnings_count
+    warnings_count += 1
     stderr_print(msg)
 
 def nodebug(*_args) -> None:
@@ -40,6 +44,10 @@ class InitExit(Exception):
 DEBUG_CONFIG_PROPERTIES : List[str] = os.environ.get("XPRA_DEBUG_CONFIG_PROPERTIES", "").split()
 
 DEFAULT_XPRA_CONF_FILENAME : str = os.environ.get("XPRA_CONF_FILENAME", 'xpra.conf')
+#cache the parsed and validated config files,
+#until one of the files or directories is modified:
+CONFIG_CACHE : bool = os.environ.get("XPRA_CONFIG_CACHE", "1")!="0"
+CONFIG_CACHE_FILENAME : str = "config.cache"
 DEFAULT_NET_WM_NAME : str = os.environ.get("XPRA_NET_WM_NAME", "Xpra")
 
 DEFAULT_POSTSCRIPT_PRINTER : str = ""
@@ -452,6 +460,65 @@ def get_xpra_defaults_dirs(username:Optional[str]=None, uid=None, gid=None):
         defaults_dirs.append(ad)
     return defaults_dirs
 
+def stat_key(path:str) -> Tuple[str,int,int]:
+    try:
+        st = os.stat(path)
+        return path, st.st_mtime_ns, st.st_size
+    except OSError:
+        return path, 0, 0
+
+def get_config_cache_key(dirs:List[str], username:str, uid:int, gid:int) -> Tuple:
+    """
+        The key changes whenever a config file is added, removed or modified:
+        we include the directories since adding or removing a file changes their mtime.
+    """
+    from xpra import __version__
+    stats : List[Tuple[str,int,int]] = []
+    for d in dirs:
+        stats.append(stat_key(d))
+        stats.append(stat_key(os.path.join(d, "conf.d")))
+        stats += [stat_key(f) for f in conf_files(d)]
+    return (__version__, DEFAULT_XPRA_CONF_FILENAME, username, uid, gid, tuple(stats))
+
+def get_config_cache_filename() -> str:
+    from xpra.platform.paths import get_user_cache_dir
+    return os.path.join(osexpand(get_user_cache_dir()), CONFIG_CACHE_FILENAME)
+
+def load_config_cache(key:Tuple) -> Optional[Dict[str,Any]]:
+    import marshal
+    filename = get_config_cache_filename()
+    try:
+        with open(filename, "rb") as f:
+            cached_key, validated = marshal.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, EOFError, TypeError) as e:
+        debug(f"failed to load config cache {filename!r}: {e}")
+        return None
+    if cached_key!=key or not isinstance(validated, dict):
+        debug(f"config cache {filename!r} is out of date")
+        return None
+    debug(f"using config cache {filename!r}")
+    return validated
+
+def save_config_cache(key:Tuple, validated:Dict[str,Any]) -> None:
+    import marshal
+    filename = get_config_cache_filename()
+    try:
+        data = marshal.dumps((key, validated))
+    except ValueError as e:
+        debug(f"cannot cache the config: {e}")
+        return
+    try:
+        os.makedirs(os.path.dirname(filename), mode=0o700, exist_ok=True)
+        #write to a temporary file first, so concurrent readers never see a partial file:
+        tmp = f"{filename}.{os.getpid()}"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, filename)
+    except OSError as e:
+        debug(f"failed to save config cache {filename!r}: {e}")
+
 def may_create_user_config(xpra_conf_filename:str=DEFAULT_XPRA_CONF_FILENAME):
     from xpra.platform.paths import get_user_conf_dirs
     #save a user config template:
@@ -1317,15 +1384,30 @@ def do_make_defaults_struct(extras_defaults:dict, extras_types:Dict, extras_vali
     #populate config with default values:
     if not username and uid:
         username = get_username_for_uid(uid)
-    defaults = read_xpra_defaults(username, uid, gid)
-    return dict_to_validated_config(defaults, extras_defaults, extras_types, extras_validation)
+    #the extra types and validation are not part of the cache key:
+    cacheable = CONFIG_CACHE and not extras_types and not extras_validation and not DEBUG_CONFIG_PROPERTIES
+    validated = None
+    if cacheable:
+        key = get_config_cache_key(get_xpra_defaults_dirs(username, uid, gid), username, uid, gid)
+        validated = load_config_cache(key)
+    if validated is None:
+        count = warnings_count
+        defaults = read_xpra_defaults(username, uid, gid)
+        validated = validate_config(defaults, extras_types=extras_types, extras_validation=extras_validation)
+        #don't cache invalid configs, so the warnings are shown every time:
+        if cacheable and warnings_count==count:
+            save_config_cache(key, validated)
+    return validated_to_config(validated, extras_defaults)
 
 def dict_to_validated_config(d:Dict, extras_defaults=None, extras_types=None, extras_validation=None) -> XpraConfig:
+    #parse config:
+    validated = validate_config(d, extras_types=extras_types, extras_validation=extras_validation)
+    return validated_to_config(validated, extras_defaults)
+
+def validated_to_config(validated:Dict[str,Any], extras_defaults=None) -> XpraConfig:
     options = get_defaults().copy()
     if extras_defaults:
         options.update(extras_defaults)
-    #parse config:
-    validated = validate_config(d, extras_types=extras_types, extras_validation=extras_validation)
     options.update(validated)
     for k,v in CLONES.items():
         if k in options:
@@ -0,0 +1,146 @@
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+# Measures the time spent importing each module,
+# enabled with the '--profile-imports' command line switch.
+# This module must not import anything from xpra,
+# so that it can be installed before any other xpra module is loaded.
+
+import os
+import sys
+from time import perf_counter
+from typing import Dict, List, Tuple, Optional, Any
+
+PROFILE_IMPORTS_LIMIT = int(os.environ.get("XPRA_PROFILE_IMPORTS_LIMIT", "40"))
+
+
+class TimedLoader:
+    """ wraps a module loader to measure the time spent creating and executing the module """
+
+    def __init__(self, profiler:"ImportProfiler", name:str, loader):
+        self.profiler = profiler
+        self.name = name
+        self.loader = loader
+
+    def __getattr__(self, attr:str) -> Any:
+        return getattr(self.loader, attr)
+
+    def create_module(self, spec):
+        create_module = getattr(self.loader, "create_module", None)
+        if not create_module:
+            return None
+        return self.profiler.timed(self.name, create_module, spec)
+
+    def exec_module(self, module):
+        #restore the real loader, some modules inspect it:
+        spec = getattr(module, "__spec__", None)
+        if spec and spec.loader is self:
+            spec.loader = self.loader
+        if getattr(module, "__loader__", None) is self:
+            module.__loader__ = self.loader
+        return self.profiler.timed(self.name, self.loader.exec_module, module)
+
+
+class ImportProfiler:
+    """
+        A meta path finder which delegates to the other finders,
+        and records the cumulative time spent loading each module:
+        including the modules it imports,
+        and the self time: excluding them.
+    """
+
+    def __init__(self):
+        #module name -> [cumulative, self]
+        self.times : Dict[str,List[float]] = {}
+        self.stack : List[List[float]] = []
+        self.finding = set()
+        self.start = perf_counter()
+
+    def find_spec(self, fullname:str, path=None, target=None):
+        if fullname in self.finding:
+            return None
+        self.finding.add(fullname)
+        try:
+            for finder in sys.meta_path:
+                if finder is self:
+                    continue
+                find_spec = getattr(finder, "find_spec", None)
+                if not find_spec:
+                    continue
+                spec = find_spec(fullname, path, target)
+                if spec is not None:
+                    if spec.loader and hasattr(spec.loader, "exec_module"):
+                        spec.loader = TimedLoader(self, fullname, spec.loader)
+                    return spec
+            return None
+        finally:
+            self.finding.discard(fullname)
+
+    def timed(self, name:str, fn, *args):
+        #the nested imports subtract their time from our 'children' counter:
+        frame = [0.0]
+        self.stack.append(frame)
+        start = perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            elapsed = perf_counter()-start
+            self.stack.pop()
+            if self.stack:
+                self.stack[-1][0] += elapsed
+            record = self.times.setdefault(name, [0.0, 0.0])
+            record[0] += elapsed
+            record[1] += elapsed-frame[0]
+
+    def get_results(self) -> List[Tuple[str,float,float]]:
+        """ returns (module name, cumulative, self) sorted by cumulative time """
+        return sorted(((name, v[0], v[1]) for name, v in self.times.items()), key=lambda x : -x[1])
+
+    def report(self, limit:int=PROFILE_IMPORTS_LIMIT, out=None) -> None:
+        out = out or sys.stderr
+        results = self.get_results()
+        total = sum(v[2] for v in results)
+        elapsed = perf_counter()-self.start
+        write = out.write
+        write(f"imported {len(results)} modules in {total*1000:.1f}ms, total run time {elapsed*1000:.1f}ms\n")
+        write(f"{'cumulative':>12} {'self':>10}  module\n")
+        for name, cumulative, self_time in results[:limit or None]:
+            write(f"{cumulative*1000:10.1f}ms {self_time*1000:8.1f}ms  {name}\n")
+        out.flush()
+
+
+profiler : Optional[ImportProfiler] = None
+
+def start_profiling() -> ImportProfiler:
+    global profiler
+    if not profiler:
+        profiler = ImportProfiler()
+        sys.meta_path.insert(0, profiler)
+        import atexit   # pylint: disable=import-outside-toplevel
+        atexit.register(stop_profiling)
+    return profiler
+
+def stop_profiling() -> None:
+    global profiler
+    p = profiler
+    if not p:
+        return
+    profiler = None
+    try:
+        sys.meta_path.remove(p)
+    except ValueError:
+        pass
+    try:
+        p.report()
+    except (OSError, ValueError):
+        #stderr is already closed
+        pass
+
+def check_argv(argv:List[str]) -> None:
+    """ enables the profiler and removes the switch if it is found """
+    if "--profile-imports" in argv:
+        while "--profile-imports" in argv:
+            argv.remove("--profile-imports")
+        start_profiling()
@@ -9,7 +9,6 @@
 import sys
 import os.path
 import stat
-import glob
 import socket
 import time
 import logging
@@ -86,6 +85,11 @@ def add_process(*args, **kwargs):
 
 
 def main(script_file:str, cmdline) -> int:
+    if "--profile-imports" in cmdline:
+        #the launcher script may already have done this,
+        #otherwise we only measure the imports from here on:
+        from xpra.scripts.import_profiler import check_argv
+        check_argv(cmdline)
     ml = envint("XPRA_MEM_USAGE_LOGGER")
     if ml>0:
         from xpra.util import start_mem_watcher
@@ -146,6 +150,9 @@ def main(script_file:str, cmdline) -> int:
         return 1
     finally:
         platform_clean()
+        import_profiler = sys.modules.get("xpra.scripts.import_profiler")
+        if import_profiler:
+            import_profiler.stop_profiling()
         def closestd(std):
             if std:
                 try:
@@ -2140,6 +2147,7 @@ def find_wayland_display_sockets(uid:int=getuid(), gid:int=getgid()) -> Dict[str
         addwaylandsock(wd, wd)
         addwaylandsock(wd, os.path.join(xrd, wd))
     #now try a file glob:
+    import glob
     for x in glob.glob(os.path.join(xrd, "wayland-*")):
         wd = os.path.basename(x)
         addwaylandsock(wd, x)
@@ -12,7 +12,6 @@ import re
 import shlex
 import os.path
 import optparse
-from urllib import parse
 from typing import Any, List, Dict, Tuple, Optional, Callable
 
 from xpra.version_util import full_version_str
@@ -334,6 +333,7 @@ def normalize_display_name(display_name:str) -> str:
         #so we end up with parsable URL, ie: "tcp://host:port"
         display_name = display_name[:pos]+"://"+display_name[pos+1:]
     #workaround missing [] around IPv6 addresses:
+    from urllib import parse
     try:
         netloc = parse.urlparse(display_name).netloc
         if netloc.find("@")>0:
@@ -383,6 +383,7 @@ def parse_display_name(error_cb, opts, display_name:str, cmdline=(), find_sessio
 
     #add our URL schemes once:
     #(should we remove them afterwards?)
+    from urllib import parse
     from xpra.net.common import SOCKET_TYPES
     def addschemes(array):
         for x in SOCKET_TYPES:
@@ -1831,7 +1832,7 @@ def do_validate_encryption(auth, tcp_auth,
     crypto_backend_init()
     env_key = os.environ.get("XPRA_ENCRYPTION_KEY")
     pass_key = os.environ.get("XPRA_PASSWORD")
-    from xpra.net.crypto import get_ciphers, get_modes, DEFAULT_MODE
+    from xpra.net.crypto import get_ciphers, get_modes, get_default_mode
     ciphers = get_ciphers()
     if not ciphers:
         raise InitException("cannot use encryption: no ciphers available"+
@@ -1840,7 +1841,7 @@ def do_validate_encryption(auth, tcp_auth,
         raise InitInfo(f"the following encryption ciphers are available: {csv(ciphers)}")
     enc, mode = ((encryption or tcp_encryption)+"-").split("-")[:2]
     if not mode:
-        mode = DEFAULT_MODE
+        mode = get_default_mode(enc)
     if enc:
         if enc not in ciphers:
             raise InitException(f"encryption {enc} is not supported, try: "+csv(ciphers))
@@ -0,0 +1,187 @@
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+# A bounded pool of worker threads for the connection handshake:
+# peeking, ssl wrapping and websocket upgrades.
+# Authentication uses a separate pool, so that slow authenticators
+# cannot stall the new connections.
+# New work is rejected immediately when the queue is full
+# or when a source address is connecting too often,
+# so that a reconnect storm cannot create hundreds of threads.
+# Work which takes longer than the timeout is cancelled
+# (ie: the connection is closed) when new work is submitted.
+
+from time import monotonic
+from queue import Queue
+from threading import Lock, get_ident
+from typing import Dict, Tuple, Any, Callable, List, Optional
+
+from xpra.make_thread import start_thread
+from xpra.util import envint
+from xpra.log import Logger
+
+log = Logger("network")
+
+ACCEPT_WORKERS = envint("XPRA_ACCEPT_WORKERS", 16)
+ACCEPT_QUEUE_SIZE = envint("XPRA_ACCEPT_QUEUE_SIZE", 256)
+#new connections per second allowed from the same address,
+#and the number of connections which can be made in a burst:
+ACCEPT_RATE = envint("XPRA_ACCEPT_RATE", 20)
+ACCEPT_BURST = envint("XPRA_ACCEPT_BURST", 50)
+#seconds before the handshake of a connection is cancelled:
+ACCEPT_TIMEOUT = envint("XPRA_ACCEPT_TIMEOUT", 20)
+AUTH_WORKERS = envint("XPRA_AUTH_WORKERS", 4)
+AUTH_QUEUE_SIZE = envint("XPRA_AUTH_QUEUE_SIZE", 64)
+#prune the rate limiting records when we have more than this many addresses:
+MAX_ADDRESSES = 4096
+
+#rejection reasons:
+OVERLOADED = "overloaded"
+RATE_LIMITED = "rate-limited"
+CLOSED = "closed"
+
+
+class AcceptPool:
+
+    def __init__(self, workers:int=ACCEPT_WORKERS, queue_size:int=ACCEPT_QUEUE_SIZE,
+                 rate:int=ACCEPT_RATE, burst:int=ACCEPT_BURST, timeout:float=ACCEPT_TIMEOUT,
+                 name:str="accept"):
+        self.max_workers = max(1, workers)
+        self.queue_size = queue_size
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.timeout = timeout
+        self.name = name
+        self.items : Queue = Queue()
+        self.lock = Lock()
+        self.workers : List = []
+        self.busy = 0
+        #queued or running:
+        self.pending = 0
+        self.closed = False
+        #address -> (tokens, last update time):
+        self.buckets : Dict[Any,Tuple[float,float]] = {}
+        #worker thread -> (deadline, cancel callback):
+        self.running : Dict[int,Tuple[float,Optional[Callable]]] = {}
+        self.max_depth = 0
+        self.accepted = 0
+        self.expired = 0
+        self.rejected : Dict[str,int] = {OVERLOADED : 0, RATE_LIMITED : 0, CLOSED : 0}
+
+    def __repr__(self):
+        return f"AcceptPool({self.name}: {len(self.workers)} workers, {self.items.qsize()} queued)"
+
+    def get_depth(self) -> int:
+        return self.items.qsize()
+
+    def get_info(self) -> Dict[str,Any]:
+        return {
+            "workers"       : len(self.workers),
+            "max-workers"   : self.max_workers,
+            "busy"          : self.busy,
+            "queue"         : {
+                "depth"     : self.items.qsize(),
+                "max-depth" : self.max_depth,
+                "size"      : self.queue_size,
+                },
+            "rate"          : self.rate,
+            "burst"         : self.burst,
+            "timeout"       : self.timeout,
+            "accepted"      : self.accepted,
+            "expired"       : self.expired,
+            "rejected"      : dict(self.rejected),
+            }
+
+    def check_rate(self, address, now:float) -> bool:
+        """ token bucket for each source address, must be called with the lock held """
+        if address is None or self.rate<=0:
+            return True
+        tokens, last = self.buckets.get(address, (self.burst, now))
+        tokens = min(self.burst, tokens+(now-last)*self.rate)
+        if tokens<1:
+            self.buckets[address] = (tokens, now)
+            return False
+        self.buckets[address] = (tokens-1, now)
+        if len(self.buckets)>MAX_ADDRESSES:
+            #forget the addresses whose bucket would be full again by now:
+            refill = self.burst/self.rate
+            self.buckets = {k : v for k, v in self.buckets.items() if now-v[1]<refill}
+        return True
+
+    def expire(self, now:float) -> None:
+        """
+            Cancels the work which has been running for too long,
+            so that it cannot hold a worker thread forever.
+        """
+        if self.timeout<=0:
+            return
+        cancel = []
+        with self.lock:
+            for ident, (deadline, cb) in tuple(self.running.items()):
+                if cb and now>=deadline:
+                    cancel.append(cb)
+                    #only cancel it once:
+                    self.running[ident] = (deadline, None)
+        for cb in cancel:
+            log("%s timeout, calling %s", self, cb)
+            self.expired += 1
+            try:
+                cb()
+            except Exception:
+                log("error cancelling %s", cb, exc_info=True)
+
+    def submit(self, address, fn:Callable, *args, cancel:Optional[Callable]=None) -> str:
+        """
+            Queues the function for execution by a worker thread.
+            The `cancel` callback is called if it runs for longer than the timeout.
+            Returns an empty string if it was accepted,
+            or the reason for rejecting it.
+        """
+        self.expire(monotonic())
+        with self.lock:
+            reason = ""
+            if self.closed:
+                reason = CLOSED
+            elif self.pending>=self.queue_size+self.max_workers:
+                reason = OVERLOADED
+            elif not self.check_rate(address, monotonic()):
+                reason = RATE_LIMITED
+            if reason:
+                self.rejected[reason] += 1
+                return reason
+            self.accepted += 1
+            self.pending += 1
+            self.items.put((fn, args, cancel))
+            self.max_depth = max(self.max_depth, self.items.qsize())
+            if len(self.workers)<min(self.pending, self.max_workers):
+                n = len(self.workers)
+                self.workers.append(start_thread(self.run, f"{self.name}-worker-{n}", daemon=True))
+        return ""
+
+    def run(self) -> None:
+        while True:
+            item = self.items.get()
+            if item is None:
+                break
+            fn, args, cancel = item
+            ident = get_ident()
+            with self.lock:
+                self.busy += 1
+                self.running[ident] = (monotonic()+self.timeout, cancel)
+            try:
+                fn(*args)
+            except Exception:
+                log.error("Error in accept worker calling %s", fn, exc_info=True)
+            finally:
+                with self.lock:
+                    self.busy -= 1
+                    self.pending -= 1
+                    self.running.pop(ident, None)
+
+    def stop(self) -> None:
+        with self.lock:
+            self.closed = True
+            for _ in self.workers:
+                self.items.put(None)
@@ -0,0 +1,212 @@
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+# Shares the cpu between the video encoders of all the windows,
+# and optionally with the other server processes running on the same host,
+# so that each encoder does not pick its own number of threads
+# and oversubscribe the cpu when there are many sessions.
+
+import os
+import mmap
+import struct
+from time import time, monotonic
+from threading import Lock
+from typing import Dict, Any, Optional
+
+from xpra.util import envint
+from xpra.os_util import POSIX
+from xpra.log import Logger
+
+log = Logger("video", "encoding")
+
+#the number of threads we can use, defaults to the number of cpus:
+CPU_BUDGET = envint("XPRA_CPU_BUDGET", 0)
+#share the budget with other processes using this file:
+CPU_BUDGET_FILE = os.environ.get("XPRA_CPU_BUDGET_FILE", "")
+#how many threads an encoder uses when there is no contention:
+ENCODER_THREADS = envint("XPRA_ENCODER_THREADS", min(4, max(1, (os.cpu_count() or 1)//2)))
+#the minimum speed we ask the encoders to use when they get no extra threads:
+MAX_SPEED_HINT = envint("XPRA_CPU_BUDGET_SPEED", 80)
+#processes which have not updated their slot for this long are not using any cpu:
+SLOT_TIMEOUT = 30
+#how often we check the load and refresh our slot, in seconds:
+REFRESH_DELAY = 10
+
+PRIORITY_BACKGROUND = 1
+PRIORITY_NORMAL = 2
+PRIORITY_FOCUSED = 4
+
+
+def get_priority(has_focus:bool, fullscreen:bool, other_is_fullscreen:bool=False, other_is_maximized:bool=False) -> int:
+    if has_focus or fullscreen:
+        return PRIORITY_FOCUSED
+    if other_is_fullscreen or other_is_maximized:
+        return PRIORITY_BACKGROUND
+    return PRIORITY_NORMAL
+
+
+class SharedBudget:
+    """
+        A small shared memory file with one slot for each process using it:
+        each process only writes its own slot, with its total encoder weight,
+        and gets a share of the host budget proportional to it.
+    """
+    SLOT = struct.Struct("=IIQ")            #pid, weight, timestamp
+    SLOTS = 256
+
+    def __init__(self, filename:str):
+        self.filename = filename
+        self.slot = -1
+        size = self.SLOT.size*self.SLOTS
+        fd = os.open(filename, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size<size:
+                os.ftruncate(fd, size)
+            self.fd = fd
+            self.area = mmap.mmap(fd, size)
+        except OSError:
+            os.close(fd)
+            raise
+
+    def read_slot(self, index:int):
+        return self.SLOT.unpack_from(self.area, index*self.SLOT.size)
+
+    def write_slot(self, index:int, pid:int, weight:int, timestamp:int) -> None:
+        self.SLOT.pack_into(self.area, index*self.SLOT.size, pid, weight, timestamp)
+
+    def update(self, weight:int) -> float:
+        """ publishes our weight and returns our share of the host budget """
+        import fcntl  # pylint: disable=import-outside-toplevel
+        pid = os.getpid()
+        now = int(time())
+        total = 0
+        fcntl.lockf(self.fd, fcntl.LOCK_EX)
+        try:
+            for i in range(self.SLOTS):
+                spid, sweight, timestamp = self.read_slot(i)
+                live = spid and now-timestamp<SLOT_TIMEOUT
+                if self.slot<0 and (not live or spid==pid):
+                    self.slot = i
+                if i==self.slot:
+                    continue
+                if live:
+                    total += sweight
+            if self.slot<0:
+                #all the slots are taken, we can't know our share:
+                return 1
+            self.write_slot(self.slot, pid, weight, now)
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN)
+        return weight/max(1, weight+total)
+
+    def close(self) -> None:
+        if self.slot>=0:
+            self.write_slot(self.slot, 0, 0, 0)
+            self.slot = -1
+        self.area.close()
+        os.close(self.fd)
+
+
+class CPUBudget:
+    """
+        Hands out encoder thread counts and speed hints,
+        the threads available are shared between the encoders using the window priority as weight,
+        and reduced when the system load is higher than the number of cpus.
+        The allocations are recalculated whenever an encoder comes or goes, or its priority changes,
+        the window sources re-create their encoder when their allocation changes a lot.
+    """
+
+    def __init__(self, threads:int=0, filename:str=""):
+        self.lock = Lock()
+        self.cpu_count = os.cpu_count() or 1
+        self.threads = threads or self.cpu_count
+        self.shared : Optional[SharedBudget] = None
+        if filename and POSIX:
+            try:
+                self.shared = SharedBudget(os.path.expanduser(filename))
+            except OSError as e:
+                log.warn(f"Warning: unable to use the cpu budget file {filename!r}")
+                log.warn(f" {e}")
+        self.priorities : Dict[Any,int] = {}
+        self.allocations : Dict[Any,int] = {}
+        self.available = self.threads
+        self.share = 1.0
+        self.last_rebalance = 0.0
+
+    def set_priority(self, key, priority:int) -> None:
+        with self.lock:
+            if self.priorities.get(key)==priority and monotonic()-self.last_rebalance<REFRESH_DELAY:
+                return
+            self.priorities[key] = priority
+            self.rebalance()
+
+    def release(self, key) -> None:
+        with self.lock:
+            if self.priorities.pop(key, None) is not None:
+                self.rebalance()
+
+    def get_load(self) -> float:
+        try:
+            return os.getloadavg()[0]
+        except (AttributeError, OSError):
+            return 0
+
+    def rebalance(self) -> None:
+        """ the lock must be held """
+        self.last_rebalance = monotonic()
+        total_weight = sum(self.priorities.values())
+        if self.shared:
+            self.share = self.shared.update(total_weight)
+        available = self.threads*self.share
+        #other processes are using the cpus:
+        load = self.get_load()
+        if load>self.cpu_count:
+            available *= self.cpu_count/load
+        self.available = max(1, int(available))
+        self.allocations = {
+            key : max(1, min(ENCODER_THREADS, int(self.available*weight/max(1, total_weight))))
+            for key, weight in self.priorities.items()
+            }
+        log("cpu budget: %i threads for %i encoders (share=%.2f, load=%.1f): %s",
+            self.available, len(self.priorities), self.share, load, tuple(self.allocations.values()))
+
+    def get_threads(self, key) -> int:
+        return self.allocations.get(key, ENCODER_THREADS)
+
+    def get_min_speed(self, key) -> int:
+        """ encoders which get fewer threads than they would like should use less cpu """
+        threads = self.get_threads(key)
+        return max(0, int(MAX_SPEED_HINT*(1-threads/ENCODER_THREADS)))
+
+    def get_info(self) -> Dict[str,Any]:
+        info = {
+            "threads"       : self.threads,
+            "available"     : self.available,
+            "encoders"      : len(self.priorities),
+            "encoder-threads" : ENCODER_THREADS,
+            }
+        if self.shared:
+            info["share"] = int(100*self.share)
+            info["file"] = self.shared.filename
+        return info
+
+    def cleanup(self) -> None:
+        with self.lock:
+            shared = self.shared
+            if shared:
+                self.shared = None
+                shared.close()
+
+
+cpu_budget : Optional[CPUBudget] = None
+
+def get_cpu_budget() -> CPUBudget:
+    global cpu_budget
+    if cpu_budget is None:
+        cpu_budget = CPUBudget(CPU_BUDGET, CPU_BUDGET_FILE)
+        if cpu_budget.shared:
+            import atexit  # pylint: disable=import-outside-toplevel
+            atexit.register(cpu_budget.cleanup)
+    return cpu_budget
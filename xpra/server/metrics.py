@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+# Pre-aggregated server metrics, exported in OpenMetrics text format.
+# Histograms and counters are updated as events happen,
+# so that exporting them does not require walking the statistics records.
+
+from bisect import bisect_left
+from threading import Lock
+from typing import Dict, Tuple, List, Iterable, Union
+
+from xpra.util import envbool
+
+METRICS = envbool("XPRA_METRICS", True)
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+#default histogram buckets, in seconds:
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+HELP : Dict[str,str] = {
+    "xpra_damage_latency_seconds"   : "Time from damage processing until the packet is queued for sending",
+    "xpra_encode_seconds"           : "Time spent compressing pixel data",
+    "xpra_encoded_bytes"            : "Compressed pixel data",
+    "xpra_encoded_pixels"           : "Pixels compressed",
+    "xpra_client_decode_seconds"    : "Time spent decoding pixel data, as reported by the client",
+    "xpra_client_latency_seconds"   : "Time from sending a pixel packet until the client acknowledges it",
+    "xpra_accept_queue_depth"       : "New connections and authentication requests waiting for a worker thread",
+    "xpra_accept_workers_busy"      : "Worker threads handling new connections or authentication",
+    "xpra_accept_rejected"          : "New connections rejected because the server was overloaded or rate limited",
+    }
+
+LabelsType = Tuple[Tuple[str,str],...]
+Number = Union[int,float]
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets:Tuple[Number,...]=LATENCY_BUCKETS):
+        self.buckets = buckets
+        #the last slot is for values above the last bucket ("+Inf"):
+        self.counts = [0]*(len(buckets)+1)
+        self.total = 0
+        self.count = 0
+
+    def observe(self, value:Number) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+lock = Lock()
+histograms : Dict[str,Dict[LabelsType,Histogram]] = {}
+counters : Dict[str,Dict[LabelsType,Number]] = {}
+
+
+def observe(name:str, value:Number, **labels) -> None:
+    if not METRICS:
+        return
+    key = tuple(sorted(labels.items()))
+    with lock:
+        family = histograms.setdefault(name, {})
+        h = family.get(key)
+        if h is None:
+            h = family[key] = Histogram()
+        h.observe(value)
+
+def increase(name:str, value:Number=1, **labels) -> None:
+    if not METRICS:
+        return
+    key = tuple(sorted(labels.items()))
+    with lock:
+        family = counters.setdefault(name, {})
+        family[key] = family.get(key, 0)+value
+
+def reset() -> None:
+    with lock:
+        histograms.clear()
+        counters.clear()
+
+
+def format_labels(labels:Iterable[Tuple[str,str]]) -> str:
+    if not labels:
+        return ""
+    def escape(v):
+        return str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+    return "{"+",".join(f'{k}="{escape(v)}"' for k, v in labels)+"}"
+
+def format_number(v:Number) -> str:
+    if isinstance(v, float):
+        return repr(v)
+    return str(int(v))
+
+def format_metrics(gauges:Dict[str,Dict[LabelsType,Number]]=None,
+                   extra_counters:Dict[str,Dict[LabelsType,Number]]=None) -> str:
+    """
+        Returns the metrics in OpenMetrics text format.
+        'gauges' and 'extra_counters' are sampled by the caller when the metrics are requested,
+        they use the same format as the module level 'counters': name -> labels -> value.
+    """
+    with lock:
+        hsnapshot = {name : {k : (h.buckets, tuple(h.counts), h.total, h.count) for k, h in family.items()}
+                     for name, family in histograms.items()}
+        csnapshot = {name : dict(family) for name, family in counters.items()}
+    for name, family in (extra_counters or {}).items():
+        csnapshot.setdefault(name, {}).update(family)
+    lines : List[str] = []
+    def header(name, mtype):
+        lines.append(f"# TYPE {name} {mtype}")
+        desc = HELP.get(name)
+        if desc:
+            lines.append(f"# HELP {name} {desc}")
+    for name, family in sorted((gauges or {}).items()):
+        header(name, "gauge")
+        for labels, value in family.items():
+            lines.append(f"{name}{format_labels(labels)} {format_number(value)}")
+    for name, family in sorted(csnapshot.items()):
+        header(name, "counter")
+        for labels, value in family.items():
+            lines.append(f"{name}_total{format_labels(labels)} {format_number(value)}")
+    for name, family in sorted(hsnapshot.items()):
+        header(name, "histogram")
+        for labels, (buckets, counts, total, count) in family.items():
+            cumulative = 0
+            for le, n in zip(tuple(repr(float(b)) for b in buckets)+("+Inf", ), counts):
+                cumulative += n
+                lines.append(f"{name}_bucket{format_labels(labels+(('le', le), ))} {cumulative}")
+            lines.append(f"{name}_count{format_labels(labels)} {count}")
+            lines.append(f"{name}_sum{format_labels(labels)} {format_number(total)}")
+    lines.append("# EOF")
+    return "\n".join(lines)+"\n"
@@ -86,6 +86,7 @@ class ClipboardServer(StubServerMixin):
             "preferred-targets"     : CLIPBOARD_PREFERRED_TARGETS,
             "set_enabled"           : True,     #v4 servers no longer use or show this flag
             "direction"             : self.clipboard_direction,
+            "contents-digest"       : True,
             }
         log("clipboard server caps=%s", ccaps)
         return {
@@ -175,6 +176,7 @@ class ClipboardServer(StubServerMixin):
             ch.set_want_targets_client(ss.clipboard_want_targets)
             ch.enable_selections(ss.clipboard_selections)
             ch.set_preferred_targets(ss.clipboard_preferred_targets)
+            ch.set_contents_digest(ss.clipboard_contents_digest)
             ch.send_tokens(ss.clipboard_selections)
         else:
             ch.enable_selections(None)
@@ -256,6 +258,7 @@ class ClipboardServer(StubServerMixin):
             self.add_packet_handler("set-clipboard-enabled", self._process_clipboard_enabled_status)
             for x in (
                 "token", "request", "contents", "contents-none",
+                "contents-digest", "contents-ack", "contents-chunk",
                 "pending-requests", "enable-selections", "loop-uuids",
                 ):
                 self.add_packet_handler("clipboard-%s" % x, self._process_clipboard_packet)
@@ -10,7 +10,6 @@ from time import monotonic
 from typing import List
 
 from xpra.util import parse_scaling_value, csv, from0to100, net_utf8, typedict, ConnectionMessage
-from xpra.os_util import load_binary_file
 from xpra.net.common import PacketType
 from xpra.simple_stats import std_unit
 from xpra.scripts.config import parse_bool, FALSE_OPTIONS, TRUE_OPTIONS
@@ -354,7 +353,12 @@ class ServerBaseControlCommands(StubServerMixin):
             checksize(stat.st_size)
         if not os.path.exists(actual_filename):
             raise ControlError(f"file {filename!r} does not exist")
-        data = load_binary_file(actual_filename)
+        from xpra.net.file_transfer import load_file_data  # pylint: disable=import-outside-toplevel
+        try:
+            data = load_file_data(actual_filename)
+        except OSError as e:
+            log("load_file_data(%s)", actual_filename, exc_info=True)
+            raise ControlError(f"failed to load {actual_filename!r}: {e}") from None
         if not data:
             raise ControlError(f"no data loaded from {actual_filename!r}")
         #verify size:
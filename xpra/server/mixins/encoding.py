@@ -93,7 +93,8 @@ class EncodingServer(StubServerMixin):
         if "jpeg" in self.allowed_encodings and not OSX:
             load_codec("enc_nvjpeg")
         #load video codecs:
-        getVideoHelper().set_modules(video_encoders=self.video_encoders, csc_modules=self.csc_modules)
+        getVideoHelper().set_modules(video_encoders=self.video_encoders, csc_modules=self.csc_modules,
+                                     encodings=self.allowed_encodings)
         getVideoHelper().init()
         self.init_encodings()
 
@@ -12,10 +12,10 @@ import hashlib
 from typing import Dict, Any
 
 from xpra.simple_stats import to_std_unit, std_unit
-from xpra.os_util import bytestostr, osexpand, load_binary_file, WIN32, POSIX
+from xpra.os_util import bytestostr, osexpand, WIN32, POSIX
 from xpra.util import u, engs, repr_ellipsized, NotificationID
 from xpra.net.common import PacketType
-from xpra.net.file_transfer import FileTransferAttributes
+from xpra.net.file_transfer import FileTransferAttributes, load_file_data
 from xpra.server.mixins.stub_server_mixin import StubServerMixin
 from xpra.log import Logger
 
@@ -307,7 +307,13 @@ class FilePrintServer(StubServerMixin):
                               "The file requested is too large to send:\n%s\nis %s" % (argf, std_unit(file_size)),
                                icon_name="file")
                 return
-        data = load_binary_file(filename)
+        try:
+            data = load_file_data(filename)
+        except OSError as e:
+            filelog("load_file_data(%s)", filename, exc_info=True)
+            filelog.warn(f"Warning: failed to load {filename!r}")
+            filelog.warn(f" {e}")
+            return
         ss.send_file(filename, "", data, len(data), openit=openit, options={"request-file" : (argf, openit)})
 
 
@@ -492,6 +492,10 @@ class ProxyInstance:
             #"xpra info" is a new connection, which talks to the proxy server...
             info = packet[1]
             info.update(self.get_proxy_info(proto))
+        elif packet_type=="info-delta" and len(packet)>=4 and packet[3]:
+            #the first (full) update from an info subscription:
+            info = packet[1]
+            info.update(self.get_proxy_info(proto))
         elif packet_type=="lost-window":
             wid = packet[1]
             #mark it as lost, so we can drop any current/pending frames
@@ -8,7 +8,7 @@
 
 import os
 from time import monotonic
-from typing import Type, Dict, List, Tuple, Callable, Any, Optional
+from typing import Type, Dict, List, Tuple, Set, Callable, Any, Optional
 
 from xpra.server.server_core import ServerCore
 from xpra.server.background_worker import add_work_item
@@ -16,7 +16,7 @@ from xpra.common import SSH_AGENT_DISPATCH, FULL_INFO
 from xpra.net.common import may_log_packet, ServerPacketHandlerType, PacketType
 from xpra.os_util import bytestostr, is_socket, WIN32
 from xpra.util import (
-    typedict, flatten_dict, updict, merge_dicts, envbool, csv,
+    typedict, flatten_dict, updict, merge_dicts, envbool, envint, csv,
     ConnectionMessage,
     )
 from xpra.net.bytestreams import set_socket_timeout
@@ -91,6 +91,8 @@ log("ServerBaseClass%s", SERVER_BASES)
 
 CLIENT_CAN_SHUTDOWN = envbool("XPRA_CLIENT_CAN_SHUTDOWN", True)
 MDNS_CLIENT_COUNT = envbool("XPRA_MDNS_CLIENT_COUNT", True)
+MIN_INFO_INTERVAL = envint("XPRA_MIN_INFO_INTERVAL", 500)
+INFO_UPDATE_TIMEOUT = envint("XPRA_INFO_UPDATE_TIMEOUT", 10)
 
 
 """
@@ -117,6 +119,8 @@ class ServerBase(ServerBaseClass):
         self.ui_driver = None
         self.sharing : Optional[bool] = None
         self.lock : Optional[bool] = None
+        #the top-level info categories returned by each info function:
+        self._info_providers : Dict[Callable,Set[str]] = {}
 
         self.start_after_connect_done = True
         self.bandwidth_detection = False
@@ -601,17 +605,50 @@ class ServerBase(ServerBaseClass):
         ss = self.get_server_source(proto)
         if not ss:
             return
-        categories = None
+        categories = ()
         #if len(packet>=2):
         #    uuid = packet[1]
         if len(packet)>=4:
             categories = tuple(bytestostr(x) for x in packet[3])
         def info_callback(_proto, info):
             assert proto==_proto
-            if categories:
-                info = dict((k,v) for k,v in info.items() if k in categories)
             ss.send_info_response(info)
-        self.get_all_info(info_callback, proto, None)
+        self.get_all_info(info_callback, proto, None, categories=categories)
+
+    def _process_info_subscribe(self, proto, packet:PacketType) -> None:
+        log("process_info_subscribe(%s, %s)", proto, packet)
+        ss = self.get_server_source(proto)
+        if not ss:
+            return
+        ss.cancel_info_timer()
+        ss.info_categories = tuple(bytestostr(x) for x in packet[1])
+        interval = int(packet[2])
+        ss.info_interval = max(MIN_INFO_INTERVAL, interval) if interval>0 else 0
+        ss.info_last = {}
+        ss.info_pending = 0
+        if ss.info_interval:
+            self.send_info_update(ss)
+            ss.info_timer = self.timeout_add(ss.info_interval, self.send_info_update, ss)
+
+    def send_info_update(self, ss) -> bool:
+        if not ss.info_interval or ss.is_closed():
+            return False
+        now = monotonic()
+        if ss.info_pending:
+            if now-ss.info_pending<INFO_UPDATE_TIMEOUT:
+                #the previous update has not been sent yet
+                return True
+            log("info update requested at %s timed out", ss.info_pending)
+        ss.info_pending = now
+        categories = ss.info_categories
+        def info_callback(_proto, info):
+            if ss.info_pending!=now:
+                #this update has timed out, or the subscription has changed
+                return
+            ss.send_info_delta(info)
+        #only collect the categories this client has subscribed to:
+        self.get_all_info(info_callback, ss.protocol, None, categories=categories)
+        return True
 
     def send_hello_info(self, proto) -> None:
         self.wait_for_threaded_init()
@@ -634,11 +671,34 @@ class ServerBase(ServerBaseClass):
             info = {}
         for c in SERVER_BASES:
             try:
-                merge_dicts(info, c.get_ui_info(self, proto, client_uuids, *args))
+                merge_dicts(info, self.get_provider_info(c.get_ui_info, proto, client_uuids, *args))
             except Exception:
                 log.error("Error gathering UI info on %s", c, exc_info=True)
         return info
 
+    def get_provider_info(self, info_fn:Callable, *args) -> Dict[str,Any]:
+        """
+            Calls the info function of a server base class,
+            unless it only provides info categories which have not been requested.
+            The first call collects all of its categories, so we know which ones it provides.
+        """
+        known = self._info_providers.get(info_fn)
+        if known and not self.info_wanted(*known):
+            return {}
+        if known is None:
+            request = self._info_request
+            categories = getattr(request, "categories", ())
+            request.categories = ()
+            try:
+                info = info_fn(self, *args)
+            finally:
+                request.categories = categories
+            known = self._info_providers[info_fn] = set()
+        else:
+            info = info_fn(self, *args)
+        known.update(info.keys())
+        return info
+
 
     def get_info(self, proto=None, client_uuids=None) -> Dict[str,Any]:
         log("ServerBase.get_info%s", (proto, client_uuids))
@@ -679,19 +739,21 @@ class ServerBase(ServerBaseClass):
         for c in SERVER_BASES:
             try:
                 cstart = monotonic()
-                merge_dicts(info, c.get_info(self, proto))
+                merge_dicts(info, self.get_provider_info(c.get_info, proto))
                 cend = monotonic()
                 log("%s.get_info(%s) took %ims", c, proto, int(1000*(cend-cstart)))
             except Exception:
                 log.error("Error collecting information from %s", c, exc_info=True)
 
-        up("features",  self.get_features_info())
-        up("network", {
-            "sharing"                      : self.sharing is not False,
-            "sharing-toggle"               : self.sharing is None,
-            "lock"                         : self.lock is not False,
-            "lock-toggle"                  : self.lock is None,
-            })
+        if self.info_wanted("features"):
+            up("features",  self.get_features_info())
+        if self.info_wanted("network"):
+            up("network", {
+                "sharing"                      : self.sharing is not False,
+                "sharing-toggle"               : self.sharing is None,
+                "lock"                         : self.lock is not False,
+                "lock-toggle"                  : self.lock is None,
+                })
 
         # other clients:
         info["clients"] = {
@@ -700,7 +762,7 @@ class ServerBase(ServerBaseClass):
                                        if ((p is not proto) and (p not in self._server_sources))),
            }
         #find the server source to report on:
-        n = len(server_sources or [])
+        n = len(server_sources or []) if self.info_wanted("client") else 0
         if n==1:
             ss = server_sources[0]
             up("client", ss.get_info())
@@ -794,6 +856,31 @@ class ServerBase(ServerBaseClass):
         info["clients"] = len(self._server_sources)
         return info
 
+    def get_metrics(self) -> Tuple[Dict[str,Dict],Dict[str,Dict]]:
+        gauges, counters = ServerCore.get_metrics(self)
+        gauges["xpra_clients"] = {() : len(self._server_sources)}
+        def add(d, name, labels, value):
+            d.setdefault(name, {})[labels] = value
+        for ss in tuple(self._server_sources.values()):
+            client = (("client", str(ss.counter)), )
+            add(gauges, "xpra_packet_queue_size", client, len(ss.packet_queue))
+            add(gauges, "xpra_ordinary_packets_size", client, len(ss.ordinary_packets))
+            add(gauges, "xpra_bulk_packets_size", client, len(ss.bulk_packets))
+            add(gauges, "xpra_encode_queue_size", client, ss.encode_queue_size())
+            add(gauges, "xpra_bandwidth_limit_bits", client, ss.soft_bandwidth_limit or 0)
+            add(gauges, "xpra_bulk_rate_limit_bytes", client, ss.get_bulk_rate_limit())
+            add(counters, "xpra_bulk_bytes", client, ss.bulk_bytes)
+            add(counters, "xpra_interactive_bytes", client, ss.interactive_bytes)
+            conn = getattr(ss.protocol, "_conn", None)
+            if conn:
+                add(counters, "xpra_sent_bytes", client, conn.output_bytecount)
+                add(counters, "xpra_received_bytes", client, conn.input_bytecount)
+            for wid, ws in tuple(getattr(ss, "window_sources", {}).items()):
+                window = client+(("wid", str(wid)), )
+                add(gauges, "xpra_batch_delay_seconds", window, ws.batch_config.delay/1000)
+                add(gauges, "xpra_damage_packets_pending", window, len(ws.statistics.damage_ack_pending))
+        return gauges, counters
+
     def get_http_scripts(self) -> Dict[str,Any]:
         scripts = {}
         for c in SERVER_BASES:
@@ -954,6 +1041,7 @@ class ServerBase(ServerBaseClass):
             "shutdown-server"   : self._process_shutdown_server,
             "exit-server"       : self._process_exit_server,
             "info-request"      : self._process_info_request,
+            "info-subscribe"    : self._process_info_subscribe,
             })
 
     def init_aliases(self) -> None:
@@ -66,13 +66,14 @@ from xpra.server.background_worker import stop_worker, get_worker, add_work_item
 from xpra.server.menu_provider import get_menu_provider
 from xpra.server.auth.auth_helper import get_auth_module
 from xpra.make_thread import start_thread
+from xpra.server.accept_pool import AcceptPool, AUTH_WORKERS, AUTH_QUEUE_SIZE
 from xpra.common import LOG_HELLO, FULL_INFO
 from xpra.util import (
     first_time, noerr, net_utf8,
     csv, merge_dicts, typedict, notypedict, flatten_dict,
     ellipsizer, repr_ellipsized,
     dump_all_frames, envint, envbool, envfloat,
-    ConnectionMessage, nicestr,
+    ConnectionMessage, nicestr, engs,
     )
 from xpra.log import Logger, get_info as get_log_info
 
@@ -193,6 +194,14 @@ class ServerCore:
         self.socket_verify_timer : WeakKeyDictionary[SocketProtocol,int] = WeakKeyDictionary()
         self.socket_rfb_upgrade_timer : WeakKeyDictionary[SocketProtocol,int] = WeakKeyDictionary()
         self._max_connections : int = MAX_CONCURRENT_CONNECTIONS
+        #handshake work: peeking, ssl wrapping, websocket upgrades and authentication:
+        self._accept_pool = AcceptPool()
+        #authentication can be slow, so it must not use the handshake workers:
+        self._auth_pool = AcceptPool(AUTH_WORKERS, AUTH_QUEUE_SIZE, rate=0, name="auth")
+        self._accept_rejected : int = 0
+        self._accept_rejected_logged : float = 0
+        #the info categories wanted by the info collection running in each thread:
+        self._info_request = threading.local()
         self._socket_timeout : float = SERVER_SOCKET_TIMEOUT
         self._ws_timeout : int = 5
         self._socket_dir : str = ""
@@ -469,6 +478,8 @@ class ServerCore:
         raise NotImplementedError()
 
     def cleanup(self) -> None:
+        self._accept_pool.stop()
+        self._auth_pool.stop()
         self.stop_splash_process()
         self.cancel_touch_timer()
         self.mdns_cleanup()
@@ -745,6 +756,7 @@ class ServerCore:
                 "/Info"             : self.http_info_request,
                 "/Sessions"         : self.http_sessions_request,
                 "/Displays"         : self.http_displays_request,
+                "/metrics"          : self.http_metrics_request,
                 }
             if self.menu_provider:
                 #we have menu data we can expose:
@@ -1117,11 +1129,30 @@ class ServerCore:
             netlog.error(" ignoring new one: %s", conn.endpoint)
             conn.close()
             return True
-        #from here on, we run in a thread, so we can poll (peek does)
-        start_thread(self.handle_new_connection, f"new-{socktype}-connection", True,
-                     args=(conn, socket_info, socket_options))
+        #from here on, we run in a worker thread, so we can poll (peek does)
+        address = None
+        if socktype!="socket" and isinstance(conn.remote, (tuple, list)) and conn.remote:
+            address = conn.remote[0]
+        #clients which send nothing (or very slowly) are disconnected after the pool's timeout:
+        reason = self._accept_pool.submit(address, self.handle_new_connection, conn, socket_info, socket_options,
+                                          cancel=conn.close)
+        if reason:
+            self.log_accept_rejected(reason, conn.endpoint)
+            conn.close()
         return True
 
+    def log_accept_rejected(self, reason:str, endpoint) -> None:
+        #avoid flooding the log during a reconnect storm:
+        self._accept_rejected += 1
+        netlog("rejected connection from %s: %s", endpoint, reason)
+        now = monotonic()
+        if now-self._accept_rejected_logged>=1:
+            netlog.warn("Warning: %i new connection%s rejected, %s",
+                        self._accept_rejected, engs(self._accept_rejected), reason)
+            netlog.warn(" latest from %s", endpoint)
+            self._accept_rejected = 0
+            self._accept_rejected_logged = now
+
     def new_conn_err(self, conn, sock, socktype:str, socket_info, packet_type:str, msg=None) -> None:
         # not an xpra client
         netlog.error("Error: %s connection failed:", socktype)
@@ -1434,6 +1465,7 @@ class ServerCore:
             """ adds xpra protocol tweaks after creating the instance """
             protocol = protocol_class(self, conn, self.process_packet)
             protocol.large_packets.append("info-response")
+            protocol.large_packets.append("info-delta")
             protocol.set_receive_aliases(self._aliases)
             return protocol
         return self.do_make_protocol(socktype, conn, socket_options, xpra_protocol_class, pre_read)
@@ -1462,7 +1494,7 @@ class ServerCore:
             from xpra.net.crypto import crypto_backend_init
             crypto_backend_init()
             from xpra.net.crypto import (
-                ENCRYPT_FIRST_PACKET,
+                can_encrypt_first_packet,
                 DEFAULT_IV,
                 DEFAULT_SALT,
                 DEFAULT_KEY_HASH,
@@ -1470,7 +1502,7 @@ class ServerCore:
                 DEFAULT_ITERATIONS,
                 INITIAL_PADDING,
                 )
-            if ENCRYPT_FIRST_PACKET:
+            if can_encrypt_first_packet(protocol.encryption):
                 authlog(f"encryption={protocol.encryption}, keyfile={protocol.keyfile!r}")
                 password = protocol.keydata or self.get_encryption_key((), protocol.keyfile)
                 protocol.set_cipher_in(protocol.encryption,
@@ -1751,6 +1783,30 @@ class ServerCore:
     def http_status_request(self, _path:str):
         return self.http_response("ready")
 
+    def http_metrics_request(self, _path:str):
+        from xpra.server import metrics  #pylint: disable=import-outside-toplevel
+        gauges, counters = self.get_metrics()
+        return self.http_response(metrics.format_metrics(gauges, counters), metrics.CONTENT_TYPE)
+
+    def get_metrics(self) -> Tuple[Dict[str,Dict],Dict[str,Dict]]:
+        """
+            Returns the gauges and counters which are sampled when the metrics are requested,
+            the histograms are aggregated as events happen. (see 'xpra.server.metrics')
+            This must remain cheap: do not call get_info() from here.
+        """
+        pools = (self._accept_pool, self._auth_pool)
+        gauges = {
+            "xpra_uptime_seconds"       : {() : int(time()-self.start_time)},
+            "xpra_accept_queue_depth"   : {(("pool", pool.name), ) : pool.get_depth() for pool in pools},
+            "xpra_accept_workers_busy"  : {(("pool", pool.name), ) : pool.busy for pool in pools},
+            }
+        counters = {
+            "xpra_accept_rejected"      : {
+                (("pool", pool.name), ("reason", k)) : v for pool in pools for k, v in pool.rejected.items()
+                },
+            }
+        return gauges, counters
+
     def http_response(self, content, content_type:str="text/plain"):
         if not content:
             return 404, {}, None
@@ -1923,7 +1979,10 @@ class ServerCore:
         #this will call auth_verified if successful
         #it may also just send challenge packets,
         #in which case we'll end up here parsing the hello again
-        start_thread(self.verify_auth, "authenticate connection", daemon=True, args=(proto, packet, c))
+        reason = self._auth_pool.submit(None, self.verify_auth, proto, packet, c)
+        if reason:
+            self.log_accept_rejected(reason, proto._conn.endpoint)
+            self.disconnect_client(proto, ConnectionMessage.SERVER_ERROR, f"server is {reason}")
 
     def make_authenticators(self, socktype:str, remote, conn) -> Tuple[Any]:
         authlog("make_authenticators%s socket options=%s", (socktype, remote, conn), conn.options)
@@ -2372,26 +2431,48 @@ class ServerCore:
     def do_send_info(self, proto:SocketProtocol, info:Dict[str,Any]) -> None:
         proto.send_now(("hello", notypedict(info)))
 
-    def get_all_info(self, callback:Callable, proto:SocketProtocol=None, *args):
+    def get_all_info(self, callback:Callable, proto:SocketProtocol=None, *args, categories:Tuple[str,...]=()):
+        """
+            Collects the info and passes it to the callback,
+            only the top-level info categories given are collected (all of them if empty).
+        """
         start = monotonic()
-        ui_info : Dict[str,Any] = self.get_ui_info(proto, *args)
+        self._info_request.categories = categories
+        try:
+            ui_info : Dict[str,Any] = self.get_ui_info(proto, *args)
+        finally:
+            self._info_request.categories = ()
         end = monotonic()
         log("get_all_info: ui info collected in %ims", (end-start)*1000)
-        start_thread(self._get_info_in_thread, "Info", daemon=True, args=(callback, ui_info, proto, args))
+        start_thread(self._get_info_in_thread, "Info", daemon=True, args=(callback, ui_info, proto, args, categories))
 
-    def _get_info_in_thread(self, callback:Callable, ui_info:Dict[str,Any], proto:SocketProtocol, args):
-        log("get_info_in_thread%s", (callback, {}, proto, args))
+    def _get_info_in_thread(self, callback:Callable, ui_info:Dict[str,Any], proto:SocketProtocol, args,
+                            categories:Tuple[str,...]=()):
+        log("get_info_in_thread%s", (callback, {}, proto, args, categories))
         start = monotonic()
         #this runs in a non-UI thread
+        self._info_request.categories = categories
         try:
             info = self.get_info(proto, *args)
             merge_dicts(ui_info, info)
         except Exception:
             log.error("Error during info collection using %s", self.get_info, exc_info=True)
+        finally:
+            self._info_request.categories = ()
+        if categories:
+            ui_info = dict((k,v) for k,v in ui_info.items() if k in categories)
         end = monotonic()
         log("get_all_info: non ui info collected in %ims", (end-start)*1000)
         callback(proto, ui_info)
 
+    def info_wanted(self, *categories:str) -> bool:
+        """
+            Can be used to skip collecting the info categories
+            which have not been requested by the current info collection.
+        """
+        wanted = getattr(self._info_request, "categories", ())
+        return not wanted or any(x in wanted for x in categories)
+
     def get_ui_info(self, _proto:SocketProtocol, *_args) -> Dict[str,Any]:
         #this function is for info which MUST be collected from the UI thread
         return {}
@@ -2458,7 +2539,9 @@ class ServerCore:
 
         authenticated = proto and proto.authenticators
         full = FULL_INFO>0 or authenticated
-        if full:
+        if not self.info_wanted("server"):
+            si = {}
+        elif full:
             si = self.get_server_info()
             si.update(self.get_server_load_info())
             si.update(self.get_server_exec_info())
@@ -2466,32 +2549,40 @@ class ServerCore:
                 si["sysconfig"] = get_sysconfig_info()
         else:
             si = self.get_minimal_server_info()
-        si.update(get_host_info(FULL_INFO or authenticated))
-        up("server", si)
+        if si:
+            si.update(get_host_info(FULL_INFO or authenticated))
+            up("server", si)
         if self.session_name:
             info["session"] = {"name" : self.session_name}
 
         if full:
-            ni = get_net_info()
-            ni.update({
-                       "sockets"        : self.get_socket_info(),
-                       "encryption"     : self.encryption or "",
-                       "tcp-encryption" : self.tcp_encryption or "",
-                       "bandwidth-limit": self.bandwidth_limit or 0,
-                       "packet-handlers" : self.get_packet_handlers_info(),
-                       "www"    : {
-                           ""                   : self._html,
-                           "dir"                : self._www_dir or "",
-                           "http-headers-dirs"   : self._http_headers_dirs or "",
-                           },
-                       "mdns"           : self.mdns,
-                       })
-            up("network", ni)
-            up("threads",   self.get_thread_info(proto))
-            up("logging", get_log_info())
-            from xpra.platform.info import get_sys_info
-            up("sys", get_sys_info())
-            up("env", get_info_env())
+            if self.info_wanted("network"):
+                ni = get_net_info()
+                ni.update({
+                           "sockets"        : self.get_socket_info(),
+                           "encryption"     : self.encryption or "",
+                           "tcp-encryption" : self.tcp_encryption or "",
+                           "bandwidth-limit": self.bandwidth_limit or 0,
+                           "packet-handlers" : self.get_packet_handlers_info(),
+                           "www"    : {
+                               ""                   : self._html,
+                               "dir"                : self._www_dir or "",
+                               "http-headers-dirs"   : self._http_headers_dirs or "",
+                               },
+                           "mdns"           : self.mdns,
+                           "accept"         : self._accept_pool.get_info(),
+                           "auth"           : self._auth_pool.get_info(),
+                           })
+                up("network", ni)
+            if self.info_wanted("threads"):
+                up("threads",   self.get_thread_info(proto))
+            if self.info_wanted("logging"):
+                up("logging", get_log_info())
+            if self.info_wanted("sys"):
+                from xpra.platform.info import get_sys_info
+                up("sys", get_sys_info())
+            if self.info_wanted("env"):
+                up("env", get_info_env())
             if self.child_reaper:
                 info.update(self.child_reaper.get_info())
             if self.dbus_pid:
@@ -10,15 +10,15 @@ import sys
 from typing import Dict, Any, Optional, Tuple, Callable, Union, List
 from typing_extensions import TypeAlias
 from time import sleep, monotonic
-from threading import Event
+from threading import Event, Lock
 from collections import deque
 from queue import Queue
 
 from xpra.make_thread import start_thread
 from xpra.common import FULL_INFO
-from xpra.util import notypedict, envbool, envint, typedict, AtomicInteger
+from xpra.util import notypedict, envbool, envint, typedict, AtomicInteger, dict_delta
 from xpra.net.common import PacketType
-from xpra.net.compression import compressed_wrapper
+from xpra.net.compression import compressed_wrapper, Compressed
 from xpra.server.source.source_stats import GlobalPerformanceStatistics
 from xpra.server.source.stub_source_mixin import StubSourceMixin
 from xpra.log import Logger
@@ -33,9 +33,25 @@ MIN_BANDWIDTH = envint("XPRA_MIN_BANDWIDTH", 5*1024*1024)
 AUTO_BANDWIDTH_PCT = envint("XPRA_AUTO_BANDWIDTH_PCT", 80)
 assert 1<AUTO_BANDWIDTH_PCT<=100, "invalid value for XPRA_AUTO_BANDWIDTH_PCT: %i" % AUTO_BANDWIDTH_PCT
 YIELD = envbool("XPRA_YIELD", False)
+BULK_LANE = envbool("XPRA_BULK_LANE", True)
+#the share of the bandwidth limit which bulk transfers are always allowed to use:
+BULK_MIN_PCT = envint("XPRA_BULK_MIN_PCT", 10)
+#bulk packets waiting longer than this are sent even if other packets are queued:
+BULK_MAX_WAIT = envint("XPRA_BULK_MAX_WAIT", 250)
+#bulk transfers are restricted to the minimum share after a congestion event:
+BULK_CONGESTION_DELAY = envint("XPRA_BULK_CONGESTION_DELAY", 1000)
+assert 0<BULK_MIN_PCT<=100, "invalid value for XPRA_BULK_MIN_PCT: %i" % BULK_MIN_PCT
+#newer packets can replace the ones with the same key which are still waiting to be sent:
+SUPERSEDE = envbool("XPRA_SUPERSEDE", True)
+BULK_PACKET_TYPES = ("send-file", "send-file-chunk", "clipboard-contents", "clipboard-contents-chunk")
 
 counter = AtomicInteger()
 
+
+def packet_size(packet) -> int:
+    """ estimates the size of a packet from its binary and string items """
+    return sum(len(item) for item in packet if isinstance(item, (bytes, bytearray, memoryview, str, Compressed)))
+
 ENCODE_WORK_ITEM : TypeAlias = Optional[Tuple[bool, Callable, Tuple[Any,...]]]
 
 
@@ -50,7 +66,10 @@ class ClientConnection(StubSourceMixin):
     or on behalf of the window sources for pixel data.
 
     Strategy: if we have 'ordinary_packets' to send, send those.
-    When we don't, then send packets from the 'packet_queue'. (compressed pixels or clipboard data)
+    When we don't, then send packets from the 'packet_queue'. (compressed pixels)
+    Bulk transfers (files and clipboard data) are queued in 'bulk_packets',
+    they are only sent when the other queues are empty (or they have been waiting for too long),
+    and at a rate limited to the spare bandwidth. (see 'update_bulk_limit')
     See 'next_packet'.
 
     The UI thread calls damage(), which goes into WindowSource and eventually (batching may be involved)
@@ -72,7 +91,7 @@ class ClientConnection(StubSourceMixin):
 
         #holds actual packets ready for sending (already encoded)
         #these packets are picked off by the "protocol" via 'next_packet()'
-        #format: packet, wid, pixels, start_send_cb, end_send_cb
+        #format: packet, wid, pixels, start_send_cb, end_send_cb, fail_cb, wait_for_more, supersede
         #(only packet is required - the rest can be 0/None for clipboard packets)
         self.packet_queue = deque()
         # the encode work queue is used by mixins that need to encode data before sending it,
@@ -82,7 +101,25 @@ class ClientConnection(StubSourceMixin):
         #the functions should add the packets they generate to the 'packet_queue'
         self.encode_work_queue : Queue[Union[None,Tuple[bool,Callable,Tuple[Any,...]]]] = Queue()
         self.encode_thread = None
-        self.ordinary_packets : List[Tuple[PacketType,bool,Callable,Callable]] = []
+        #format: packet, synchronous, fail_cb, will_have_more, supersede key
+        self.ordinary_packets : List[Tuple[PacketType,bool,Callable,bool,Any]] = []
+        #guards the packet queues against concurrent modifications when replacing packets:
+        self.queue_lock = Lock()
+        self.superseded_packets = 0
+        #low priority packets: file transfers and clipboard data,
+        #format: packet, start_send_cb, end_send_cb, fail_cb, synchronous, will_have_more, queued time
+        self.bulk_packets = deque()
+        self.bulk_timer = 0
+        #bytes per second, 0 for unlimited:
+        self.bulk_rate_limit = 0
+        self.bulk_min_rate = 0
+        self.bulk_budget = 0
+        self.bulk_budget_time = monotonic()
+        self.bulk_bytes = 0
+        self.interactive_bytes = 0
+        self.bulk_rate = 0
+        self.interactive_rate = 0
+        self.bytes_sample = (monotonic(), 0, 0)
         self.socket_dir = socket_dir
         self.unix_socket_paths = unix_socket_paths
         self.log_disconnect = log_disconnect
@@ -124,6 +161,13 @@ class ClientConnection(StubSourceMixin):
         self.wants = ["aliases", "encodings", "versions", "features", "display", "packet-types"]
         #these statistics are shared by all WindowSource instances:
         self.statistics = GlobalPerformanceStatistics()
+        #info subscription: the client receives the info deltas every 'info_interval' milliseconds
+        self.info_categories : Tuple[str,...] = ()
+        self.info_interval = 0
+        self.info_timer = 0
+        #when we requested the info update we are waiting for:
+        self.info_pending : float = 0
+        self.info_last : Dict[str,Any] = {}
 
 
     def is_closed(self) -> bool:
@@ -132,6 +176,8 @@ class ClientConnection(StubSourceMixin):
     def cleanup(self):
         log("%s.close()", self)
         self.close_event.set()
+        self.cancel_bulk_timer()
+        self.cancel_info_timer()
         self.protocol = None
         self.statistics.reset(0)
 
@@ -153,10 +199,8 @@ class ClientConnection(StubSourceMixin):
 
 
     def update_bandwidth_limits(self):
-        if not self.bandwidth_detection:
-            return
-        mmap_size = getattr(self, "mmap_size", 0)
-        if mmap_size>0:
+        if not self.bandwidth_detection or getattr(self, "mmap_size", 0)>0:
+            self.update_bulk_limit()
             return
         #calculate soft bandwidth limit based on send congestion data:
         bandwidth_limit = 0
@@ -194,6 +238,34 @@ class ClientConnection(StubSourceMixin):
             else:
                 weight = window_weight.get(wid, 0)
                 ws.bandwidth_limit = max(MIN_BANDWIDTH//10, bandwidth_limit*weight//total_weight)
+        self.update_bulk_limit()
+
+    def update_bulk_limit(self):
+        """
+            Bulk transfers can use the bandwidth not used by interactive packets,
+            but never less than BULK_MIN_PCT of the limit.
+            (see 'get_bulk_rate_limit' for congestion events)
+        """
+        now = monotonic()
+        last_time, last_bulk, last_interactive = self.bytes_sample
+        elapsed = now-last_time
+        if elapsed>0:
+            self.bulk_rate = int((self.bulk_bytes-last_bulk)/elapsed)
+            self.interactive_rate = int((self.interactive_bytes-last_interactive)/elapsed)
+            self.bytes_sample = (now, self.bulk_bytes, self.interactive_bytes)
+        #bandwidth limits are expressed in bits per second:
+        limit = (self.soft_bandwidth_limit or self.bandwidth_limit or 0)//8
+        self.bulk_min_rate = limit*BULK_MIN_PCT//100
+        self.bulk_rate_limit = max(self.bulk_min_rate, limit-self.interactive_rate) if limit>0 else 0
+        bandwidthlog("update_bulk_limit() limit=%iKB/s, interactive=%iKB/s, bulk=%iKB/s, bulk limit=%iKB/s",
+                     limit//1024, self.interactive_rate//1024, self.bulk_rate//1024, self.bulk_rate_limit//1024)
+
+    def get_bulk_rate_limit(self) -> int:
+        #only use the minimum share until the network recovers from congestion:
+        last_congestion = self.statistics.last_congestion_time
+        if self.bulk_min_rate and last_congestion and monotonic()-last_congestion<BULK_CONGESTION_DELAY/1000:
+            return self.bulk_min_rate
+        return self.bulk_rate_limit
 
 
     def parse_client_caps(self, c : typedict):
@@ -265,22 +337,67 @@ class ClientConnection(StubSourceMixin):
         self.statistics.compression_work_qsizes.append((monotonic(), self.encode_queue_size()))
         self.queue_encode((optional, fn, args))
 
+    def use_draw_datagrams(self) -> bool:
+        #the client can ask quic connections to send some draw packets as datagrams,
+        #but the connection can stop using them at any time (ie: when it switches to ordered mode):
+        conn = getattr(self.protocol, "_conn", None)
+        return bool(getattr(conn, "draw_datagrams", False))
+
     def queue_packet(self, packet, wid=0, pixels=0,
-                     start_send_cb=None, end_send_cb=None, fail_cb=None, wait_for_more=False):
+                     start_send_cb=None, end_send_cb=None, fail_cb=None, wait_for_more=False,
+                     supersede=False) -> Tuple[PacketType,...]:
         """
-            Add a new 'draw' packet to the 'packet_queue'.
+            Add a new 'draw' packet to the 'packet_queue',
+            or to the 'bulk_packets' queue for clipboard data.
+            When `supersede` is set, the 'draw' packets for this window
+            which are still queued and fully covered by this one are removed,
+            and returned so the caller can release them.
+            (unless some draw packets are sent as datagrams:
+            the client would see the missing packets as lost)
             Note: this code runs in the non-ui thread
         """
         now = monotonic()
+        if wid==0 and self.is_bulk(packet):
+            self.queue_bulk(packet, start_send_cb, end_send_cb, fail_cb, True, wait_for_more)
+            return ()
         self.statistics.packet_qsizes.append((now, len(self.packet_queue)))
         if wid>0:
             self.statistics.damage_packet_qpixels.append(
                 (now, wid, sum(x[2] for x in tuple(self.packet_queue) if x[1]==wid))
                 )
-        self.packet_queue.append((packet, wid, pixels, start_send_cb, end_send_cb, fail_cb, wait_for_more))
+        superseded : Tuple[PacketType,...] = ()
+        with self.queue_lock:
+            if supersede and SUPERSEDE and wid>0 and not self.use_draw_datagrams():
+                superseded = self.remove_superseded(packet, wid)
+            self.packet_queue.append((packet, wid, pixels, start_send_cb, end_send_cb, fail_cb, wait_for_more, supersede))
         p = self.protocol
         if p:
             p.source_has_more()
+        return superseded
+
+    def remove_superseded(self, packet, wid:int) -> Tuple[PacketType,...]:
+        """
+            Removes the queued 'draw' packets for this window
+            whose area is fully covered by the new packet.
+            We stop at the first packet for this window which cannot be replaced,
+            since it may depend on the pixels painted before it (ie: scroll or video).
+            The queue_lock must be held.
+        """
+        x, y, w, h = packet[2:6]
+        superseded = []
+        q = self.packet_queue
+        for i in range(len(q)-1, -1, -1):
+            queued = q[i]
+            if queued[1]!=wid:
+                continue
+            if not queued[7]:
+                break
+            qx, qy, qw, qh = queued[0][2:6]
+            if qx>=x and qy>=y and qx+qw<=x+w and qy+qh<=y+h:
+                del q[i]
+                superseded.insert(0, queued[0])
+        self.superseded_packets += len(superseded)
+        return tuple(superseded)
 
     def encode_loop(self):
         """
@@ -318,23 +435,110 @@ class ClientConnection(StubSourceMixin):
         packet, start_send_cb, end_send_cb, fail_cb = None, None, None, None
         synchronous, have_more, will_have_more = True, False, False
         if not self.is_closed():
-            if self.ordinary_packets:
-                packet, synchronous, fail_cb, will_have_more = self.ordinary_packets.pop(0)
-            elif self.packet_queue:
-                packet, _, _, start_send_cb, end_send_cb, fail_cb, will_have_more = self.packet_queue.popleft()
-            have_more = packet is not None and bool(self.ordinary_packets or self.packet_queue)
+            idle = not (self.ordinary_packets or self.packet_queue)
+            bulk = (idle or self.bulk_overdue()) and self.may_send_bulk()
+            if bulk:
+                packet, start_send_cb, end_send_cb, fail_cb, synchronous, will_have_more, _ = self.bulk_packets.popleft()
+            else:
+                with self.queue_lock:
+                    if self.ordinary_packets:
+                        packet, synchronous, fail_cb, will_have_more, _ = self.ordinary_packets.pop(0)
+                    elif self.packet_queue:
+                        packet, _, _, start_send_cb, end_send_cb, fail_cb, will_have_more, _ = self.packet_queue.popleft()
+            if packet is not None:
+                size = packet_size(packet)
+                if bulk:
+                    self.bulk_bytes += size
+                    self.bulk_budget -= size
+                else:
+                    self.interactive_bytes += size
+            have_more = packet is not None and bool(self.ordinary_packets or self.packet_queue or self.may_send_bulk())
         return packet, start_send_cb, end_send_cb, fail_cb, synchronous, have_more, will_have_more
 
+    def is_bulk(self, packet) -> bool:
+        return BULK_LANE and bool(packet) and packet[0] in BULK_PACKET_TYPES
+
+    def queue_bulk(self, packet, start_send_cb, end_send_cb, fail_cb, synchronous, will_have_more):
+        self.bulk_packets.append((packet, start_send_cb, end_send_cb, fail_cb, synchronous, will_have_more, monotonic()))
+        p = self.protocol
+        if p:
+            p.source_has_more()
+
+    def bulk_overdue(self) -> bool:
+        return bool(self.bulk_packets) and monotonic()-self.bulk_packets[0][-1]>BULK_MAX_WAIT/1000
+
+    def may_send_bulk(self) -> bool:
+        """
+            Bulk packets are rate limited using a token bucket,
+            which is allowed to go negative so that large packets can still be sent.
+            When the budget is exhausted, we schedule a timer to resume sending.
+        """
+        if not self.bulk_packets:
+            return False
+        rate = self.get_bulk_rate_limit()
+        if rate<=0:
+            return True
+        now = monotonic()
+        #allow bursts of up to 100ms worth of data:
+        self.bulk_budget = min(rate//10, self.bulk_budget+int((now-self.bulk_budget_time)*rate))
+        self.bulk_budget_time = now
+        if self.bulk_budget>=0:
+            return True
+        if not self.bulk_timer and not self.is_closed():
+            delay = max(1, -self.bulk_budget*1000//rate)
+            self.bulk_timer = self.timeout_add(delay, self.bulk_timer_fired)
+        return False
+
+    def bulk_timer_fired(self):
+        self.bulk_timer = 0
+        p = self.protocol
+        if p:
+            p.source_has_more()
+
+    def cancel_bulk_timer(self):
+        bt = self.bulk_timer
+        if bt:
+            self.bulk_timer = 0
+            self.source_remove(bt)
+
     def send(self, *parts, **kwargs):
-        """ This method queues non-damage packets (higher priority) """
+        """
+            This method queues non-damage packets (higher priority)
+            Packets sent with a `supersede` key replace the queued packet with the same key,
+            the optional `merge` function combines the contents of the old and new packets.
+        """
         synchronous = kwargs.get("synchronous", True)
         will_have_more = kwargs.get("will_have_more", not synchronous)
         fail_cb = kwargs.get("fail_cb", None)
+        supersede = kwargs.get("supersede", None) if SUPERSEDE else None
         p = self.protocol
         if p:
-            self.ordinary_packets.append((parts, synchronous, fail_cb, will_have_more))
+            if self.is_bulk(parts):
+                self.queue_bulk(parts, None, None, fail_cb, synchronous, will_have_more)
+                return
+            item = (parts, synchronous, fail_cb, will_have_more, supersede)
+            with self.queue_lock:
+                if not (supersede and self.replace_packet(item, kwargs.get("merge", None))):
+                    self.ordinary_packets.append(item)
             p.source_has_more()
 
+    def replace_packet(self, item, merge:Optional[Callable]) -> bool:
+        """
+            replaces the queued packet with the same key, the queue_lock must be held
+            the new packet goes at the end of the queue,
+            so it is not sent before the packets queued after the one it replaces
+        """
+        key = item[4]
+        for i, queued in enumerate(self.ordinary_packets):
+            if queued[4]==key:
+                if merge:
+                    item = (merge(queued[0], item[0]), ) + item[1:]
+                del self.ordinary_packets[i]
+                self.ordinary_packets.append(item)
+                self.superseded_packets += 1
+                return True
+        return False
+
     def send_more(self, *parts, **kwargs):
         kwargs["will_have_more"] = True
         self.send(*parts, **kwargs)
@@ -363,7 +567,19 @@ class ClientConnection(StubSourceMixin):
                 "bandwidth-limit"   : {
                     "detection"     : self.bandwidth_detection,
                     "actual"        : self.soft_bandwidth_limit or 0,
-                    }
+                    },
+                "bulk"              : {
+                    "enabled"       : BULK_LANE,
+                    "queue"         : len(self.bulk_packets),
+                    "rate-limit"    : self.get_bulk_rate_limit(),
+                    "bytes"         : self.bulk_bytes,
+                    "rate"          : self.bulk_rate,
+                    },
+                "interactive"       : {
+                    "bytes"         : self.interactive_bytes,
+                    "rate"          : self.interactive_rate,
+                    },
+                "superseded"        : self.superseded_packets,
                 }
         p = self.protocol
         if p:
@@ -386,6 +602,30 @@ class ClientConnection(StubSourceMixin):
     def send_info_response(self, info):
         self.send_async("info-response", notypedict(info))
 
+    def cancel_info_timer(self):
+        it = self.info_timer
+        if it:
+            self.info_timer = 0
+            self.source_remove(it)
+
+    def send_info_delta(self, info):
+        """
+            Sends only the info keys which have changed since the last update,
+            the first update contains all the keys and is flagged as 'full'.
+        """
+        self.info_pending = 0
+        if not self.info_interval:
+            return
+        full = not self.info_last
+        if full:
+            changed, removed = info, []
+        else:
+            changed, removed = dict_delta(self.info_last, info)
+        self.info_last = info
+        log("send_info_delta(..) full=%s, %i changed, %i removed", full, len(changed), len(removed))
+        if changed or removed or full:
+            self.send_async("info-delta", notypedict(changed), removed, full)
+
 
     def send_setting_change(self, setting, value):
         #we always subclass InfoMixin which defines "client_setting_change":
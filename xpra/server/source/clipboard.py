@@ -39,6 +39,7 @@ class ClipboardConnection(StubSourceMixin):
         self.clipboard_want_targets = False
         self.clipboard_selections = CLIPBOARDS
         self.clipboard_preferred_targets : Tuple[str,...] = ()
+        self.clipboard_contents_digest = False
 
     def cleanup(self) -> None:
         self.cancel_clipboard_progress_timer()
@@ -53,6 +54,7 @@ class ClipboardConnection(StubSourceMixin):
             self.clipboard_want_targets = ccaps.boolget("want_targets")
             self.clipboard_selections = ccaps.strtupleget("selections", CLIPBOARDS)
             self.clipboard_preferred_targets = ccaps.strtupleget("preferred-targets", ())
+            self.clipboard_contents_digest = ccaps.boolget("contents-digest")
         else:
             #no namespace in v4.3 and earlier:
             self.clipboard_enabled = c.boolget("clipboard", False)
@@ -75,6 +77,7 @@ class ClipboardConnection(StubSourceMixin):
                 "want-targets"          : self.clipboard_want_targets,
                 "preferred-targets"     : self.clipboard_preferred_targets,
                 "selections"            : self.clipboard_selections,
+                "contents-digest"       : self.clipboard_contents_digest,
                 },
             }
 
@@ -110,21 +113,23 @@ class ClipboardConnection(StubSourceMixin):
             return
         if getattr(self, "suspended", False):
             return
-        now = monotonic()
-        self.clipboard_stats.append(now)
-        if len(self.clipboard_stats)>=MAX_CLIPBOARD_LIMIT:
-            event = self.clipboard_stats[-MAX_CLIPBOARD_LIMIT]
-            elapsed = now-event
-            log("send_clipboard(..) elapsed=%.2f, clipboard_stats=%s", elapsed, self.clipboard_stats)
-            if elapsed<1:
-                msg = f"more than {MAX_CLIPBOARD_LIMIT} clipboard requests per second!"
-                log.warn("Warning: %s", msg)
-                #disable if this rate is sustained for more than S seconds:
-                events = [x for x in tuple(self.clipboard_stats) if x>(now-MAX_CLIPBOARD_LIMIT_DURATION)]
-                log("%i events in the last %i seconds: %s", len(events), MAX_CLIPBOARD_LIMIT_DURATION, events)
-                if len(events)>=MAX_CLIPBOARD_LIMIT*MAX_CLIPBOARD_LIMIT_DURATION:
-                    log.warn(" limit sustained for more than %i seconds,", MAX_CLIPBOARD_LIMIT_DURATION)
-                return
+        #streamed contents are not new requests:
+        if packet[0]!="clipboard-contents-chunk":
+            now = monotonic()
+            self.clipboard_stats.append(now)
+            if len(self.clipboard_stats)>=MAX_CLIPBOARD_LIMIT:
+                event = self.clipboard_stats[-MAX_CLIPBOARD_LIMIT]
+                elapsed = now-event
+                log("send_clipboard(..) elapsed=%.2f, clipboard_stats=%s", elapsed, self.clipboard_stats)
+                if elapsed<1:
+                    msg = f"more than {MAX_CLIPBOARD_LIMIT} clipboard requests per second!"
+                    log.warn("Warning: %s", msg)
+                    #disable if this rate is sustained for more than S seconds:
+                    events = [x for x in tuple(self.clipboard_stats) if x>(now-MAX_CLIPBOARD_LIMIT_DURATION)]
+                    log("%i events in the last %i seconds: %s", len(events), MAX_CLIPBOARD_LIMIT_DURATION, events)
+                    if len(events)>=MAX_CLIPBOARD_LIMIT*MAX_CLIPBOARD_LIMIT_DURATION:
+                        log.warn(" limit sustained for more than %i seconds,", MAX_CLIPBOARD_LIMIT_DURATION)
+                    return
         #call compress_clibboard via the encode work queue:
         self.queue_encode((True, self.compress_clipboard, (packet, )))
 
@@ -0,0 +1,279 @@
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+import os
+from threading import Lock
+from collections import deque
+from typing import Dict, Any, Tuple, Type, Deque
+
+from xpra.server.cystats import calculate_size_weighted_average, time_weighted_average #@UnresolvedImport
+from xpra.util import envint
+from xpra.log import Logger
+
+log = Logger("network", "bandwidth")
+
+CONGESTION_CONTROL = os.environ.get("XPRA_CONGESTION_CONTROL", "heuristic")
+#bbr: how long we keep the delivery rate and rtt samples for:
+BBR_WINDOW = envint("XPRA_CONGESTION_BBR_WINDOW", 10)
+#delay: the queueing delay we aim for, in milliseconds:
+DELAY_TARGET = envint("XPRA_CONGESTION_DELAY_TARGET", 25)
+#delay: how much the rate can change with each ack, in percent:
+DELAY_GAIN = envint("XPRA_CONGESTION_DELAY_GAIN", 5)
+
+MAX_INFLIGHT = 1024
+NSAMPLES = 500
+MIN_RATE = 256*1024
+#the congestion value at which the quality and speed targets reach their minimum,
+#(see batch_delay_calculator)
+MAX_CONGESTION = 0.1
+
+#the 'bbr' gain cycle, probes for more bandwidth then drains the queue:
+BBR_GAINS = (1.25, 0.75, 1, 1, 1, 1, 1, 1)
+
+
+def clamp(v:float, vmin:float=0, vmax:float=1) -> float:
+    return max(vmin, min(vmax, v))
+
+
+class CongestionControl:
+    """
+        Estimates how much bandwidth is available and how congested the network is.
+        The statistics and window sources feed it the network events,
+        (packets sent, acknowledged or late) and read back:
+        * `bandwidth`: the estimated bandwidth in bits per second, or zero when unknown
+        * `congestion`: from zero to MAX_CONGESTION, which lowers the quality and speed targets
+        * `congestion_time`: the last time we detected congestion, which increases the batch delay
+        The subclasses implement the actual algorithms using the `sample`, `on_late` and `update` hooks.
+        (warning: the events come from the network threads, `update` runs in the worker thread)
+    """
+    name = ""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.bandwidth = 0
+        self.congestion = 0.0
+        self.congestion_time = 0.0
+        self.events : Deque[Tuple[float,int,int]] = deque(maxlen=NSAMPLES//4)
+                                                #(event_time, late_pct, send_speed)
+        #packets sent and not acknowledged yet:
+        #(send time, bytecount, bytes delivered, delivered time)
+        self.inflight : Dict[Any,Tuple[float,int,int,float]] = {}
+        self.delivered = 0
+        self.delivered_time = 0.0
+        self.rtt_samples : Deque[Tuple[float,float]] = deque(maxlen=NSAMPLES)
+        self.rate_samples : Deque[Tuple[float,int]] = deque(maxlen=NSAMPLES)
+
+    def __repr__(self):
+        return f"CongestionControl({self.name})"
+
+    def on_packet_sent(self, key, now:float, bytecount:int) -> None:
+        with self.lock:
+            self.inflight[key] = (now, bytecount, self.delivered, self.delivered_time or now)
+            if len(self.inflight)>MAX_INFLIGHT:
+                #lost or never acknowledged:
+                self.inflight.pop(next(iter(self.inflight)))
+
+    def on_ack(self, key, now:float, decode_time:float=0) -> None:
+        """ the client acknowledged this packet, `decode_time` is in seconds """
+        with self.lock:
+            record = self.inflight.pop(key, None)
+            if not record:
+                return
+            sent_at, bytecount, delivered, delivered_time = record
+            self.delivered += bytecount
+            self.delivered_time = now
+            #don't count the time the client spent decoding:
+            received = max(sent_at, now-decode_time)
+            rtt = max(0.0001, received-sent_at)
+            #the delivery rate since this packet was sent (like BBR):
+            interval = max(received-delivered_time, rtt)
+            rate = int((self.delivered-delivered)*8/interval)
+            self.rtt_samples.append((now, rtt))
+            self.rate_samples.append((now, rate))
+            self.sample(now, rtt, rate)
+
+    def sample(self, now:float, rtt:float, rate:int) -> None:
+        """ a new rtt (in seconds) and delivery rate (in bits per second) sample """
+
+    def on_late(self, now:float, late_pct:int, send_speed:int) -> bool:
+        """
+            A packet was sent slowly or acknowledged late,
+            returns True if this is treated as a congestion event.
+        """
+        return False
+
+    def congestion_event(self, now:float, late_pct:int=0, send_speed:int=0) -> None:
+        self.congestion_time = now
+        self.events.append((now, late_pct, send_speed))
+
+    def update(self, now:float) -> None:
+        """ updates `bandwidth` and `congestion` """
+
+    def get_recent(self, samples, min_time:float) -> Tuple:
+        with self.lock:
+            return tuple(v for t, v in tuple(samples) if t>min_time)
+
+    def get_info(self) -> Dict[str,Any]:
+        return {
+            "name"          : self.name,
+            "bandwidth"     : self.bandwidth,
+            "congestion"    : int(1000*self.congestion),
+            "inflight"      : len(self.inflight),
+            "delivered"     : self.delivered,
+            "events"        : len(self.events),
+            }
+
+
+class HeuristicCongestionControl(CongestionControl):
+    """
+        Packets that are sent slowly or acknowledged late are congestion events,
+        the bandwidth is the average send speed recorded with these events,
+        and the congestion value is how often they occur.
+    """
+    name = "heuristic"
+
+    def on_late(self, now:float, late_pct:int, send_speed:int) -> bool:
+        self.congestion_event(now, late_pct, send_speed)
+        return True
+
+    def update(self, now:float) -> None:
+        #set to 0 if we have less than 2 events in the last 60 seconds:
+        min_time = now-60
+        css = tuple(x for x in tuple(self.events) if x[0]>min_time)
+        acss = 0
+        if len(css)>=2:
+            #weighted average of the send speed over the last minute:
+            acss = int(calculate_size_weighted_average(css)[0])
+            latest_ctime = css[-1][0]
+            elapsed = now-latest_ctime
+            #require at least one recent event:
+            if elapsed<30:
+                #as the last event recedes in the past, increase limit:
+                acss *= 1+elapsed
+        self.bandwidth = int(acss)
+        #how often we get congestion events:
+        #first chunk it into second intervals
+        cst = tuple(x[0] for x in css)
+        cps = []
+        for t in range(10):
+            etime = now-t
+            matches = tuple(1 for x in cst if etime-1<x<=etime) or (0,)
+            cps.append((etime, sum(matches)))
+        self.congestion = time_weighted_average(cps)
+
+
+class BBRCongestionControl(CongestionControl):
+    """
+        Delivery rate estimator, similar to BBR:
+        the bandwidth is the maximum delivery rate seen recently,
+        using a gain cycle to probe for more,
+        and the rtt inflation above the minimum rtt measures the congestion.
+    """
+    name = "bbr"
+
+    def __init__(self):
+        super().__init__()
+        self.max_rate = 0
+        self.min_rtt = 0.0
+        self.recent_rtt = 0.0
+
+    def update(self, now:float) -> None:
+        min_time = now-BBR_WINDOW
+        rates = self.get_recent(self.rate_samples, min_time)
+        rtts = self.get_recent(self.rtt_samples, min_time)
+        if not rates or not rtts:
+            return
+        self.min_rtt = min(rtts)
+        recent = rtts[-8:]
+        self.recent_rtt = sum(recent)/len(recent)
+        #the queue builds up when we send faster than the network can deliver:
+        inflation = self.recent_rtt/self.min_rtt
+        severity = clamp((inflation-1.25)/1.75)
+        self.congestion = MAX_CONGESTION*severity
+        if severity>=0.5:
+            #the bandwidth has dropped, the older samples are no longer valid:
+            rates = self.get_recent(self.rate_samples, now-1) or rates
+            self.congestion_event(now, int(100*inflation)-100, max(rates))
+        #application limited samples are lower, so we use the maximum:
+        self.max_rate = max(rates)
+        cycle = int(now/max(0.1, self.min_rtt)) % len(BBR_GAINS)
+        self.bandwidth = max(MIN_RATE, int(self.max_rate*BBR_GAINS[cycle]))
+
+    def get_info(self) -> Dict[str,Any]:
+        info = super().get_info()
+        info.update({
+            "max-rate"      : self.max_rate,
+            "min-rtt"       : int(1000*self.min_rtt),
+            "recent-rtt"    : int(1000*self.recent_rtt),
+            })
+        return info
+
+
+class DelayCongestionControl(CongestionControl):
+    """
+        Delay based, similar to LEDBAT:
+        the queueing delay is the rtt above the lowest rtt seen in the last minute,
+        the rate increases when it is below DELAY_TARGET and decreases when it is above.
+    """
+    name = "delay"
+
+    def __init__(self):
+        super().__init__()
+        self.rate = 0
+        self.queue_delay = 0.0
+        #the minimum rtt for each 10 second interval:
+        self.base_history : Deque[Tuple[int,float]] = deque(maxlen=6)
+
+    def get_base_delay(self, now:float, rtt:float) -> float:
+        interval = int(now//10)
+        if not self.base_history or self.base_history[-1][0]!=interval:
+            self.base_history.append((interval, rtt))
+        elif rtt<self.base_history[-1][1]:
+            self.base_history[-1] = (interval, rtt)
+        return min(v for _, v in self.base_history)
+
+    def sample(self, now:float, rtt:float, rate:int) -> None:
+        base = self.get_base_delay(now, rtt)
+        #smooth out the noise:
+        self.queue_delay = (self.queue_delay*3+rtt-base)/4
+        target = DELAY_TARGET/1000
+        off_target = clamp((target-self.queue_delay)/target, -1, 1)
+        if not self.rate:
+            self.rate = max(MIN_RATE, rate)
+        #application limited connections can't measure more than they send,
+        #so don't go too far above the highest delivery rate:
+        ceiling = max(MIN_RATE, 2*max(v for _, v in self.rate_samples))
+        self.rate = int(clamp(self.rate*(1+DELAY_GAIN*off_target/100), MIN_RATE, ceiling))
+        if self.queue_delay>2*target and now-self.congestion_time>self.queue_delay:
+            self.congestion_event(now, int(100*self.queue_delay/target)-100, self.rate)
+
+    def update(self, now:float) -> None:
+        if not self.rate:
+            return
+        target = DELAY_TARGET/1000
+        self.bandwidth = self.rate
+        self.congestion = MAX_CONGESTION*clamp((self.queue_delay-target)/(3*target))
+
+    def get_info(self) -> Dict[str,Any]:
+        info = super().get_info()
+        info.update({
+            "rate"          : self.rate,
+            "queue-delay"   : int(1000*self.queue_delay),
+            "target"        : DELAY_TARGET,
+            })
+        return info
+
+
+ALGORITHMS : Dict[str,Type[CongestionControl]] = {
+    c.name : c for c in (HeuristicCongestionControl, BBRCongestionControl, DelayCongestionControl)
+    }
+
+def get_congestion_control(name:str=CONGESTION_CONTROL) -> CongestionControl:
+    cc_class = ALGORITHMS.get(name.lower())
+    if not cc_class:
+        log.warn(f"Warning: unknown congestion control algorithm {name!r}")
+        log.warn(" use: %s", ", ".join(ALGORITHMS.keys()))
+        cc_class = HeuristicCongestionControl
+    return cc_class()
@@ -12,6 +12,7 @@ from time import sleep, monotonic
 
 from xpra.server.source.stub_source_mixin import StubSourceMixin
 from xpra.server.window import batch_config
+from xpra.server.window.video_scoring import get_pipeline_scores
 from xpra.server.server_core import ClientException
 from xpra.codecs.video_helper import getVideoHelper
 from xpra.codecs.codec_constants import video_spec
@@ -494,6 +495,7 @@ class EncodingsMixin(StubSourceMixin):
             "default"      : self.default_encoding or "",
             "defaults"     : self.default_encoding_options,
             "client-defaults" : self.encoding_options,
+            "pipeline-scores" : get_pipeline_scores().get_info(),
             }
         info.setdefault("encoding", {}).update(einfo)
         return info
@@ -7,7 +7,7 @@
 import os
 from typing import Dict, Any, Set
 
-from xpra.util import envbool, typedict, net_utf8
+from xpra.util import envbool, typedict, net_utf8, csv
 from xpra.os_util import get_machine_id
 from xpra.net.file_transfer import FileTransferHandler
 from xpra.server.source.stub_source_mixin import StubSourceMixin
@@ -19,6 +19,22 @@ ADD_LOCAL_PRINTERS = envbool("XPRA_ADD_LOCAL_PRINTERS", False)
 PRINTER_LOCATION_STRING = os.environ.get("XPRA_PRINTER_LOCATION_STRING", "via xpra")
 
 
+def get_peer_identity(protocol) -> str:
+    """
+        The remote host and the usernames the connection authenticated as,
+        unlike the client uuid, the client cannot choose these values.
+    """
+    conn = getattr(protocol, "_conn", None)
+    endpoint = getattr(conn, "endpoint", None)
+    if isinstance(endpoint, (tuple, list)):
+        #ignore the port, which changes with every connection:
+        endpoint = endpoint[0] if endpoint else None
+    if not endpoint:
+        return ""
+    usernames = csv(getattr(authenticator, "username", "") for authenticator in getattr(protocol, "authenticators", ()))
+    return f"{usernames}@{endpoint}"
+
+
 class FilePrintMixin(FileTransferHandler, StubSourceMixin):
 
     @classmethod
@@ -31,22 +47,33 @@ class FilePrintMixin(FileTransferHandler, StubSourceMixin):
         self.printers_added : Set[str] = set()
         #duplicated from clientinfo mixin
         self.machine_id = ""
+        self.file_transfer_identity = ""
 
     def cleanup(self) -> None:
         self.remove_printers()
+        self.interrupt_file_transfers()
 
     def parse_client_caps(self, c : typedict) -> None:
         FileTransferHandler.parse_file_transfer_caps(self, c)
         self.machine_id = c.strget("machine_id")
 
+    def get_file_transfer_peer_id(self) -> str:
+        #the client uuid is stable for the same user,
+        #so transfers can be resumed when the client reconnects,
+        #but since the client chooses it, we also require the same authenticated user and host:
+        if not self.uuid or not self.file_transfer_identity:
+            return ""
+        return f"{self.uuid}/{self.file_transfer_identity}"
+
     def get_info(self) -> Dict[str,Any]:
         return {
             "printers"          : self.printers,
             "file-transfers"    : FileTransferHandler.get_info(self),
             }
 
-    def init_from(self, _protocol, server) -> None:
+    def init_from(self, protocol, server) -> None:
         self.init_attributes()
+        self.file_transfer_identity = get_peer_identity(protocol)
         #copy attributes
         for x in ("file_transfer", "file_transfer_ask", "file_size_limit", "file_chunks",
                   "printing", "printing_ask", "open_files", "open_files_ask",
@@ -150,4 +150,4 @@ class InputMixin(StubSourceMixin):
         if self.mouse_last_position!=(x, y) or self.mouse_last_relative_position!=(rx, ry):
             self.mouse_last_position = (x, y)
             self.mouse_last_position = (rx, ry)
-            self.send_async("pointer-position", wid, x, y, rx, ry)
+            self.send_async("pointer-position", wid, x, y, rx, ry, supersede="pointer-position")
@@ -43,11 +43,13 @@ class MMAP_Connection(StubSourceMixin):
         self.mmap_client_token_index = 512
         self.mmap_client_token_bytes = 0
         self.mmap_client_namespace = False
+        self.mmap_rings = None
 
     def cleanup(self) -> None:
         mmap = self.mmap
         if mmap:
             self.mmap = None
+            self.mmap_rings = None
             self.mmap_size = 0
             mmap.close()
 
@@ -123,9 +125,14 @@ class MMAP_Connection(StubSourceMixin):
                                      self.mmap_client_token,
                                      self.mmap_client_token_index,
                                      self.mmap_client_token_bytes)
+                    from xpra.net.mmap_pipe import MmapRings, MMAP_RINGS
+                    if MMAP_RINGS and c.boolget("rings"):
+                        self.mmap_rings = MmapRings(self.mmap, self.mmap_size)
         if self.mmap_size>0:
             from xpra.simple_stats import std_unit
             log.info(" mmap is enabled using %sB area in %s", std_unit(self.mmap_size, unit=1024), mmap_filename)
+            if self.mmap_rings:
+                log(" using a separate ring for each window")
 
     def get_caps(self) -> Dict[str,Any]:
         sep = "." if self.mmap_client_namespace else "_"
@@ -143,11 +150,13 @@ class MMAP_Connection(StubSourceMixin):
         return caps
 
     def get_info(self) -> Dict[str,Any]:
-        return {
-            "mmap" : {
-                "supported"     : self.supports_mmap,
-                "enabled"       : self.mmap is not None,
-                "size"          : self.mmap_size,
-                "filename"      : self.mmap_filename or "",
-                },
+        info = {
+            "supported"     : self.supports_mmap,
+            "enabled"       : self.mmap is not None,
+            "size"          : self.mmap_size,
+            "filename"      : self.mmap_filename or "",
             }
+        rings = self.mmap_rings
+        if rings:
+            info["rings"] = rings.get_info()
+        return {"mmap" : info}
@@ -13,9 +13,11 @@ from collections import deque
 
 from xpra.server.cystats import (                                           #@UnresolvedImport
     logp, calculate_time_weighted_average, calculate_size_weighted_average, #@UnresolvedImport
-    calculate_for_target, time_weighted_average, queue_inspect,             #@UnresolvedImport
+    calculate_for_target, queue_inspect,                                    #@UnresolvedImport
     )
+from xpra.server.source.congestion_control import get_congestion_control
 from xpra.simple_stats import get_list_stats
+from xpra.server import metrics
 from xpra.log import Logger
 
 log = Logger("network", "stats")
@@ -64,8 +66,8 @@ class GlobalPerformanceStatistics:
                                                             #(event_time, elapsed_time_in_seconds)
         self.server_ping_latency = d()                      #time it took for the client to get a ping_echo back from us:
                                                             #(event_time, elapsed_time_in_seconds)
-        self.congestion_send_speed = d(NRECS//4)            #when we are being throttled, record what speed we are sending at
-                                                            #last NRECS: (event_time, lateness_pct, duration)
+        self.congestion_control = get_congestion_control()  #estimates the bandwidth and congestion,
+                                                            #and records the congestion events
         self.bytes_sent = d(NRECS//4)                       #how much bandwidth we are using
                                                             #last NRECS: (sample_time, bytes)
         self.quality = d()                                  #quality used for sending updates:
@@ -112,6 +114,7 @@ class GlobalPerformanceStatistics:
         if self.min_client_latency is None or self.min_client_latency>net_total_latency:
             self.min_client_latency = net_total_latency
         self.client_latency.append((wid, now, pixels, net_total_latency))
+        metrics.observe("xpra_client_latency_seconds", net_total_latency)
         self.frame_total_latency.append((wid, now, pixels, latency))
 
     def get_damage_pixels(self, wid:int) -> Tuple[Tuple[float,int],...]:
@@ -137,31 +140,11 @@ class GlobalPerformanceStatistics:
         if server_ping_latency:
             self.min_server_ping_latency = min(x for _,x in server_ping_latency)
             self.avg_server_ping_latency, self.recent_server_ping_latency = latency_averages(server_ping_latency)
-        #set to 0 if we have less than 2 events in the last 60 seconds:
-        now = monotonic()
-        min_time = now-60
-        css = tuple(x for x in tuple(self.congestion_send_speed) if x[0]>min_time)
-        acss = 0
-        if len(css)>=2:
-            #weighted average of the send speed over the last minute:
-            acss = safeint(calculate_size_weighted_average(css)[0])
-            latest_ctime = self.congestion_send_speed[-1][0]
-            elapsed = now-latest_ctime
-            #require at least one recent event:
-            if elapsed<30:
-                #as the last event recedes in the past, increase limit:
-                acss *= 1+elapsed
-        self.avg_congestion_send_speed = int(acss)
-        #how often we get congestion events:
-        #first chunk it into second intervals
-        cst = tuple(x[0] for x in css)
-        cps = []
-        for t in range(10):
-            etime = now-t
-            matches = tuple(1 for x in cst if etime-1<x<=etime) or (0,)
-            cps.append((etime, sum(matches)))
-        #log("cps(%s)=%s (now=%s)", cst, cps, now)
-        self.congestion_value = time_weighted_average(cps)
+        cc = self.congestion_control
+        cc.update(monotonic())
+        self.avg_congestion_send_speed = cc.bandwidth
+        self.congestion_value = cc.congestion
+        self.last_congestion_time = max(self.last_congestion_time, cc.congestion_time)
         ftl = tuple(self.frame_total_latency)
         if ftl:
             edata = tuple((event_time, pixels, latency) for _, event_time, pixels, latency in ftl)
@@ -225,6 +208,7 @@ class GlobalPerformanceStatistics:
             "congestion" : {
                 "avg-send-speed"        : self.avg_congestion_send_speed,
                 "elapsed-time"          : int(now-self.last_congestion_time),
+                "control"               : self.congestion_control.get_info(),
                 },
             }
         if self.min_client_latency is not None:
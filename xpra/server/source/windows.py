@@ -18,6 +18,7 @@ except ImportError:
 from xpra.server.source.stub_source_mixin import StubSourceMixin
 from xpra.server.window.metadata import make_window_metadata
 from xpra.server.window.filters import get_window_filter
+from xpra.server import metrics
 from xpra.net.compression import Compressed
 from xpra.os_util import memoryview_to_bytes, bytestostr
 from xpra.util import typedict, envint, envbool, DEFAULT_METADATA_SUPPORTED, NotificationID
@@ -39,6 +40,13 @@ MIN_BANDWIDTH = envint("XPRA_MIN_BANDWIDTH", 5*1024*1024)
 PROPERTIES_DEBUG = [x.strip() for x in os.environ.get("XPRA_WINDOW_PROPERTIES_DEBUG", "").split(",")]
 
 
+def merge_metadata_packets(old, new) -> Tuple:
+    """ applies a new 'window-metadata' update on top of the one still waiting to be sent """
+    metadata = dict(old[2])
+    metadata.update(new[2])
+    return ("window-metadata", new[1], metadata)
+
+
 class WindowsMixin(StubSourceMixin):
     """
     Handle window forwarding:
@@ -64,7 +72,7 @@ class WindowsMixin(StubSourceMixin):
         #duplicated from clientconnection:
         self.statistics = None
 
-    def init_from(self, _protocol, server) -> None:
+    def init_from(self, protocol, server) -> None:
         self.get_focus          = server.get_focus
         self.get_cursor_data_cb = server.get_cursor_data
         self.get_window_id      = server.get_window_id
@@ -308,12 +316,13 @@ class WindowsMixin(StubSourceMixin):
         cursorlog("do_send_cursor(..) %sx%s %s cursor name='%s', serial=%#x with delay=%s (cursor_encodings=%s)",
                   w, h, (encoding or "empty"), bytestostr(name), serial, delay, self.cursor_encodings)
         args = [encoding_prefix+encoding] + list(cursor_data[:9]) + [cursor_sizes[0]] + list(cursor_sizes[1])
-        self.send_more("cursor", *args)
+        #a newer cursor replaces the one still waiting to be sent:
+        self.send_more("cursor", *args, supersede="cursor")
 
     def send_empty_cursor(self) -> None:
         cursorlog("send_empty_cursor(..)")
         self.last_cursor_sent = ()
-        self.send_more("cursor", "")
+        self.send_more("cursor", "", supersede="cursor")
 
 
     def bell(self, wid:int, device, percent:int, pitch:int, duration:int, bell_class, bell_id:int, bell_name:str) -> None:
@@ -388,7 +397,9 @@ class WindowsMixin(StubSourceMixin):
             else:
                 metalog("make_metadata(%s, %s, %s)=%s", wid, window, prop, metadata)
             if metadata:
-                self.send("window-metadata", wid, metadata)
+                #merge with the metadata update still waiting to be sent for this window:
+                self.send("window-metadata", wid, metadata,
+                          supersede=("window-metadata", wid), merge=merge_metadata_packets)
 
 
     # Takes the name of a WindowModel property, and returns a dictionary of
@@ -564,6 +575,7 @@ class WindowsMixin(StubSourceMixin):
             bandwidth_limit = self.bandwidth_limit
             mmap = getattr(self, "mmap", None)
             mmap_size = getattr(self, "mmap_size", 0)
+            mmap_rings = getattr(self, "mmap_rings", None)
             av_sync = getattr(self, "av_sync", False)
             av_sync_delay = getattr(self, "av_sync_delay", 0)
             if mmap_size>0:
@@ -585,7 +597,8 @@ class WindowsMixin(StubSourceMixin):
                               self.window_icon_encodings, self.encoding_options, self.icons_encoding_options,
                               self.rgb_formats,
                               self.default_encoding_options,
-                              mmap, mmap_size, bandwidth_limit, self.jitter)
+                              mmap, mmap_size, mmap_rings, bandwidth_limit, self.jitter)
+            ws.use_draw_datagrams = self.use_draw_datagrams
             ws.init_encoders()
             self.window_sources[wid] = ws
             if len(self.window_sources)>1:
@@ -626,6 +639,7 @@ class WindowsMixin(StubSourceMixin):
             return
         if decode_time>0:
             self.statistics.client_decode_time.append((wid, monotonic(), width*height, decode_time))
+            metrics.observe("xpra_client_decode_seconds", decode_time/1000/1000)
         ws = self.window_sources.get(wid)
         if ws:
             ws.damage_packet_acked(damage_packet_sequence, width, height, decode_time, message)
@@ -645,13 +659,15 @@ class WindowsMixin(StubSourceMixin):
         elapsed = now-self.bandwidth_warning_time
         bandwidthlog("record_congestion_event(%s, %i, %i) bandwidth_warnings=%s, elapsed time=%i",
                      source, late_pct, send_speed, self.bandwidth_warnings, elapsed)
+        if not gs.congestion_control.on_late(now, late_pct, send_speed):
+            #this algorithm uses other signals
+            return
         gs.last_congestion_time = now
-        gs.congestion_send_speed.append((now, late_pct, send_speed))
         if self.bandwidth_warnings and elapsed>CONGESTION_REPEAT_DELAY:
             #enough congestion events?
             T = 10
             min_time = now-T
-            count = sum(int(x[0]>min_time) for x in gs.congestion_send_speed)
+            count = sum(int(x[0]>min_time) for x in tuple(gs.congestion_control.events))
             bandwidthlog("record_congestion_event: %i events in the last %i seconds (warnings after %i)",
                          count, T, CONGESTION_WARNING_EVENT_COUNT)
             if count>CONGESTION_WARNING_EVENT_COUNT:
@@ -0,0 +1,113 @@
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+# Tells the video encoders which areas of the picture have changed since their previous frame,
+# so they can encode the other macroblocks as skip blocks without analyzing them.
+# The hints must cover every change the video encoder has not seen,
+# including the frames that were sent using a different encoding,
+# otherwise the client would keep showing stale pixels.
+
+from typing import Dict, Any, List, Tuple, Optional
+
+from xpra.util import envbool, envint
+
+DAMAGE_HINTS = envbool("XPRA_VIDEO_DAMAGE_HINTS", True)
+#beyond this many rectangles, we just encode the whole picture:
+MAX_DAMAGE_HINTS = envint("XPRA_VIDEO_MAX_DAMAGE_HINTS", 64)
+#scaling filters spread the changes to the neighbouring pixels:
+SCALING_MARGIN = 2
+
+
+class DamageHints:
+    """
+        The UI thread records the window damage with `add_damage`,
+        and takes it with `take_damage` when it captures a video frame,
+        the regions are sent to the encode thread with the frame, as the "damage-regions" option,
+        which is set to `None` when too many regions have been damaged.
+        The encode thread calls `add_frame` for every frame it encodes, using video or not,
+        then `get_hints` to get the regions the video encoder should encode,
+        and `compressed` once the video encoder has dealt with the frame.
+        `None` is used when the damage is not known, the whole picture must be encoded.
+    """
+
+    def __init__(self, max_regions:int=MAX_DAMAGE_HINTS):
+        self.max_regions = max_regions
+        #UI thread: window damage since the last video frame capture
+        self.damage : Optional[List[Tuple[int,int,int,int]]] = []
+        #encode thread: window damage the video encoder has not seen yet
+        self.pending : Optional[List[Tuple[int,int,int,int]]] = []
+        #encode thread: the window area of the last frame the video encoder compressed
+        self.geometry : Tuple[int,int,int,int] = (0, 0, 0, 0)
+        self.frames = 0
+        self.hinted = 0
+
+    def add_damage(self, x:int, y:int, w:int, h:int) -> None:
+        damage = self.damage
+        if damage is None:
+            return
+        if len(damage)>=self.max_regions:
+            self.damage = None
+            return
+        damage.append((x, y, w, h))
+
+    def take_damage(self) -> Optional[Tuple[Tuple[int,int,int,int],...]]:
+        damage = self.damage
+        self.damage = []
+        if damage is None:
+            return None
+        return tuple(damage)
+
+    def add_frame(self, regions) -> None:
+        """ the damage regions of a frame we are about to encode, `None` if they are not known """
+        pending = self.pending
+        if pending is None:
+            return
+        if regions is None or len(pending)+len(regions)>self.max_regions:
+            self.pending = None
+            return
+        pending += regions
+
+    def get_hints(self, x:int, y:int, w:int, h:int, enc_w:int, enc_h:int) -> Tuple[Tuple[int,int,int,int],...]:
+        """
+            The areas of the picture which may have changed since the last video frame,
+            clipped to the picture at `x`, `y` (window coordinates) and scaled to `enc_w` x `enc_h`.
+            An empty tuple means that we don't have any hints to give.
+        """
+        self.frames += 1
+        pending = self.pending
+        if pending is None or self.geometry!=(x, y, w, h) or w<=0 or h<=0:
+            #the encoder's previous frame may not be the same area of the window:
+            return ()
+        scaled = enc_w!=w or enc_h!=h
+        margin = SCALING_MARGIN if scaled else 0
+        hints = []
+        for rx, ry, rw, rh in pending:
+            x1 = max(x, rx-margin)-x
+            y1 = max(y, ry-margin)-y
+            x2 = min(x+w, rx+rw+margin)-x
+            y2 = min(y+h, ry+rh+margin)-y
+            if x2<=x1 or y2<=y1:
+                continue
+            if scaled:
+                x1 = x1*enc_w//w
+                y1 = y1*enc_h//h
+                x2 = (x2*enc_w+w-1)//w
+                y2 = (y2*enc_h+h-1)//h
+            hints.append((x1, y1, x2-x1, y2-y1))
+        if hints:
+            self.hinted += 1
+        return tuple(hints)
+
+    def compressed(self, x:int, y:int, w:int, h:int) -> None:
+        """ the video encoder is now up to date with this area of the window """
+        self.pending = []
+        self.geometry = (x, y, w, h)
+
+    def get_info(self) -> Dict[str,Any]:
+        return {
+            "enabled"   : DAMAGE_HINTS,
+            "frames"    : self.frames,
+            "hinted"    : self.hinted,
+            }
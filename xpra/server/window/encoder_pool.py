@@ -0,0 +1,147 @@
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+# Keeps initialized csc and video encoder contexts ready for use,
+# so that changing the video pipeline does not have to wait for them.
+# None of the codecs can change their dimensions once initialized,
+# so the contexts are keyed by their exact configuration:
+# csc contexts can be recycled when the pipeline changes,
+# video encoders only if they have not encoded any frames yet.
+
+from time import monotonic
+from threading import Lock
+from collections import deque
+from typing import Dict, Any, List, Tuple, Deque, Hashable
+
+from xpra.util import envint
+from xpra.log import Logger
+
+log = Logger("video", "encoding")
+
+ENCODER_POOL_SIZE = envint("XPRA_ENCODER_POOL_SIZE", 4)
+#unused contexts are freed after this many seconds:
+ENCODER_POOL_AGE = envint("XPRA_ENCODER_POOL_AGE", 10)
+
+
+class EncoderPool:
+    """
+        The contexts are taken from the pool by the encode thread,
+        and added to it by the encode thread or the background worker.
+        Each context must have a `clean()` method, which is called when it expires.
+        The owner should call `expire_contexts` periodically, so the contexts are freed
+        even if the pool is not used again.
+    """
+
+    def __init__(self, size:int=ENCODER_POOL_SIZE, max_age:int=ENCODER_POOL_AGE):
+        self.lock = Lock()
+        self.size = size
+        self.max_age = max_age
+        self.contexts : Dict[Hashable,List[Tuple[float,Any]]] = {}
+        self.pending : set = set()
+        self.closed = False
+        self.hits = 0
+        self.misses = 0
+        self.added = 0
+        self.expired = 0
+        #(codec type, setup time in seconds, taken from the pool):
+        self.setup_times : Deque[Tuple[str,float,bool]] = deque(maxlen=50)
+
+    def __len__(self):
+        return sum(len(v) for v in self.contexts.values())
+
+    def set_pending(self, key:Hashable, pending:bool=True) -> bool:
+        """ returns False if we already have this context or it is being initialized """
+        with self.lock:
+            if pending:
+                if key in self.pending or key in self.contexts:
+                    return False
+                self.pending.add(key)
+            else:
+                self.pending.discard(key)
+            return True
+
+    def take(self, key:Hashable):
+        with self.lock:
+            self.expire(monotonic())
+            contexts = self.contexts.get(key)
+            if not contexts:
+                self.misses += 1
+                return None
+            self.hits += 1
+            _, context = contexts.pop()
+            if not contexts:
+                del self.contexts[key]
+            return context
+
+    def put(self, key:Hashable, context) -> None:
+        now = monotonic()
+        with self.lock:
+            self.pending.discard(key)
+            if self.closed or self.size<=0:
+                context.clean()
+                return
+            self.expire(now)
+            self.contexts.setdefault(key, []).append((now, context))
+            self.added += 1
+            while len(self)>self.size:
+                self.evict(self.oldest())
+
+    def oldest(self) -> Hashable:
+        return min(self.contexts.keys(), key=lambda k: self.contexts[k][0][0])
+
+    def evict(self, key:Hashable) -> None:
+        """ the lock must be held """
+        contexts = self.contexts[key]
+        _, context = contexts.pop(0)
+        if not contexts:
+            del self.contexts[key]
+        self.expired += 1
+        log("encoder pool: freeing %s", context)
+        context.clean()
+
+    def expire(self, now:float) -> None:
+        """ the lock must be held """
+        for key in tuple(self.contexts.keys()):
+            while key in self.contexts and now-self.contexts[key][0][0]>self.max_age:
+                self.evict(key)
+
+    def expire_contexts(self) -> int:
+        """ frees the contexts which have not been used for too long, returns how many are left """
+        with self.lock:
+            self.expire(monotonic())
+            return len(self)
+
+    def record_setup(self, codec_type:str, elapsed:float, pooled:bool) -> None:
+        self.setup_times.append((codec_type, elapsed, pooled))
+
+    def get_info(self) -> Dict[str,Any]:
+        info : Dict[str,Any] = {
+            "size"      : self.size,
+            "contexts"  : len(self),
+            "hits"      : self.hits,
+            "misses"    : self.misses,
+            "added"     : self.added,
+            "expired"   : self.expired,
+            }
+        for pooled, name in ((True, "pool"), (False, "new")):
+            times = tuple(elapsed for _, elapsed, p in tuple(self.setup_times) if p==pooled)
+            if times:
+                #in microseconds:
+                info.setdefault("setup-time", {})[name] = {
+                    "count" : len(times),
+                    "avg"   : int(1000*1000*sum(times)/len(times)),
+                    "max"   : int(1000*1000*max(times)),
+                    }
+        return info
+
+    def cleanup(self) -> None:
+        with self.lock:
+            self.closed = True
+            contexts = self.contexts
+            self.contexts = {}
+            self.pending = set()
+        for items in contexts.values():
+            for _, context in items:
+                context.clean()
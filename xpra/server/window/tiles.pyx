@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+# This file is part of Xpra.
+# Copyright (C) 2023 Antoine Martin <antoine@xpra.org>
+# Xpra is released under the terms of the GNU GPL v2, or, at your option, any
+# later version. See the file COPYING for details.
+
+#cython: boundscheck=False, wraparound=False
+
+from xpra.buffers.membuf cimport buffer_context #pylint: disable=syntax-error
+
+from libc.stdint cimport uint8_t, uint16_t, uint32_t, uintptr_t
+from libc.string cimport memset
+
+
+#tile classes:
+DEF FLAT = 0
+DEF TEXT = 1
+DEF PHOTO = 2
+TILE_FLAT = FLAT
+TILE_TEXT = TEXT
+TILE_PHOTO = PHOTO
+
+TILE_NAMES = {
+    TILE_FLAT   : "flat",
+    TILE_TEXT   : "text",
+    TILE_PHOTO  : "photo",
+    }
+
+#open addressing hash table used for counting colours,
+#must be a power of 2 and larger than MAX_PALETTE:
+DEF HASH_SIZE = 1024
+DEF MAX_PALETTE = 256
+
+
+cdef inline uint32_t pixel_value(const uint8_t *p, uint8_t bpp) nogil:
+    if bpp==4:
+        return (<uint32_t*> p)[0]
+    if bpp==3:
+        return p[0] | (p[1]<<8) | (p[2]<<16)
+    if bpp==2:
+        return p[0] | (p[1]<<8)
+    return p[0]
+
+cdef inline uint16_t pixel_diff(const uint8_t *p1, const uint8_t *p2, uint8_t bpp) nogil:
+    cdef uint16_t d = 0
+    cdef uint8_t i
+    for i in range(bpp):
+        if p1[i]>p2[i]:
+            d += p1[i]-p2[i]
+        else:
+            d += p2[i]-p1[i]
+    return d
+
+
+cdef uint8_t classify_tile(const uint8_t *buf, uint32_t rowstride, uint8_t bpp,
+                           uint16_t tw, uint16_t th,
+                           uint32_t *table, uint8_t *used,
+                           uint16_t max_text_colors, uint16_t edge_threshold) nogil:
+    """
+        Counts the colours used in the tile (up to MAX_PALETTE+1),
+        and the number of sharp vs smooth transitions between horizontal neighbours.
+        Text and UI elements use few colours and sharp edges,
+        photos and gradients use many colours and smooth transitions.
+    """
+    memset(used, 0, HASH_SIZE)
+    cdef uint16_t colors = 0
+    cdef uint32_t sharp = 0
+    cdef uint32_t smooth = 0
+    cdef uint16_t x, y, d
+    cdef uint32_t v, slot
+    cdef const uint8_t *row
+    cdef const uint8_t *p
+    for y in range(th):
+        row = buf + y*rowstride
+        for x in range(tw):
+            p = row + x*bpp
+            if colors<=MAX_PALETTE:
+                v = pixel_value(p, bpp)
+                slot = (v*(<uint32_t> 2654435761U)) & (HASH_SIZE-1)
+                while used[slot] and table[slot]!=v:
+                    slot = (slot+1) & (HASH_SIZE-1)
+                if not used[slot]:
+                    used[slot] = 1
+                    table[slot] = v
+                    colors += 1
+            if x>0:
+                d = pixel_diff(p, p-bpp, bpp)
+                if d>=edge_threshold:
+                    sharp += 1
+                elif d>0:
+                    smooth += 1
+    if colors<=1:
+        return FLAT
+    if colors<=max_text_colors:
+        return TEXT
+    if colors<=MAX_PALETTE and sharp*4>=smooth:
+        return TEXT
+    return PHOTO
+
+
+def classify_tiles(pixels, uint16_t width, uint16_t height, uint32_t rowstride, uint8_t bpp=4,
+                   uint16_t tile_size=64, uint16_t max_text_colors=32, uint16_t edge_threshold=96):
+    """
+        Splits the image into tiles of 'tile_size' pixels
+        and returns the number of columns, rows, and the class of each tile
+        as a bytes object of length columns*rows (row major order).
+        The tiles on the right and bottom edges may be smaller.
+    """
+    assert width>0 and height>0, "invalid dimensions: %ix%i" % (width, height)
+    assert 1<=bpp<=4, "invalid bytes per pixel: %i" % bpp
+    assert tile_size>=8, "tile size %i is too small" % tile_size
+    assert width*bpp<=rowstride, "invalid row length: %ix%i=%i but rowstride is %i" % (width, bpp, width*bpp, rowstride)
+    cdef uint16_t cols = (width+tile_size-1)//tile_size
+    cdef uint16_t rows = (height+tile_size-1)//tile_size
+    cdef Py_ssize_t min_buf_len = rowstride*(height-1)+width*bpp
+    cdef uint32_t table[HASH_SIZE]
+    cdef uint8_t used[HASH_SIZE]
+    classes = bytearray(cols*rows)
+    cdef uint8_t *cbuf = classes
+    cdef uint8_t *buf
+    cdef uint16_t tx, ty, tw, th
+    with buffer_context(pixels) as bc:
+        buf = <uint8_t*> (<uintptr_t> int(bc))
+        assert len(bc)>=min_buf_len, "buffer length=%i is too small for %ix%i with rowstride %i, should be %i" % (
+                len(bc), width, height, rowstride, min_buf_len)
+        with nogil:
+            for ty in range(rows):
+                th = min(tile_size, height-ty*tile_size)
+                for tx in range(cols):
+                    tw = min(tile_size, width-tx*tile_size)
+                    cbuf[ty*cols+tx] = classify_tile(buf + ty*tile_size*rowstride + tx*tile_size*bpp,
+                                                     rowstride, bpp, tw, th, table, used,
+                                                     max_text_colors, edge_threshold)
+    return cols, rows, bytes(classes)
+
+
+def merge_tiles(classes, uint16_t cols, uint16_t rows, uint16_t tile_size, uint16_t width, uint16_t height):
+    """
+        Merges adjacent tiles into rectangles,
+        flat tiles are merged with their neighbours since any encoding handles them well.
+        Returns a list of (x, y, w, h, tile_class) tuples covering the whole image.
+    """
+    assert len(classes)==cols*rows
+    #flat tiles join the class of the tile on their left (or the first non-flat one):
+    row_runs = []
+    for ty in range(rows):
+        row = list(classes[ty*cols:(ty+1)*cols])
+        fill = next((c for c in row if c!=TILE_FLAT), TILE_TEXT)
+        for tx in range(cols):
+            if row[tx]==TILE_FLAT:
+                row[tx] = fill
+            else:
+                fill = row[tx]
+        runs = []
+        start = 0
+        for tx in range(1, cols+1):
+            if tx==cols or row[tx]!=row[start]:
+                runs.append((start, tx, row[start]))
+                start = tx
+        row_runs.append(tuple(runs))
+    #now merge identical runs vertically:
+    rects = []
+    open_runs = {}
+    for ty in range(rows+1):
+        runs = row_runs[ty] if ty<rows else ()
+        for run, sy in tuple(open_runs.items()):
+            if run not in runs:
+                del open_runs[run]
+                rects.append((run, sy, ty))
+        for run in runs:
+            open_runs.setdefault(run, ty)
+    regions = []
+    for (sx, ex, tile_class), sy, ey in sorted(rects, key=lambda r : (r[1], r[0][0])):
+        x = sx*tile_size
+        y = sy*tile_size
+        w = min(width, ex*tile_size)-x
+        h = min(height, ey*tile_size)-y
+        regions.append((x, y, w, h, tile_class))
+    return regions
@@ -4,14 +4,23 @@
 # Xpra is released under the terms of the GNU GPL v2, or, at your option, any
 # later version. See the file COPYING for details.
 
+from threading import Lock
+from collections import OrderedDict
+from typing import Dict, Tuple, Any, Callable, Optional
+
 from xpra.util import envint
-from xpra.codecs.codec_constants import LOSSY_PIXEL_FORMATS
+from xpra.codecs.codec_constants import LOSSY_PIXEL_FORMATS, PREFERRED_ENCODING_ORDER
 from xpra.log import Logger
 
 scorelog = Logger("score")
 
 GPU_BIAS = envint("XPRA_GPU_BIAS", 100)
 MIN_FPS_COST = envint("XPRA_MIN_FPS_COST", 4)
+#how many sets of pipeline scores we keep, shared by all the windows:
+SCORE_CACHE_SIZE = envint("XPRA_PIPELINE_SCORE_CACHE", 1024)
+#the speed and quality targets are rounded to this value,
+#so that the windows can share the same scores:
+SCORE_BUCKET = max(1, envint("XPRA_PIPELINE_SCORE_BUCKET", 5))
 
 #any colourspace conversion will lose at least some quality (due to rounding)
 #(so add 0.2 to the value we get from calculating the degradation using get_subsampling_divs)
@@ -216,3 +225,189 @@ def get_encoder_dimensions(encoder_spec, width : int, height : int, scaling=(1,1
     enc_width = int(width * v / u) & encoder_spec.width_mask
     enc_height = int(height * v / u) & encoder_spec.height_mask
     return enc_width, enc_height
+
+
+def get_score_bucket(value : int) -> int:
+    if value>=100:
+        #keep 100, which enables lossless modes
+        return 100
+    return int(value)//SCORE_BUCKET*SCORE_BUCKET
+
+def get_encoding_score_delta(encoding : str) -> int:
+    #discount encodings further down the list of preferred encodings:
+    #(ie: prefer h264 to vp9)
+    try:
+        return len(PREFERRED_ENCODING_ORDER)//2-list(PREFERRED_ENCODING_ORDER).index(encoding)
+    except ValueError:
+        return 0
+
+def get_spec_limits(video_helper, encodings, src_format : str) -> Tuple[Tuple,Tuple]:
+    """
+        Returns the maximum dimensions of all the encoders for these encodings,
+        and the csc specs limited to a number of instances,
+        which are scored lower as they get used.
+    """
+    sizes = set()
+    for encoding in encodings:
+        for colorspace_specs in video_helper.get_encoder_specs(encoding).values():
+            for encoder_spec in colorspace_specs:
+                sizes.add((encoder_spec.max_w, encoder_spec.max_h))
+    limited = []
+    for csc_specs in video_helper.get_csc_specs(src_format).values():
+        limited += [csc_spec for csc_spec in csc_specs if csc_spec.max_instances>0]
+    return tuple(sorted(sizes)), tuple(limited)
+
+def get_pipeline_options(video_helper, encodings, width : int, height : int, src_format : str,
+                         csc_modes : Dict[str,Tuple[str,...]], score_deltas : Dict[str,int],
+                         scalings : Dict[Tuple[int,int],Tuple[int,int]], max_size : Tuple[int,int],
+                         target_quality : int, min_quality : int,
+                         target_speed : int, min_speed : int,
+                         current_csce, current_ve, ffps : int, detection : bool, is_shadow : bool,
+                         force_csc_mode : str="", force_csc : bool=False) -> Tuple:
+    """
+        Scores all the csc and encoder combinations that can compress
+        pictures of the given size and pixel format using the given encodings,
+        and which produce an output that the client can handle (`csc_modes`).
+        `scalings` has the scaling value to use for each maximum encoder size.
+        Returns the options sorted by score, the best one first.
+    """
+    vmw, vmh = max_size
+    scores = []
+    for encoding in encodings:
+        #these are the CSC modes the client can handle for this encoding:
+        #we must check that the output csc mode for each encoder is one of those
+        supported_csc_modes = csc_modes.get(encoding)
+        if not supported_csc_modes:
+            scorelog(" no supported csc modes for %s", encoding)
+            continue
+        encoder_specs = video_helper.get_encoder_specs(encoding)
+        if not encoder_specs:
+            scorelog(" no encoder specs for %s", encoding)
+            continue
+        encoding_score_delta = score_deltas.get(encoding, 0)
+        no_match = []
+        def add_scores(info, csc_spec, enc_in_format):
+            #find encoders that take 'enc_in_format' as input:
+            colorspace_specs = encoder_specs.get(enc_in_format)
+            if not colorspace_specs:
+                no_match.append(info)
+                return
+            for encoder_spec in colorspace_specs:
+                #ensure that the output of the encoder can be processed by the client:
+                matches = tuple(x for x in encoder_spec.output_colorspaces if x in supported_csc_modes)
+                if not matches:
+                    no_match.append(encoder_spec.codec_type+" "+info)
+                    continue
+                if (csc_spec and csc_spec.can_scale) or encoder_spec.can_scale:
+                    scaling = scalings.get((min(encoder_spec.max_w, vmw), min(encoder_spec.max_h, vmh)), (1, 1))
+                else:
+                    scaling = (1, 1)
+                score_delta = encoding_score_delta
+                if is_shadow and enc_in_format in ("NV12", "YUV420P", "YUV422P") and scaling==(1, 1):
+                    #avoid subsampling with shadow servers:
+                    score_delta -= 40
+                score_data = get_pipeline_score(enc_in_format, csc_spec, encoder_spec, width, height, scaling,
+                                                target_quality, min_quality, target_speed, min_speed,
+                                                current_csce, current_ve,
+                                                score_delta, ffps, detection)
+                if score_data:
+                    scores.append(score_data)
+                else:
+                    scorelog(" no score data for %s",
+                             (enc_in_format, csc_spec, encoder_spec, width, height, scaling, ".."))
+        if not force_csc or src_format==force_csc_mode:
+            add_scores(f"direct (no csc) {src_format}", None, src_format)
+
+        #now add those that require a csc step:
+        csc_specs = video_helper.get_csc_specs(src_format)
+        if csc_specs:
+            #we have csc module(s) that can get us from pixel_format to out_csc:
+            for out_csc, l in csc_specs.items():
+                if not bool(force_csc_mode) or force_csc_mode==out_csc:
+                    for csc_spec in l:
+                        add_scores(f"via {out_csc}", csc_spec, out_csc)
+        scorelog("no matching colorspace specs for %s: %s", encoding, no_match)
+    return tuple(sorted(scores, key=lambda x : -x[0]))
+
+
+def get_context_key(current_csce, current_ve) -> Tuple:
+    """ the attributes of the current pipeline which are used by `get_pipeline_score` """
+    csc_key : Tuple = ()
+    if current_csce:
+        csc_key = (type(current_csce), current_csce.get_dst_format(),
+                   current_csce.get_src_width(), current_csce.get_src_height())
+    ve_key : Tuple = ()
+    if current_ve:
+        ve_key = (current_ve.get_type(), current_ve.get_src_format(),
+                  current_ve.get_width(), current_ve.get_height())
+    return csc_key, ve_key
+
+
+class PipelineScores:
+    """
+        Memoizes the pipeline scores, so that windows with the same
+        dimensions, pixel format, targets and current pipeline don't have to
+        score all the csc and encoder combinations again.
+        The keys include the video helper generation and the client's csc modes,
+        so the scores are not re-used when the codecs or the client change.
+
+        Can be called from any thread.
+    """
+
+    def __init__(self, size : int=SCORE_CACHE_SIZE):
+        self.lock = Lock()
+        self.size = size
+        self.scores : OrderedDict = OrderedDict()
+        self.limits : Dict[Tuple,Tuple] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get_spec_limits(self, video_helper, encodings, src_format : str) -> Tuple[Tuple,Tuple]:
+        key = (video_helper.generation, tuple(encodings), src_format)
+        limits = self.limits.get(key)
+        if limits is None:
+            limits = get_spec_limits(video_helper, encodings, src_format)
+            with self.lock:
+                if len(self.limits)>=self.size:
+                    self.limits.clear()
+                self.limits[key] = limits
+        return limits
+
+    def get(self, key : Tuple, score_fn : Callable, *args) -> Tuple:
+        with self.lock:
+            scores : Optional[Tuple] = self.scores.get(key)
+            if scores is not None:
+                self.hits += 1
+                self.scores.move_to_end(key)
+                return scores
+            self.misses += 1
+        scores = score_fn(*args)
+        if self.size>0:
+            with self.lock:
+                self.scores[key] = scores
+                while len(self.scores)>self.size:
+                    self.scores.popitem(last=False)
+        return scores
+
+    def invalidate(self) -> None:
+        with self.lock:
+            self.scores.clear()
+            self.limits.clear()
+
+    def get_info(self) -> Dict[str,Any]:
+        return {
+            "size"      : self.size,
+            "entries"   : len(self.scores),
+            "hits"      : self.hits,
+            "misses"    : self.misses,
+            "bucket"    : SCORE_BUCKET,
+            }
+
+
+pipeline_scores : Optional[PipelineScores] = None
+
+def get_pipeline_scores() -> PipelineScores:
+    global pipeline_scores
+    if pipeline_scores is None:
+        pipeline_scores = PipelineScores()
+    return pipeline_scores
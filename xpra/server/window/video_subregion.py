@@ -56,8 +56,10 @@ def scoreinout(ww:int, wh:int, region, incount:int, outcount:int) -> int:
 
 
 class VideoSubregion:
-    def __init__(self, refresh_cb:Callable, auto_refresh_delay:int, supported=False):
+    def __init__(self, refresh_cb:Callable, auto_refresh_delay:int, supported=False,
+                 new_region_cb:Optional[Callable]=None):
         self.refresh_cb = refresh_cb        #usage: refresh_cb(window, regions)
+        self.new_region_cb = new_region_cb  #usage: new_region_cb(rect), called when we start using a new region
         self.auto_refresh_delay = auto_refresh_delay
         self.supported = supported
         self.enabled = True
@@ -482,7 +484,8 @@ class VideoSubregion:
                 if rect.width<MIN_W or rect.height<MIN_H:
                     self.novideoregion("match is too small after removing excluded regions")
                     return
-            if not self.rectangle or self.rectangle!=rect:
+            new_region = not self.rectangle or self.rectangle!=rect
+            if new_region:
                 sslog("setting new region %s: "+msg, rect, *args)
                 sslog(" is child window: %s", rect in children_rects)
                 self.set_at = damage_events_count
@@ -494,6 +497,8 @@ class VideoSubregion:
             if not self.detection:
                 return
             updateregion(rect)
+            if new_region and self.new_region_cb:
+                self.new_region_cb(rect)
 
         update_markers()
 
@@ -16,24 +16,31 @@ from typing import Callable, Dict, List, Tuple, Iterable, ContextManager, Any, O
 
 from xpra.os_util import bytestostr, POSIX, OSX, DummyContextManager
 from xpra.util import envint, envbool, csv, typedict, first_time, decode_str, repr_ellipsized
-from xpra.common import MAX_WINDOW_SIZE, WINDOW_DECODE_SKIPPED, WINDOW_DECODE_ERROR, WINDOW_NOT_FOUND
+from xpra.common import MAX_WINDOW_SIZE, WINDOW_DECODE_SKIPPED, WINDOW_DECODE_ERROR, WINDOW_NOT_FOUND, WINDOW_PACKET_LOST
 from xpra.server.window.windowicon_source import WindowIconSource
 from xpra.server.window.window_stats import WindowPerformanceStatistics
 from xpra.server.window.batch_delay_calculator import calculate_batch_delay, get_target_speed, get_target_quality
 from xpra.server.cystats import time_weighted_average, logp #@UnresolvedImport
 from xpra.server.source.source_stats import GlobalPerformanceStatistics
+from xpra.server import metrics
 from xpra.rectangle import rectangle, add_rectangle, remove_rectangle, merge_all   #@UnresolvedImport
 from xpra.simple_stats import get_list_stats
 from xpra.codecs.rgb_transform import rgb_reformat
 from xpra.codecs.loader import get_codec
 from xpra.codecs.image_wrapper import ImageWrapper
-from xpra.codecs.codec_constants import preforder, LOSSY_PIXEL_FORMATS
+from xpra.codecs.codec_constants import preforder, LOSSY_PIXEL_FORMATS, STREAM_ENCODINGS
 from xpra.net.compression import use, Compressed
+from xpra.latency_trace import get_latency_trace, get_server_stages, to_us
 from xpra.log import Logger
+try:
+    from xpra.server.window.tiles import classify_tiles, merge_tiles, TILE_PHOTO, TILE_NAMES #@UnresolvedImport
+except ImportError:     # pragma: no cover
+    classify_tiles = merge_tiles = None
 
 log = Logger("window", "encoding")
 refreshlog = Logger("window", "refresh")
 compresslog = Logger("window", "compress")
+tileslog = Logger("window", "tiles")
 damagelog = Logger("window", "damage")
 scalinglog = Logger("scaling")
 iconlog = Logger("icon")
@@ -63,6 +70,11 @@ MIN_WINDOW_REGION_SIZE : int = envint("XPRA_MIN_WINDOW_REGION_SIZE", 1024)
 MAX_SOFT_EXPIRED : int = envint("XPRA_MAX_SOFT_EXPIRED", 5)
 ACK_JITTER : int = envint("XPRA_ACK_JITTER", 100)
 ACK_TOLERANCE : int = envint("XPRA_ACK_TOLERANCE", 250)
+LOSS_REFRESH_DELAY : int = envint("XPRA_LOSS_REFRESH_DELAY", 50)
+#leave room for the rest of the draw packet in the datagram:
+DATAGRAM_DRAW_SIZE : int = envint("XPRA_DATAGRAM_DRAW_SIZE", 900)
+#the decoder's state depends on every frame, or on the pixels already on screen:
+NO_DATAGRAM_ENCODINGS : Tuple[str,...] = STREAM_ENCODINGS + ("stream", "scroll", "mmap")
 SLOW_SEND_THRESHOLD : int = envint("XPRA_SLOW_SEND_THRESHOLD", 20*1000*1000)
 FRAME_OVERHEAD : int = envint("XPRA_FRAME_OVERHEAD", 1)
 
@@ -85,6 +97,12 @@ SEND_TIMESTAMPS : bool = envbool("XPRA_SEND_TIMESTAMPS", False)
 DAMAGE_STATISTICS : bool = envbool("XPRA_DAMAGE_STATISTICS", False)
 
 SCROLL_ALL : bool = envbool("XPRA_SCROLL_ALL", True)
+TILES : bool = envbool("XPRA_TILES", True)
+TILE_SIZE : int = max(16, envint("XPRA_TILE_SIZE", 64))
+MIN_TILES_PIXELS : int = envint("XPRA_MIN_TILES_PIXELS", 256*256)
+MAX_TILE_REGIONS : int = envint("XPRA_MAX_TILE_REGIONS", 16)
+#newer 'draw' packets can replace the queued ones they fully cover:
+SUPERSEDE_DRAW : bool = envbool("XPRA_SUPERSEDE_DRAW", True)
 FORCE_PILLOW : bool = envbool("XPRA_FORCE_PILLOW", False)
 HARDCODED_ENCODING : str = os.environ.get("XPRA_HARDCODED_ENCODING", "")
 
@@ -104,6 +122,9 @@ else:
     LOSSLESS_ENCODINGS = ("rgb", "png", "png/P", "png/L", "webp", "avif", "jpeg", "jpega")
 LOSSLESS_ENCODINGS = get_env_encodings("LOSSLESS", LOSSLESS_ENCODINGS)
 REFRESH_ENCODINGS = get_env_encodings("REFRESH", LOSSLESS_ENCODINGS)
+#encodings which do not depend on the previous frames,
+#so an older packet can be dropped if a newer one covers the same area:
+SUPERSEDE_ENCODINGS = get_env_encodings("SUPERSEDE", ("rgb24", "rgb32", "png", "png/P", "png/L", "webp", "jpeg", "jpega", "avif"))
 
 LOSSLESS_WINDOW_TYPES = set(os.environ.get("XPRA_LOSSLESS_WINDOW_TYPES",
                                        "DOCK,TOOLBAR,MENU,UTILITY,DROPDOWN_MENU,POPUP_MENU,TOOLTIP,NOTIFICATION,COMBO,DND").split(","))
@@ -174,7 +195,7 @@ class WindowSource(WindowIconSource):
                     encoding_options:typedict, icons_encoding_options:typedict,
                     rgb_formats:Tuple[str,...],
                     default_encoding_options,
-                    mmap, mmap_size:int, bandwidth_limit:int, jitter:int):
+                    mmap, mmap_size:int, mmap_rings, bandwidth_limit:int, jitter:int):
         super().__init__(window_icon_encodings, icons_encoding_options)
         self.idle_add = idle_add
         self.timeout_add = timeout_add
@@ -182,6 +203,12 @@ class WindowSource(WindowIconSource):
         # mmap:
         self._mmap = mmap
         self._mmap_size = mmap_size
+        #when the client supports it, each window uses its own ring in the mmap area:
+        self._mmap_rings = mmap_rings
+        self.mmap_fallbacks = 0
+        self.superseded_packets = 0
+        #the connection can send some draw packets as datagrams (ie: quic):
+        self.use_draw_datagrams : Callable[[], bool] = lambda : False
 
         self.init_vars()
 
@@ -223,6 +250,11 @@ class WindowSource(WindowIconSource):
         self.max_soft_expired : int = max(0, min(100, encoding_options.intget("max-soft-expired", MAX_SOFT_EXPIRED)))
         self.send_timetamps : bool = encoding_options.boolget("send-timestamps", SEND_TIMESTAMPS)
         self.send_window_size : bool = encoding_options.boolget("send-window-size", False)
+        self.latency_trace = get_latency_trace("server")
+        #only send the timestamps to the clients which ask for them:
+        self.send_trace_stamps : bool = encoding_options.boolget("latency-trace", False)
+        #the timestamps of the packets waiting to be sent, for our own trace:
+        self.trace_stamps : Dict[int,Tuple[int,...]] = {}
         self.decoder_speed = typedict(self.encoding_options.dictget("decoder-speed") or {})
         self.batch_config = batch_config
         #auto-refresh:
@@ -432,6 +464,7 @@ class WindowSource(WindowIconSource):
         self.mmap_write = None
         #
         self.decode_error_refresh_timer : int = 0
+        self.window_not_found_refresh : bool = False
         self.may_send_timer : int = 0
         self.auto_refresh_delay = 0
         self.base_auto_refresh_delay = 0
@@ -479,6 +512,10 @@ class WindowSource(WindowIconSource):
         self._sequence : int = 1
         self._damage_cancelled = INFINITY
         self._damage_packet_sequence : int = 1
+        #the sequence of the last draw packet which was allowed to be lost:
+        self._datagram_sequence : int = 0
+        #pixel counts for the images encoded as tiles, by tile class:
+        self.tiles_stats : Dict[str,int] = {}
 
     def cleanup(self) -> None:
         self.cancel_damage(INFINITY)
@@ -486,6 +523,10 @@ class WindowSource(WindowIconSource):
             self.wid, self.encoding, self.statistics.encoding_totals)
         self.init_vars()
         self._mmap_size = 0
+        rings = self._mmap_rings
+        if rings:
+            self._mmap_rings = None
+            rings.release(self.wid)
         self.batch_config.cleanup()
         #we can only clear the encoders after clearing the whole encoding queue:
         #(because mmap cannot be cancelled once queued for encoding)
@@ -567,7 +608,10 @@ class WindowSource(WindowIconSource):
                 "encodings"             : esinfo,
                 "rgb_threshold"         : self._rgb_auto_threshold,
                 "mmap"                  : self._mmap_size>0,
+                "mmap-fallbacks"        : self.mmap_fallbacks,
+                "superseded"            : self.superseded_packets,
                 "last_used"             : self.encoding_last_used or "",
+                "tiles"                 : dict(self.tiles_stats),
                 "full-frames-only"      : self.full_frames_only,
                 "supports-transparency" : self.supports_transparency,
                 "property"              : self.get_property_info(),
@@ -579,6 +623,7 @@ class WindowSource(WindowIconSource):
                                            },
                 "send-timetamps"        : self.send_timetamps,
                 "send-window-size"      : self.send_window_size,
+                "latency-trace"         : self.send_trace_stamps,
                 "rgb_formats"           : self.rgb_formats,
                 "bit-depth"             : {
                     "source"                : self.image_depth,
@@ -2178,6 +2223,11 @@ class WindowSource(WindowIconSource):
         if not packet:
             return
         #queue packet for sending:
+        if isinstance(packet, list):
+            #the image was split into tiles:
+            for tile_packet in packet:
+                self.queue_damage_packet(tile_packet, damage_time, process_damage_time, options)
+            return
         self.queue_damage_packet(packet, damage_time, process_damage_time, options)
 
 
@@ -2430,6 +2480,7 @@ class WindowSource(WindowIconSource):
         ack_pending = [0, coding, 0, 0, 0, width*height, client_options, damage_time]
         statistics = self.statistics
         statistics.damage_ack_pending[damage_packet_sequence] = ack_pending
+        stamps = self.trace_stamps.pop(damage_packet_sequence, ())
         def start_send(bytecount:int):
             ack_pending[0] = monotonic()
             ack_pending[2] = bytecount
@@ -2437,8 +2488,12 @@ class WindowSource(WindowIconSource):
             now = monotonic()
             ack_pending[3] = now
             ack_pending[4] = bytecount
+            gs = self.global_statistics
+            if gs:
+                gs.congestion_control.on_packet_sent((self.wid, damage_packet_sequence), ack_pending[0], bytecount-ack_pending[2])
             if process_damage_time>0:
                 statistics.damage_out_latency.append((now, width*height, actual_batch_delay, now-process_damage_time))
+                metrics.observe("xpra_damage_latency_seconds", now-process_damage_time)
             elapsed_ms = int((now-ack_pending[0])*1000)
             #only record slow send as congestion events
             #if the bandwidth limit is already below the threshold:
@@ -2450,14 +2505,28 @@ class WindowSource(WindowIconSource):
                     send_speed = int(ldata*8*1000/elapsed_ms)
                     self.networksend_congestion_event("slow send", late_pct, send_speed)
             self.schedule_auto_refresh(packet, options or {})
+            trace = self.latency_trace
+            if trace and stamps:
+                send_start = to_us(ack_pending[0])
+                trace.spans(self.wid, damage_packet_sequence, get_server_stages(stamps) + [
+                    ("send-queue", stamps[-1], send_start),
+                    ("send", send_start, to_us(now)),
+                    ])
+                trace.flow(self.wid, damage_packet_sequence, send_start, True)
         if process_damage_time>0:
             now = monotonic()
             damage_in_latency = now-process_damage_time
             statistics.damage_in_latency.append((now, width*height, actual_batch_delay, damage_in_latency))
         #log.info("queuing %s packet with fail_cb=%s", coding, fail_cb)
         self.statistics.last_packet_time = monotonic()
-        self.queue_packet(packet, self.wid, width*height, start_send, damage_packet_sent,
-                          self.get_fail_cb(packet), client_options.get("flush", 0))
+        supersede = SUPERSEDE_DRAW and coding in SUPERSEDE_ENCODINGS and "scaled_size" not in client_options
+        superseded = self.queue_packet(packet, self.wid, width*height, start_send, damage_packet_sent,
+                                       self.get_fail_cb(packet), client_options.get("flush", 0), supersede)
+        for old_packet in superseded or ():
+            #these packets will never be sent, so don't wait for the client to ack them:
+            log("draw packet sequence %i superseded by %i", old_packet[8], damage_packet_sequence)
+            self.superseded_packets += 1
+            self.damage_packet_acked(old_packet[8], old_packet[4], old_packet[5], WINDOW_DECODE_SKIPPED, "superseded")
 
     def networksend_congestion_event(self, source, late_pct:int, cur_send_speed:int=0) -> None:
         gs = self.global_statistics
@@ -2544,9 +2613,19 @@ class WindowSource(WindowIconSource):
         elif decode_time==WINDOW_DECODE_SKIPPED:
             log(f"client skipped decoding sequence {damage_packet_sequence} for window {self.wid}")
         elif decode_time==WINDOW_NOT_FOUND:
-            log.warn("Warning: client cannot find window %i", self.wid)
+            if not self.statistics.client_decode_time and not self.window_not_found_refresh:
+                #with multiple streams (ie: quic), the first draw packets can overtake the 'new-window' packet:
+                log("client cannot find window %i yet, refreshing it", self.wid)
+                self.window_not_found_refresh = True
+                if self.window and not self.decode_error_refresh_timer:
+                    self.decode_error_refresh_timer = self.timeout_add(LOSS_REFRESH_DELAY, self.decode_error_refresh)
+            else:
+                log.warn("Warning: client cannot find window %i", self.wid)
         elif decode_time==WINDOW_DECODE_ERROR:
             self.client_decode_error(decode_time, message)
+        elif decode_time==WINDOW_PACKET_LOST:
+            log(f"client lost sequence {damage_packet_sequence} for window {self.wid}: {message!r}")
+            self.packet_lost(damage_packet_sequence)
         pending = self.statistics.damage_ack_pending.pop(damage_packet_sequence, None)
         if pending is None:
             log("cannot find sent time for sequence %s", damage_packet_sequence)
@@ -2559,6 +2638,7 @@ class WindowSource(WindowIconSource):
         #damage_packet_sent, so we must validate the data:
         if bytecount>0 and end_send_at>0:
             now = monotonic()
+            gs.congestion_control.on_ack((self.wid, damage_packet_sequence), now, max(0, decode_time)/1000/1000)
             if decode_time>0:
                 latency = int(1000*(now-damage_time))
                 self.global_statistics.record_latency(self.wid, damage_packet_sequence, decode_time,
@@ -2624,6 +2704,17 @@ class WindowSource(WindowIconSource):
             delay = min(1000, 250+self.global_statistics.decode_errors*100)
             self.decode_error_refresh_timer = self.timeout_add(delay, self.decode_error_refresh)
 
+    def packet_lost(self, damage_packet_sequence:int) -> None:
+        #the client cannot detect the loss of the datagram packets sent before a lost one,
+        #so don't wait for their acks:
+        dap = self.statistics.damage_ack_pending
+        for sequence, pending in tuple(dap.items()):
+            if sequence<damage_packet_sequence and "datagram" in pending[6]:
+                dap.pop(sequence, None)
+        #refresh the window, unless a refresh is already pending:
+        if self.window and not self.decode_error_refresh_timer:
+            self.decode_error_refresh_timer = self.timeout_add(LOSS_REFRESH_DELAY, self.decode_error_refresh)
+
     def decode_error_refresh(self) -> None:
         self.decode_error_refresh_timer = 0
         self.full_quality_refresh({})
@@ -2640,6 +2731,13 @@ class WindowSource(WindowIconSource):
         return False
 
 
+    def record_encoding(self, end, coding:str, pixels:int, bpp:int, csize:int, elapsed:float) -> None:
+        self.statistics.encoding_stats.append((end, coding, pixels, bpp, csize, elapsed))
+        metrics.observe("xpra_encode_seconds", elapsed, encoder=coding)
+        metrics.increase("xpra_encoded_bytes", csize, encoder=coding)
+        metrics.increase("xpra_encoded_pixels", pixels, encoder=coding)
+
+
     def make_data_packet(self, damage_time, process_damage_time,
                          image : ImageWrapper, coding : str, sequence : int, options, flush) -> Optional[Tuple]:
         """
@@ -2652,6 +2750,7 @@ class WindowSource(WindowIconSource):
             * 'webp' uses 'webp_encode'
             * 'rgb24' and 'rgb32' use 'rgb_encode'
             * etc..
+            When the image is split into tiles, a list of packets is returned instead.
         """
         def nodata(msg, *args) -> None:
             log("make_data_packet: no data for window %s with sequence=%s: "+msg, self.wid, sequence, *args)
@@ -2665,17 +2764,19 @@ class WindowSource(WindowIconSource):
             return nodata("used scrolling instead")
         end = monotonic()
         log("scroll detection took %ims", 1000*(end-start))
-        x = image.get_target_x()
-        y = image.get_target_y()
+        regions = self.may_use_tiles(image, coding, options) if TILES else ()
+        if regions:
+            packets = self.make_tile_packets(damage_time, process_damage_time, image, regions, sequence, options, flush)
+            if packets is not None:
+                if not packets:
+                    return nodata("tiles cancelled after encoding")
+                return packets
+            tileslog("failed to encode the tiles, sending the whole image instead")
         w = image.get_width()
         h = image.get_height()
         if w<=0 or h<=0:
             raise RuntimeError(f"invalid dimensions: {w}x{h}")
-
-        #more useful is the actual number of bytes (assuming 32bpp)
-        #since we generally don't send the padding with it:
-        psize = w*h*4
-        log("make_data_packet: image=%s, damage data: %s", image, (self.wid, x, y, w, h, coding))
+        log("make_data_packet: image=%s, damage data: %s", image, (self.wid, image.get_target_x(), image.get_target_y(), w, h, coding))
         start = monotonic()
 
         options["cuda-device-context"] = self.cuda_device_context
@@ -2690,15 +2791,30 @@ class WindowSource(WindowIconSource):
             return nodata("no data from encoder %s for %s",
                           get_encoder_type(encoder), (coding, image, options))
 
-        coding, data, client_options, outw, outh, outstride, bpp = ret
         #check for cancellation again since the code above may take some time to encode:
         #but never cancel mmap after encoding because we need to reclaim the space
         #by getting the client to move the mmap received pointer
-        if coding!="mmap":
+        if ret[0]!="mmap":
             if self.is_cancelled(sequence):
                 return nodata("cancelled after encoding")
             if self.suspended:
                 return nodata("suspended after encoding")
+        return self.make_encoded_packet(damage_time, process_damage_time, image, encoder, ret, start, flush, options)
+
+    def make_encoded_packet(self, damage_time, process_damage_time, image : ImageWrapper,
+                            encoder, ret : Tuple, start : float, flush, options, end : float=0) -> Tuple:
+        """
+            Adds the client options to the result of the `encoder`
+            and returns the draw packet.
+        """
+        x = image.get_target_x()
+        y = image.get_target_y()
+        w = image.get_width()
+        h = image.get_height()
+        #more useful is the actual number of bytes (assuming 32bpp)
+        #since we generally don't send the padding with it:
+        psize = w*h*4
+        coding, data, client_options, outw, outh, outstride, bpp = ret
         csize = len(data)
         if INTEGRITY_HASH and coding!="mmap":
             #could be a compressed wrapper or just raw bytes:
@@ -2722,17 +2838,101 @@ class WindowSource(WindowIconSource):
             client_options["flush"] = flush
         if self.send_timetamps:
             client_options["ts"] = image.get_timestamp()
-        end = monotonic()
+        end = end or monotonic()
         if DAMAGE_STATISTICS:
             client_options['damage_time'] = int(damage_time * 1000)
             client_options['process_damage_time'] = int(process_damage_time * 1000)
             client_options['damage_packet_time'] = int(end * 1000)
+        stamps : Tuple[int,...] = ()
+        if self.latency_trace or self.send_trace_stamps:
+            stamps = tuple(to_us(t) for t in (damage_time, process_damage_time, start, end))
+            if self.send_trace_stamps:
+                client_options["trace"] = stamps
         compresslog(COMPRESS_FMT,
                  (end-start)*1000.0, outw, outh, x, y, self.wid, coding,
                  100.0*csize/psize, ceil(psize/1024), ceil(csize/1024),
                  self._damage_packet_sequence, client_options, options)
-        self.statistics.encoding_stats.append((end, coding, w*h, bpp, csize, end-start))
-        return self.make_draw_packet(x, y, outw, outh, coding, data, outstride, client_options, options)
+        self.record_encoding(end, coding, w*h, bpp, csize, end-start)
+        packet = self.make_draw_packet(x, y, outw, outh, coding, data, outstride, client_options, options)
+        if stamps and self.latency_trace:
+            self.trace_stamps[packet[8]] = stamps
+        return packet
+
+    def may_use_tiles(self, image : ImageWrapper, coding : str, options) -> Tuple:
+        """
+            Splits the image into text-like and photo-like tiles,
+            and when the image contains both, returns the tile regions
+            which should be encoded separately: lossless for text, lossy for photos.
+        """
+        if not classify_tiles or self.encoding!="auto" or coding not in ("jpeg", "webp", "avif"):
+            return ()
+        if self._want_alpha or self.is_tray or not image.has_pixels() or image.get_planes()!=ImageWrapper.PACKED:
+            return ()
+        if options.get("auto_refresh") or options.get("quality", 0)>=100 or "scaled-width" in options:
+            return ()
+        w = image.get_width()
+        h = image.get_height()
+        if w*h<MIN_TILES_PIXELS or (w<TILE_SIZE*2 and h<TILE_SIZE*2):
+            return ()
+        pixels = image.get_pixels()
+        if not pixels:
+            return ()
+        start = monotonic()
+        cols, rows, classes = classify_tiles(pixels, w, h, image.get_rowstride(), image.get_bytesperpixel(), TILE_SIZE)
+        regions = merge_tiles(classes, cols, rows, TILE_SIZE, w, h)
+        end = monotonic()
+        tileslog("classified %ix%i tiles of %ix%i in %.1fms: %s", cols, rows, w, h, 1000*(end-start), regions)
+        if len(set(tile_class for _, _, _, _, tile_class in regions))<2:
+            return ()
+        if len(regions)>MAX_TILE_REGIONS:
+            tileslog("too many tile regions: %i", len(regions))
+            return ()
+        return tuple(regions)
+
+    def make_tile_packets(self, damage_time, process_damage_time, image : ImageWrapper,
+                          regions, sequence : int, options, flush) -> Optional[List[Tuple]]:
+        """
+            Encodes each tile region separately and returns all the draw packets,
+            or None if any of the tiles could not be encoded,
+            in which case the caller should send the whole image instead.
+        """
+        encodings = tuple(e for e in self.common_encodings if e in self.picture_encodings)
+        lossless_options = dict(options)
+        lossless_options["quality"] = 100
+        encoded = []
+        subs = []
+        try:
+            for x, y, w, h, tile_class in regions:
+                toptions = options if tile_class==TILE_PHOTO else lossless_options
+                encoding = self.do_get_auto_encoding(w, h, toptions, None, encodings)
+                encode_fn = self._encoders.get(encoding)
+                if not encode_fn:
+                    tileslog("no encoder for %r %ix%i tile", encoding, w, h)
+                    return None
+                sub = image.get_sub_image(x, y, w, h)
+                subs.append(sub)
+                start = monotonic()
+                ret = encode_fn(encoding, sub, toptions)
+                if not ret or not ret[1]:
+                    tileslog("no result for %s encoding of %s with options %s", encoding, sub, toptions)
+                    return None
+                encoded.append((sub, encode_fn, ret, start, monotonic(), tile_class, toptions))
+            if self.is_cancelled(sequence) or self.suspended:
+                return []
+            stats = self.tiles_stats
+            stats["images"] = stats.get("images", 0)+1
+            packets = []
+            for i, (sub, encode_fn, ret, start, end, tile_class, toptions) in enumerate(encoded):
+                #the last tile gets the flush value of the whole image:
+                tile_flush = len(encoded)-1-i+(flush or 0)
+                packets.append(self.make_encoded_packet(damage_time, process_damage_time, sub,
+                                                        encode_fn, ret, start, tile_flush, toptions, end))
+                tname = TILE_NAMES.get(tile_class, "unknown")
+                stats[tname] = stats.get(tname, 0)+sub.get_width()*sub.get_height()
+            return packets
+        finally:
+            for sub in subs:
+                self.free_image_wrapper(sub)
 
     def make_draw_packet(self, x : int, y : int, outw : int, outh : int,
                          coding : str, data, outstride : int, client_options, options) -> Tuple:
@@ -2745,6 +2945,11 @@ class WindowSource(WindowIconSource):
             ws = options.get("window-size")
             if ws:
                 client_options["window-size"] = ws
+        if self.use_draw_datagrams() and coding not in NO_DATAGRAM_ENCODINGS and len(data)<=DATAGRAM_DRAW_SIZE:
+            #this packet can be lost, tell the client which one came before it
+            #so it can detect the missing ones:
+            client_options["datagram"] = self._datagram_sequence
+            self._datagram_sequence = self._damage_packet_sequence
         packet = ("draw", self.wid, x, y, outw, outh, coding, data,
                   self._damage_packet_sequence, outstride, client_options)
         self.global_statistics.packet_count += 1
@@ -2789,16 +2994,36 @@ class WindowSource(WindowIconSource):
         data = image.get_pixels()
         if not data:
             raise RuntimeError(f"failed to get pixels from {image}")
-        mmap_data, mmap_free_size = self.mmap_write(self._mmap, self._mmap_size, data)
+        client_options : Dict[str,Any] = {"rgb_format" : pf}
+        rings = self._mmap_rings
+        if rings:
+            ring = rings.get_ring(self.wid, len(data))
+            mmap_data, mmap_free_size = self.mmap_ring_write(ring, data)
+            if mmap_data:
+                #the client releases the space from this ring once it has painted the data:
+                client_options["mmap-ring"] = ring.offset
+        else:
+            mmap_data, mmap_free_size = self.mmap_write(self._mmap, self._mmap_size, data)
         #elapsed = monotonic()-start+0.000000001 #make sure never zero!
         #log("%s MBytes/s - %s bytes written to mmap in %.1f ms", int(len(data)/elapsed/1024/1024),
         #    len(data), 1000*elapsed)
         if mmap_data is None:
+            self.mmap_fallbacks += 1
             return ()
         self.global_statistics.mmap_bytes_sent += len(data)
         self.global_statistics.mmap_free_size = mmap_free_size
         #the data we send is the index within the mmap area:
         return (
-            "mmap", mmap_data, {"rgb_format" : pf},
+            "mmap", mmap_data, client_options,
             image.get_width(), image.get_height(), image.get_rowstride(), len(pf)*8,
             )
+
+    def mmap_ring_write(self, ring, data) -> Tuple[Optional[List[Tuple[int,int]]],int]:
+        if not ring:
+            return None, 0
+        pos = ring.write(data)
+        #report how full this window's ring is, scaled to the whole area:
+        mmap_free_size = (ring.size-ring.used())*self._mmap_size//ring.size
+        if pos is None:
+            return None, mmap_free_size
+        return [(pos, len(data))], mmap_free_size
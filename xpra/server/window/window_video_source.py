@@ -25,8 +25,15 @@ from xpra.server.window.window_source import (
     )
 from xpra.rectangle import rectangle, merge_all          #@UnresolvedImport
 from xpra.server.window.video_subregion import VideoSubregion, VIDEO_SUBREGION
-from xpra.server.window.video_scoring import get_pipeline_score
-from xpra.codecs.codec_constants import PREFERRED_ENCODING_ORDER, EDGE_ENCODING_ORDER, preforder
+from xpra.server.window.video_scoring import (
+    get_pipeline_options, get_pipeline_scores, get_context_key, get_score_bucket, get_encoding_score_delta,
+    MIN_FPS_COST,
+    )
+from xpra.server.cpu_budget import get_cpu_budget, get_priority, PRIORITY_NORMAL
+from xpra.server.window.encoder_pool import EncoderPool, ENCODER_POOL_AGE
+from xpra.server.window.damage_hints import DamageHints, DAMAGE_HINTS
+from xpra.server.background_worker import add_work_item
+from xpra.codecs.codec_constants import EDGE_ENCODING_ORDER, preforder
 from xpra.codecs.loader import has_codec
 from xpra.util import parse_scaling_value, engs, envint, envbool, csv, roundup, print_nested_dict, first_time, typedict
 from xpra.log import Logger
@@ -95,6 +102,10 @@ FORCE_AV_DELAY = envint("XPRA_FORCE_AV_DELAY", -1)
 AV_SYNC_DEFAULT = envbool("XPRA_AV_SYNC_DEFAULT", False)
 B_FRAMES = envbool("XPRA_B_FRAMES", True)
 VIDEO_SKIP_EDGE = envbool("XPRA_VIDEO_SKIP_EDGE", False)
+#don't re-create the video encoder for a new cpu budget more often than this (in seconds):
+CPU_BUDGET_DELAY = envint("XPRA_CPU_BUDGET_DELAY", 10)
+#initialize the video pipeline in the background when we find a new video region:
+WARM_PIPELINE = envbool("XPRA_WARM_PIPELINE", True)
 SCROLL_MIN_PERCENT = max(1, min(100, envint("XPRA_SCROLL_MIN_PERCENT", 30)))
 MIN_SCROLL_IMAGE_SIZE = envint("XPRA_MIN_SCROLL_IMAGE_SIZE", 128)
 
@@ -156,7 +167,10 @@ class WindowVideoSource(WindowSource):
         #this will call init_vars():
         self.supports_scrolling : bool = False
         super().__init__(*args)
-        self.video_subregion = VideoSubregion(self.refresh_subregion, self.auto_refresh_delay, VIDEO_SUBREGION)
+        self.encoder_pool = EncoderPool()
+        self.encoder_pool_timer : int = 0
+        self.video_subregion = VideoSubregion(self.refresh_subregion, self.auto_refresh_delay, VIDEO_SUBREGION,
+                                              self.warm_pipeline)
         self.supports_scrolling : bool = False
         self.supports_eos : bool= self.encoding_options.boolget("eos")
         self.scroll_min_percent : int = self.encoding_options.intget("scrolling.min-percent", SCROLL_MIN_PERCENT)
@@ -202,6 +216,12 @@ class WindowVideoSource(WindowSource):
         self._csc_encoder = None
         self._video_encoder = None
         self._last_pipeline_check = 0
+        self.cpu_priority : int = PRIORITY_NORMAL
+        self.encoder_threads : int = 0
+        self.encoder_setup_time : float = 0
+        #the encoder pool keys of the contexts we may return to the pool:
+        self.pool_keys : Dict[int,Tuple] = {}
+        self.damage_hints = DamageHints()
 
     def init_encoders(self) -> None:
         super().init_encoders()
@@ -294,6 +314,12 @@ class WindowVideoSource(WindowSource):
                 log.error("Error collecting codec information from %s", x, exc_info=True)
         addcinfo("csc", self._csc_encoder)
         addcinfo("encoder", self._video_encoder)
+        info["cpu-budget"] = {
+            "priority"  : self.cpu_priority,
+            "threads"   : self.encoder_threads,
+            }
+        info["encoder-pool"] = self.encoder_pool.get_info()
+        info["damage-hints"] = self.damage_hints.get_info()
         info.setdefault("encodings", {}).update({
                                                  "non-video"    : self.non_video_encodings,
                                                  "video"        : self.common_video_encodings,
@@ -342,6 +368,8 @@ class WindowVideoSource(WindowSource):
         super().cleanup()
         self.cleanup_codecs()
         self.stop_gstreamer_pipeline()
+        self.cancel_encoder_pool_timer()
+        self.call_in_encode_thread(False, self.encoder_pool.cleanup)
 
     def cleanup_codecs(self) -> None:
         """ Video encoders (x264, nvenc and vpx) and their csc helpers
@@ -356,6 +384,7 @@ class WindowVideoSource(WindowSource):
         """ Calls clean() from the encode thread """
         csce = self._csc_encoder
         ve = self._video_encoder
+        get_cpu_budget().release(self)
         if csce or ve:
             if DEBUG_VIDEO_CLEAN:
                 log.warn("video_context_clean() for wid %i: %s and %s", self.wid, csce, ve)
@@ -373,11 +402,22 @@ class WindowVideoSource(WindowSource):
     # noinspection PyMethodMayBeStatic
     def csc_clean(self, csce) -> None:
         if csce:
-            csce.clean()
+            key = self.pool_keys.pop(id(csce), None)
+            if key and not csce.is_closed():
+                self.encoder_pool.put(key, csce)
+                self.idle_add(self.schedule_encoder_pool_timer)
+            else:
+                csce.clean()
 
     def ve_clean(self, ve) -> None:
         self.cancel_video_encoder_timer()
         if ve:
+            #this encoder has not been used yet, so it can be re-used:
+            key = self.pool_keys.pop(id(ve), None)
+            if key and not ve.is_closed():
+                self.encoder_pool.put(key, ve)
+                self.idle_add(self.schedule_encoder_pool_timer)
+                return
             ve.clean()
             #only send eos if this video encoder is still current,
             #(otherwise, sending the new stream will have taken care of it already,
@@ -604,6 +644,8 @@ class WindowVideoSource(WindowSource):
 
 
     def do_damage(self, ww : int, wh : int, x : int, y : int, w : int, h : int, options):
+        if DAMAGE_HINTS:
+            self.damage_hints.add_damage(x, y, w, h)
         if ww>=64 and wh>=64 and self.encoding=="stream" and STREAM_MODE=="gstreamer" and self.common_video_encodings:
             #in this mode, we start a pipeline once
             #and let it submit packets, bypassing all the usual logic:
@@ -985,7 +1027,12 @@ class WindowVideoSource(WindowSource):
             av_delay, must_freeze, (w, h), coding)
         if must_freeze:
             image.freeze()
-        def call_encode(ew : int, eh : int, eimage, encoding : str, flush):
+        if video_mode and DAMAGE_HINTS:
+            #everything that has changed since the last video frame was captured:
+            #(`None` if there are too many regions to keep track of)
+            options = dict(options)
+            options["damage-regions"] = self.damage_hints.take_damage()
+        def call_encode(ew : int, eh : int, eimage, encoding : str, flush, eoptions):
             if self.is_cancelled(sequence):
                 self.free_image_wrapper(image)
                 log("call_encode: sequence %s is cancelled", sequence)
@@ -993,7 +1040,7 @@ class WindowVideoSource(WindowSource):
             now = monotonic()
             log("process_damage_region: wid=%i, sequence=%i, adding pixel data to encode queue (%4ix%-4i - %5s), elapsed time: %3.1f ms, request time: %3.1f ms, frame delay=%3ims",
                     self.wid, sequence, ew, eh, encoding, 1000*(now-damage_time), 1000*(now-rgb_request_time), av_delay)
-            item = (ew, eh, damage_time, now, eimage, encoding, sequence, options, flush)
+            item = (ew, eh, damage_time, now, eimage, encoding, sequence, eoptions, flush)
             if av_delay<=0:
                 self.call_in_encode_thread(True, self.make_data_packet_cb, *item)
             else:
@@ -1009,22 +1056,27 @@ class WindowVideoSource(WindowSource):
         if video_mode and ee:
             dw = ow - w
             dh = oh - h
+            #the damage regions are only recorded once, with the main area:
+            edge_options = options
+            if w>0 and h>0 and "damage-regions" in options:
+                edge_options = dict(options)
+                del edge_options["damage-regions"]
             if dw>0 and h>0:
                 sub = image.get_sub_image(w, 0, dw, oh)
-                regions.append((dw, h, sub, ee))
+                regions.append((dw, h, sub, ee, edge_options))
             if dh>0 and w>0:
                 sub = image.get_sub_image(0, h, ow, dh)
-                regions.append((dw, h, sub, ee))
+                regions.append((dw, h, sub, ee, edge_options))
         #the main area:
         if w>0 and h>0:
-            regions.append((w, h, image, coding))
+            regions.append((w, h, image, coding, options))
         #process all regions:
         if regions:
             #ensure that the flush value ends at 0 on the last region:
             flush = max(len(regions)-1, flush or 0)
             for i, region in enumerate(regions):
-                w, h, image, coding = region
-                call_encode(w, h, image, coding, flush-i)
+                w, h, image, coding, region_options = region
+                call_encode(w, h, image, coding, flush-i, region_options)
         return True
 
     def get_frame_encode_delay(self, options) -> int:
@@ -1368,7 +1420,8 @@ class WindowVideoSource(WindowSource):
             using csc encoders to convert to an intermediary format.
             Each solution is rated, and we return all of them in descending
             score (the best solution comes first).
-            Because this function is expensive to call, we cache the results.
+            Because this function is expensive to call, we cache the results,
+            and share them with all the other windows (see `PipelineScores`).
             This allows it to run more often from the timer thread.
 
             Can be called from any thread.
@@ -1394,80 +1447,39 @@ class WindowVideoSource(WindowSource):
                 #not the video region, or not really video content, raise quality a bit:
                 target_q = int(sqrt(target_q/100.0)*100)
                 scorelog("raising quality for video encoding of non-video region")
+        #round the targets so that the scores can be shared:
+        target_q = get_score_bucket(target_q)
+        target_s = get_score_bucket(target_s)
         scorelog("get_video_pipeline_options%s speed: %s (min %s), quality: %s (min %s)",
                  (encodings, width, height, src_format), target_s, min_s, target_q, min_q)
-        vmw, vmh = self.video_max_size
-        ffps = self.get_video_fps(width, height)
-        scores = []
-        for encoding in encodings:
-            #these are the CSC modes the client can handle for this encoding:
-            #we must check that the output csc mode for each encoder is one of those
-            supported_csc_modes = self.full_csc_modes.strtupleget(encoding)
-            if not supported_csc_modes:
-                scorelog(" no supported csc modes for %s", encoding)
-                continue
-            encoder_specs = vh.get_encoder_specs(encoding)
-            if not encoder_specs:
-                scorelog(" no encoder specs for %s", encoding)
-                continue
-            #if not specified as an encoding option,
-            #discount encodings further down the list of preferred encodings:
-            #(ie: prefer h264 to vp9)
-            try:
-                encoding_score_delta = len(PREFERRED_ENCODING_ORDER)//2-list(PREFERRED_ENCODING_ORDER).index(encoding)
-            except ValueError:
-                encoding_score_delta = 0
-            encoding_score_delta = self.encoding_options.get(f"{encoding}.score-delta", encoding_score_delta)
-            no_match = []
-            def add_scores(info, csc_spec, enc_in_format):
-                #find encoders that take 'enc_in_format' as input:
-                colorspace_specs = encoder_specs.get(enc_in_format)
-                if not colorspace_specs:
-                    no_match.append(info)
-                    return
-                #log("%s encoding from %s: %s", info, pixel_format, colorspace_specs)
-                for encoder_spec in colorspace_specs:
-                    #ensure that the output of the encoder can be processed by the client:
-                    matches = tuple(x for x in encoder_spec.output_colorspaces if x in supported_csc_modes)
-                    if not matches or self.is_cancelled():
-                        no_match.append(encoder_spec.codec_type+" "+info)
-                        continue
-                    max_w = min(encoder_spec.max_w, vmw)
-                    max_h = min(encoder_spec.max_h, vmh)
-                    if (csc_spec and csc_spec.can_scale) or encoder_spec.can_scale:
-                        scaling = self.calculate_scaling(width, height, max_w, max_h)
-                    else:
-                        scaling = (1, 1)
-                    score_delta = encoding_score_delta
-                    if self.is_shadow and enc_in_format in ("NV12", "YUV420P", "YUV422P") and scaling==(1, 1):
-                        #avoid subsampling with shadow servers:
-                        score_delta -= 40
-                    vs = self.video_subregion
-                    detection = bool(vs) and vs.detection
-                    score_data = get_pipeline_score(enc_in_format, csc_spec, encoder_spec, width, height, scaling,
-                                                    target_q, min_q, target_s, min_s,
-                                                    self._csc_encoder, self._video_encoder,
-                                                    score_delta, ffps, detection)
-                    if score_data:
-                        scores.append(score_data)
-                    else:
-                        scorelog(" no score data for %s",
-                                 (enc_in_format, csc_spec, encoder_spec, width, height, scaling, ".."))
-            if not FORCE_CSC or src_format==FORCE_CSC_MODE:
-                add_scores(f"direct (no csc) {src_format}", None, src_format)
-
-            #now add those that require a csc step:
-            csc_specs = vh.get_csc_specs(src_format)
-            if csc_specs:
-                #log("%s can also be converted to %s using %s",
-                #    pixel_format, [x[0] for x in csc_specs], set(x[1] for x in csc_specs))
-                #we have csc module(s) that can get us from pixel_format to out_csc:
-                for out_csc, l in csc_specs.items():
-                    if not bool(FORCE_CSC_MODE) or FORCE_CSC_MODE==out_csc:
-                        for csc_spec in l:
-                            add_scores(f"via {out_csc}", csc_spec, out_csc)
-            scorelog("no matching colorspace specs for %s: %s", encoding, no_match)
-        s = tuple(sorted(scores, key=lambda x : -x[0]))
+        max_size = self.video_max_size
+        vmw, vmh = max_size
+        #the fps only matters below MIN_FPS_COST:
+        ffps = min(MIN_FPS_COST, self.get_video_fps(width, height))
+        vs = self.video_subregion
+        detection = bool(vs) and vs.detection
+        csc_modes = {encoding : self.full_csc_modes.strtupleget(encoding) for encoding in encodings}
+        score_deltas = {encoding : self.encoding_options.get(f"{encoding}.score-delta", get_encoding_score_delta(encoding))
+                        for encoding in encodings}
+        pscores = get_pipeline_scores()
+        max_sizes, limited_specs = pscores.get_spec_limits(vh, encodings, src_format)
+        scalings = {}
+        for max_w, max_h in max_sizes:
+            mwh = min(max_w, vmw), min(max_h, vmh)
+            if mwh not in scalings:
+                scalings[mwh] = self.calculate_scaling(width, height, *mwh)
+        csce = self._csc_encoder
+        ve = self._video_encoder
+        key = (vh.generation, tuple(encodings), width, height, src_format,
+               tuple(csc_modes.items()), tuple(score_deltas.items()), tuple(sorted(scalings.items())), max_size,
+               target_q, min_q, target_s, min_s, get_context_key(csce, ve), ffps, detection, self.is_shadow,
+               tuple(spec.get_instance_count() for spec in limited_specs))
+        s = pscores.get(key, get_pipeline_options,
+                        vh, encodings, width, height, src_format,
+                        csc_modes, score_deltas, scalings, max_size,
+                        target_q, min_q, target_s, min_s,
+                        csce, ve, ffps, detection, self.is_shadow,
+                        FORCE_CSC_MODE, FORCE_CSC)
         scorelog("get_video_pipeline_options%s scores=%s", (encodings, width, height, src_format), s)
         if self.is_cancelled():
             self.last_pipeline_params = ()
@@ -1851,17 +1863,16 @@ class WindowVideoSource(WindowSource):
             min_h = max(min_h, csc_spec.min_h)
             max_w = min(max_w, csc_spec.max_w)
             max_h = min(max_h, csc_spec.max_h)
-            #csc speed is not very important compared to encoding speed,
-            #so make sure it never degrades quality
-            speed = options.get("speed", self._current_speed)
-            quality = options.get("quality", self._current_quality)
-            csc_speed = max(1, min(speed, 100-quality/2.0))
-            csc_options = typedict({"speed" : csc_speed})
             csc_start = monotonic()
-            csce = csc_spec.make_instance()
-            csce.init_context(csc_width, csc_height, src_format,
-                                   enc_width, enc_height, enc_in_format, csc_options)
+            csc_key = ("csc", csc_spec.codec_type, csc_width, csc_height, src_format, enc_width, enc_height, enc_in_format)
+            csce = self.encoder_pool.take(csc_key)
+            pooled = csce is not None
+            if not pooled:
+                csce = self.make_csc(options, csc_spec, csc_width, csc_height, src_format,
+                                     enc_width, enc_height, enc_in_format)
+            self.pool_keys[id(csce)] = csc_key
             csc_end = monotonic()
+            self.encoder_pool.record_setup(csc_spec.codec_type, csc_end-csc_start, pooled)
             csclog("setup_pipeline: csc=%s, info=%s, setup took %.2fms",
                   csce, csce.get_info(), (csc_end-csc_start)*1000.0)
         else:
@@ -1879,20 +1890,18 @@ class WindowVideoSource(WindowSource):
                 return False
         self._csc_encoder = csce
         enc_start = monotonic()
-        #FIXME: filter dst_formats to only contain formats the encoder knows about?
-        dst_formats = self.full_csc_modes.strtupleget(encoder_spec.encoding)
-        ve = encoder_spec.make_instance()
-        options.update(self.get_video_encoder_options(encoder_spec.encoding, width, height))
-        if self.encoding=="grayscale":
-            options["grayscale"] = True
-        if encoder_scaling!=(1, 1):
-            n, d = encoder_scaling
-            options["scaling"] = encoder_scaling
-            options["scaled-width"] = enc_width*n//d
-            options["scaled-height"] = enc_height*n//d
-        options["dst-formats"] = dst_formats
-
-        ve.init_context(encoder_spec.encoding, enc_width, enc_height, enc_in_format, options)
+        budget = get_cpu_budget()
+        budget.set_priority(self, self.cpu_priority)
+        self.encoder_threads = threads = budget.get_threads(self)
+        self.encoder_setup_time = monotonic()
+        ve_key = self.get_encoder_key(encoder_spec, enc_in_format, encoder_scaling,
+                                      width, height, enc_width, enc_height, threads)
+        ve = self.encoder_pool.take(ve_key)
+        pooled = ve is not None
+        if not pooled:
+            ve = self.make_video_encoder(options, width, height, encoder_spec, enc_in_format,
+                                         encoder_scaling, enc_width, enc_height, threads)
+        self.pool_keys[id(ve)] = ve_key
         #record new actual limits:
         self.actual_scaling = scaling
         self.width_mask = width_mask
@@ -1902,6 +1911,7 @@ class WindowVideoSource(WindowSource):
         self.max_w = max_w
         self.max_h = max_h
         enc_end = monotonic()
+        self.encoder_pool.record_setup(encoder_spec.codec_type, enc_end-enc_start, pooled)
         self.start_video_frame = 0
         self._video_encoder = ve
         videolog("setup_pipeline: csc=%s, video encoder=%s, info: %s, setup took %.2fms",
@@ -1909,6 +1919,150 @@ class WindowVideoSource(WindowSource):
         scalinglog("setup_pipeline: scaling=%s, encoder_scaling=%s", scaling, encoder_scaling)
         return True
 
+    def make_csc(self, options : typedict, csc_spec, csc_width : int, csc_height : int, src_format : str,
+                 enc_width : int, enc_height : int, enc_in_format : str):
+        #csc speed is not very important compared to encoding speed,
+        #so make sure it never degrades quality
+        speed = options.get("speed", self._current_speed)
+        quality = options.get("quality", self._current_quality)
+        csc_speed = max(1, min(speed, 100-quality/2.0))
+        csc_options = typedict({"speed" : csc_speed})
+        csce = csc_spec.make_instance()
+        csce.init_context(csc_width, csc_height, src_format,
+                               enc_width, enc_height, enc_in_format, csc_options)
+        return csce
+
+    def get_encoder_key(self, encoder_spec, enc_in_format : str, encoder_scaling, width : int, height : int,
+                        enc_width : int, enc_height : int, threads : int) -> Tuple:
+        #the encoder options which can't be changed once the encoder is initialized:
+        opts = self.get_video_encoder_options(encoder_spec.encoding, width, height)
+        return ("encoder", encoder_spec.codec_type, encoder_spec.encoding, enc_in_format,
+                encoder_scaling, enc_width, enc_height, threads, self.encoding=="grayscale",
+                opts.get("content-type", ""), opts.get("b-frames", False))
+
+    def make_video_encoder(self, options : typedict, width : int, height : int, encoder_spec, enc_in_format : str,
+                           encoder_scaling, enc_width : int, enc_height : int, threads : int):
+        #FIXME: filter dst_formats to only contain formats the encoder knows about?
+        dst_formats = self.full_csc_modes.strtupleget(encoder_spec.encoding)
+        ve = encoder_spec.make_instance()
+        options.update(self.get_video_encoder_options(encoder_spec.encoding, width, height))
+        if self.encoding=="grayscale":
+            options["grayscale"] = True
+        if encoder_scaling!=(1, 1):
+            n, d = encoder_scaling
+            options["scaling"] = encoder_scaling
+            options["scaled-width"] = enc_width*n//d
+            options["scaled-height"] = enc_height*n//d
+        options["dst-formats"] = dst_formats
+        options["threads"] = threads
+        ve.init_context(encoder_spec.encoding, enc_width, enc_height, enc_in_format, options)
+        return ve
+
+    def warm_pipeline(self, rect) -> None:
+        """
+            Called by the video subregion when it finds a new region,
+            the region is only used for video once it has received enough updates,
+            so we can initialize the pipeline for it in the background,
+            and setup_pipeline will find it in the encoder pool.
+        """
+        if not WARM_PIPELINE or self.encoder_pool.size<=0 or not self.pixel_format or self.is_cancelled():
+            return
+        if self.encoding in ("auto", "stream", "grayscale"):
+            encodings = self.common_video_encodings
+        else:
+            encodings = (self.encoding, )
+        width = rect.width & self.width_mask
+        height = rect.height & self.height_mask
+        ve = self._video_encoder
+        if ve and (ve.get_width(), ve.get_height())==(width, height):
+            return
+        src_format = self.pixel_format
+        scores = self.get_video_pipeline_options(encodings, width, height, src_format)
+        if not scores:
+            return
+        def warm():
+            self.do_warm_pipeline(width, height, src_format, *scores[0])
+        add_work_item(warm)
+
+    def do_warm_pipeline(self, width : int, height : int, src_format : str,
+                         _score : int, _scaling, _csc_scaling, csc_width : int, csc_height : int, csc_spec,
+                         enc_in_format : str, encoder_scaling, enc_width : int, enc_height : int, encoder_spec) -> None:
+        """ runs in the background worker thread """
+        if self.is_cancelled() or (not csc_spec and encoder_scaling!=(1, 1) and not encoder_spec.can_scale):
+            return
+        pool = self.encoder_pool
+        options = typedict(self.encoding_options)
+        self.assign_sq_options(options)
+        if csc_spec:
+            csc_key = ("csc", csc_spec.codec_type, csc_width, csc_height, src_format, enc_width, enc_height, enc_in_format)
+            if pool.set_pending(csc_key):
+                try:
+                    pool.put(csc_key, self.make_csc(options, csc_spec, csc_width, csc_height, src_format,
+                                                    enc_width, enc_height, enc_in_format))
+                except Exception as e:
+                    pool.set_pending(csc_key, False)
+                    csclog("failed to warm up %s: %s", csc_spec, e)
+        threads = get_cpu_budget().get_threads(self)
+        ve_key = self.get_encoder_key(encoder_spec, enc_in_format, encoder_scaling,
+                                      width, height, enc_width, enc_height, threads)
+        if pool.set_pending(ve_key):
+            start = monotonic()
+            try:
+                pool.put(ve_key, self.make_video_encoder(options, width, height, encoder_spec, enc_in_format,
+                                                         encoder_scaling, enc_width, enc_height, threads))
+            except Exception as e:
+                pool.set_pending(ve_key, False)
+                videolog("failed to warm up %s: %s", encoder_spec, e)
+            else:
+                videolog("warm_pipeline: %s for %ix%i ready in %.2fms",
+                         encoder_spec.codec_type, enc_width, enc_height, (monotonic()-start)*1000)
+        self.idle_add(self.schedule_encoder_pool_timer)
+
+    def schedule_encoder_pool_timer(self) -> None:
+        #free the pooled contexts once they expire, even if the pool is not used again:
+        if not self.encoder_pool_timer and len(self.encoder_pool):
+            self.encoder_pool_timer = self.timeout_add(ENCODER_POOL_AGE*1000+100, self.encoder_pool_expiry)
+
+    def cancel_encoder_pool_timer(self) -> None:
+        ept = self.encoder_pool_timer
+        if ept:
+            self.encoder_pool_timer = 0
+            self.source_remove(ept)
+
+    def encoder_pool_expiry(self) -> bool:
+        self.encoder_pool_timer = 0
+        def expire():
+            if self.encoder_pool.expire_contexts():
+                self.idle_add(self.schedule_encoder_pool_timer)
+        self.call_in_encode_thread(False, expire)
+        return False
+
+    def calculate_batch_delay(self, has_focus, other_is_fullscreen, other_is_maximized) -> None:
+        super().calculate_batch_delay(has_focus, other_is_fullscreen, other_is_maximized)
+        self.update_cpu_priority(get_priority(has_focus, self.fullscreen, other_is_fullscreen, other_is_maximized))
+
+    def update_cpu_priority(self, priority:int) -> None:
+        self.cpu_priority = priority
+        if not self._video_encoder:
+            return
+        budget = get_cpu_budget()
+        budget.set_priority(self, priority)
+        #only re-create the encoder if the number of threads has changed a lot:
+        threads = budget.get_threads(self)
+        et = self.encoder_threads
+        if et and (threads>=2*et or et>=2*threads) and monotonic()-self.encoder_setup_time>CPU_BUDGET_DELAY:
+            videolog("cpu budget for window %i changed from %i to %i threads", self.wid, et, threads)
+            self.video_context_clean()
+
+    def update_speed(self) -> None:
+        super().update_speed()
+        if self._video_encoder and self._speed_hint<0 and self._fixed_speed<0:
+            #use less cpu when we don't get as many threads as we would like:
+            min_speed = get_cpu_budget().get_min_speed(self)
+            if min_speed>self._current_speed:
+                self._current_speed = min_speed
+                self._encoding_speed_info["cpu-budget"] = min_speed
+
     def get_video_encoder_options(self, encoding, width, height) -> Dict[str,Any]:
         #tweaks for "real" video:
         opts = {"cuda-device-context" : self.cuda_device_context}
@@ -2227,6 +2381,14 @@ class WindowVideoSource(WindowSource):
         super().do_schedule_auto_refresh(encoding, data, region, client_options, options)
 
 
+    def make_data_packet(self, damage_time, process_damage_time,
+                         image : ImageWrapper, coding : str, sequence : int, options, flush) -> Optional[Tuple]:
+        #the video encoder must be told about these changes,
+        #even if this frame ends up being sent some other way:
+        if "damage-regions" in options:
+            self.damage_hints.add_frame(options["damage-regions"])
+        return super().make_data_packet(damage_time, process_damage_time, image, coding, sequence, options, flush)
+
     def video_fallback(self, image : ImageWrapper, options, warn=False) -> Tuple:
         if warn and first_time(f"non-video-{self.wid}"):
             videolog.warn("Warning: using non-video fallback encoding")
@@ -2359,6 +2521,13 @@ class WindowVideoSource(WindowSource):
 
         start = monotonic()
         options.update(self.get_video_encoder_options(ve.get_encoding(), width, height))
+        if "damage-regions" in options:
+            #only the areas which have changed since the previous video frame:
+            damage = self.damage_hints.get_hints(x, y, width, height, enc_width, enc_height)
+            if damage:
+                options["damage-hints"] = damage
+        #the encoder now has some stream state, it can't go back in the pool:
+        self.pool_keys.pop(id(ve), None)
         try:
             ret = ve.compress_image(csc_image, options)
         except Exception as e:
@@ -2387,6 +2556,7 @@ class WindowVideoSource(WindowSource):
             return ()
         data, client_options = ret
         end = monotonic()
+        self.damage_hints.compressed(x, y, width, height)
         if LOG_ENCODERS or compresslog.is_debug_enabled():
             client_options["csc-type"] = csce.get_type() if csce else "none"
 
@@ -248,6 +248,45 @@ def merge_dicts(a : Dict[str,Any], b : Dict[str,Any], path:Optional[List[str]]=N
             a[key] = b[key]
     return a
 
+def dict_delta(old : Dict, new : Dict) -> Tuple[Dict, List[Tuple]]:
+    """
+        returns the nested dictionary of keys added or modified in 'new',
+        and the list of paths (as tuples of keys) removed from 'old'
+    """
+    changed = {}
+    removed : List[Tuple] = []
+    for k, v in new.items():
+        ov = old.get(k, dict_delta)
+        if ov is dict_delta:
+            changed[k] = v
+        elif isinstance(v, dict) and isinstance(ov, dict):
+            sub_changed, sub_removed = dict_delta(ov, v)
+            if sub_changed:
+                changed[k] = sub_changed
+            removed += [(k, )+path for path in sub_removed]
+        elif v!=ov:
+            changed[k] = v
+    removed += [(k, ) for k in old if k not in new]
+    return changed, removed
+
+def apply_dict_delta(d : Dict, changed : Dict, removed : Iterable[Iterable]=()) -> Dict:
+    """ updates 'd' in place using the values returned by 'dict_delta' """
+    for path in removed:
+        *parents, key = path
+        parent = d
+        for pk in parents:
+            parent = parent.get(pk)
+            if not isinstance(parent, dict):
+                break
+        else:
+            parent.pop(key, None)
+    for k, v in changed.items():
+        if isinstance(v, dict) and isinstance(d.get(k), dict):
+            apply_dict_delta(d[k], v)
+        else:
+            d[k] = v
+    return d
+
 def make_instance(class_options, *args):
     log = get_util_logger()
     log("make_instance%s", tuple([class_options]+list(args)))
@@ -7,7 +7,6 @@
 import sys
 import os
 import socket
-import platform
 from typing import Any, Dict, Tuple, Optional
 
 #tricky: use xpra.scripts.config to get to the python "platform" module
@@ -222,6 +221,7 @@ def dict_version_trim(d, parts=FULL_INFO+1):
 
 def do_get_platform_info() -> Dict[str, Any]:
     # pylint: disable=import-outside-toplevel
+    import platform
     from xpra.os_util import platform_name, platform_release
     pp = sys.modules.get("platform", platform)
     def get_processor_name():